@@ -26,14 +26,10 @@
 
 # noinspection PyPep8Naming
 def classFactory(iface):  # pylint: disable=invalid-name
-    """Load DSS class from file DSS.
+    """Load DSSMenuPlugin class from file dss_menu.
 
     :param iface: A QGIS interface instance.
     :type iface: QgsInterface
     """
-    #
-    # from .dss import DSS
-    # return DSS(iface)
-    
     from .dss_menu import DSSMenuPlugin
     return DSSMenuPlugin(iface)
\ No newline at end of file
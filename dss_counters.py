@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+# Work counted across the analysis modules. Counts are added per build or per
+# batch (never per feature), so keeping them costs next to nothing.
+SPATIAL_INDEX_BUILDS = 'spatial_index_builds'
+FULL_LAYER_SCANS = 'full_layer_scans'
+FEATURES_FETCHED = 'features_fetched'
+EXACT_PREDICATES = 'exact_predicates'
+UNION_CALLS = 'union_calls'
+
+_counts = Counter()
+_lock = threading.Lock()
+
+
+def count(name, amount=1):
+    """Adds `amount` to the counter `name` (thread safe)."""
+    with _lock:
+        _counts[name] += amount
+
+
+def totals():
+    """Copy of all the counters since the start of the session."""
+    with _lock:
+        return Counter(_counts)
+
+
+@contextmanager
+def counting():
+    """
+    Yields a Counter that holds, once the block exits, the work counted
+    inside it, e.g. to check a run did not rebuild an index::
+
+        with counting() as work:
+            engine.calculate(point)
+        assert work[SPATIAL_INDEX_BUILDS] == 0
+    """
+    before = totals()
+    work = Counter()
+    try:
+        yield work
+    finally:
+        after = totals()
+        for name, value in after.items():
+            if value != before[name]:
+                work[name] = value - before[name]
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+import datetime
+import json
+
+from qgis.PyQt.QtCore import QDate, QDateTime, QVariant
+from qgis.core import QgsWkbTypes
+
+# pyarrow is optional: it ships with most Python distributions used for
+# analytics, but not with every QGIS install
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+GEOMETRY_COLUMN = 'geometry'
+GEOPARQUET_VERSION = '1.0.0'
+DEFAULT_BATCH_SIZE = 10000
+
+# File extension -> format
+FORMATS = {'.parquet': 'parquet', '.arrow': 'arrow', '.feather': 'arrow'}
+
+
+class ExportError(Exception):
+    """Raised when results cannot be exported; the message is meant for the user."""
+
+
+def arrow_available():
+    return pyarrow is not None
+
+
+def _arrow_type(field):
+    field_type = field.type()
+    if field_type in (QVariant.Int, QVariant.UInt, QVariant.LongLong, QVariant.ULongLong):
+        return pyarrow.int64()
+    if field_type == QVariant.Double:
+        return pyarrow.float64()
+    if field_type == QVariant.Bool:
+        return pyarrow.bool_()
+    if field_type == QVariant.Date:
+        return pyarrow.date32()
+    if field_type == QVariant.DateTime:
+        return pyarrow.timestamp('ms')
+    return pyarrow.string()
+
+
+def _python_value(value, arrow_type):
+    if value is None or (isinstance(value, QVariant) and value.isNull()):
+        return None
+    if isinstance(value, QDate):
+        return value.toPyDate()
+    if isinstance(value, QDateTime):
+        return value.toPyDateTime()
+    if arrow_type == pyarrow.string() and not isinstance(value, str):
+        return str(value)
+    return value
+
+
+def geometry_types(wkb_type):
+    """GeoParquet 'geometry_types' of a layer WKB type, e.g. ['LineString Z']; [] when unknown."""
+    flat_type = QgsWkbTypes.flatType(wkb_type)
+    if flat_type in (QgsWkbTypes.Unknown, QgsWkbTypes.NoGeometry):
+        return []
+    name = QgsWkbTypes.displayString(flat_type)
+    return [name + ' Z' if QgsWkbTypes.hasZ(wkb_type) else name]
+
+
+def projjson(crs):
+    """PROJJSON of a CRS as GeoParquet stores it, or None if it cannot be produced."""
+    if not crs.isValid():
+        return None
+    if hasattr(crs, 'toJson'):
+        # QGIS >= 3.38
+        return json.loads(crs.toJson())
+    try:
+        import pyproj
+    except ImportError:
+        return None
+    return pyproj.CRS.from_wkt(crs.toWkt(crs.WKT2_2019)).to_json_dict()
+
+
+class ResultWriter:
+    """
+    Writes features to a Parquet (GeoParquet) or Arrow IPC file in batches.
+
+    The schema is derived from the QgsFields in their order (integers as
+    int64, decimals as float64, anything unknown as string) plus a WKB
+    `geometry` column, so the same DSS output always gets the same schema.
+    Run metadata (tool, parameters, inputs) is stored as JSON in the `dss`
+    key of the schema metadata, next to the GeoParquet `geo` key.
+    """
+
+    def __init__(self, path, fields, crs=None, wkb_type=QgsWkbTypes.NoGeometry, metadata=None,
+                 batch_size=DEFAULT_BATCH_SIZE, file_format=None):
+        """
+        :param path:        Output file; its extension chooses the format unless `file_format` is given.
+        :param fields:      QgsFields of the features.
+        :param crs:         QgsCoordinateReferenceSystem of the geometries.
+        :param wkb_type:    Geometry type; NoGeometry writes no geometry column.
+        :param metadata:    JSON-serializable dict describing the run.
+        :param batch_size:  Features buffered before a record batch is written.
+        :param file_format: 'parquet' or 'arrow'.
+        """
+        if pyarrow is None:
+            raise ExportError("Parquet/Arrow export needs the 'pyarrow' Python package.")
+        if file_format is None:
+            extension = path[path.rfind('.'):].lower() if '.' in path else ''
+            file_format = FORMATS.get(extension, 'parquet')
+
+        self.path = path
+        self.field_names = fields.names()
+        self.batch_size = batch_size
+        self.file_format = file_format
+        self.has_geometry = bool(geometry_types(wkb_type))
+        self.count = 0
+
+        arrow_fields = [pyarrow.field(field.name(), _arrow_type(field)) for field in fields]
+        schema_metadata = {
+            'dss': json.dumps(dict(metadata or {}, written=datetime.datetime.now().isoformat(timespec='seconds')))
+        }
+        if self.has_geometry:
+            arrow_fields.append(pyarrow.field(GEOMETRY_COLUMN, pyarrow.binary()))
+            column = {'encoding': 'WKB', 'geometry_types': geometry_types(wkb_type)}
+            if crs is not None:
+                column['crs'] = projjson(crs)
+            schema_metadata['geo'] = json.dumps({
+                'version': GEOPARQUET_VERSION,
+                'primary_column': GEOMETRY_COLUMN,
+                'columns': {GEOMETRY_COLUMN: column},
+            })
+        self.schema = pyarrow.schema(arrow_fields, metadata=schema_metadata)
+        self._types = [field.type for field in self.schema]
+        self._rows = []
+
+        if file_format == 'parquet':
+            self._writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        else:
+            self._sink = pyarrow.OSFile(path, 'wb')
+            self._writer = pyarrow.ipc.new_file(self._sink, self.schema)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add_feature(self, feature):
+        row = [
+            _python_value(value, arrow_type)
+            for value, arrow_type in zip(feature.attributes(), self._types)
+        ]
+        if self.has_geometry:
+            geometry = feature.geometry()
+            row.append(bytes(geometry.asWkb()) if not geometry.isNull() else None)
+        self._rows.append(row)
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def add_features(self, features):
+        for feature in features:
+            self.add_feature(feature)
+
+    def flush(self):
+        if not self._rows:
+            return
+        columns = [
+            pyarrow.array([row[position] for row in self._rows], type=arrow_type)
+            for position, arrow_type in enumerate(self._types)
+        ]
+        batch = pyarrow.RecordBatch.from_arrays(columns, schema=self.schema)
+        if self.file_format == 'parquet':
+            self._writer.write_table(pyarrow.Table.from_batches([batch]))
+        else:
+            self._writer.write_batch(batch)
+        self.count += len(self._rows)
+        self._rows = []
+
+    def close(self):
+        if self._writer is None:
+            return
+        self.flush()
+        self._writer.close()
+        if self.file_format != 'parquet':
+            self._sink.close()
+        self._writer = None
+
+
+def export_layer(layer, path, metadata=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Writes all the features of `layer` to `path` (.parquet or .arrow).
+
+    :param metadata: Run metadata; the layer name and source are always added.
+    :return:         Number of features written.
+    """
+    metadata = dict(metadata or {}, layer=layer.name(), source=layer.source())
+    with ResultWriter(path, layer.fields(), layer.crs(), layer.wkbType(), metadata, batch_size) as writer:
+        writer.add_features(layer.getFeatures())
+    return writer.count
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+from qgis.PyQt.QtCore import QCoreApplication, QThread
+from qgis.core import QgsCoordinateReferenceSystem, QgsCoordinateTransform, QgsExpression, QgsProject, qgsfunction
+
+# The functions are registered at startup; the analysis modules are only
+# imported on their first evaluation.
+
+# Project entries (scope, key prefix) holding the layers last used by the Watershed tool
+PROJECT_SCOPE = 'dss'
+WATERSHED_LAYER_ROLES = ('water_bodies', 'catchments', 'abstraction', 'discharge', 'groundwater')
+WS_METRICS = ('ws_surface', 'ws_groundwater', 'ws_total')
+
+# The functions read the project layers and the session structures, which are
+# not thread-safe: map rendering and labeling evaluate expressions in worker
+# threads, where the functions return an error instead.
+THREAD_ERROR = "DSS functions only run on the main thread (e.g. the field calculator), not while rendering."
+
+_session = None
+_engine = None
+_engine_key = None
+# WS metrics by basin (see WatershedLoadEngine.basin_key), reset with the engine,
+# i.e. whenever a layer or its generation changes
+_memo = {}
+
+
+def store_watershed_layers(layers):
+    """
+    Saves the ids of the Watershed tool layers (in WATERSHED_LAYER_ROLES
+    order) with the project, for the expression functions. Only writes the
+    entries that changed, so the project is not marked dirty on every run.
+    """
+    project = QgsProject.instance()
+    for role, layer in zip(WATERSHED_LAYER_ROLES, layers):
+        key = f'watershed/{role}'
+        if project.readEntry(PROJECT_SCOPE, key, '')[0] != layer.id():
+            project.writeEntry(PROJECT_SCOPE, key, layer.id())
+
+
+def watershed_layers():
+    """The layers saved by store_watershed_layers, or None if one is missing."""
+    project = QgsProject.instance()
+    layers = []
+    for role in WATERSHED_LAYER_ROLES:
+        layer = project.mapLayer(project.readEntry(PROJECT_SCOPE, f'watershed/{role}', '')[0])
+        if layer is None:
+            return None
+        layers.append(layer)
+    return layers
+
+
+def watershed_engine():
+    """
+    Engine on the saved layers, kept while neither the layers nor the
+    session structures change, so consecutive evaluations share its lookups
+    and, through the result cache, the totals of the basins already seen.
+    """
+    global _engine, _engine_key, _memo
+    from .dss_watershed_engine import WatershedLoadEngine, WatershedLoadError
+    layers = watershed_layers()
+    if layers is None:
+        raise WatershedLoadError("Run the DSS Watershed tool once to select its input layers.")
+    key = tuple((layer.id(), _session.generation(layer.id()) if _session is not None else 0) for layer in layers)
+    if key != _engine_key:
+        _engine = WatershedLoadEngine(
+            *layers,
+            session=_session,
+            result_cache=_session.result_cache if _session is not None else None
+        )
+        _engine.pin_inputs_keys()
+        _engine_key = key
+        _memo = {}
+    return _engine
+
+
+def _on_main_thread():
+    application = QCoreApplication.instance()
+    return application is None or QThread.currentThread() == application.thread()
+
+
+def _transform(source_crs, target_crs):
+    if _session is not None:
+        return _session.transform(source_crs, target_crs)
+    return QgsCoordinateTransform(source_crs, target_crs, QgsProject.instance())
+
+
+def _layer_crs(context):
+    if context is not None and context.hasVariable('layer_crs'):
+        crs = QgsCoordinateReferenceSystem(context.variable('layer_crs'))
+        if crs.isValid():
+            return crs
+    return None
+
+
+@qgsfunction(args=-1, group='DSS', usesgeometry=False, register=False)
+def dss_water_stress(values, feature, parent, context):
+    """
+    Water stress of the basin upstream of a geometry, as calculated by the
+    DSS Watershed tool on its last input layers.
+
+    <h4>Syntax</h4>
+    <p>dss_water_stress(<i>geometry</i>[, <i>metric</i>])</p>
+    <h4>Arguments</h4>
+    <p><i>geometry</i> &rarr; point (or the point on surface of another geometry), in the layer CRS</p>
+    <p><i>metric</i> &rarr; 'ws_total' (default), 'ws_surface' or 'ws_groundwater'</p>
+    <h4>Notes</h4>
+    <p>Only evaluated on the main thread: map rendering, labels and data-defined
+    symbology return an error. Store the value in a field with the field
+    calculator and style on that field instead.</p>
+    <h4>Example</h4>
+    <p>dss_water_stress($geometry, 'ws_surface')</p>
+    """
+    if not values or values[0] is None or values[0].isNull():
+        return None
+    metric = values[1] if len(values) > 1 else 'ws_total'
+    if metric not in WS_METRICS:
+        parent.setEvalErrorString(f"Unknown metric {metric!r}, expected one of {', '.join(WS_METRICS)}.")
+        return None
+    if not _on_main_thread():
+        parent.setEvalErrorString(THREAD_ERROR)
+        return None
+
+    from .dss_watershed_engine import WatershedLoadError
+    try:
+        engine = watershed_engine()
+        point = values[0].pointOnSurface().asPoint()
+        crs = _layer_crs(context)
+        water_bodies_crs = engine.water_bodies_source.crs()
+        if crs is not None and crs != water_bodies_crs:
+            point = _transform(crs, water_bodies_crs).transform(point)
+        basin = engine.basin_key(point)
+        if basin not in _memo:
+            results = engine.calculate(point)
+            _memo[basin] = {name: results[name] for name in WS_METRICS}
+        return _memo[basin][metric]
+    except WatershedLoadError as e:
+        parent.setEvalErrorString(str(e))
+        return None
+
+
+@qgsfunction(args='auto', group='DSS', usesgeometry=False, register=False)
+def dss_upstream_rcodes(rcode, feature, parent):
+    """
+    RCodes of the catchments upstream of a catchment (itself included), in
+    the catchments layer of the DSS Watershed tool.
+
+    <h4>Syntax</h4>
+    <p>dss_upstream_rcodes(<i>rcode</i>)</p>
+    <h4>Notes</h4>
+    <p>Only evaluated on the main thread: map rendering, labels and data-defined
+    symbology return an error. Store the value in a field with the field
+    calculator instead.</p>
+    <h4>Example</h4>
+    <p>array_length(dss_upstream_rcodes("RCode"))</p>
+    """
+    if not _on_main_thread():
+        parent.setEvalErrorString(THREAD_ERROR)
+        return None
+    from .dss_watershed_engine import WatershedLoadError
+    try:
+        engine = watershed_engine()
+    except WatershedLoadError as e:
+        parent.setEvalErrorString(str(e))
+        return None
+    return [code for code, _ in engine.rcode_hierarchy().upstream(rcode)]
+
+
+FUNCTIONS = (dss_water_stress, dss_upstream_rcodes)
+
+
+def register_functions(session):
+    """Registers the DSS expression functions; they use (and keep warm) the session structures."""
+    global _session
+    _session = session
+    for function in FUNCTIONS:
+        if not QgsExpression.isFunctionName(function.name()):
+            QgsExpression.registerFunction(function)
+
+
+def unregister_functions():
+    global _session, _engine, _engine_key, _memo
+    for function in FUNCTIONS:
+        QgsExpression.unregisterFunction(function.name())
+    _session = None
+    _engine = None
+    _engine_key = None
+    _memo = {}
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+
+from qgis.core import QgsFeatureRequest
+
+from . import dss_counters as counters
+
+# Rough footprint of a cached feature (geometry and attributes), for the session budget
+FEATURE_BYTES_ESTIMATE = 1024
+
+
+class FeatureCache:
+    """
+    Fetches features of a layer by id, a whole candidate set per provider
+    request, and keeps the most recently used ones in memory.
+
+    Spatial index queries return candidate ids; fetching them one by one is
+    one provider round trip each (slow on GeoPackage, very slow on PostGIS).
+    `features` fetches all the missing ids of a query in a single
+    setFilterFids request.
+
+    Only use from the thread owning the layer. The cache is bounded to
+    `max_features` (least recently used evicted first); when it lives in the
+    DSSSession it is dropped as soon as the layer is edited.
+    """
+
+    DEFAULT_MAX_FEATURES = 5000
+
+    def __init__(self, layer, attributes=None, max_features=DEFAULT_MAX_FEATURES):
+        """
+        :param layer:        QgsVectorLayer to read.
+        :param attributes:   Names of the attributes to fetch; all when None.
+        :param max_features: Number of features kept in memory.
+        """
+        self.layer = layer
+        self.attributes = list(attributes) if attributes is not None else None
+        self.max_features = max_features
+        self._features = OrderedDict()
+        self.requests = 0
+        self.hits = 0
+        self.misses = 0
+
+    def features(self, fids):
+        """
+        Features with the given ids, in the order of `fids`; ids that do not
+        exist in the layer are skipped.
+        """
+        fids = list(fids)
+        missing = [fid for fid in dict.fromkeys(fids) if fid not in self._features]
+        self.hits += len(fids) - len(missing)
+        self.misses += len(missing)
+
+        fetched = {}
+        if missing:
+            request = QgsFeatureRequest().setFilterFids(missing)
+            if self.attributes is not None:
+                request.setSubsetOfAttributes(self.attributes, self.layer.fields())
+            self.requests += 1
+            fetched = {feature.id(): feature for feature in self.layer.getFeatures(request)}
+            counters.count(counters.FEATURES_FETCHED, len(fetched))
+
+        result = []
+        for fid in fids:
+            feature = fetched.get(fid)
+            if feature is None:
+                feature = self._features.get(fid)
+                if feature is None:
+                    continue
+                self._features.move_to_end(fid)
+            result.append(feature)
+
+        for fid, feature in fetched.items():
+            self._features[fid] = feature
+        while len(self._features) > self.max_features:
+            self._features.popitem(last=False)
+        return result
+
+    def feature(self, fid):
+        """The feature with the given id, or None."""
+        features = self.features([fid])
+        return features[0] if features else None
+
+    def invalidate(self, fids=None):
+        """Forgets the given features, or all of them."""
+        if fids is None:
+            self._features.clear()
+            return
+        for fid in fids:
+            self._features.pop(fid, None)
+
+    def __len__(self):
+        return len(self._features)
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+import math
+
+import numpy as np
+
+from qgis.core import QgsGeometry, QgsWkbTypes
+
+# Simplification tolerance, relative to the diagonal of the filtering geometry
+SIMPLIFY_RATIO = 0.001
+BUFFER_SEGMENTS = 4
+# Points x polygon edges compared at once by the vectorized point test
+POINT_EDGE_BLOCK = 1024 * 1024
+
+
+def _prepared(geometry):
+    """(geometry, prepared GEOS engine) - the engine points into the geometry, which must be kept alive."""
+    engine = QgsGeometry.createGeometryEngine(geometry.constGet())
+    engine.prepareGeometry()
+    return geometry, engine
+
+
+def _rings(geometry):
+    """(n, 2) vertex arrays of every ring of a polygon geometry, or None for other geometries."""
+    if geometry.type() != QgsWkbTypes.PolygonGeometry:
+        return None
+    polygons = geometry.asMultiPolygon() if geometry.isMultipart() else [geometry.asPolygon()]
+    return [
+        np.array([(point.x(), point.y()) for point in ring], dtype=np.float64).reshape(-1, 2)
+        for polygon in polygons for ring in polygon
+    ]
+
+
+def points_in_rings(x, y, rings):
+    """
+    Even-odd (ray casting) point in polygon test of coordinate arrays against
+    the rings of a polygon, holes and parts included. Points on or very near a
+    ring may go either way.
+    """
+    inside = np.zeros(len(x), dtype=bool)
+    if not len(x):
+        return inside
+    px = x[:, None]
+    py = y[:, None]
+    block = max(1, POINT_EDGE_BLOCK // len(x))
+    for ring in rings:
+        edge_count = len(ring) - 1
+        for start in range(0, edge_count, block):
+            end = min(start + block, edge_count)
+            x1 = ring[start:end, 0]
+            y1 = ring[start:end, 1]
+            x2 = ring[start + 1:end + 1, 0]
+            y2 = ring[start + 1:end + 1, 1]
+            # edges crossing the horizontal line through each point, counted right of the point
+            straddles = (y1 > py) != (y2 > py)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                crossing_x = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+            inside ^= np.logical_xor.reduce(straddles & (px < crossing_x), axis=1)
+    return inside
+
+
+class TwoPhaseFilter:
+    """
+    Intersects test against a large polygon (e.g. an upstream union with
+    hundreds of thousands of vertices), with most candidates classified
+    without touching the full-resolution geometry.
+
+    The polygon is simplified with a topology-preserving simplification of
+    tolerance `tol`, then buffered inwards and outwards by 2 * tol. The
+    simplified boundary stays within `tol` of the real one, so a geometry
+    inside the inner buffer is inside the polygon and a geometry not meeting
+    the outer buffer is outside it. Only the geometries in the band between
+    both go to the exact (prepared) predicate, so the results are the same as
+    testing everything exactly.
+    """
+
+    def __init__(self, geometry, tolerance=None):
+        """
+        :param geometry:  Polygon QgsGeometry to test against.
+        :param tolerance: Simplification tolerance in layer units; by default
+                          SIMPLIFY_RATIO of the diagonal of its bounding box.
+        """
+        box = geometry.boundingBox()
+        if tolerance is None:
+            tolerance = math.hypot(box.width(), box.height()) * SIMPLIFY_RATIO
+        self.tolerance = tolerance
+        self.geometry = geometry
+        self._exact = _prepared(geometry)
+        self._inner = None
+        self._outer = None
+        if tolerance > 0:
+            simplified = QgsGeometry(self._exact[1].simplify(tolerance))
+            if not simplified.isEmpty():
+                inner = simplified.buffer(-2 * tolerance, BUFFER_SEGMENTS)
+                outer = simplified.buffer(2 * tolerance, BUFFER_SEGMENTS)
+                self._inner = _prepared(inner) if not inner.isEmpty() else None
+                self._outer = _prepared(outer) if not outer.isEmpty() else None
+
+        self.inside_count = 0
+        self.outside_count = 0
+        self.exact_count = 0
+        # vertex arrays of the inner and outer envelopes, for classify_points
+        self._envelope_rings = None
+
+    def intersects(self, geometry):
+        """Same result as self.geometry.intersects(geometry)."""
+        candidate = geometry.constGet()
+        if self._inner is not None and self._inner[1].contains(candidate):
+            self.inside_count += 1
+            return True
+        if self._outer is not None and not self._outer[1].intersects(candidate):
+            self.outside_count += 1
+            return False
+        self.exact_count += 1
+        return self._exact[1].intersects(candidate)
+
+    def classify_points(self, x, y):
+        """
+        First phase for points given as coordinate arrays, vectorized: a point
+        inside the inner envelope is inside the polygon, a point outside the
+        outer envelope is outside it. A point near an envelope boundary is
+        still at least `tolerance` from the polygon boundary, so the even-odd
+        test needs no exact arithmetic there.
+
+        :return: (inside, band) boolean masks; the band points need
+                 exact_intersects(), the others are outside.
+        """
+        if self._envelope_rings is None:
+            self._envelope_rings = (
+                _rings(self._inner[0]) if self._inner is not None else None,
+                _rings(self._outer[0]) if self._outer is not None else None,
+            )
+        inner_rings, outer_rings = self._envelope_rings
+        inside = points_in_rings(x, y, inner_rings) if inner_rings is not None else np.zeros(len(x), dtype=bool)
+        outside = np.zeros(len(x), dtype=bool)
+        if outer_rings is not None:
+            outside = ~inside & ~points_in_rings(x, y, outer_rings)
+        self.inside_count += int(inside.sum())
+        self.outside_count += int(outside.sum())
+        return inside, ~(inside | outside)
+
+    def exact_intersects(self, geometry):
+        """The full-resolution test, for the band left by classify_points."""
+        self.exact_count += 1
+        return self._exact[1].intersects(geometry.constGet())
+
+    def summary(self):
+        total = self.inside_count + self.outside_count + self.exact_count
+        return f"{self.exact_count} of {total} candidates tested at full precision"
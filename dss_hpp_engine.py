@@ -0,0 +1,470 @@
+# -*- coding: utf-8 -*-
+
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from qgis.core import (
+    Qgis,
+    QgsCoordinateTransform,
+    QgsFeatureRequest,
+    QgsGeometry,
+    QgsProject,
+    QgsSpatialIndex,
+    QgsVectorLayerFeatureSource,
+    QgsWkbTypes
+)
+
+from . import dss_counters as counters
+from .dss_diagnostics import RunDiagnostics
+from .dss_linear_referencing import LinearReferencingCache
+from .dss_nearest import nearest_feature
+from .dss_rcode import is_upstream_rcode
+
+CATCHMENT_ID_FIELD = 'RCode'
+
+
+def normalize_code(code_value):
+    """Normalizes an abstraction/discharge code (numeric codes become int)."""
+    code_str = str(code_value).strip()
+    try:
+        return int(code_str)
+    except ValueError:
+        return code_str
+
+
+class HPPPairResult:
+    """Segments and diagnostics computed for one abstraction feature."""
+
+    __slots__ = ('code', 'segments', 'diagnostics')
+
+    def __init__(self, code):
+        self.code = code
+        self.segments = []
+        self.diagnostics = RunDiagnostics("HPP Load")
+
+
+class HPPSegmentEngine:
+    """
+    Computes the river segments loaded by HPPs, i.e. the river stretches
+    between each abstraction point and its discharge point(s) with the same code.
+
+    Everything that is shared between abstraction codes (the discharge code
+    dictionary, the river and catchment spatial indexes, the linear-referencing
+    cache) is built once on the calling thread. The per-code work then only
+    reads from them, so it can be spread over a thread pool: every worker gets
+    its own QgsVectorLayerFeatureSource for rivers and catchments and its own
+    coordinate transforms, and the heavy GEOS calls run outside Python.
+
+    Results are collected per abstraction feature and merged in the order of
+    the abstraction layer, so a parallel run produces exactly the same segments
+    (and diagnostics) as a serial one.
+    """
+
+    def __init__(
+        self,
+        rivers_layer,
+        abstraction_layer,
+        discharge_layer,
+        catchments_layer,
+        abstraction_code_field='N_Jrar',
+        discharge_code_field='N_Jrher',
+        session=None
+    ):
+        self.rivers_layer = rivers_layer
+        self.abstraction_layer = abstraction_layer
+        self.discharge_layer = discharge_layer
+        self.catchments_layer = catchments_layer
+        self.abstraction_code_field = abstraction_code_field
+        self.discharge_code_field = discharge_code_field
+        self.session = session
+
+        self.discharge_code_dict = {}
+        self.river_index = None
+        self.catchment_index = None
+        self.lr_cache = LinearReferencingCache()
+        self._local = threading.local()
+        self._sources = queue.Queue()
+
+    # ------------------------------------------------------------------ setup
+
+    def prepare(self):
+        """Builds the shared, read-only lookup structures (main thread)."""
+        self.build_discharge_dict()
+
+        if self.session is not None:
+            # shared with the other tools, and kept until the layers change
+            self.river_index = self.session.spatial_index(self.rivers_layer)
+            self.catchment_index = self.session.spatial_index(self.catchments_layer)
+        else:
+            counters.count(counters.SPATIAL_INDEX_BUILDS, 2)
+            counters.count(counters.FULL_LAYER_SCANS, 2)
+            self.river_index = QgsSpatialIndex(self.rivers_layer.getFeatures())
+            self.catchment_index = QgsSpatialIndex(self.catchments_layer.getFeatures())
+
+        self._rivers_crs = self.rivers_layer.crs()
+        self._abstraction_crs = self.abstraction_layer.crs()
+        self._discharge_crs = self.discharge_layer.crs()
+        self._transform_context = QgsProject.instance().transformContext()
+
+    def build_discharge_dict(self):
+        """(Re)builds the discharge code dict from the discharge layer, edit buffer included."""
+        # Handles multiple codes in one field, e.g. "124,176"
+        counters.count(counters.FULL_LAYER_SCANS)
+        self.discharge_code_dict = {}
+        for feat in self.discharge_layer.getFeatures():
+            for code_val_norm in self.discharge_codes(feat):
+                self.discharge_code_dict.setdefault(code_val_norm, []).append(feat)
+
+    def discharge_codes(self, discharge_feat):
+        """Normalized abstraction codes served by a discharge feature."""
+        raw_code_val = discharge_feat[self.discharge_code_field]
+        return [normalize_code(single_code_str.strip()) for single_code_str in str(raw_code_val).split(",")]
+
+    def _worker(self):
+        """Returns the feature sources and transforms owned by the current thread."""
+        worker = getattr(self._local, 'worker', None)
+        if worker is None:
+            rivers_source, catchments_source = self._sources.get_nowait()
+            worker = {
+                'rivers': rivers_source,
+                'catchments': catchments_source,
+                'abstraction_xform': self._make_transform(self._abstraction_crs),
+                'discharge_xform': self._make_transform(self._discharge_crs),
+            }
+            self._local.worker = worker
+        return worker
+
+    def _make_transform(self, source_crs):
+        if source_crs == self._rivers_crs:
+            return None
+        return QgsCoordinateTransform(source_crs, self._rivers_crs, self._transform_context)
+
+    # ------------------------------------------------------------------- run
+
+    def run(self, max_workers=None, diagnostics=None, abstraction_features=None):
+        """
+        Processes every abstraction feature.
+
+        :param max_workers:          Number of worker threads; 1 runs serially on the
+                                     calling thread, None uses all available cores.
+        :param diagnostics:          RunDiagnostics receiving the merged diagnostics.
+        :param abstraction_features: Optional subset of abstraction features to process
+                                     (e.g. the ones whose code changed); all by default.
+        :return:                     List of (abstraction code, segment QgsGeometry) in
+                                     abstraction layer order.
+        """
+        abstraction_features, max_workers = self.start_run(max_workers, abstraction_features)
+        segments = []
+        for result in self.process(abstraction_features, max_workers):
+            segments.extend((result.code, geom) for geom in result.segments)
+            if diagnostics is not None:
+                diagnostics.extend(result.diagnostics)
+        return segments
+
+    def start_run(self, max_workers=None, abstraction_features=None):
+        """
+        Main-thread part of a run: prepares the shared structures, reads the
+        abstraction features and creates one pair of feature sources per worker.
+
+        :return: (abstraction features, number of workers) to pass to process().
+        """
+        if self.river_index is None:
+            self.prepare()
+
+        if abstraction_features is None:
+            counters.count(counters.FULL_LAYER_SCANS)
+            abstraction_features = list(self.abstraction_layer.getFeatures())
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        max_workers = max(1, min(max_workers, len(abstraction_features)))
+
+        # Feature sources must be created on the thread owning the layers;
+        # each worker thread takes one pair on its first task.
+        self._local = threading.local()
+        self._sources = queue.Queue()
+        for _ in range(max_workers):
+            self._sources.put((
+                QgsVectorLayerFeatureSource(self.rivers_layer),
+                QgsVectorLayerFeatureSource(self.catchments_layer)
+            ))
+        return abstraction_features, max_workers
+
+    def process(self, abstraction_features, max_workers, is_canceled=None):
+        """
+        Yields the HPPPairResult of every abstraction feature, in abstraction
+        layer order. Only reads the layers through the feature sources made
+        by start_run(), so it can run on any thread (e.g. in a QgsTask).
+
+        :param is_canceled: Callable returning True to stop; the features not
+                            started yet are then skipped (no result yielded).
+        """
+        if max_workers == 1:
+            for abs_feat in abstraction_features:
+                if is_canceled is not None and is_canceled():
+                    return
+                yield self.process_abstraction(abs_feat)
+            return
+
+        def process_unless_canceled(abs_feat):
+            if is_canceled is not None and is_canceled():
+                return None
+            return self.process_abstraction(abs_feat)
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='dss-hpp') as executor:
+            # map() yields in submission order, which keeps the merge deterministic
+            for result in executor.map(process_unless_canceled, abstraction_features):
+                if result is None:
+                    return
+                yield result
+
+    def process_abstraction(self, abs_feat):
+        """Computes the loaded segments for a single abstraction feature."""
+        abstraction_code_val = abs_feat[self.abstraction_code_field]
+        abstraction_code_val_norm = normalize_code(abstraction_code_val)
+        result = HPPPairResult(abstraction_code_val)
+        diagnostics = result.diagnostics
+
+        if abstraction_code_val_norm not in self.discharge_code_dict:
+            diagnostics.add(
+                "no_discharge",
+                f"Found no discharge points for abstraction code {abstraction_code_val}.",
+                Qgis.Warning,
+                abstraction_code_val
+            )
+            return result
+
+        matching_discharge_feats = self.discharge_code_dict[abstraction_code_val_norm]
+        if len(matching_discharge_feats) != 1:
+            # More than 1 discharge
+            diagnostics.add(
+                "multiple_discharges",
+                f"Found {len(matching_discharge_feats)} discharge points for abstraction code {abstraction_code_val}. Skipping.",
+                Qgis.Warning,
+                abstraction_code_val
+            )
+            return result
+
+        abs_geom = abs_feat.geometry()
+        if not abs_geom or abs_geom.isEmpty():
+            diagnostics.add(
+                "no_abstraction_geometry",
+                f"No abstraction point found for code {abstraction_code_val}.",
+                Qgis.Warning,
+                abstraction_code_val
+            )
+            return result
+
+        discharge_geom = matching_discharge_feats[0].geometry()
+        if not discharge_geom or discharge_geom.isEmpty():
+            diagnostics.add(
+                "no_discharge_geometry",
+                f"No discharge point found for code {abstraction_code_val}.",
+                Qgis.Warning,
+                abstraction_code_val
+            )
+            return result
+
+        worker = self._worker()
+        abs_point = self._transform_point(worker['abstraction_xform'], abs_geom.asPoint())
+        discharge_point = self._transform_point(worker['discharge_xform'], discharge_geom.asPoint())
+
+        nearest_river_abs = self.nearest_river(abs_point)
+        nearest_river_dis = self.nearest_river(discharge_point)
+
+        if not nearest_river_abs or not nearest_river_dis:
+            diagnostics.add(
+                "no_nearest_river",
+                f"Abstraction code {abstraction_code_val}: could not find nearest river for abstraction or discharge.",
+                Qgis.Warning,
+                abstraction_code_val
+            )
+            return result
+
+        if nearest_river_abs.id() == nearest_river_dis.id():
+            diagnostics.add(
+                "same_river",
+                f"Abstraction code {abstraction_code_val} uses the same river feature for both points.",
+                Qgis.Info,
+                abstraction_code_val
+            )
+            sub_geom = self.lr_cache.substring_between(nearest_river_abs, abs_point, discharge_point)
+            if sub_geom and not sub_geom.isEmpty():
+                result.segments.append(sub_geom)
+            return result
+
+        diagnostics.add(
+            "different_rivers",
+            f"Abstraction code {abstraction_code_val} has different river features: "
+            f"{nearest_river_abs.id()} vs {nearest_river_dis.id()}",
+            Qgis.Info,
+            abstraction_code_val
+        )
+        self._process_confluence(result, abs_point, discharge_point, nearest_river_abs, nearest_river_dis)
+        return result
+
+    def _process_confluence(self, result, abs_point, discharge_point, nearest_river_abs, nearest_river_dis):
+        """Abstraction and discharge on different rivers X and Y: cut both at their confluence."""
+        diagnostics = result.diagnostics
+        abstraction_code_val = result.code
+
+        # 1) Find intersection (the confluence or shared segment)
+        engine = QgsGeometry.createGeometryEngine(nearest_river_abs.geometry().constGet())
+        intersection = engine.intersection(nearest_river_dis.geometry().constGet())
+        intersection_geom = QgsGeometry(intersection) if intersection else QgsGeometry()
+
+        if intersection_geom.isEmpty():
+            diagnostics.add(
+                "no_confluence",
+                f"No intersection found between river {nearest_river_abs.id()} and "
+                f"river {nearest_river_dis.id()}. Cannot extract sub-segment.",
+                Qgis.Warning,
+                abstraction_code_val
+            )
+            return
+
+        # If it’s a line or multi-line, that implies they share a segment.
+        # For a typical confluence, we expect a Point or MultiPoint.
+        if intersection_geom.wkbType() not in (QgsWkbTypes.Point, QgsWkbTypes.MultiPoint):
+            diagnostics.add(
+                "shared_segment",
+                "River X and Y share a line or polygon intersection (not a simple point). Handling not implemented.",
+                Qgis.Warning,
+                abstraction_code_val
+            )
+            return
+
+        if intersection_geom.isMultipart():
+            points = intersection_geom.asMultiPoint()
+            if not points:
+                diagnostics.add(
+                    "empty_confluence",
+                    "Intersection is multipoint but empty. Skipping.",
+                    Qgis.Warning,
+                    abstraction_code_val
+                )
+                return
+            confluence_point = points[0]  # first intersection
+        else:
+            confluence_point = intersection_geom.asPoint()
+
+        # 2) Sub-segment of river X from the abstraction point to the confluence
+        sub_geom = self.lr_cache.substring_between(nearest_river_abs, abs_point, confluence_point)
+        if not sub_geom or sub_geom.isEmpty():
+            diagnostics.add(
+                "substring_failed",
+                "Could not extract sub-segment from River X to confluence. Possibly off-geometry or multi-part intersection.",
+                Qgis.Warning,
+                abstraction_code_val
+            )
+            return
+        result.segments.append(sub_geom)
+
+        # 3) Find which catchment(s) contain the abstraction and the discharge point
+        abstraction_catchments = self.intersecting_catchments(QgsGeometry.fromPointXY(abs_point))
+        discharge_catchments = self.intersecting_catchments(QgsGeometry.fromPointXY(discharge_point))
+
+        if not abstraction_catchments:
+            diagnostics.add(
+                "no_abstraction_catchment",
+                f"No catchment found for abstraction point of code {abstraction_code_val}.",
+                Qgis.Warning,
+                abstraction_code_val
+            )
+        if not discharge_catchments:
+            diagnostics.add(
+                "no_discharge_catchment",
+                f"No catchment found for discharge point of code {abstraction_code_val}.",
+                Qgis.Warning,
+                abstraction_code_val
+            )
+        if not abstraction_catchments or not discharge_catchments:
+            # Can't do flow check
+            return
+
+        # 4) Check if the abstraction's catchment flows into the discharge's catchment
+        abs_catchment_feat = abstraction_catchments[0]
+        dis_catchment_feat = discharge_catchments[0]
+        if not is_upstream_rcode(abs_catchment_feat[CATCHMENT_ID_FIELD], dis_catchment_feat[CATCHMENT_ID_FIELD]):
+            diagnostics.add(
+                "not_upstream",
+                f"Catchment of code {abstraction_code_val} does NOT flow into discharge catchment. Skipping segment.",
+                Qgis.Info,
+                abstraction_code_val
+            )
+            return
+
+        # 5) If yes, we add the sub-segment on river Y from confluence to discharge
+        if not self.lr_cache.parts(nearest_river_dis):
+            diagnostics.add(
+                "locate_failed",
+                f"River Y (ID={nearest_river_dis.id()}) has no line parts to locate points on.",
+                Qgis.Warning,
+                abstraction_code_val
+            )
+            return
+
+        sub_geom_y = self.lr_cache.substring_between(nearest_river_dis, confluence_point, discharge_point)
+        if sub_geom_y and not sub_geom_y.isEmpty():
+            result.segments.append(sub_geom_y)
+        else:
+            diagnostics.add(
+                "substring_failed",
+                f"Could not extract sub-segment on River Y (ID={nearest_river_dis.id()})",
+                Qgis.Warning,
+                abstraction_code_val
+            )
+
+    # ---------------------------------------------------------------- lookups
+
+    def _transform_point(self, xform, point):
+        return xform.transform(point) if xform is not None else point
+
+    def nearest_river(self, point, batch_size=8):
+        """
+        Finds the nearest river feature to `point` (in the rivers CRS) by
+        geometry distance (exact best-first search over the river index).
+        """
+        source = self._worker()['rivers']
+
+        def fetch(fids):
+            if not fids:
+                return []
+            by_id = {feat.id(): feat for feat in source.getFeatures(QgsFeatureRequest().setFilterFids(fids))}
+            counters.count(counters.FEATURES_FETCHED, len(by_id))
+            return [by_id[fid] for fid in fids if fid in by_id]
+
+        feature, _ = nearest_feature(self.river_index, point, fetch, batch_size)
+        return feature
+
+    def intersecting_catchments(self, geometry):
+        """Catchment features intersecting `geometry`, in provider order."""
+        candidate_ids = self.catchment_index.intersects(geometry.boundingBox())
+        request = QgsFeatureRequest().setFilterFids(candidate_ids)
+        features = list(self._worker()['catchments'].getFeatures(request))
+        counters.count(counters.FEATURES_FETCHED, len(features))
+        counters.count(counters.EXACT_PREDICATES, len(features))
+        return [feature for feature in features if feature.geometry().intersects(geometry)]
+
+    def rivers_touched_by(self, geometries):
+        """Ids of the river features whose bounding box meets any of `geometries`."""
+        river_ids = set()
+        for geometry in geometries:
+            river_ids.update(self.river_index.intersects(geometry.boundingBox()))
+        return river_ids
+
+
+def coverage_percent(river_geom, segments_geom):
+    """
+    Percentage of the river length covered by the (unified) HPP segments,
+    or None for rivers without a meaningful length.
+    """
+    if not river_geom or river_geom.isEmpty():
+        return None
+    river_length = river_geom.length()
+    if river_length <= 0:
+        return None
+    intersection_geom = river_geom.intersection(segments_geom)
+    covered_length = intersection_geom.length() if intersection_geom else 0.0
+    return covered_length / river_length * 100.0
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+
+from qgis.PyQt.QtCore import QObject, QTimer, pyqtSignal
+from qgis.core import (
+    Qgis,
+    QgsFeature,
+    QgsFeatureRequest,
+    QgsGeometry,
+    QgsMessageLog,
+    QgsSpatialIndex
+)
+
+from .dss_diagnostics import RunDiagnostics
+from .dss_hpp_engine import coverage_percent, normalize_code
+
+MESSAGE_CATEGORY = 'Messages'
+
+
+class HPPLiveUpdater(QObject):
+    """
+    Keeps the output of an HPP load run up to date while the HPP registry
+    is being edited.
+
+    It listens to the edit signals of the abstraction and discharge layers,
+    collects the abstraction codes touched by the edits (old and new codes)
+    and, after a short debounce, recomputes only the segments of these codes.
+    Only the rivers met by the removed or added segments get their coverage
+    recomputed, and both output layers are patched in place.
+    """
+
+    # number of recomputed codes, number of rivers whose coverage was updated
+    updated = pyqtSignal(int, int)
+
+    DEBOUNCE_MS = 500
+
+    def __init__(
+        self,
+        engine,
+        segments_layer,
+        segment_ids_by_code,
+        coverage_layer,
+        coverage_ids_by_river,
+        coverage_field_name,
+        max_workers=None,
+        verbose=False,
+        parent=None
+    ):
+        """
+        :param engine:                Prepared HPPSegmentEngine of the full run.
+        :param segments_layer:        "HPP Load Segments" memory layer.
+        :param segment_ids_by_code:   Normalized abstraction code -> segment feature ids.
+        :param coverage_layer:        "RiversCoverage" memory layer.
+        :param coverage_ids_by_river: River feature id -> coverage feature id.
+        :param coverage_field_name:   Name of the coverage percentage field.
+        """
+        super().__init__(parent)
+        self.engine = engine
+        self.segments_layer = segments_layer
+        self.segment_ids_by_code = segment_ids_by_code
+        self.coverage_layer = coverage_layer
+        self.coverage_ids_by_river = coverage_ids_by_river
+        self.coverage_field_index = coverage_layer.fields().indexOf(coverage_field_name)
+        self.max_workers = max_workers
+        self.verbose = verbose
+
+        self.abstraction_layer = engine.abstraction_layer
+        self.discharge_layer = engine.discharge_layer
+        self._abstraction_codes = {}   # abstraction fid -> normalized code
+        self._discharge_codes = {}     # discharge fid -> list of normalized codes
+        self._dirty_codes = set()
+        self._discharges_dirty = False
+        self._segment_index = None
+        self._connections = []
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(self.DEBOUNCE_MS)
+        self._timer.timeout.connect(self.flush)
+
+    # ------------------------------------------------------------ subscribing
+
+    def start(self):
+        self._sync_code_maps()
+        self._segment_index = QgsSpatialIndex(self.segments_layer.getFeatures())
+
+        for layer, handlers in (
+            (self.abstraction_layer, (
+                self._abstraction_added, self._abstraction_deleted,
+                self._abstraction_attribute_changed, self._abstraction_geometry_changed
+            )),
+            (self.discharge_layer, (
+                self._discharge_added, self._discharge_deleted,
+                self._discharge_attribute_changed, self._discharge_geometry_changed
+            )),
+        ):
+            added, deleted, attribute_changed, geometry_changed = handlers
+            self._connect(layer.featureAdded, added)
+            self._connect(layer.featureDeleted, deleted)
+            self._connect(layer.attributeValueChanged, attribute_changed)
+            self._connect(layer.geometryChanged, geometry_changed)
+            # committing may renumber the features added in the edit buffer
+            self._connect(layer.afterCommitChanges, self._sync_code_maps)
+
+    def stop(self):
+        self._timer.stop()
+        for signal, slot in self._connections:
+            try:
+                signal.disconnect(slot)
+            except TypeError:
+                # the layer was already removed
+                pass
+        self._connections = []
+
+    def _connect(self, signal, slot):
+        signal.connect(slot)
+        self._connections.append((signal, slot))
+
+    def _sync_code_maps(self):
+        """Reads the code of every abstraction and discharge feature (attributes only)."""
+        request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes([self.engine.abstraction_code_field], self.abstraction_layer.fields())
+        self._abstraction_codes = {
+            feat.id(): normalize_code(feat[self.engine.abstraction_code_field])
+            for feat in self.abstraction_layer.getFeatures(request)
+        }
+
+        request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes([self.engine.discharge_code_field], self.discharge_layer.fields())
+        self._discharge_codes = {
+            feat.id(): self.engine.discharge_codes(feat)
+            for feat in self.discharge_layer.getFeatures(request)
+        }
+
+    def _mark_dirty(self, codes, discharges=False):
+        self._dirty_codes.update(codes)
+        self._discharges_dirty = self._discharges_dirty or discharges
+        self._timer.start()
+
+    # ---------------------------------------------------- abstraction edits
+
+    def _abstraction_code_of(self, fid):
+        feat = self.abstraction_layer.getFeature(fid)
+        return normalize_code(feat[self.engine.abstraction_code_field]) if feat.isValid() else None
+
+    def _abstraction_added(self, fid):
+        code = self._abstraction_code_of(fid)
+        self._abstraction_codes[fid] = code
+        self._mark_dirty([code])
+
+    def _abstraction_deleted(self, fid):
+        self._mark_dirty([self._abstraction_codes.pop(fid, None)])
+
+    def _abstraction_attribute_changed(self, fid, field_index, value):
+        if self.abstraction_layer.fields().at(field_index).name() != self.engine.abstraction_code_field:
+            return
+        old_code = self._abstraction_codes.get(fid)
+        new_code = normalize_code(value)
+        self._abstraction_codes[fid] = new_code
+        self._mark_dirty([old_code, new_code])
+
+    def _abstraction_geometry_changed(self, fid, geometry):
+        self._mark_dirty([self._abstraction_codes.get(fid)])
+
+    # ------------------------------------------------------ discharge edits
+
+    def _discharge_codes_of(self, fid):
+        feat = self.discharge_layer.getFeature(fid)
+        return self.engine.discharge_codes(feat) if feat.isValid() else []
+
+    def _discharge_added(self, fid):
+        codes = self._discharge_codes_of(fid)
+        self._discharge_codes[fid] = codes
+        self._mark_dirty(codes, discharges=True)
+
+    def _discharge_deleted(self, fid):
+        self._mark_dirty(self._discharge_codes.pop(fid, []), discharges=True)
+
+    def _discharge_attribute_changed(self, fid, field_index, value):
+        if self.discharge_layer.fields().at(field_index).name() != self.engine.discharge_code_field:
+            return
+        old_codes = self._discharge_codes.get(fid, [])
+        new_codes = self._discharge_codes_of(fid)
+        self._discharge_codes[fid] = new_codes
+        self._mark_dirty(old_codes + new_codes, discharges=True)
+
+    def _discharge_geometry_changed(self, fid, geometry):
+        self._mark_dirty(self._discharge_codes.get(fid, []), discharges=True)
+
+    # ------------------------------------------------------- recomputation
+
+    def flush(self):
+        """Recomputes the segments of the dirty codes and patches both output layers."""
+        codes = self._dirty_codes - {None}
+        self._dirty_codes = set()
+        if self._discharges_dirty:
+            self.engine.build_discharge_dict()
+            self._discharges_dirty = False
+        if not codes:
+            return
+
+        # 1) Remove the old segments of these codes
+        dp_segments = self.segments_layer.dataProvider()
+        old_ids = [fid for code in codes for fid in self.segment_ids_by_code.pop(code, [])]
+        old_geometries = []
+        if old_ids:
+            for feat in self.segments_layer.getFeatures(QgsFeatureRequest().setFilterFids(old_ids)):
+                old_geometries.append(feat.geometry())
+                self._segment_index.deleteFeature(feat)
+            dp_segments.deleteFeatures(old_ids)
+
+        # 2) Recompute the segments of the abstraction features carrying these codes
+        fids = [fid for fid, code in self._abstraction_codes.items() if code in codes]
+        abstraction_features = list(self.abstraction_layer.getFeatures(QgsFeatureRequest().setFilterFids(fids))) if fids else []
+        diagnostics = RunDiagnostics("HPP Load (live)", verbose=self.verbose)
+        segments = self.engine.run(
+            max_workers=self.max_workers,
+            diagnostics=diagnostics,
+            abstraction_features=abstraction_features
+        )
+
+        new_feats = []
+        for abstraction_code_val, sub_geom in segments:
+            new_feat = QgsFeature(self.segments_layer.fields())
+            new_feat.setGeometry(sub_geom)
+            new_feat.setAttribute(new_feat.fieldNameIndex("AbstrCode"), str(abstraction_code_val))
+            new_feats.append(new_feat)
+        _, added_feats = dp_segments.addFeatures(new_feats)
+        for (abstraction_code_val, _), feat in zip(segments, added_feats):
+            self.segment_ids_by_code.setdefault(normalize_code(abstraction_code_val), []).append(feat.id())
+            self._segment_index.addFeature(feat)
+
+        # 3) Update the coverage of the rivers met by the old or the new segments only
+        touched_rivers = self.engine.rivers_touched_by(old_geometries + [geom for _, geom in segments])
+        self._update_coverage(touched_rivers)
+
+        self.segments_layer.updateExtents()
+        self.segments_layer.triggerRepaint()
+        self.coverage_layer.triggerRepaint()
+
+        QgsMessageLog.logMessage(
+            f"HPP live update: {len(codes)} codes recomputed, {len(touched_rivers)} rivers updated. "
+            + diagnostics.summary(),
+            MESSAGE_CATEGORY,
+            Qgis.Info
+        )
+        self.updated.emit(len(codes), len(touched_rivers))
+
+    def _update_coverage(self, river_ids):
+        """Recomputes CoveragePct of the given rivers from the segments around them."""
+        patch_coverage(
+            self.engine.rivers_layer,
+            river_ids,
+            self.segments_layer,
+            self._segment_index,
+            self.coverage_layer,
+            self.coverage_ids_by_river,
+            self.coverage_field_index
+        )
+
+
+def patch_coverage(rivers_layer, river_ids, segments_layer, segment_index, coverage_layer,
+                   coverage_ids_by_river, coverage_field_index):
+    """
+    Recomputes the coverage of the given rivers from the segments around
+    them (found with `segment_index`, a spatial index of `segments_layer`)
+    and writes it to their features of `coverage_layer`.
+    """
+    river_ids = [river_id for river_id in river_ids if river_id in coverage_ids_by_river]
+    if not river_ids:
+        return
+
+    changes = {}
+    rivers_request = QgsFeatureRequest().setFilterFids(river_ids)
+    for river_feat in rivers_layer.getFeatures(rivers_request):
+        river_geom = river_feat.geometry()
+        # Only the segments near this river can cover it
+        segment_ids = segment_index.intersects(river_geom.boundingBox())
+        segment_geometries = [
+            feat.geometry() for feat in
+            segments_layer.getFeatures(QgsFeatureRequest().setFilterFids(segment_ids))
+        ] if segment_ids else []
+        if segment_geometries:
+            coverage_pct = coverage_percent(river_geom, QgsGeometry.unaryUnion(segment_geometries))
+        else:
+            coverage_pct = 0.0
+        if coverage_pct is None:
+            continue
+        changes[coverage_ids_by_river[river_feat.id()]] = {coverage_field_index: coverage_pct}
+
+    coverage_layer.dataProvider().changeAttributeValues(changes)
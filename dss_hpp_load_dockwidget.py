@@ -1,15 +1,10 @@
 # -*- coding: utf-8 -*-
 import os
-import sys
-import traceback
-from qgis.PyQt import QtWidgets, uic, QtGui
-from qgis.PyQt.QtCore import pyqtSignal, QVariant, Qt
+import sqlite3
+from qgis.PyQt import QtWidgets
+from qgis.PyQt.QtCore import pyqtSignal, QVariant
 from qgis.PyQt.QtWidgets import QMessageBox
 from qgis.core import (
-    QgsPointXY,
-    QgsSpatialIndex,
-    QgsFeatureRequest,
-    QgsCoordinateTransform,
     QgsProject,
     QgsGeometry,
     QgsFeature,
@@ -18,85 +13,74 @@ from qgis.core import (
     Qgis,
     QgsMessageLog,
     QgsField,
-    QgsGraduatedSymbolRenderer, 
-    QgsRendererRange, 
-    QgsSymbol,
-    QgsFillSymbol,
-    QgsLinePatternFillSymbolLayer,
-    QgsLineSymbol,
-    QgsSimpleLineSymbolLayer,
-    QgsUnitTypes,
     QgsRenderContext,
-    QgsCurve,
     QgsFields
 )
-from qgis.gui import QgsMapToolEmitPoint
-from PyQt5.QtGui import QColor
-
-FORM_CLASS, _ = uic.loadUiType(os.path.join(os.path.dirname(__file__), 'dss_hpp_load_dockwidget_base.ui'))
+from qgis.PyQt.QtGui import QColor
+from .dss_diagnostics import RunDiagnostics
+from .dss_hpp_engine import HPPSegmentEngine, coverage_percent, normalize_code
+from .dss_hpp_live import HPPLiveUpdater
+from .dss_hpp_progress import ProgressiveHPPRun
+from .dss_prewarm import SessionPrewarmer
+from .dss_profiling import profile_run, show_report
+from .dss_rendering import COVERAGE_CLASSES, COVERAGE_STYLE, style_layer
+from .dss_run_history import HPP_KIND, HPP_TOOL, hpp_run_values, inputs_description
+from .dss_utils import enable_remote_debugging, load_form_class
+
+FORM_CLASS = load_form_class('dss_hpp_load_dockwidget_base.ui')
 
 MESSAGE_CATEGORY = 'Messages'
 
-def enable_remote_debugging():
-    try:
-        import ptvsd
-        QgsMessageLog.logMessage("ptvsd imported successfully!", MESSAGE_CATEGORY, Qgis.Info)
-        if ptvsd.is_attached():
-            QgsMessageLog.logMessage("Remote Debug for Visual Studio is already active", MESSAGE_CATEGORY, Qgis.Info)
-            return
-        ptvsd.enable_attach(address=('localhost', 5678))
-        QgsMessageLog.logMessage("Attached remote Debug for Visual Studio", MESSAGE_CATEGORY, Qgis.Info)
-    except Exception as e:
-        exc_type, exc_value, exc_traceback = sys.exc_info()
-        format_exception = traceback.format_exception(exc_type, exc_value, exc_traceback)
-        QgsMessageLog.logMessage(str(e), MESSAGE_CATEGORY, Qgis.Critical)        
-        QgsMessageLog.logMessage(repr(format_exception[0]), MESSAGE_CATEGORY, Qgis.Critical)
-        QgsMessageLog.logMessage(repr(format_exception[1]), MESSAGE_CATEGORY, Qgis.Critical)
-        QgsMessageLog.logMessage(repr(format_exception[2]), MESSAGE_CATEGORY, Qgis.Critical)
-
 
 class HPPLoadDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
     closingPlugin = pyqtSignal()
 
-    def __init__(self, iface, parent=None):
-        """Constructor."""
+    def __init__(self, iface, parent=None, session=None):
+        """Constructor.
+
+        :param session: DSSSession shared by the DSS tools (indexes, lookups, transforms).
+        """
         enable_remote_debugging()
         super().__init__(parent)
         self.setupUi(self)
         self.iface = iface
+        self.session = session
         self.btnCalculate.clicked.connect(self.calculate_hpp_load)
+        self.btnExportDiagnostics.clicked.connect(self.export_diagnostics)
+        self.diagnostics = None
+        self.spinWorkers.setMaximum(max(1, os.cpu_count() or 1))
+        self.spinWorkers.setValue(max(1, os.cpu_count() or 1))
+        self.chkLiveUpdate.toggled.connect(self.toggle_live_update)
+        self.hpp_engine = None
+        self.hpp_segments_layer = None
+        self.coverage_layer = None
+        self.coverage_ids_by_river = {}
+        self.live_updater = None
+        self.progressive_run = None
+        self.btnStop.clicked.connect(self.stop_calculation)
+        self.btnStop.setEnabled(False)
+
+        # Build the river and catchment indexes as soon as the layers are chosen
+        self.prewarmer = None
+        if self.session is not None:
+            self.prewarmer = SessionPrewarmer(self.session, self)
+            self.prewarmer.readinessChanged.connect(self.lblReadiness.setText)
+            self.prewarmer.watch(self.cmbRivers)
+            self.prewarmer.watch(self.cmbCatchments)
+
+    def showEvent(self, event):
+        if self.prewarmer:
+            self.prewarmer.schedule()
+        super().showEvent(event)
 
     def closeEvent(self, event):
+        if self.prewarmer:
+            self.prewarmer.stop()
+        self.stop_live_update()
+        self.stop_calculation()
         self.closingPlugin.emit()
         event.accept()
         
-    def select_catchment_features_by_id(self, layer, id_field, value_given):
-        selected_features = []
-        value_given_str = str(value_given)
-        try:
-            value_given_num = int(value_given_str)
-        except:
-            return selected_features
-
-        for feature in layer.getFeatures():
-            id_value = feature[id_field]
-            if id_value is None:
-                continue
-            id_value_str = str(id_value)
-            try:
-                id_value_num = int(id_value_str)
-            except:
-                continue
-
-            if len(id_value_str) == len(value_given_str):
-                if id_value_str[:-2] == value_given_str[:-2] and id_value_num >= value_given_num:
-                    selected_features.append(feature)
-            else:
-                id_value_subset = id_value_str[:len(value_given_str)]
-                if id_value_subset[:-2] == value_given_str[:-2] and int(id_value_subset) >= value_given_num:
-                    selected_features.append(feature)
-        return selected_features
-
     def calculate_hpp_load(self):
         """
         Calculates HPP load on rivers by matching abstraction and discharge points
@@ -119,9 +103,13 @@ class HPPLoadDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
             return
         
         catchments_layer = self.cmbCatchments.currentLayer()
-        if not self._validate_layer(hpp_discharge_layer, "ERICA Catchments"):
+        if not self._validate_layer(catchments_layer, "ERICA Catchments"):
             return
 
+        # A new full run replaces the layers the live updater was patching
+        self.stop_live_update()
+        self.coverage_layer = None
+
         # 2. Hardcode or get from UI
         water_abstraction_code_field_name = 'N_Jrar'
         water_discharge_code_field_name = 'N_Jrher'
@@ -147,29 +135,6 @@ class HPPLoadDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
             return
         
 
-        # Helper to normalize code
-        def normalize_code(code_value):
-            code_str = str(code_value).strip()
-            try:
-                return int(code_str)
-            except ValueError:
-                return code_str
-
-        # 4. Build discharge code dict (handling multiple codes in one field)
-        discharge_code_dict = {}
-        for feat in hpp_discharge_layer.getFeatures():
-            # This might be "123" or "124,176" or "12 , 13 , 14", etc.
-            raw_code_val = feat[water_discharge_code_field_name]
-            # Split by comma
-            split_codes = str(raw_code_val).split(",")  # e.g. ["124", "176"]
-            for single_code_str in split_codes:
-                # Trim whitespace
-                single_code_str = single_code_str.strip()
-                # Normalize (convert numeric if possible)
-                code_val_norm = normalize_code(single_code_str)
-                # Store the feature in the dict under this code
-                discharge_code_dict.setdefault(code_val_norm, []).append(feat)
-
         # >>> ADDED FOR SUB-SEGMENT EXTRACTION AND MEMORY LAYER <<<
 
         # Create an in‐memory layer for all extracted sub‐segments (only once).
@@ -206,340 +171,49 @@ class HPPLoadDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
 
         # >>> END OF MEMORY LAYER SETUP <<<
 
-        # 5. Loop through each abstraction feature
-        for abs_feat in hpp_abstraction_layer.getFeatures():
-            abstraction_code_val = abs_feat[water_abstraction_code_field_name]
-            abstraction_code_val_norm = normalize_code(abstraction_code_val)
-
-            if abstraction_code_val_norm not in discharge_code_dict:
-                QgsMessageLog.logMessage(
-                    f"Found no discharge points for abstraction code {abstraction_code_val}.",
-                    MESSAGE_CATEGORY,
-                    Qgis.Warning
-                )
-                continue
+        # Per-feature notices are collected here and summarized once at the end;
+        # they only go to the message log one by one if verbose logging is enabled.
+        diagnostics = RunDiagnostics("HPP Load", verbose=self.chkVerboseLog.isChecked())
+        self.diagnostics = diagnostics
+
+        # 4. Compute the segments of every abstraction code. The per-code work is
+        # spread over worker threads; results come back in abstraction layer order.
+        engine = HPPSegmentEngine(
+            rivers_layer,
+            hpp_abstraction_layer,
+            hpp_discharge_layer,
+            catchments_layer,
+            water_abstraction_code_field_name,
+            water_discharge_code_field_name,
+            session=self.session
+        )
+        # profiled only when "Profile Next Run" is checked in the DSS menu; cProfile
+        # only sees the calling thread, so a profiled run is serial and in the foreground.
+        # Other runs go to the background and fill the map as they progress.
+        with profile_run(self.session, 'hpp') as profile_report:
+            if profile_report is not None:
+                segments = engine.run(max_workers=1, diagnostics=diagnostics)
+        self.hpp_engine = engine
+        if profile_report is None:
+            self.start_progressive_run(engine, rivers_layer, diagnostics)
+            return
+
+        # 5. Add the segments to the memory layer
+        new_feats = []
+        for abstraction_code_val, sub_geom in segments:
+            new_feat = QgsFeature(self.hpp_segments_layer.fields())
+            new_feat.setGeometry(sub_geom)
+            new_feat.setAttribute(
+                new_feat.fieldNameIndex("AbstrCode"),
+                str(abstraction_code_val)
+            )
+            new_feats.append(new_feat)
+        _, added_feats = dp_segments.addFeatures(new_feats)
 
-            matching_discharge_feats = discharge_code_dict[abstraction_code_val_norm]
-
-            if len(matching_discharge_feats) == 1:
-                # 1 discharge => proceed
-                abs_geom = abs_feat.geometry()
-                if not abs_geom or abs_geom.isEmpty():
-                    QgsMessageLog.logMessage(
-                        f"No abstraction point found for code {abstraction_code_val}.",
-                        MESSAGE_CATEGORY,
-                        Qgis.Warning
-                    )
-                    continue
-
-                discharge_feat = matching_discharge_feats[0]
-                discharge_geom = discharge_feat.geometry()
-                if not discharge_geom or discharge_geom.isEmpty():
-                    QgsMessageLog.logMessage(
-                        f"No discharge point found for code {abstraction_code_val}.",
-                        MESSAGE_CATEGORY,
-                        Qgis.Warning
-                    )
-                    continue
-
-                abs_point = abs_geom.asPoint()
-                abs_point = self._transform_point(rivers_layer, hpp_abstraction_layer, abs_point)
-                discharge_point = discharge_geom.asPoint()
-                discharge_point = self._transform_point(rivers_layer, hpp_discharge_layer, discharge_point)
-
-                nearest_river_abs = self._get_nearest_feature_precise(rivers_layer, abs_point)
-                nearest_river_dis = self._get_nearest_feature_precise(rivers_layer, discharge_point)
-
-                if nearest_river_abs and nearest_river_dis:
-                    if nearest_river_abs.id() == nearest_river_dis.id():
-                        QgsMessageLog.logMessage(
-                            f"Abstraction code {abstraction_code_val} uses the same river feature for both points.",
-                            MESSAGE_CATEGORY,
-                            Qgis.Info
-                        )
-                        # >>> SUB-SEGMENT EXTRACTION <<<
-                        river_geom = nearest_river_abs.geometry()
-
-                        # 3) Get sub‐geometry
-                        # Convert the river geometry into a list of line-parts (each part is a list of QgsPointXY).
-                        # For a MultiLineString geometry, asMultiPolyline() returns a list-of-lists of points.
-                        # For a single LineString, asMultiPolyline() simply returns a 1-element list.
-                        multi_parts = river_geom.asMultiPolyline()
-
-                        # We'll store whichever part matches (if any).
-                        sub_geom = None
-
-                        # 1) Find a line part that contains both points.
-                        for part in multi_parts:
-                            part_geom = QgsGeometry.fromPolylineXY(part)  # single linestring geometry
-
-                            # Distances along this linestring for each point
-                            start_dist = part_geom.lineLocatePoint(QgsGeometry.fromPointXY(abs_point))
-                            end_dist = part_geom.lineLocatePoint(QgsGeometry.fromPointXY(discharge_point))
-
-                            if start_dist == end_dist: # in case part of the multipolygon is far away from both points
-                                continue
-
-                            # lineLocatePoint(...) returns -1 if the point is off this line part,
-                            # so we only proceed if both distances are >= 0.
-                            if start_dist >= 0 and end_dist >= 0:
-                                # Ensure start_dist < end_dist
-                                if start_dist > end_dist:
-                                    start_dist, end_dist = end_dist, start_dist
-
-                                # 1) Get the underlying geometry (QgsLineString, etc.)
-                                abstract_geom = part_geom.constGet()  # returns a QgsAbstractGeometryConstPtr
-
-                                # 2) Check if it's a curve (QgsCurve or QgsLineString). For a simple linestring,
-                                #    this should be a QgsLineString, which is a subclass of QgsCurve.
-                                if isinstance(abstract_geom, QgsCurve):
-                                    # 3) Call curveSubstring on the curve. This returns another QgsCurve.
-                                    sub_curve = abstract_geom.curveSubstring(start_dist, end_dist)
-                                    if sub_curve:
-                                        # 4) Wrap in a new QgsGeometry.
-                                        sub_geom = QgsGeometry(sub_curve.clone())
-                                        # If sub_geom is valid and not empty, we found our sub-segment.
-                                        if not sub_geom.isEmpty():
-                                            # Found the part that has both points; break out if we only want one match
-                                            break
-                                else:
-                                    QgsMessageLog.logMessage(
-                                        "Part geometry is not a curve/linestring. Cannot do curveSubstring.",
-                                        MESSAGE_CATEGORY, Qgis.Warning
-                                    )
-                                    # continue to next part
-                            # else continue to next part
-
-                        # after the loop, we check if sub_geom was found:
-                        if sub_geom and not sub_geom.isEmpty():
-                            new_feat = QgsFeature(self.hpp_segments_layer.fields())
-                            new_feat.setGeometry(sub_geom)
-                            new_feat.setAttribute(
-                                new_feat.fieldNameIndex("AbstrCode"),
-                                str(abstraction_code_val)
-                            )
-                            dp_segments.addFeatures([new_feat])
-
-                    else:
-                        QgsMessageLog.logMessage(
-                            f"Abstraction code {abstraction_code_val} has different river features: "
-                            f"{nearest_river_abs.id()} vs {nearest_river_dis.id()}",
-                            MESSAGE_CATEGORY,
-                            Qgis.Info
-                        )
-                        
-                        abs_river_geom = nearest_river_abs.geometry()
-                        dis_river_geom = nearest_river_dis.geometry()
-
-                        # 1) Find intersection (the confluence or shared segment)
-                        intersection_geom = abs_river_geom.intersection(dis_river_geom)
-
-                        if intersection_geom.isEmpty():
-                            QgsMessageLog.logMessage(
-                                f"No intersection found between river {nearest_river_abs.id()} and "
-                                f"river {nearest_river_dis.id()}. Cannot extract sub-segment.",
-                                MESSAGE_CATEGORY,
-                                Qgis.Warning
-                            )
-                            # You might choose to continue, skip, or do some fallback
-                            continue
-
-                        # If it’s a line or multi-line, that implies they share a segment. 
-                        # For a typical confluence, we expect a Point or MultiPoint.
-                        if intersection_geom.wkbType() in (QgsWkbTypes.Point, QgsWkbTypes.MultiPoint):
-                            # If multi, pick the first point
-                            if intersection_geom.isMultipart():
-                                points = intersection_geom.asMultiPoint()
-                                if not points:
-                                    QgsMessageLog.logMessage(
-                                        "Intersection is multipoint but empty. Skipping.",
-                                        MESSAGE_CATEGORY, Qgis.Warning
-                                    )
-                                    continue
-                                confluence_point = points[0]  # first intersection
-                            else:
-                                # single point
-                                confluence_point = intersection_geom.asPoint()
-
-                            # 2) Now we want the sub-segment of abstraction river from the abstraction point to confluence_point
-                            #    We'll locate the chainage along abstraction river for each point
-                            abs_point_geom = QgsGeometry.fromPointXY(abs_point)
-                            dis_point_geom = QgsGeometry.fromPointXY(discharge_point)
-                            conf_point_geom = QgsGeometry.fromPointXY(confluence_point)
-
-                            # start_dist = abs_river_geom.lineLocatePoint(abs_point_geom)
-                            # end_dist = abs_river_geom.lineLocatePoint(conf_point_geom)
-
-                            # if start_dist < 0 or end_dist < 0:
-                            #     QgsMessageLog.logMessage(
-                            #         f"lineLocatePoint returned -1. Possibly points are off the line. Skipping.",
-                            #         MESSAGE_CATEGORY,
-                            #         Qgis.Warning
-                            #     )
-                            #     continue
-
-                            # # Ensure start_dist <= end_dist
-                            # if start_dist > end_dist:
-                            #     start_dist, end_dist = end_dist, start_dist
-
-                            # 3) Extract the sub‐segment from river X
-                            # If you are using curveSubstring:
-                            multi_parts = abs_river_geom.asMultiPolyline()  # For multi-line geometry
-                            sub_geom = None
-
-                            for part in multi_parts:
-                                part_geom = QgsGeometry.fromPolylineXY(part)
-                                # check distances for each part
-                                sdist = part_geom.lineLocatePoint(abs_point_geom)
-                                edist = part_geom.lineLocatePoint(conf_point_geom)
-                                if sdist==edist:
-                                    continue
-                                if sdist >= 0 and edist >= 0:
-                                    if sdist > edist:
-                                        sdist, edist = edist, sdist
-                                    abstract_curve = part_geom.constGet()
-                                    if isinstance(abstract_curve, QgsCurve):
-                                        sub_curve = abstract_curve.curveSubstring(sdist, edist)
-                                        if sub_curve:
-                                            candidate_sub_geom = QgsGeometry(sub_curve.clone())
-                                            if not candidate_sub_geom.isEmpty():
-                                                sub_geom = candidate_sub_geom
-                                                break
-
-                            if sub_geom and not sub_geom.isEmpty():
-                                # 4) Add to memory layer
-                                new_feat = QgsFeature(self.hpp_segments_layer.fields())
-                                new_feat.setGeometry(sub_geom)
-                                new_feat.setAttribute(
-                                    new_feat.fieldNameIndex("AbstrCode"),
-                                    str(abstraction_code_val)
-                                )
-                                dp_segments.addFeatures([new_feat])
-
-                                # 5a) Find which catchment(s) contain the abstraction point
-                                abstraction_catchments = self._get_intersecting_features(catchments_layer, abs_point_geom)
-                                # 5b) Find which catchment(s) contain the discharge point
-                                discharge_catchments = self._get_intersecting_features(catchments_layer, dis_point_geom)
-
-                                if not abstraction_catchments:
-                                    QgsMessageLog.logMessage(
-                                        f"No catchment found for abstraction point of code {abstraction_code_val}.",
-                                        MESSAGE_CATEGORY,
-                                        Qgis.Warning
-                                    )
-                                if not discharge_catchments:
-                                    QgsMessageLog.logMessage(
-                                        f"No catchment found for discharge point of code {abstraction_code_val}.",
-                                        MESSAGE_CATEGORY,
-                                        Qgis.Warning
-                                    )
-
-                                if not abstraction_catchments or not discharge_catchments:
-                                    # Can't do flow check
-                                    pass
-                                else:
-                                    # For simplicity, let's assume we just take the *first* intersecting
-                                    # polygon for each. If you can have multiple, adapt accordingly.
-                                    abs_catchment_feat = abstraction_catchments[0]
-                                    dis_catchment_feat = discharge_catchments[0]
-
-                                    # 6) Check if the abstraction's catchment flows into the discharge's catchment
-                                    #    This is your custom function. We'll call it flows_into for example.
-                                    #    E.g.:
-                                    # if self.flows_into(abs_catchment_feat, dis_catchment_feat):
-                                    #     ...
-                                    # We'll just *assume* it's True for demonstration:
-                                    catchment_id_field = "RCode"
-                                    selected_catchments = self.select_catchment_features_by_id(catchments_layer, catchment_id_field, dis_catchment_feat[catchment_id_field])
-                                    if abs_catchment_feat in selected_catchments:
-                                        # 7) If yes, we add the sub-segment on River Y from confluence to discharge
-
-                                        # a) lineLocatePoint on River Y
-                                        confluence_geom_pt = QgsGeometry.fromPointXY(confluence_point)
-                                        start_dist_y = dis_river_geom.lineLocatePoint(confluence_geom_pt)
-                                        end_dist_y = dis_river_geom.lineLocatePoint(dis_point_geom)
-
-                                        if start_dist_y < 0 or end_dist_y < 0:
-                                            QgsMessageLog.logMessage(
-                                                f"lineLocatePoint returned -1 on River Y (ID={nearest_river_dis.id()}).",
-                                                MESSAGE_CATEGORY,
-                                                Qgis.Warning
-                                            )
-                                        else:
-                                            # ensure start <= end
-                                            if start_dist_y > end_dist_y:
-                                                start_dist_y, end_dist_y = end_dist_y, start_dist_y
-
-                                            # b) Extract sub-geometry from River Y
-                                            multi_parts_y = dis_river_geom.asMultiPolyline()
-                                            sub_geom_y = None
-
-                                            for part in multi_parts_y:
-                                                part_geom_y = QgsGeometry.fromPolylineXY(part)
-                                                sdist_y = part_geom_y.lineLocatePoint(confluence_geom_pt)
-                                                edist_y = part_geom_y.lineLocatePoint(dis_point_geom)
-                                                if sdist_y==edist_y:
-                                                    continue
-                                                if sdist_y >= 0 and edist_y >= 0:
-                                                    if sdist_y > edist_y:
-                                                        sdist_y, edist_y = edist_y, sdist_y
-                                                    abstract_curve_y = part_geom_y.constGet()
-                                                    if isinstance(abstract_curve_y, QgsCurve):
-                                                        sub_curve_y = abstract_curve_y.curveSubstring(sdist_y, edist_y)
-                                                        if sub_curve_y:
-                                                            candidate_sub_geom_y = QgsGeometry(sub_curve_y.clone())
-                                                            if not candidate_sub_geom_y.isEmpty():
-                                                                sub_geom_y = candidate_sub_geom_y
-                                                                break
-
-                                            if sub_geom_y and not sub_geom_y.isEmpty():
-                                                new_feat_2 = QgsFeature(self.hpp_segments_layer.fields())
-                                                new_feat_2.setGeometry(sub_geom_y)
-                                                new_feat_2.setAttribute(
-                                                    new_feat_2.fieldNameIndex("AbstrCode"),
-                                                    str(abstraction_code_val)
-                                                )
-                                                dp_segments.addFeatures([new_feat_2])
-                                            else:
-                                                QgsMessageLog.logMessage(
-                                                    f"Could not extract sub-segment on River Y (ID={nearest_river_dis.id()})",
-                                                    MESSAGE_CATEGORY,
-                                                    Qgis.Warning
-                                                )
-                                    else:
-                                        QgsMessageLog.logMessage(
-                                            f"Catchment of code {abstraction_code_val} does NOT flow into discharge catchment. Skipping segment.",
-                                            MESSAGE_CATEGORY,
-                                            Qgis.Info
-                                        )
-                            else:
-                                QgsMessageLog.logMessage(
-                                    "Could not extract sub-segment from River X to confluence. Possibly off-geometry or multi-part intersection.",
-                                    MESSAGE_CATEGORY,
-                                    Qgis.Warning
-                                )
-                        else:
-                            # Intersection is a line or polygon? Possibly they share a segment or something unexpected.
-                            QgsMessageLog.logMessage(
-                                "River X and Y share a line or polygon intersection (not a simple point). Handling not implemented.",
-                                MESSAGE_CATEGORY,
-                                Qgis.Warning
-                            )
-                else:
-                    QgsMessageLog.logMessage(
-                        f"Abstraction code {abstraction_code_val}: could not find nearest river for abstraction or discharge.",
-                        MESSAGE_CATEGORY,
-                        Qgis.Warning
-                    )
-
-            else:
-                # More than 1 discharge or none
-                QgsMessageLog.logMessage(
-                    f"Found {len(matching_discharge_feats)} discharge points for abstraction code {abstraction_code_val}. Skipping.",
-                    MESSAGE_CATEGORY,
-                    Qgis.Warning
-                )
-                pass
+        # Segment ids per abstraction code, used by live updates to replace a code's segments
+        self.segment_ids_by_code = {}
+        for (abstraction_code_val, _), feat in zip(segments, added_feats):
+            self.segment_ids_by_code.setdefault(normalize_code(abstraction_code_val), []).append(feat.id())
 
         # Once done with all features, refresh the memory layer
         self.hpp_segments_layer.updateExtents()
@@ -547,156 +221,183 @@ class HPPLoadDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
         
         self.calculate_coverage()
 
-        QMessageBox.information(self, "Calculation done", "Calculation completed successfully.")
+        self._finish_run(diagnostics, "Calculation completed successfully.", True)
+        show_report(self, profile_report)
 
+    def start_progressive_run(self, engine, rivers_layer, diagnostics):
+        """
+        Runs the engine in a background task. Segments and coverage values
+        reach the map in batches while it runs; Stop cancels it and keeps
+        what was computed so far.
+        """
+        # every river starts at 0%, the batches update the rivers their segments touch
+        self._create_coverage_layer(rivers_layer, QgsGeometry())
+        self.progressive_run = ProgressiveHPPRun(
+            engine,
+            self.hpp_segments_layer,
+            self.coverage_layer,
+            self.coverage_ids_by_river,
+            "CoveragePct",
+            diagnostics,
+            canvas=self.iface.mapCanvas() if self.iface else None,
+            max_workers=self.spinWorkers.value(),
+            parent=self
+        )
+        self.progressive_run.progressed.connect(self._show_progress)
+        self.progressive_run.finished.connect(self._progressive_run_finished)
+        self.btnCalculate.setEnabled(False)
+        self.btnStop.setEnabled(True)
+        self.progressive_run.start()
+
+    def stop_calculation(self):
+        if self.progressive_run:
+            self.btnStop.setEnabled(False)
+            self.lblReadiness.setText("Stopping…")
+            self.progressive_run.stop()
+
+    def _show_progress(self, processed, total):
+        self.lblReadiness.setText(f"Calculating… {processed}/{total} abstraction points")
+
+    def _progressive_run_finished(self, completed):
+        run = self.progressive_run
+        self.progressive_run = None
+        self.btnCalculate.setEnabled(True)
+        self.btnStop.setEnabled(False)
+        self.lblReadiness.setText("")
+        self.segment_ids_by_code = run.segment_ids_by_code
+        run.deleteLater()
+
+        if run.layers_removed:
+            # the output layers are gone: nothing to repaint, patch or record
+            self.hpp_segments_layer = None
+            self.coverage_layer = None
+        else:
+            self.hpp_segments_layer.triggerRepaint()
+            self.coverage_layer.triggerRepaint()
 
-
-    def _validate_layer(self, layer, layer_name):
-        if not layer:
-            QMessageBox.warning(self, "Error", f"Please select a {layer_name} layer.")
-            return False
-        if not layer.isSpatial():
-            QMessageBox.warning(self, "Error", f"Selected {layer_name} layer is not spatial.")
-            return False
-        return True
-
-    def _transform_point(self, target_layer, source_layer, point):
-        if not target_layer or not source_layer:
-            QgsMessageLog.logMessage(
-                "Either target_layer or source_layer is not valid.",
-                MESSAGE_CATEGORY,
-                Qgis.Warning
+        if run.layers_removed:
+            message = (
+                f"Calculation stopped after {run.processed} of {run.total} abstraction points: "
+                "an output layer was removed from the project."
             )
-            return None
-
-        target_crs = target_layer.crs()
-        source_crs = source_layer.crs()
+        elif run.error is not None:
+            QgsMessageLog.logMessage(f"HPP load failed: {run.error}", MESSAGE_CATEGORY, Qgis.Critical)
+            message = f"Calculation failed after {run.processed} of {run.total} abstraction points:\n{run.error}"
+        elif completed:
+            message = "Calculation completed successfully."
+        else:
+            message = (
+                f"Calculation stopped after {run.processed} of {run.total} abstraction points; "
+                "the segments computed so far are kept."
+            )
+        # the output layers are gone: nothing to record or patch
+        self._finish_run(run.diagnostics, message, completed and not run.layers_removed)
+
+    def _finish_run(self, diagnostics, message, completed):
+        # only complete runs are kept: a stopped run would show as removed segments in diffs
+        if completed:
+            self.record_run(diagnostics)
+        diagnostics.log_summary()
+        if len(diagnostics):
+            QgsProject.instance().addMapLayer(diagnostics.to_layer("HPP Load Diagnostics"))
+
+        # live updates patch a complete run; a stopped one is recalculated instead
+        if completed and self.chkLiveUpdate.isChecked():
+            self.start_live_update()
+
+        QMessageBox.information(
+            self,
+            "Calculation done" if completed else "Calculation stopped",
+            f"{message}\n\n{diagnostics.summary()}"
+        )
 
-        if not target_crs.isValid() or not source_crs.isValid():
-            QgsMessageLog.logMessage(
-                "Invalid CRS on either target or source layer.",
-                MESSAGE_CATEGORY,
-                Qgis.Warning
+    def record_run(self, diagnostics):
+        """Keeps the segments and the river coverage in the run history (see the DSS Run History panel)."""
+        if self.session is None:
+            return
+        values, geometries = hpp_run_values(
+            self.hpp_segments_layer, self.coverage_layer, self.coverage_ids_by_river, "CoveragePct"
+        )
+        engine = self.hpp_engine
+        try:
+            self.session.run_history.record(
+                HPP_TOOL,
+                f"HPP {engine.abstraction_layer.name()}",
+                {
+                    'abstraction_code_field': engine.abstraction_code_field,
+                    'discharge_code_field': engine.discharge_code_field,
+                },
+                inputs_description([
+                    engine.rivers_layer, engine.abstraction_layer, engine.discharge_layer, engine.catchments_layer
+                ]),
+                values,
+                geometries,
+                self.hpp_segments_layer.crs(),
+                {'codes': len(values[HPP_KIND]), 'notices': len(diagnostics)}
             )
-            return None
-
-        # If layer CRSs differ, reproject the point
-        if target_crs != source_crs:
-            try:
-                xform = QgsCoordinateTransform(source_crs, target_crs, QgsProject.instance())
-                point = xform.transform(point)
-                return point
-            except Exception as e:
-                QgsMessageLog.logMessage(
-                    f"Error reprojecting point from {source_crs.authid()} to {target_crs.authid()}: {e}",
-                    MESSAGE_CATEGORY,
-                    Qgis.Critical
-                )
-                return None
-        else:
-            # If CRSs are the same, just return the original point
-            return point
+        except sqlite3.Error as e:
+            QgsMessageLog.logMessage(f"Run history: {e}", MESSAGE_CATEGORY, Qgis.Warning)
 
+    def toggle_live_update(self, checked):
+        if checked:
+            self.start_live_update()
+        else:
+            self.stop_live_update()
 
-    def _get_nearest_feature(self, target_layer, point):
+    def start_live_update(self):
         """
-        Finds the nearest feature in `target_layer` to the given `point`,
-        automatically reprojecting the point from `source_layer`'s CRS
-        to `target_layer`'s CRS if needed.
-
-        :param target_layer: QgsVectorLayer where we do the nearest-neighbor search.
-        :param source_layer: QgsVectorLayer from which `point` originated.
-        :param point:        QgsPointXY in the CRS of `source_layer`.
-        :return: The nearest QgsFeature in `target_layer`, or None if none found.
+        Subscribes to edits of the abstraction and discharge layers of the last run
+        and keeps its segments and coverage layers up to date incrementally.
         """
+        if self.live_updater:
+            return
+        if not self.hpp_engine or not self.hpp_segments_layer or not self.coverage_layer or self.progressive_run:
+            # Nothing to patch yet; live mode starts with the next full calculation
+            return
 
-        # Build the spatial index in the target layer's CRS
-        index = QgsSpatialIndex(target_layer.getFeatures())
-        nearest_ids = index.nearestNeighbor(point, 5)
-        QgsMessageLog.logMessage(
-            f"Nearest 5 features for point {point}: {nearest_ids}",
-            MESSAGE_CATEGORY, Qgis.Info
+        self.live_updater = HPPLiveUpdater(
+            self.hpp_engine,
+            self.hpp_segments_layer,
+            self.segment_ids_by_code,
+            self.coverage_layer,
+            self.coverage_ids_by_river,
+            "CoveragePct",
+            max_workers=self.spinWorkers.value(),
+            verbose=self.chkVerboseLog.isChecked(),
+            parent=self
         )
-        if not nearest_ids:
-            return None
-
-        feature_request = QgsFeatureRequest(nearest_ids[0])
-        nearest_feat = next(target_layer.getFeatures(feature_request), None)
-        return nearest_feat
-
-    def _get_nearest_feature_precise(self, layer, point, k=5):
-        """
-        Finds the truly nearest feature in `layer` to the given `point`
-        by first retrieving up to `k` bounding-box neighbors, then doing
-        a real geometry distance check.
-
-        :param layer: QgsVectorLayer to search in.
-        :param point: QgsPointXY for the query.
-        :param k:     Number of bounding-box neighbors to retrieve.
-        :return:      The nearest QgsFeature by geometry distance, or None if none found.
-        """
-        # Build the spatial index if not done. For repeated calls, you might want to build it once.
-        index = QgsSpatialIndex(layer.getFeatures())
+        self.live_updater.start()
+
+    def stop_live_update(self):
+        if self.live_updater:
+            self.live_updater.stop()
+            self.live_updater.deleteLater()
+            self.live_updater = None
+
+    def export_diagnostics(self):
+        """Saves the diagnostics of the last run as a CSV file."""
+        if self.diagnostics is None:
+            QMessageBox.information(self, "No diagnostics", "Run a calculation first.")
+            return
 
-        # 1) Find the K nearest bounding boxes
-        candidate_ids = index.nearestNeighbor(point, k)
-        if not candidate_ids:
-            return None
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(
+            self, "Export diagnostics", "hpp_load_diagnostics.csv", "CSV files (*.csv)"
+        )
+        if not path:
+            return
+        self.diagnostics.to_csv(path)
 
-        point_geom = QgsGeometry.fromPointXY(point)
 
-        best_feat = None
-        best_dist = float('inf')
 
-        # 2) Among those K candidates, find the actual closest geometry
-        for fid in candidate_ids:
-            request = QgsFeatureRequest(fid)
-            candidate_feat = next(layer.getFeatures(request), None)
-            if not candidate_feat:
-                continue
+    def _validate_layer(self, layer, layer_name):
+        if not layer:
+            QMessageBox.warning(self, "Error", f"Please select a {layer_name} layer.")
+            return False
+        if not layer.isSpatial():
+            QMessageBox.warning(self, "Error", f"Selected {layer_name} layer is not spatial.")
+            return False
+        return True
 
-            dist = candidate_feat.geometry().distance(point_geom)
-            if dist < best_dist:
-                best_dist = dist
-                best_feat = candidate_feat
-
-        return best_feat
-
-    def _unify_geometries(self, features):
-        geometries = [feature.geometry() for feature in features]
-        union_geom = QgsGeometry.unaryUnion(geometries)
-        return union_geom if not union_geom.isEmpty() else None
-
-    def _transform_geometry(self, geometry, source_crs, target_crs):
-        if source_crs != target_crs:
-            transformer = QgsCoordinateTransform(source_crs, target_crs, QgsProject.instance())
-            transformed_geom = QgsGeometry(geometry)
-            transformed_geom.transform(transformer)
-            return transformed_geom
-        return geometry
-
-    def _transform_features(self, features, source_crs, target_crs):
-        """Transforms the geometries of features from source CRS to target CRS."""
-        transformed_features = []
-        for feature in features:
-            geom = QgsGeometry(feature.geometry())
-            if source_crs != target_crs:
-                transformer = QgsCoordinateTransform(source_crs, target_crs, QgsProject.instance())
-                geom.transform(transformer)
-            feature_copy = QgsFeature(feature)
-            feature_copy.setGeometry(geom)
-            transformed_features.append(feature_copy)
-        return transformed_features
-
-    def _get_intersecting_features(self, layer, geometry):
-        index = QgsSpatialIndex(layer.getFeatures())
-        candidate_ids = index.intersects(geometry.boundingBox())
-        intersecting_features = [
-            feature for feature in layer.getFeatures(QgsFeatureRequest(candidate_ids))
-            if feature.geometry().intersects(geometry)
-        ]
-        return intersecting_features
-    
     def calculate_coverage(self):
         """
         Create a new memory layer that has all columns from the rivers layer
@@ -733,6 +434,15 @@ class HPPLoadDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
             QMessageBox.information(self, "No coverage", "Unified memory geometry is empty.")
             return
 
+        self._create_coverage_layer(rivers_layer, unified_segments_geom)
+
+        # QMessageBox.information(self, "Coverage done", "Created coverage layer with coverage percentage.")
+
+    def _create_coverage_layer(self, rivers_layer, unified_segments_geom):
+        """
+        Adds the "RiversCoverage" layer: the rivers with their coverage by
+        `unified_segments_geom` (an empty geometry gives 0% everywhere).
+        """
         # 4) Create a new memory layer that clones the rivers layer's fields
         #    plus one new field for coverage percentage.
         river_fields = rivers_layer.fields()
@@ -754,38 +464,37 @@ class HPPLoadDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
         coverage_layer.updateFields()
 
         # 5) For each river feature, compute coverage
+        coverage_field_index = coverage_layer.fields().indexOf(new_coverage_field_name)
+        new_feats = []
+        river_ids = []
         for river_feat in rivers_layer.getFeatures():
-            river_geom = river_feat.geometry()
-            if not river_geom or river_geom.isEmpty():
-                continue
-
-            river_length = river_geom.length()
-            if river_length <= 0:
-                # No meaningful length
+            # Intersection with the unified memory geometry (None: no meaningful length)
+            coverage_pct = coverage_percent(river_feat.geometry(), unified_segments_geom)
+            if coverage_pct is None:
                 continue
 
-            # Intersection with the unified memory geometry
-            intersection_geom = river_geom.intersection(unified_segments_geom)
-            covered_length = intersection_geom.length() if intersection_geom else 0.0
-
-            coverage_ratio = covered_length / river_length  # fraction 0..1
-            coverage_percent = coverage_ratio * 100.0       # percentage
-
             # 6) Create new feature for the coverage layer
             new_feat = QgsFeature(coverage_layer.fields())
             # copy geometry from the original river
-            new_feat.setGeometry(river_geom)
+            new_feat.setGeometry(river_feat.geometry())
 
             # copy attributes from the original river
             attr_map = {}
             for i, field in enumerate(river_fields):
                 attr_map[i] = river_feat[i]
             # set coverage in the new field (the last one we appended)
-            coverage_field_index = coverage_layer.fields().indexOf(new_coverage_field_name)
-            attr_map[coverage_field_index] = coverage_percent
+            attr_map[coverage_field_index] = coverage_pct
 
             new_feat.setAttributes(list(attr_map.values()))
-            dp_cov.addFeature(new_feat)
+            new_feats.append(new_feat)
+            river_ids.append(river_feat.id())
+
+        _, added_feats = dp_cov.addFeatures(new_feats)
+        # Remember which coverage feature belongs to which river, so live updates can patch it in place
+        self.coverage_layer = coverage_layer
+        self.coverage_ids_by_river = {
+            river_id: feat.id() for river_id, feat in zip(river_ids, added_feats)
+        }
 
         coverage_layer.updateExtents()
 
@@ -796,34 +505,9 @@ class HPPLoadDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
         # For instance, a simple graduated style from 0 to 100
         self._apply_coverage_style(coverage_layer, new_coverage_field_name)
 
-        # QMessageBox.information(self, "Coverage done", "Created coverage layer with coverage percentage.")
-
     def _apply_coverage_style(self, layer, field_name):
         """
-        Apply a simple two-category style on 'field_name':
-        - < 40%  -> blue
-        - >= 40% -> red
+        Two classes on 'field_name': < 40% blue, >= 40% red; hairlines and
+        draw-time simplification when zoomed out (see dss_rendering).
         """
-        # Create symbols for each category
-        blue_symbol = QgsSymbol.defaultSymbol(layer.geometryType())
-        blue_symbol.setColor(QColor("blue"))
-        blue_symbol.setWidth(0.8)
-
-        red_symbol = QgsSymbol.defaultSymbol(layer.geometryType())
-        red_symbol.setColor(QColor("red"))
-        red_symbol.setWidth(0.8)
-
-        # Define two ranges:
-        #  1) 0 to <40
-        #  2) 40 to a large max number
-        ranges = []
-        ranges.append(QgsRendererRange(0, 40, blue_symbol, "< 40%"))
-        ranges.append(QgsRendererRange(40, 999999, red_symbol, "≥ 40%"))
-
-        # Create a graduated symbol renderer
-        renderer = QgsGraduatedSymbolRenderer(field_name, ranges)
-        # Keep it in 'GraduatedColor' mode so it appears nicely in the legend
-        renderer.setMode(QgsGraduatedSymbolRenderer.GraduatedColor)
-
-        layer.setRenderer(renderer)
-        layer.triggerRepaint()
+        style_layer(layer, COVERAGE_STYLE, field_name, COVERAGE_CLASSES)
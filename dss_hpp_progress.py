@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from qgis.PyQt.QtCore import QObject, QTimer, pyqtSignal
+from qgis.core import (
+    QgsApplication,
+    QgsCoordinateTransform,
+    QgsCsException,
+    QgsFeature,
+    QgsProject,
+    QgsRectangle,
+    QgsSpatialIndex,
+    QgsTask
+)
+
+from .dss_hpp_engine import normalize_code
+from .dss_hpp_live import patch_coverage
+
+
+class HPPRunTask(QgsTask):
+    """Processes the abstraction features of a started HPP run in the background."""
+
+    def __init__(self, engine, abstraction_features, max_workers):
+        super().__init__("DSS: HPP load", QgsTask.CanCancel)
+        self.engine = engine
+        self.abstraction_features = abstraction_features
+        self.max_workers = max_workers
+        self.error = None
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def run(self):
+        total = len(self.abstraction_features)
+        try:
+            for done, result in enumerate(
+                self.engine.process(self.abstraction_features, self.max_workers, self.isCanceled), 1
+            ):
+                with self._lock:
+                    self._pending.append(result)
+                self.setProgress(100.0 * done / max(total, 1))
+        except Exception as e:
+            self.error = e
+            return False
+        return not self.isCanceled()
+
+    def take_results(self):
+        """The results computed since the previous call (main thread)."""
+        with self._lock:
+            results, self._pending = self._pending, []
+        return results
+
+
+class ProgressiveHPPRun(QObject):
+    """
+    Runs an HPP load calculation in a QgsTask and shows its output while it
+    runs: every BATCH_MS the segments computed so far are added to the
+    segments layer and the coverage of the rivers they touch is updated.
+
+    The map is only repainted when a batch falls inside the visible canvas
+    extent, so a national run does not redraw the whole river network twice
+    a second while it computes far from the current view.
+    """
+
+    # number of abstraction features processed, total
+    progressed = pyqtSignal(int, int)
+    # True when every abstraction feature was processed, False when stopped or failed
+    finished = pyqtSignal(bool)
+
+    BATCH_MS = 500
+
+    def __init__(
+        self,
+        engine,
+        segments_layer,
+        coverage_layer,
+        coverage_ids_by_river,
+        coverage_field_name,
+        diagnostics,
+        canvas=None,
+        max_workers=None,
+        parent=None
+    ):
+        """
+        :param engine:                HPPSegmentEngine of the run.
+        :param segments_layer:        Empty "HPP Load Segments" memory layer.
+        :param coverage_layer:        "RiversCoverage" memory layer, every river at 0%.
+        :param coverage_ids_by_river: River feature id -> coverage feature id.
+        :param diagnostics:           RunDiagnostics receiving the diagnostics of each result.
+        :param canvas:                QgsMapCanvas whose visible extent decides on repaints.
+        """
+        super().__init__(parent)
+        self.engine = engine
+        self.segments_layer = segments_layer
+        self.coverage_layer = coverage_layer
+        self.coverage_ids_by_river = coverage_ids_by_river
+        self.coverage_field_index = coverage_layer.fields().indexOf(coverage_field_name)
+        self.diagnostics = diagnostics
+        self.canvas = canvas
+        self.max_workers = max_workers
+
+        self.segment_ids_by_code = {}
+        self.processed = 0
+        self.total = 0
+        self.task = None
+        self.completed = False
+        self.error = None
+        # set when an output layer is removed from the project mid-run
+        self.layers_removed = False
+        self._segment_index = QgsSpatialIndex()
+        # the Python side of the task must live until the task manager is done with it
+        self._tasks = set()
+
+        self._timer = QTimer(self)
+        self._timer.setInterval(self.BATCH_MS)
+        self._timer.timeout.connect(self.flush)
+
+        for layer in (segments_layer, coverage_layer):
+            layer.willBeDeleted.connect(self._layer_removed)
+
+    def start(self):
+        abstraction_features, max_workers = self.engine.start_run(self.max_workers)
+        self.total = len(abstraction_features)
+        task = HPPRunTask(self.engine, abstraction_features, max_workers)
+        task.taskCompleted.connect(lambda: self._task_finished(task, True))
+        task.taskTerminated.connect(lambda: self._task_finished(task, False))
+        self._tasks.add(task)
+        self.task = task
+        QgsApplication.taskManager().addTask(task)
+        self._timer.start()
+
+    def stop(self):
+        """Cancels the run; the segments computed so far stay on the map."""
+        if self.task is not None:
+            self.task.cancel()
+
+    def is_running(self):
+        return self.task is not None
+
+    def _layer_removed(self):
+        """An output layer is about to be deleted: stop writing to the layers and cancel the run."""
+        self.layers_removed = True
+        self._timer.stop()
+        self.stop()
+
+    def _task_finished(self, task, completed):
+        self._tasks.discard(task)
+        if task is not self.task:
+            return
+        self._timer.stop()
+        self.flush()
+        self.task = None
+        for layer in (self.segments_layer, self.coverage_layer):
+            try:
+                layer.willBeDeleted.disconnect(self._layer_removed)
+            except (TypeError, RuntimeError):
+                # already deleted
+                pass
+        # the task may have returned before a layer was removed: the run is still incomplete
+        self.completed = completed and not self.layers_removed
+        self.error = task.error
+        self.finished.emit(self.completed)
+
+    def flush(self):
+        """Adds the results computed since the last batch to the output layers."""
+        if self.task is None or self.layers_removed:
+            return
+        results = self.task.take_results()
+        if not results:
+            return
+
+        new_feats = []
+        codes = []
+        for result in results:
+            self.diagnostics.extend(result.diagnostics)
+            for sub_geom in result.segments:
+                new_feat = QgsFeature(self.segments_layer.fields())
+                new_feat.setGeometry(sub_geom)
+                new_feat.setAttribute(new_feat.fieldNameIndex("AbstrCode"), str(result.code))
+                new_feats.append(new_feat)
+                codes.append(result.code)
+        self.processed += len(results)
+
+        if new_feats:
+            _, added_feats = self.segments_layer.dataProvider().addFeatures(new_feats)
+            extent = QgsRectangle()
+            extent.setMinimal()
+            for code, feat in zip(codes, added_feats):
+                self.segment_ids_by_code.setdefault(normalize_code(code), []).append(feat.id())
+                self._segment_index.addFeature(feat)
+                extent.combineExtentWith(feat.geometry().boundingBox())
+            self.segments_layer.updateExtents()
+
+            touched_rivers = self.engine.rivers_touched_by([feat.geometry() for feat in added_feats])
+            patch_coverage(
+                self.engine.rivers_layer,
+                touched_rivers,
+                self.segments_layer,
+                self._segment_index,
+                self.coverage_layer,
+                self.coverage_ids_by_river,
+                self.coverage_field_index
+            )
+            if self._is_visible(extent):
+                self.segments_layer.triggerRepaint()
+                self.coverage_layer.triggerRepaint()
+
+        self.progressed.emit(self.processed, self.total)
+
+    def _is_visible(self, extent):
+        """Whether `extent` (in the segments CRS) meets the visible canvas extent."""
+        if self.canvas is None:
+            return True
+        destination_crs = self.canvas.mapSettings().destinationCrs()
+        if destination_crs != self.segments_layer.crs():
+            transform = QgsCoordinateTransform(
+                self.segments_layer.crs(), destination_crs, QgsProject.instance().transformContext()
+            )
+            try:
+                extent = transform.transformBoundingBox(extent)
+            except QgsCsException:
+                return True
+        return self.canvas.extent().intersects(extent)
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from qgis.core import QgsFeature, QgsGeometry, QgsMemoryProviderUtils
+
+from . import dss_counters as counters
+
+
+def working_copy_key(crs):
+    return ('working_copy', crs.authid() or crs.toWkt())
+
+
+class WorkingLayer:
+    """
+    A layer as seen in the working CRS: the layer itself when it is already
+    in that CRS, else a memory copy with every geometry reprojected once (and
+    a provider spatial index), so no query geometry has to be transformed
+    back and forth per run.
+
+    Feature ids of a copy are assigned by the memory provider; `source_id`
+    maps them back to the ids of the source layer (e.g. for keys stored
+    across sessions).
+    """
+
+    def __init__(self, layer, source=None, source_ids=None):
+        """
+        :param layer:      QgsVectorLayer in the working CRS.
+        :param source:     Layer it was copied from; None if `layer` is the source itself.
+        :param source_ids: Dict of copy feature id -> source feature id.
+        """
+        self.layer = layer
+        self.source = source if source is not None else layer
+        self.source_ids = source_ids or {}
+
+    @property
+    def is_copy(self):
+        return self.source is not self.layer
+
+    def source_id(self, fid):
+        return self.source_ids.get(fid, fid)
+
+    @classmethod
+    def reproject(cls, layer, crs, transform, feedback=None):
+        """
+        Copies `layer` into a memory layer in `crs`.
+
+        :param transform: QgsCoordinateTransform from the layer CRS to `crs`.
+        """
+        counters.count(counters.FULL_LAYER_SCANS)
+        copy = QgsMemoryProviderUtils.createMemoryLayer(
+            f"{layer.name()} ({crs.authid()})", layer.fields(), layer.wkbType(), crs
+        )
+        features = []
+        source_fids = []
+        for feature in layer.getFeatures():
+            if feedback is not None and feedback.isCanceled():
+                break
+            working_feature = QgsFeature(feature)
+            if feature.hasGeometry():
+                geometry = QgsGeometry(feature.geometry())
+                geometry.transform(transform)
+                working_feature.setGeometry(geometry)
+            features.append(working_feature)
+            source_fids.append(feature.id())
+
+        provider = copy.dataProvider()
+        _, added = provider.addFeatures(features)
+        provider.createSpatialIndex()
+        source_ids = {feature.id(): fid for feature, fid in zip(added, source_fids)}
+        return cls(copy, layer, source_ids)
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from qgis.core import QgsGeometry, QgsLineString
+
+
+class LinePart:
+    """
+    One single linestring part of a river stored as NumPy arrays:
+    the vertex coordinates and the cumulative length at every vertex.
+
+    Locating a point is a vectorized projection on all segments at once,
+    cutting a substring is two binary searches on the cumulative lengths
+    plus a slice, so no QgsGeometry has to be rebuilt for either.
+    """
+
+    __slots__ = ('xy', 'cumlen', 'length')
+
+    def __init__(self, points):
+        """
+        :param points: Sequence of QgsPointXY (as returned by asMultiPolyline()).
+        """
+        self.xy = np.array([(p.x(), p.y()) for p in points], dtype=float).reshape(-1, 2)
+        segment_lengths = np.hypot(*np.diff(self.xy, axis=0).T) if len(self.xy) > 1 else np.zeros(0)
+        self.cumlen = np.concatenate(([0.0], np.cumsum(segment_lengths)))
+        self.length = float(self.cumlen[-1])
+
+    def is_valid(self):
+        return len(self.xy) > 1
+
+    def locate(self, x, y):
+        """
+        Returns the distance along the part of the point on the part closest
+        to (x, y), like QgsGeometry.lineLocatePoint() does for a linestring.
+        On ties the first segment wins, as in GEOS.
+        """
+        start = self.xy[:-1]
+        delta = self.xy[1:] - start
+        seg_len2 = np.einsum('ij,ij->i', delta, delta)
+        rel = np.array((x, y)) - start
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.where(seg_len2 > 0, np.einsum('ij,ij->i', rel, delta) / seg_len2, 0.0)
+        t = np.clip(t, 0.0, 1.0)
+        proj = start + delta * t[:, None]
+        dist2 = np.einsum('ij,ij->i', proj - (x, y), proj - (x, y))
+        i = int(np.argmin(dist2))
+        return float(self.cumlen[i] + t[i] * (self.cumlen[i + 1] - self.cumlen[i]))
+
+    def interpolate(self, distance):
+        """Returns the (x, y) coordinates at `distance` along the part."""
+        i = int(np.searchsorted(self.cumlen, distance, side='right')) - 1
+        i = min(max(i, 0), len(self.xy) - 2)
+        seg_len = self.cumlen[i + 1] - self.cumlen[i]
+        t = (distance - self.cumlen[i]) / seg_len if seg_len > 0 else 0.0
+        return self.xy[i] + (self.xy[i + 1] - self.xy[i]) * t
+
+    def substring(self, start_distance, end_distance):
+        """
+        Returns the part between the two distances as a linestring QgsGeometry,
+        the equivalent of QgsCurve.curveSubstring() on this part.
+        """
+        start_distance = min(max(start_distance, 0.0), self.length)
+        end_distance = min(max(end_distance, 0.0), self.length)
+        # vertices strictly inside (start, end), bounded by two binary searches
+        first = int(np.searchsorted(self.cumlen, start_distance, side='right'))
+        last = int(np.searchsorted(self.cumlen, end_distance, side='left'))
+        coords = np.vstack((
+            self.interpolate(start_distance),
+            self.xy[first:last],
+            self.interpolate(end_distance)
+        ))
+        return QgsGeometry(QgsLineString(coords[:, 0].tolist(), coords[:, 1].tolist()))
+
+
+class LinearReferencingCache:
+    """
+    Caches the LinePart arrays of river features by feature id, so repeated
+    HPPs on the same river reuse them instead of converting the geometry
+    with asMultiPolyline() and rebuilding every part for each query.
+    """
+
+    def __init__(self):
+        self._parts = {}
+
+    def __len__(self):
+        return len(self._parts)
+
+    def clear(self):
+        self._parts.clear()
+
+    def invalidate(self, feature_id):
+        self._parts.pop(feature_id, None)
+
+    def parts(self, feature):
+        """Returns the list of valid LineParts of a river feature."""
+        parts = self._parts.get(feature.id())
+        if parts is None:
+            geometry = feature.geometry()
+            multi_parts = geometry.asMultiPolyline() if geometry and not geometry.isEmpty() else []
+            parts = [part for part in (LinePart(points) for points in multi_parts) if part.is_valid()]
+            self._parts[feature.id()] = parts
+        return parts
+
+    def substring_between(self, feature, point_a, point_b):
+        """
+        Extracts the sub-segment of the river between two points.
+
+        The first part where the two points locate at different distances is
+        used (if both project to the same spot, e.g. the same end vertex of a
+        part far away from both, the part does not contain them).
+
+        :param feature: River QgsFeature.
+        :param point_a: QgsPointXY, in the CRS of the river.
+        :param point_b: QgsPointXY, in the CRS of the river.
+        :return:        The sub-segment as QgsGeometry, or None if no part matches.
+        """
+        for part in self.parts(feature):
+            start_dist = part.locate(point_a.x(), point_a.y())
+            end_dist = part.locate(point_b.x(), point_b.y())
+            if start_dist == end_dist:
+                continue
+            if start_dist > end_dist:
+                start_dist, end_dist = end_dist, start_dist
+            sub_geom = part.substring(start_dist, end_dist)
+            if not sub_geom.isEmpty():
+                return sub_geom
+        return None
@@ -1,13 +1,17 @@
 # -*- coding: utf-8 -*-
-from qgis.PyQt.QtWidgets import QAction, QMenu, QMessageBox
+from qgis.PyQt.QtWidgets import QAction, QFileDialog, QInputDialog, QMenu, QMessageBox
 from qgis.PyQt.QtCore import QCoreApplication, Qt
 from qgis.PyQt.QtGui import QIcon
-from qgis.core import QgsApplication
+from qgis.core import QgsApplication, QgsMapLayerType
 from qgis.utils import iface
-from .dss_watershed_load_dockwidget import WatershedLoadDockWidget
-from .dss_hpp_load_dockwidget import HPPLoadDockWidget
+from .dss_expressions import register_functions, unregister_functions
+from .dss_rendering import lightweight_rendering, set_lightweight_rendering
+from .dss_session import DSSSession
 import os
 
+# The dock widget modules (and the analysis modules they pull in) are only
+# imported when their action is first triggered, to keep QGIS startup fast.
+
 class DSSMenuPlugin:
     def __init__(self, iface):
         """
@@ -20,27 +24,94 @@ class DSSMenuPlugin:
         self.actions = []  # Keep track of our custom actions so we can remove them later
         self.watershed_load_widget = None
         self.hpp_load_widget = None
+        self.run_history_widget = None
+        # Indexes, lookups and transforms shared by all DSS tools
+        self.session = DSSSession()
 
     def open_watershed_load_widget(self):
         if not self.watershed_load_widget:
+            from .dss_watershed_load_dockwidget import WatershedLoadDockWidget
             # Pass the QGIS interface as the first argument and the QMainWindow as the parent
-            self.watershed_load_widget = WatershedLoadDockWidget(self.iface, parent=self.iface.mainWindow())
+            self.watershed_load_widget = WatershedLoadDockWidget(self.iface, parent=self.iface.mainWindow(), session=self.session)
             self.iface.addDockWidget(Qt.LeftDockWidgetArea, self.watershed_load_widget)
         else:
             self.watershed_load_widget.show()
             
     def open_hpp_load_widget(self):
         if not self.hpp_load_widget:
-            self.hpp_load_widget = HPPLoadDockWidget(self.iface, parent=self.iface.mainWindow())
+            from .dss_hpp_load_dockwidget import HPPLoadDockWidget
+            self.hpp_load_widget = HPPLoadDockWidget(self.iface, parent=self.iface.mainWindow(), session=self.session)
             # Add to QGIS
             self.iface.addDockWidget(Qt.LeftDockWidgetArea, self.hpp_load_widget)
         else:
             # If it's already created, just show it
             self.hpp_load_widget.show()
     
+    def open_run_history_widget(self):
+        if not self.run_history_widget:
+            from .dss_run_history_dockwidget import RunHistoryDockWidget
+            self.run_history_widget = RunHistoryDockWidget(self.iface, parent=self.iface.mainWindow(), session=self.session)
+            self.iface.addDockWidget(Qt.RightDockWidgetArea, self.run_history_widget)
+        else:
+            self.run_history_widget.show()
+
     def empty_action(self):
         pass
 
+    def update_session_usage(self, *args):
+        self.session_usage_action.setText(f"Session: {self.session.summary()}")
+
+    def export_active_layer(self):
+        """Writes the active vector layer (e.g. a DSS result layer) to GeoParquet or Arrow."""
+        from .dss_export import ExportError, export_layer
+        layer = self.iface.activeLayer()
+        if layer is None or layer.type() != QgsMapLayerType.VectorLayer:
+            QMessageBox.warning(self.iface.mainWindow(), "DSS Export", "Select the vector layer to export first.")
+            return
+        path, _ = QFileDialog.getSaveFileName(
+            self.iface.mainWindow(), "Export Layer", f"{layer.name()}.parquet",
+            "GeoParquet (*.parquet);;Arrow IPC (*.arrow)"
+        )
+        if not path:
+            return
+        try:
+            count = export_layer(layer, path, {'tool': 'DSS'})
+        except ExportError as e:
+            QMessageBox.warning(self.iface.mainWindow(), "DSS Export", str(e))
+            return
+        self.iface.messageBar().pushSuccess("DSS Export", f"{count} features written to {path}")
+
+    def toggle_profile_next_run(self, checked):
+        profiler = self.session.profiler
+        if not checked:
+            profiler.disarm()
+            return
+        directory = QFileDialog.getExistingDirectory(
+            self.iface.mainWindow(), "Folder for the profile files", profiler.directory
+        )
+        if directory:
+            profiler.arm(directory)
+        else:
+            self.profile_action.setChecked(False)
+
+    def clear_session_caches(self):
+        self.session.clear()
+
+    def clear_result_cache(self):
+        self.session.result_cache.clear()
+
+    def set_session_memory_budget(self):
+        budget_mb, ok = QInputDialog.getInt(
+            self.iface.mainWindow(),
+            "DSS Memory Budget",
+            "Memory budget of the session caches (MB):",
+            self.session.memory_budget // (1024 * 1024),
+            16,
+            65536
+        )
+        if ok:
+            self.session.set_memory_budget_mb(budget_mb)
+
     def show_about(self):
         """
         Opens a message box with "About DSS" information.
@@ -163,12 +234,61 @@ class DSSMenuPlugin:
         hpp_load_action.triggered.connect(self.open_hpp_load_widget)
         water_resources_load_menu.addAction(hpp_load_action)
 
+        run_history_action = QAction("Run History", self.iface.mainWindow())
+        run_history_action.triggered.connect(self.open_run_history_widget)
+        water_resources_load_menu.addAction(run_history_action)
+
+        water_resources_load_menu.addSeparator()
+
+        export_action = QAction("Export Layer to Parquet/Arrow...", self.iface.mainWindow())
+        export_action.triggered.connect(self.export_active_layer)
+        water_resources_load_menu.addAction(export_action)
+
+        # Cheap symbols and draw-time simplification for DSS output layers when zoomed out
+        lightweight_rendering_action = QAction("Lightweight Rendering", self.iface.mainWindow())
+        lightweight_rendering_action.setCheckable(True)
+        lightweight_rendering_action.setChecked(lightweight_rendering())
+        lightweight_rendering_action.toggled.connect(set_lightweight_rendering)
+        water_resources_load_menu.addAction(lightweight_rendering_action)
+
         #================= Climate Change Model =================
         climate_change_model_menu = QMenu("Climate Change Model", self.iface.mainWindow())
         self.menu.addMenu(climate_change_model_menu)
         
         self.menu.addSeparator()
         
+        #================= Session =================
+        session_menu = QMenu("Session", self.iface.mainWindow())
+        self.menu.addMenu(session_menu)
+        
+        self.session_usage_action = QAction("", self.iface.mainWindow())
+        self.session_usage_action.setEnabled(False)
+        session_menu.addAction(self.session_usage_action)
+        session_menu.aboutToShow.connect(self.update_session_usage)
+        
+        memory_budget_action = QAction("Memory Budget...", self.iface.mainWindow())
+        memory_budget_action.triggered.connect(self.set_session_memory_budget)
+        session_menu.addAction(memory_budget_action)
+        
+        clear_caches_action = QAction("Clear Caches", self.iface.mainWindow())
+        clear_caches_action.triggered.connect(self.clear_session_caches)
+        session_menu.addAction(clear_caches_action)
+        
+        clear_result_cache_action = QAction("Clear Result Cache", self.iface.mainWindow())
+        clear_result_cache_action.triggered.connect(self.clear_result_cache)
+        session_menu.addAction(clear_result_cache_action)
+
+        session_menu.addSeparator()
+
+        # cProfile + tracemalloc around the next Watershed or HPP calculation; turns itself off after it
+        self.profile_action = QAction("Profile Next Run", self.iface.mainWindow())
+        self.profile_action.setCheckable(True)
+        self.profile_action.triggered.connect(self.toggle_profile_next_run)
+        self.session.profiler.armedChanged.connect(self.profile_action.setChecked)
+        session_menu.addAction(self.profile_action)
+        
+        self.menu.addSeparator()
+        
         #================= Language =================
         language_menu = QMenu("Language", self.iface.mainWindow())
         self.menu.addMenu(language_menu)
@@ -191,6 +311,9 @@ class DSSMenuPlugin:
         about_action.triggered.connect(self.show_about)
         self.menu.addAction(about_action)
 
+        # dss_water_stress() and dss_upstream_rcodes() in the expression engine
+        register_functions(self.session)
+
     def unload(self):
         """Called by QGIS (or the reloader) when the plugin is unloaded."""
         if self.menu:
@@ -204,3 +327,6 @@ class DSSMenuPlugin:
         # Also clear out your actions so you don't accidentally re-add them
         self.actions = []
 
+        unregister_functions()
+        self.session.clear()
+
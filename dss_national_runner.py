@@ -0,0 +1,608 @@
+# -*- coding: utf-8 -*-
+"""
+Runs the watershed and HPP load pipelines over the whole country, one
+top-level basin per process.
+
+The study area is split by the first `basin_digits` digits of the catchment
+RCode. Every worker process starts its own standalone QGIS application and
+opens the input layers with a subset filter on its basin, so its memory stays
+bounded by the size of the basin. Outputs are written per basin and merged
+into a single GeoPackage at the end.
+
+HPPs whose abstraction and discharge points lie in different basins
+(cross-basin diversions) are not processed by either basin worker: they are
+reported back and processed in a second round by workers that open both
+basins. River coverage is computed in a third round, once all segments
+(including the cross-basin ones) are known.
+
+Usage, from the QGIS plugins directory (so that the plugin is importable)
+and with the QGIS Python environment set up:
+
+    python -m dss.dss_national_runner config.json
+
+Example config.json:
+
+    {
+        "output": "/data/runs/national.gpkg",
+        "workers": 8,
+        "basin_digits": 2,
+        "layers": {
+            "catchments": "/data/erica.gpkg|layername=catchments",
+            "water_bodies": "/data/erica.gpkg|layername=water_bodies",
+            "rivers": "/data/erica.gpkg|layername=rivers",
+            "water_abstraction": "/data/permits.gpkg|layername=abstraction",
+            "water_discharge": "/data/permits.gpkg|layername=discharge",
+            "groundwater": "/data/erica.gpkg|layername=groundwater",
+            "hpp_abstraction": "/data/hpp.gpkg|layername=abstraction",
+            "hpp_discharge": "/data/hpp.gpkg|layername=discharge",
+            "points": "/data/outlets.gpkg|layername=outlets"
+        },
+        "basin_fields": {
+            "catchments": "RCode",
+            "rivers": "RCode",
+            "water_bodies": "RCode"
+        }
+    }
+
+Layers listed in "basin_fields" are filtered per basin on that field. The
+water bodies, water abstraction, water discharge, groundwater and rivers
+layers are otherwise clipped to the extent of the basin catchments (read
+into memory), so the memory of a worker follows the size of its basin. The
+HPP abstraction and discharge points and the outlet points are opened
+whole: round 1 needs every HPP discharge to recognize the cross-basin
+diversions, and the points are only read to test their location. The watershed pipeline runs when "points"
+is given, the HPP pipeline when "hpp_abstraction" and "hpp_discharge" are.
+
+With "export_dir" (and pyarrow installed), every output layer is also
+written there as GeoParquet (e.g. ws_points.parquet), with the run
+configuration in the file metadata, ready for pandas or DuckDB.
+
+With "as_of" (a date as "YYYY-MM-DD"), the WS only counts the water
+abstraction permits valid on that day (see dss_permits).
+
+With "history" (true, or the path of a run history database), the WS per
+outlet RCode, the segment length per HPP code and the coverage per river
+are also kept in the DSS run history, to be opened or compared with other
+runs from the Run History panel.
+"""
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from qgis.PyQt.QtCore import QVariant
+from qgis.core import (
+    Qgis,
+    QgsApplication,
+    QgsCoordinateTransform,
+    QgsFeature,
+    QgsFeatureRequest,
+    QgsField,
+    QgsFields,
+    QgsGeometry,
+    QgsProject,
+    QgsRectangle,
+    QgsSpatialIndex,
+    QgsVectorFileWriter,
+    QgsVectorLayer,
+    QgsWkbTypes
+)
+
+from .dss_diagnostics import LEVEL_NAMES, RunDiagnostics
+from .dss_hpp_engine import HPPSegmentEngine, coverage_percent, normalize_code
+from .dss_watershed_engine import CATCHMENT_ID_FIELD, WatershedLoadEngine, WatershedLoadError
+
+_QGIS_APP = None
+
+WS_FIELDS = [
+    ('SourceFid', QVariant.LongLong),
+    ('Basin', QVariant.String),
+    ('RCode', QVariant.String),
+    ('WS_Surface', QVariant.Double),
+    ('WS_Groundwater', QVariant.Double),
+    ('WS_Total', QVariant.Double),
+]
+
+
+def _init_qgis():
+    """Starts a standalone (non-GUI) QGIS application once per process."""
+    global _QGIS_APP
+    if _QGIS_APP is None and QgsApplication.instance() is not None:
+        # called in a process that already runs QGIS (e.g. the tests)
+        _QGIS_APP = QgsApplication.instance()
+    if _QGIS_APP is None:
+        _QGIS_APP = QgsApplication([], False)
+        _QGIS_APP.initQgis()
+    return _QGIS_APP
+
+
+def basin_filter(field_name, basins):
+    """Provider subset string keeping the features whose `field_name` starts with one of `basins`."""
+    return " OR ".join(
+        f"CAST(\"{field_name}\" AS character(32)) LIKE '{basin}%'" for basin in sorted(basins)
+    )
+
+
+def list_basins(config):
+    """Distinct top-level basin codes found in the catchments layer."""
+    layer = QgsVectorLayer(config['layers']['catchments'], 'catchments', 'ogr')
+    request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry)
+    request.setSubsetOfAttributes([CATCHMENT_ID_FIELD], layer.fields())
+    digits = config.get('basin_digits', 2)
+    basins = set()
+    for feature in layer.getFeatures(request):
+        rcode = feature[CATCHMENT_ID_FIELD]
+        if rcode is None or str(rcode) in ('', 'NULL'):
+            continue
+        basins.add(str(rcode)[:digits])
+    return sorted(basins)
+
+
+# Layers read into memory for the extent of the worker's catchments (see the module docstring)
+CLIPPED_LAYERS = ('water_bodies', 'water_abstraction', 'water_discharge', 'groundwater', 'rivers')
+# Margin added around the catchments extent, as a share of its larger side
+CLIP_MARGIN = 0.05
+
+
+def _open_layers(config, basins, clip=CLIPPED_LAYERS):
+    """
+    Opens all configured layers, filtering the ones with a basin field to
+    `basins` and clipping the `clip` ones to the extent of the basin catchments.
+    """
+    basin_fields = config.get('basin_fields', {'catchments': CATCHMENT_ID_FIELD})
+    layers = {}
+    for key, source in config['layers'].items():
+        layer = QgsVectorLayer(source, key, 'ogr')
+        if not layer.isValid():
+            raise RuntimeError(f"Layer '{key}' could not be opened from {source}.")
+        if key in basin_fields:
+            layer.setSubsetString(basin_filter(basin_fields[key], basins))
+        layers[key] = layer
+
+    catchments = layers['catchments']
+    catchments.updateExtents()
+    extent = catchments.extent()
+    extent.grow(CLIP_MARGIN * max(extent.width(), extent.height()))
+    for key in clip:
+        if key not in layers or key in basin_fields:
+            continue
+        layer = layers[key]
+        rect = extent
+        if layer.crs() != catchments.crs():
+            rect = QgsCoordinateTransform(catchments.crs(), layer.crs(), QgsProject.instance()).transformBoundingBox(extent)
+        layers[key] = layer.materialize(QgsFeatureRequest().setFilterRect(rect))
+    return layers
+
+
+class _BasinLocator:
+    """Tells whether a geometry lies in the (filtered) catchments of a worker."""
+
+    def __init__(self, catchments_layer):
+        self.layer = catchments_layer
+        self.index = QgsSpatialIndex(catchments_layer.getFeatures())
+
+    def catchment_at(self, geometry, source_crs):
+        if source_crs != self.layer.crs():
+            geometry = QgsGeometry(geometry)
+            geometry.transform(QgsCoordinateTransform(source_crs, self.layer.crs(), QgsProject.instance()))
+        candidate_ids = self.index.intersects(geometry.boundingBox())
+        if not candidate_ids:
+            return None
+        for feature in self.layer.getFeatures(QgsFeatureRequest().setFilterFids(candidate_ids)):
+            if feature.geometry().intersects(geometry):
+                return feature
+        return None
+
+
+def _write_layer(path, layer_name, fields, wkb_type, crs, features):
+    """Writes `features` as layer `layer_name` of the GeoPackage at `path`."""
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = 'GPKG'
+    options.layerName = layer_name
+    options.actionOnExistingFile = (
+        QgsVectorFileWriter.CreateOrOverwriteLayer if os.path.exists(path)
+        else QgsVectorFileWriter.CreateOrOverwriteFile
+    )
+    writer = QgsVectorFileWriter.create(path, fields, wkb_type, crs, QgsProject.instance().transformContext(), options)
+    writer.addFeatures(features)
+    del writer
+
+
+def _fields(definitions):
+    fields = QgsFields()
+    for name, field_type in definitions:
+        fields.append(QgsField(name, field_type))
+    return fields
+
+
+def _diagnostic_rows(diagnostics, basin):
+    return [
+        (basin, category, LEVEL_NAMES.get(level, str(level)), code, message)
+        for category, level, code, message in diagnostics.records
+    ]
+
+
+# ---------------------------------------------------------------- round 1
+
+def run_basin(config, basin, work_dir):
+    """
+    Worker: watershed WS for the outlet points of the basin and HPP segments
+    for the HPPs fully inside the basin.
+
+    :return: Dict with the output path, the cross-basin HPP codes found here
+             and the codes of the HPP discharges located in this basin.
+    """
+    _init_qgis()
+    layers = _open_layers(config, [basin])
+    locator = _BasinLocator(layers['catchments'])
+    output = os.path.join(work_dir, f"basin_{basin}.gpkg")
+    diagnostics = RunDiagnostics(f"Basin {basin}")
+    result = {'basin': basin, 'output': output, 'cross_basin': {}, 'discharge_basins': {}, 'ws_count': 0, 'segment_count': 0}
+
+    # ---- watershed pipeline for the outlet points in this basin
+    if 'points' in layers:
+        engine = WatershedLoadEngine(
+            layers['water_bodies'], layers['catchments'], layers['water_abstraction'],
+            layers['water_discharge'], layers['groundwater']
+        )
+        as_of = datetime.date.fromisoformat(config['as_of']) if config.get('as_of') else None
+        points_layer = layers['points']
+        to_water_bodies = QgsCoordinateTransform(points_layer.crs(), layers['water_bodies'].crs(), QgsProject.instance())
+        fields = _fields(WS_FIELDS)
+        ws_features = []
+        for point_feat in points_layer.getFeatures():
+            if not locator.catchment_at(point_feat.geometry(), points_layer.crs()):
+                continue
+            point = to_water_bodies.transform(point_feat.geometry().asPoint())
+            try:
+                results = engine.calculate(point, as_of)
+            except WatershedLoadError as e:
+                diagnostics.add('ws_failed', f"Point {point_feat.id()}: {e}", Qgis.Warning, code=point_feat.id())
+                continue
+            feature = QgsFeature(fields)
+            feature.setGeometry(results['union_geometry'])
+            feature.setAttributes([
+                point_feat.id(), basin, str(results['catchment_id']),
+                results['ws_surface'], results['ws_groundwater'], results['ws_total']
+            ])
+            ws_features.append(feature)
+        _write_layer(output, 'ws_points', fields, QgsWkbTypes.MultiPolygon, layers['catchments'].crs(), ws_features)
+        result['ws_count'] = len(ws_features)
+
+    # ---- HPP pipeline for the HPPs with both points in this basin
+    if 'hpp_abstraction' in layers and 'hpp_discharge' in layers:
+        hpp_engine = HPPSegmentEngine(
+            layers['rivers'], layers['hpp_abstraction'], layers['hpp_discharge'], layers['catchments']
+        )
+        hpp_engine.prepare()
+        discharge_layer = layers['hpp_discharge']
+        for discharge_feat in discharge_layer.getFeatures():
+            if locator.catchment_at(discharge_feat.geometry(), discharge_layer.crs()):
+                for code in hpp_engine.discharge_codes(discharge_feat):
+                    result['discharge_basins'][code] = basin
+
+        abstraction_layer = layers['hpp_abstraction']
+        local_features = []
+        for abs_feat in abstraction_layer.getFeatures():
+            if not locator.catchment_at(abs_feat.geometry(), abstraction_layer.crs()):
+                continue
+            code = normalize_code(abs_feat[hpp_engine.abstraction_code_field])
+            discharges = hpp_engine.discharge_code_dict.get(code, [])
+            if len(discharges) == 1 and not locator.catchment_at(discharges[0].geometry(), discharge_layer.crs()):
+                # cross-basin diversion: processed in round 2 with both basins open
+                result['cross_basin'][code] = basin
+                continue
+            local_features.append(abs_feat)
+
+        segments = hpp_engine.run(max_workers=1, diagnostics=diagnostics, abstraction_features=local_features)
+        _write_segments(output, 'hpp_segments', segments, basin, layers['rivers'].crs())
+        result['segment_count'] = len(segments)
+
+    result['diagnostics'] = _diagnostic_rows(diagnostics, basin)
+    return result
+
+
+def _write_segments(path, layer_name, segments, basin, crs):
+    fields = _fields([('AbstrCode', QVariant.String), ('Basin', QVariant.String)])
+    features = []
+    for code, geometry in segments:
+        feature = QgsFeature(fields)
+        feature.setGeometry(geometry)
+        feature.setAttributes([str(code), basin])
+        features.append(feature)
+    _write_layer(path, layer_name, fields, QgsWkbTypes.LineString, crs, features)
+
+
+# ---------------------------------------------------------------- round 2
+
+def run_cross_basin(config, basins, codes, work_dir):
+    """Worker: HPP segments of cross-basin diversions, with all involved basins open."""
+    _init_qgis()
+    layers = _open_layers(config, basins)
+    key = "_".join(sorted(basins))
+    output = os.path.join(work_dir, f"cross_{key}.gpkg")
+    diagnostics = RunDiagnostics(f"Cross-basin {key}")
+
+    hpp_engine = HPPSegmentEngine(
+        layers['rivers'], layers['hpp_abstraction'], layers['hpp_discharge'], layers['catchments']
+    )
+    codes = set(codes)
+    features = [
+        abs_feat for abs_feat in layers['hpp_abstraction'].getFeatures()
+        if normalize_code(abs_feat[hpp_engine.abstraction_code_field]) in codes
+    ]
+    segments = hpp_engine.run(max_workers=1, diagnostics=diagnostics, abstraction_features=features)
+    _write_segments(output, 'hpp_segments', segments, key, layers['rivers'].crs())
+    return {'output': output, 'segment_count': len(segments), 'diagnostics': _diagnostic_rows(diagnostics, key)}
+
+
+# ---------------------------------------------------------------- round 3
+
+def run_coverage(config, basin, segments_path, work_dir):
+    """
+    Worker: coverage of the rivers of a basin by all HPP segments (cross-basin
+    included). A river belongs to the basin holding its midpoint; its source
+    feature id is kept in RiverFid.
+    """
+    _init_qgis()
+    # the rivers are read by location below, with their source feature ids
+    layers = _open_layers(config, [basin], clip=())
+    rivers_layer = layers['rivers']
+    locator = _BasinLocator(layers['catchments'])
+    catchments_extent = layers['catchments'].extent()
+    if rivers_layer.crs() != layers['catchments'].crs():
+        catchments_extent = QgsCoordinateTransform(
+            layers['catchments'].crs(), rivers_layer.crs(), QgsProject.instance()
+        ).transformBoundingBox(catchments_extent)
+
+    rivers = []
+    extent = QgsRectangle()
+    extent.setMinimal()
+    for river_feat in rivers_layer.getFeatures(QgsFeatureRequest().setFilterRect(catchments_extent)):
+        river_geom = river_feat.geometry()
+        if river_geom.isEmpty():
+            continue
+        midpoint = river_geom.interpolate(river_geom.length() / 2)
+        if not locator.catchment_at(midpoint, rivers_layer.crs()):
+            continue
+        rivers.append(river_feat)
+        extent.combineExtentWith(river_geom.boundingBox())
+
+    segments_layer = QgsVectorLayer(f"{segments_path}|layername=hpp_segments", 'segments', 'ogr')
+    # only the segments around the rivers of this basin are read
+    segment_geometries = {
+        feat.id(): feat.geometry()
+        for feat in segments_layer.getFeatures(QgsFeatureRequest().setFilterRect(extent))
+    } if rivers else {}
+    segment_index = QgsSpatialIndex()
+    for fid, geometry in segment_geometries.items():
+        segment_index.addFeature(fid, geometry.boundingBox())
+
+    fields = QgsFields(rivers_layer.fields())
+    fields.append(QgsField('RiverFid', QVariant.LongLong))
+    fields.append(QgsField('CoveragePct', QVariant.Double))
+    features = []
+    for river_feat in rivers:
+        river_geom = river_feat.geometry()
+        nearby = [segment_geometries[fid] for fid in segment_index.intersects(river_geom.boundingBox())]
+        coverage_pct = coverage_percent(river_geom, QgsGeometry.unaryUnion(nearby)) if nearby else 0.0
+        if coverage_pct is None:
+            continue
+        feature = QgsFeature(fields)
+        feature.setGeometry(river_geom)
+        feature.setAttributes(river_feat.attributes() + [river_feat.id(), coverage_pct])
+        features.append(feature)
+
+    output = os.path.join(work_dir, f"coverage_{basin}.gpkg")
+    _write_layer(output, 'rivers_coverage', fields, rivers_layer.wkbType(), rivers_layer.crs(), features)
+    return {'output': output}
+
+
+# ------------------------------------------------------------------ merge
+
+def _append_layers(sources, layer_name, output, dedupe_field=None):
+    """
+    Appends layer `layer_name` of every GeoPackage in `sources` into `output`.
+    With `dedupe_field`, a value is taken from the first source holding it
+    only (a source may hold several features with the same value).
+    """
+    owners = {}
+    writer = None
+    for position, source in enumerate(sources):
+        layer = QgsVectorLayer(f"{source}|layername={layer_name}", layer_name, 'ogr')
+        if not layer.isValid():
+            continue
+        if writer is None:
+            options = QgsVectorFileWriter.SaveVectorOptions()
+            options.driverName = 'GPKG'
+            options.layerName = layer_name
+            options.actionOnExistingFile = (
+                QgsVectorFileWriter.CreateOrOverwriteLayer if os.path.exists(output)
+                else QgsVectorFileWriter.CreateOrOverwriteFile
+            )
+            fields = QgsFields()
+            for field in layer.fields():
+                if field.name() != 'fid':
+                    fields.append(field)
+            writer = QgsVectorFileWriter.create(
+                output, fields, layer.wkbType(), layer.crs(), QgsProject.instance().transformContext(), options
+            )
+        for feature in layer.getFeatures():
+            if dedupe_field:
+                # a feature on a basin boundary is processed by both basins: keep the first
+                if owners.setdefault(feature[dedupe_field], position) != position:
+                    continue
+            out_feature = QgsFeature(fields)
+            out_feature.setGeometry(feature.geometry())
+            out_feature.setAttributes([feature[field.name()] for field in fields])
+            writer.addFeature(out_feature)
+    del writer
+
+
+def _write_diagnostics(output, rows):
+    fields = _fields([(name, QVariant.String) for name in ('basin', 'category', 'level', 'code', 'message')])
+    features = []
+    for row in rows:
+        feature = QgsFeature(fields)
+        feature.setAttributes([str(value) for value in row])
+        features.append(feature)
+    _write_layer(output, 'diagnostics', fields, QgsWkbTypes.NoGeometry, QgsProject.instance().crs(), features)
+
+
+def _export_outputs(output, export_dir, metadata):
+    """Writes every layer of the output GeoPackage to `export_dir` as GeoParquet; returns the paths."""
+    from .dss_export import export_layer
+    os.makedirs(export_dir, exist_ok=True)
+    paths = []
+    for layer_name in ('ws_points', 'hpp_segments', 'rivers_coverage', 'diagnostics'):
+        layer = QgsVectorLayer(f"{output}|layername={layer_name}", layer_name, 'ogr')
+        if not layer.isValid():
+            continue
+        path = os.path.join(export_dir, f"{layer_name}.parquet")
+        export_layer(layer, path, metadata)
+        paths.append(path)
+    return paths
+
+
+def _record_history(config, output, basins, summary):
+    """Keeps the outputs of the run in the run history; returns the run id."""
+    from .dss_run_history import (
+        CATCHMENT_KIND, HPP_KIND, NATIONAL_TOOL, RIVER_KIND, WS_METRICS, RunHistory, inputs_description
+    )
+    path = config['history'] if isinstance(config['history'], str) else None
+    values = {}
+    geometries = {}
+    crs = None
+
+    ws_layer = QgsVectorLayer(f"{output}|layername=ws_points", 'ws_points', 'ogr')
+    if ws_layer.isValid():
+        crs = ws_layer.crs()
+        values[CATCHMENT_KIND] = {
+            feat['RCode']: {metric: feat[metric] for metric in WS_METRICS} for feat in ws_layer.getFeatures()
+        }
+        geometries[CATCHMENT_KIND] = {feat['RCode']: feat.geometry() for feat in ws_layer.getFeatures()}
+
+    segments_layer = QgsVectorLayer(f"{output}|layername=hpp_segments", 'hpp_segments', 'ogr')
+    if segments_layer.isValid():
+        lengths = {}
+        for feat in segments_layer.getFeatures():
+            code = str(normalize_code(feat['AbstrCode']))
+            lengths[code] = lengths.get(code, 0.0) + feat.geometry().length()
+        values[HPP_KIND] = {code: {'SegmentLength': length} for code, length in lengths.items()}
+
+    coverage_layer = QgsVectorLayer(f"{output}|layername=rivers_coverage", 'rivers_coverage', 'ogr')
+    if coverage_layer.isValid():
+        # keyed by the feature id of the river in the input layer, as the HPP tool records it
+        values[RIVER_KIND] = {
+            feat['RiverFid']: {'CoveragePct': feat['CoveragePct']} for feat in coverage_layer.getFeatures()
+        }
+
+    layers = [
+        QgsVectorLayer(source, name, 'ogr') for name, source in sorted(config['layers'].items())
+    ]
+    return RunHistory(path).record(
+        NATIONAL_TOOL,
+        f"National run ({len(basins)} basins)",
+        {'config': config},
+        inputs_description(layers),
+        values,
+        geometries,
+        crs,
+        {key: summary[key] for key in ('ws_points', 'segments', 'diagnostics')}
+    )
+
+
+def _feature_count(output, layer_name):
+    layer = QgsVectorLayer(f"{output}|layername={layer_name}", layer_name, 'ogr')
+    return layer.featureCount() if layer.isValid() else 0
+
+
+def run(config, executor=None):
+    """
+    Runs the three rounds and merges the outputs into config['output'].
+
+    :param executor: Executor running the workers; a process pool by default.
+    """
+    _init_qgis()
+    basins = list_basins(config)
+    work_dir = config.get('work_dir') or tempfile.mkdtemp(prefix='dss_national_')
+    output = config['output']
+    if os.path.exists(output):
+        os.remove(output)
+
+    if executor is None:
+        context = multiprocessing.get_context('spawn')
+        executor = ProcessPoolExecutor(max_workers=config.get('workers'), mp_context=context)
+    with executor:
+        # round 1: one worker per basin
+        basin_results = list(executor.map(run_basin, [config] * len(basins), basins, [work_dir] * len(basins)))
+        diagnostics = [row for result in basin_results for row in result['diagnostics']]
+
+        # round 2: cross-basin diversions, grouped by the pair of basins they connect
+        discharge_basins = {}
+        for result in basin_results:
+            discharge_basins.update(result['discharge_basins'])
+        groups = {}
+        for result in basin_results:
+            for code, abstraction_basin in result['cross_basin'].items():
+                involved = tuple(sorted({abstraction_basin, discharge_basins.get(code, abstraction_basin)}))
+                groups.setdefault(involved, []).append(code)
+        cross_results = list(executor.map(
+            run_cross_basin,
+            [config] * len(groups), [list(key) for key in groups], list(groups.values()), [work_dir] * len(groups)
+        ))
+        diagnostics.extend(row for result in cross_results for row in result['diagnostics'])
+
+        segment_sources = [result['output'] for result in basin_results] + [result['output'] for result in cross_results]
+        has_hpp = 'hpp_abstraction' in config['layers'] and 'hpp_discharge' in config['layers']
+        if has_hpp:
+            # an HPP whose abstraction lies on a basin boundary is computed by both basins
+            _append_layers(segment_sources, 'hpp_segments', output, dedupe_field='AbstrCode')
+            # round 3: coverage per basin, against all segments
+            coverage_results = list(executor.map(
+                run_coverage, [config] * len(basins), basins, [output] * len(basins), [work_dir] * len(basins)
+            ))
+            _append_layers(
+                [result['output'] for result in coverage_results], 'rivers_coverage', output, dedupe_field='RiverFid'
+            )
+
+    if 'points' in config['layers']:
+        _append_layers([result['output'] for result in basin_results], 'ws_points', output, dedupe_field='SourceFid')
+    _write_diagnostics(output, diagnostics)
+
+    exports = []
+    if config.get('export_dir'):
+        exports = _export_outputs(output, config['export_dir'], {'tool': 'dss_national_runner', 'basins': basins, 'config': config})
+
+    summary = {
+        'basins': len(basins),
+        'ws_points': _feature_count(output, 'ws_points'),
+        'segments': _feature_count(output, 'hpp_segments'),
+        'cross_basin_codes': sum(len(codes) for codes in groups.values()),
+        'diagnostics': len(diagnostics),
+        'output': output,
+        'exports': exports,
+    }
+    if config.get('history'):
+        summary['history_run'] = _record_history(config, output, basins, summary)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="DSS national run, one basin per process.")
+    parser.add_argument('config', help="JSON configuration file")
+    args = parser.parse_args(argv)
+    with open(args.config, encoding='utf-8') as config_file:
+        config = json.load(config_file)
+    summary = run(config)
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import math
+
+from qgis.core import QgsGeometry
+
+
+def box_distance(point, rectangle):
+    """Distance from a point to a rectangle (0 inside): a lower bound of the distance to anything inside it."""
+    dx = max(rectangle.xMinimum() - point.x(), 0.0, point.x() - rectangle.xMaximum())
+    dy = max(rectangle.yMinimum() - point.y(), 0.0, point.y() - rectangle.yMaximum())
+    return math.hypot(dx, dy)
+
+
+def nearest_feature(index, point, fetch, batch_size=8):
+    """
+    Exact nearest feature to `point` by geometry distance.
+
+    The spatial index yields candidates in increasing bounding-box distance,
+    which is a lower bound of their geometry distance. Candidates are
+    evaluated in that order, in batches, and the search stops as soon as the
+    next bounding box is not closer than the best geometry found: no feature
+    left can beat it. When a batch is exhausted without reaching that point,
+    the next query asks the index for twice as many neighbours.
+
+    :param index:      QgsSpatialIndex of the layer.
+    :param point:      QgsPointXY, in the CRS of the layer.
+    :param fetch:      Callable returning the features of a list of ids, in
+                       that order (e.g. FeatureCache.features).
+    :param batch_size: Number of neighbours asked for in the first query.
+    :return:           (nearest QgsFeature, distance), or (None, inf) for an empty index.
+    """
+    point_geom = QgsGeometry.fromPointXY(point)
+    best_feat = None
+    best_dist = float('inf')
+    evaluated = set()
+    k = batch_size
+
+    while True:
+        candidate_ids = index.nearestNeighbor(point, k)
+        new_ids = [fid for fid in candidate_ids if fid not in evaluated]
+        for candidate_feat in fetch(new_ids):
+            geometry = candidate_feat.geometry()
+            if box_distance(point, geometry.boundingBox()) >= best_dist:
+                # candidates come by increasing box distance: none of the others can be closer
+                return best_feat, best_dist
+            dist = geometry.distance(point_geom)
+            if dist < best_dist:
+                best_dist = dist
+                best_feat = candidate_feat
+        evaluated.update(new_ids)
+
+        if len(candidate_ids) < k:
+            # the whole index was browsed
+            return best_feat, best_dist
+        k *= 2
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+import json
+
+from qgis.core import QgsGeometry, QgsRectangle
+
+from . import dss_counters as counters
+from .dss_result_cache import layer_fingerprint
+
+# Layer custom property holding the assignment table (saved with the project)
+ASSIGNMENT_PROPERTY = 'dss/outlet_catchments'
+
+
+def assignment_key(catchments_layer_id, catchments_generation):
+    """Session key of the table on the water bodies layer; it also depends on the catchments."""
+    return ('outlets', catchments_layer_id, catchments_generation)
+
+
+def assignment_signature(water_bodies_layer, catchments_layer):
+    """
+    Identifies the content of both layers; None when it cannot be identified
+    reliably across sessions (memory layers, unsaved edits), in which case the
+    table is only kept in memory.
+    """
+    water_bodies = layer_fingerprint(water_bodies_layer)
+    catchments = layer_fingerprint(catchments_layer)
+    if water_bodies is None or catchments is None:
+        return None
+    return json.dumps([water_bodies, catchments], sort_keys=True)
+
+
+class OutletAssignment:
+    """
+    Water body -> outlet catchment table, built once for a pair of layers.
+
+    For every water body it stores the catchments sharing the longest stretch
+    with it (several only on exact ties, or when no catchment intersects it);
+    the point-dependent part of the choice (a catchment containing the
+    clicked point, the closest of tied catchments) is resolved per click.
+    """
+
+    def __init__(self, table):
+        """:param table: Dict of water body feature id -> list of candidate catchment ids."""
+        self.table = table
+
+    def candidates(self, water_body_id):
+        return self.table.get(water_body_id, [])
+
+    @classmethod
+    def build(cls, water_bodies_layer, catchment_index, fetch_catchments, transform=None, feedback=None):
+        """
+        :param water_bodies_layer: Layer (or feature source) of the water bodies.
+        :param catchment_index:    QgsSpatialIndex of the catchments.
+        :param fetch_catchments:   Callable returning the catchment features of a list of ids, in order.
+        :param transform:          QgsCoordinateTransform from water bodies to catchments, if the CRSs differ.
+        """
+        counters.count(counters.FULL_LAYER_SCANS)
+        table = {}
+        for water_body in water_bodies_layer.getFeatures():
+            if feedback is not None and feedback.isCanceled():
+                break
+            geometry = QgsGeometry(water_body.geometry())
+            if transform is not None:
+                geometry.transform(transform)
+            candidate_ids = catchment_index.intersects(geometry.boundingBox())
+
+            best_ids = []
+            max_intersection_length = 0
+            for catchment in fetch_catchments(candidate_ids):
+                length = catchment.geometry().intersection(geometry).length()
+                if length > max_intersection_length:
+                    max_intersection_length = length
+                    best_ids = [catchment.id()]
+                elif length == max_intersection_length:
+                    best_ids.append(catchment.id())
+            table[water_body.id()] = best_ids
+        return cls(table)
+
+    def to_json(self, signature):
+        return json.dumps({'signature': signature, 'table': list(self.table.items())})
+
+    @classmethod
+    def from_json(cls, text, signature):
+        """The stored table, or None if it was built on other data."""
+        try:
+            stored = json.loads(text)
+        except (TypeError, ValueError):
+            return None
+        if stored.get('signature') != signature:
+            return None
+        return cls({water_body_id: catchment_ids for water_body_id, catchment_ids in stored['table']})
+
+    @classmethod
+    def stored(cls, water_bodies_layer, signature):
+        """The table stored with the water bodies layer if built on the data of `signature`, else None."""
+        if signature is None:
+            return None
+        return cls.from_json(water_bodies_layer.customProperty(ASSIGNMENT_PROPERTY), signature)
+
+    def store(self, water_bodies_layer, signature):
+        """Stores the table with the water bodies layer (main thread only), when the data can be identified."""
+        if signature is not None:
+            water_bodies_layer.setCustomProperty(ASSIGNMENT_PROPERTY, self.to_json(signature))
+
+    @classmethod
+    def for_layers(cls, water_bodies_layer, catchments_layer, catchment_index, fetch_catchments, transform=None):
+        """The table stored with the water bodies layer if still valid, else a new one (stored when possible)."""
+        signature = assignment_signature(water_bodies_layer, catchments_layer)
+        assignment = cls.stored(water_bodies_layer, signature)
+        if assignment is None:
+            assignment = cls.build(water_bodies_layer, catchment_index, fetch_catchments, transform)
+            assignment.store(water_bodies_layer, signature)
+        return assignment
+
+
+class ContainmentLookup:
+    """
+    Finds the catchment containing a point, with the prepared GEOS geometry
+    of each catchment tested so far kept for the next clicks.
+    """
+
+    def __init__(self, catchment_index, fetch_catchments):
+        self.catchment_index = catchment_index
+        self.fetch_catchments = fetch_catchments
+        self._engines = {}   # catchment id -> (geometry, prepared engine); the engine points into the geometry
+
+    def catchment_at(self, point):
+        """The catchment feature containing `point` (QgsPointXY, catchments CRS), or None."""
+        point_geom = QgsGeometry.fromPointXY(point)
+        candidate_ids = self.catchment_index.intersects(QgsRectangle(point.x(), point.y(), point.x(), point.y()))
+        for catchment in self.fetch_catchments(candidate_ids):
+            prepared = self._engines.get(catchment.id())
+            if prepared is None:
+                geometry = catchment.geometry()
+                engine = QgsGeometry.createGeometryEngine(geometry.constGet())
+                engine.prepareGeometry()
+                prepared = (geometry, engine)
+                self._engines[catchment.id()] = prepared
+            if prepared[1].contains(point_geom.constGet()):
+                return catchment
+        return None
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+import datetime
+
+import numpy as np
+
+from qgis.PyQt.QtCore import QDate, QDateTime
+
+# Validity of an abstraction permit; a missing field or a NULL date is an open bound
+PERMIT_START_FIELD = 'Valid_from'
+PERMIT_END_FIELD = 'Valid_to'
+
+OPEN_START = float('-inf')
+OPEN_END = float('inf')
+
+
+def day_number(value):
+    """
+    Day number (proleptic Gregorian ordinal, as a float) of a date attribute:
+    QDate, QDateTime, datetime.date or an ISO 'YYYY-MM-DD' string. None when
+    the value is NULL or not a date.
+    """
+    if isinstance(value, QDateTime):
+        value = value.date()
+    if isinstance(value, QDate):
+        if value.isNull() or not value.isValid():
+            return None
+        return float(value.toPyDate().toordinal())
+    if isinstance(value, datetime.datetime):
+        value = value.date()
+    if isinstance(value, datetime.date):
+        return float(value.toordinal())
+    if isinstance(value, str):
+        try:
+            return float(datetime.date.fromisoformat(value.strip()[:10]).toordinal())
+        except ValueError:
+            return None
+    return None
+
+
+def permit_interval(feature):
+    """(first day, last day) a permit is valid, both inclusive; open bounds are -inf/inf."""
+    fields = feature.fields()
+    start = end = None
+    if fields.indexOf(PERMIT_START_FIELD) != -1:
+        start = day_number(feature[PERMIT_START_FIELD])
+    if fields.indexOf(PERMIT_END_FIELD) != -1:
+        end = day_number(feature[PERMIT_END_FIELD])
+    return (OPEN_START if start is None else start), (OPEN_END if end is None else end)
+
+
+def month_starts(first, count):
+    """`count` dates, the first day of each month from the month of `first` on."""
+    year, month = first.year, first.month
+    dates = []
+    for _ in range(count):
+        dates.append(datetime.date(year, month, 1))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return dates
+
+
+class IntervalTree:
+    """
+    Static centered interval tree over closed [start, end] intervals, e.g.
+    the validity of every permit of an abstraction layer.
+
+    Each node keeps the intervals containing its center sorted by start and
+    by end, so the intervals valid on a day are found in O(log n + k)
+    instead of testing every interval.
+    """
+
+    # Below this many intervals a node is a plain list
+    LEAF_SIZE = 16
+
+    def __init__(self, starts, ends):
+        """
+        :param starts: Array of the first day of each interval (-inf when open).
+        :param ends:   Array of the last day of each interval (inf when open).
+        Intervals are identified by their position; those ending before they start are ignored.
+        """
+        self.starts = np.asarray(starts, dtype=np.float64)
+        self.ends = np.asarray(ends, dtype=np.float64)
+        ids = np.flatnonzero(self.starts <= self.ends)
+        self._root = self._build(ids) if len(ids) else None
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _build(self, ids):
+        starts = self.starts[ids]
+        ends = self.ends[ids]
+        if len(ids) <= self.LEAF_SIZE:
+            return (None, ids, None, None, None)
+        bounds = np.concatenate([starts, ends])
+        bounds = bounds[np.isfinite(bounds)]
+        center = float(np.median(bounds)) if len(bounds) else 0.0
+        left = ends < center
+        right = starts > center
+        here = ~(left | right)
+        if left.all() or right.all():
+            # no split possible: keep them together
+            return (None, ids, None, None, None)
+        here_ids = ids[here]
+        by_start = here_ids[np.argsort(self.starts[here_ids], kind='stable')]
+        by_end = here_ids[np.argsort(-self.ends[here_ids], kind='stable')]
+        return (
+            center,
+            by_start,
+            by_end,
+            self._build(ids[left]) if left.any() else None,
+            self._build(ids[right]) if right.any() else None
+        )
+
+    def at(self, day):
+        """Ids of the intervals containing `day`, sorted."""
+        return self.overlapping(day, day)
+
+    def overlapping(self, first, last):
+        """Ids of the intervals overlapping [first, last], sorted."""
+        found = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            center, by_start, by_end, left, right = stack.pop()
+            if center is None:
+                ids = by_start
+                found.append(ids[(self.starts[ids] <= last) & (self.ends[ids] >= first)])
+                continue
+            if last < center:
+                # the intervals here end at or after the center: those starting by `last` overlap
+                count = np.searchsorted(self.starts[by_start], last, side='right')
+                found.append(by_start[:count])
+                if left is not None:
+                    stack.append(left)
+            elif first > center:
+                count = np.searchsorted(-self.ends[by_end], -first, side='right')
+                found.append(by_end[:count])
+                if right is not None:
+                    stack.append(right)
+            else:
+                found.append(by_start)
+                if left is not None:
+                    stack.append(left)
+                if right is not None:
+                    stack.append(right)
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(found)).astype(np.int64)
+
+
+class PermitTimeline:
+    """
+    Total permitted abstraction of a basin through time, as a step function:
+    the surface and groundwater sums are precomputed at every change point
+    (a permit starting or expiring), so the totals on any day are a binary
+    search and the mean over a window a difference of two prefix sums.
+    """
+
+    def __init__(self, values, groundwater, starts, ends):
+        """
+        :param values:      m3/yr of each permit (NaN values are left out).
+        :param groundwater: 1.0 for groundwater permits, else 0.0.
+        :param starts:      First valid day of each permit (-inf when open).
+        :param ends:        Last valid day of each permit (inf when open).
+        """
+        values = np.asarray(values, dtype=np.float64)
+        groundwater = np.asarray(groundwater, dtype=np.float64)
+        starts = np.asarray(starts, dtype=np.float64)
+        ends = np.asarray(ends, dtype=np.float64)
+        keep = ~np.isnan(values) & (starts <= ends)
+        values, groundwater, starts, ends = values[keep], groundwater[keep], starts[keep], ends[keep]
+        # (surface, groundwater) column per permit
+        amounts = np.column_stack([np.where(groundwater == 1, 0.0, values), np.where(groundwater == 1, values, 0.0)])
+        self.permit_count = len(values)
+
+        # valid since the beginning of time
+        self.base = amounts[np.isneginf(starts)].sum(axis=0)
+        finite_starts = np.isfinite(starts)
+        finite_ends = np.isfinite(ends)
+        days = np.concatenate([starts[finite_starts], ends[finite_ends] + 1])
+        deltas = np.concatenate([amounts[finite_starts], -amounts[finite_ends]])
+        order = np.argsort(days, kind='stable')
+        days = days[order]
+        levels = self.base + np.cumsum(deltas[order], axis=0)
+        # the level after the last event of each change point
+        last_of_day = np.append(days[1:] != days[:-1], True) if len(days) else np.empty(0, dtype=bool)
+        self.days = days[last_of_day]
+        self.levels = levels[last_of_day].reshape(-1, 2)
+        # integral of the level from the first change point to each change point (m3/yr x days)
+        spans = np.diff(self.days)
+        self._integrals = np.concatenate([[[0.0, 0.0]], np.cumsum(self.levels[:-1] * spans[:, None], axis=0)]) \
+            if len(self.days) else np.empty((0, 2))
+
+    def totals_at(self, days):
+        """(n, 2) array of the (surface, groundwater) totals on each of `days`."""
+        days = np.atleast_1d(np.asarray(days, dtype=np.float64))
+        positions = np.searchsorted(self.days, days, side='right') - 1
+        totals = np.tile(self.base, (len(days), 1))
+        valid = positions >= 0
+        totals[valid] = self.levels[positions[valid]]
+        return totals
+
+    def _integral(self, day):
+        """Integral of the totals from the first change point up to (not including) `day`."""
+        if not len(self.days):
+            return self.base * day
+        position = np.searchsorted(self.days, day, side='right') - 1
+        if position < 0:
+            # before the first change point the level is `base`
+            return self.base * (day - self.days[0])
+        return self._integrals[position] + self.levels[position] * (day - self.days[position])
+
+    def mean_between(self, first, last):
+        """(surface, groundwater) totals averaged over the days first..last (inclusive)."""
+        if last < first:
+            raise ValueError("The window ends before it starts.")
+        return (self._integral(last + 1) - self._integral(first)) / (last + 1 - first)
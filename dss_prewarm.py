@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+from qgis.PyQt.QtCore import QObject, QTimer, pyqtSignal
+from qgis.core import (
+    Qgis,
+    QgsApplication,
+    QgsCoordinateTransform,
+    QgsFeatureRequest,
+    QgsFeedback,
+    QgsMessageLog,
+    QgsProject,
+    QgsTask,
+    QgsVectorLayerFeatureSource
+)
+
+from .dss_outlets import OutletAssignment, assignment_key, assignment_signature
+from .dss_session import (
+    LOOKUP_BYTES_PER_FEATURE,
+    SPATIAL_INDEX_KEY,
+    build_attribute_lookup,
+    build_spatial_index,
+    lookup_key
+)
+
+MESSAGE_CATEGORY = 'Messages'
+
+
+class _PrewarmJob:
+    """One structure to build: read from a feature source, stored in the session afterwards."""
+
+    def __init__(self, layer, key, builder, size, generation, on_stored=None):
+        self.layer_id = layer.id()
+        self.layer_name = layer.name()
+        self.key = key
+        # feature sources must be created on the main thread, they are then safe to read anywhere
+        self.source = QgsVectorLayerFeatureSource(layer)
+        self.builder = builder
+        self.size = size
+        self.generation = generation
+        # called on the main thread with (layer, value) once the value is in the session
+        self.on_stored = on_stored
+        self.value = None
+
+
+def _outlet_job(session, water_bodies_layer, catchments_layer):
+    """
+    Job building the outlet assignment table of a pair of layers, or None
+    when the session has it. A table stored with the water bodies layer and
+    still valid is put in the session right away.
+    """
+    key = assignment_key(catchments_layer.id(), session.generation(catchments_layer.id()))
+    if session.contains(water_bodies_layer, key):
+        return None
+    size = max(water_bodies_layer.featureCount(), 0) * LOOKUP_BYTES_PER_FEATURE
+    signature = assignment_signature(water_bodies_layer, catchments_layer)
+    assignment = OutletAssignment.stored(water_bodies_layer, signature)
+    if assignment is not None:
+        session.put(water_bodies_layer, key, assignment, size)
+        return None
+
+    catchments = QgsVectorLayerFeatureSource(catchments_layer)
+    transform = None
+    if water_bodies_layer.crs() != catchments_layer.crs():
+        # a transform of its own: the session ones are used on the main thread
+        transform = QgsCoordinateTransform(water_bodies_layer.crs(), catchments_layer.crs(), QgsProject.instance())
+
+    def build(source, feedback):
+        catchment_index = build_spatial_index(catchments, feedback)
+        return OutletAssignment.build(
+            source,
+            catchment_index,
+            lambda ids: catchments.getFeatures(QgsFeatureRequest().setFilterFids(ids)),
+            transform,
+            feedback
+        )
+
+    return _PrewarmJob(
+        water_bodies_layer, key, build, size, session.generation(water_bodies_layer.id()),
+        on_stored=lambda layer, assignment: assignment.store(layer, signature)
+    )
+
+
+class PrewarmTask(QgsTask):
+    """Builds session structures in the background."""
+
+    def __init__(self, jobs):
+        super().__init__("DSS: preparing layers", QgsTask.CanCancel)
+        self.jobs = jobs
+        self.feedback = QgsFeedback()
+
+    def run(self):
+        for done, job in enumerate(self.jobs):
+            if self.isCanceled():
+                return False
+            job.value = job.builder(job.source, self.feedback)
+            self.setProgress(100.0 * (done + 1) / len(self.jobs))
+        return not self.isCanceled()
+
+    def cancel(self):
+        # also interrupts a spatial index being bulk loaded
+        self.feedback.cancel()
+        super().cancel()
+
+
+class SessionPrewarmer(QObject):
+    """
+    Builds the session structures of the layers selected in a dock widget
+    (spatial indexes, attribute lookups, the outlet assignment table) as soon
+    as they are chosen, so that the first Calculate does not pay for them.
+
+    Selection changes are debounced; a new selection cancels the running
+    task and starts a new one for whatever is still missing.
+    """
+
+    # text describing whether the structures are ready, for a status label
+    readinessChanged = pyqtSignal(str)
+
+    DEBOUNCE_MS = 400
+
+    def __init__(self, session, parent=None):
+        super().__init__(parent)
+        self.session = session
+        self._combos = []   # (QgsMapLayerComboBox, attribute lookups to build)
+        self._outlet_combos = []   # (water bodies combo, catchments combo)
+        self._task = None
+        # the Python side of a task must live until the task manager is done with it
+        self._tasks = set()
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(self.DEBOUNCE_MS)
+        self._timer.timeout.connect(self._start)
+
+    def watch(self, combo, lookups=()):
+        """Prewarms the layer of `combo`: its spatial index plus the attribute lookups of `lookups`."""
+        self._combos.append((combo, list(lookups)))
+        combo.layerChanged.connect(self.schedule)
+
+    def watch_outlets(self, water_bodies_combo, catchments_combo):
+        """Prewarms the outlet assignment table of the water bodies and catchments of the two combos."""
+        self._outlet_combos.append((water_bodies_combo, catchments_combo))
+        water_bodies_combo.layerChanged.connect(self.schedule)
+        catchments_combo.layerChanged.connect(self.schedule)
+
+    def schedule(self, *args):
+        self._cancel_task()
+        self.readinessChanged.emit("Preparing layers…")
+        self._timer.start()
+
+    def stop(self):
+        self._timer.stop()
+        self._cancel_task()
+
+    def _cancel_task(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _jobs(self):
+        jobs = []
+        seen = set()
+        for combo, lookups in self._combos:
+            layer = combo.currentLayer()
+            if layer is None or not layer.isValid():
+                continue
+            generation = self.session.generation(layer.id())
+            fields = layer.fields()
+            wanted = [(SPATIAL_INDEX_KEY, build_spatial_index, self.session.spatial_index_size(layer))]
+            for field_name in lookups:
+                if fields.indexOf(field_name) < 0:
+                    continue
+                wanted.append((
+                    lookup_key(field_name),
+                    lambda source, feedback, fields=fields, field_name=field_name:
+                        build_attribute_lookup(source, fields, field_name, feedback),
+                    max(layer.featureCount(), 0) * LOOKUP_BYTES_PER_FEATURE
+                ))
+            for key, builder, size in wanted:
+                # the same layer may be selected in several combo boxes
+                if (layer.id(), key) in seen or self.session.contains(layer, key):
+                    continue
+                seen.add((layer.id(), key))
+                jobs.append(_PrewarmJob(layer, key, builder, size, generation))
+        for water_bodies_combo, catchments_combo in self._outlet_combos:
+            water_bodies_layer = water_bodies_combo.currentLayer()
+            catchments_layer = catchments_combo.currentLayer()
+            if water_bodies_layer is None or not water_bodies_layer.isValid() \
+                    or catchments_layer is None or not catchments_layer.isValid():
+                continue
+            job = _outlet_job(self.session, water_bodies_layer, catchments_layer)
+            if job is not None and (job.layer_id, job.key) not in seen:
+                seen.add((job.layer_id, job.key))
+                jobs.append(job)
+        return jobs
+
+    def _start(self):
+        jobs = self._jobs()
+        if not jobs:
+            self.readinessChanged.emit("Ready")
+            return
+
+        task = PrewarmTask(jobs)
+        task.taskCompleted.connect(lambda: self._completed(task))
+        task.taskTerminated.connect(lambda: self._terminated(task))
+        self._task = task
+        self._tasks.add(task)
+        self.readinessChanged.emit(f"Preparing {len(jobs)} structures…")
+        QgsApplication.taskManager().addTask(task)
+
+    def _completed(self, task):
+        self._tasks.discard(task)
+        stored = 0
+        stale = False
+        for job in task.jobs:
+            layer = QgsProject.instance().mapLayer(job.layer_id)
+            if layer is None:
+                continue
+            # a layer edited meanwhile keeps no stale structure
+            if self.session.put(layer, job.key, job.value, job.size, job.generation):
+                stored += 1
+                if job.on_stored is not None:
+                    job.on_stored(layer, job.value)
+            else:
+                stale = True
+        if task is not self._task:
+            return
+        self._task = None
+        QgsMessageLog.logMessage(
+            f"DSS: {stored} structures prepared in the background ({self.session.summary()}).",
+            MESSAGE_CATEGORY,
+            Qgis.Info
+        )
+        # layers edited meanwhile are picked up again
+        if stale:
+            self._timer.start()
+        else:
+            self.readinessChanged.emit("Ready")
+
+    def _terminated(self, task):
+        self._tasks.discard(task)
+        if task is self._task:
+            self._task = None
+            self.readinessChanged.emit("Not prepared")
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+import cProfile
+import io
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+from qgis.PyQt.QtCore import QObject, QSettings, Qt, pyqtSignal
+from qgis.PyQt.QtWidgets import QMessageBox
+
+TOP_FUNCTIONS = 10
+TOP_ALLOCATIONS = 25
+
+
+class ProfileReport:
+    """What one profiled run produced: the saved files and the headline numbers."""
+
+    def __init__(self, label):
+        self.label = label
+        self.pstats_path = None
+        self.allocations_path = None
+        self.wall_seconds = 0.0
+        self.peak_bytes = 0
+        self.top_functions = []   # (function, calls, own seconds, cumulative seconds), hottest first
+
+    def summary(self):
+        lines = [
+            f"{self.label}: {self.wall_seconds:.2f} s, peak traced memory {self.peak_bytes / (1024 * 1024):.1f} MB",
+            "",
+            f"{'own s':>8} {'cum s':>8} {'calls':>9}  function",
+        ]
+        for function, calls, own_seconds, cumulative_seconds in self.top_functions:
+            lines.append(f"{own_seconds:8.3f} {cumulative_seconds:8.3f} {calls:9d}  {function}")
+        lines += ["", f"Profile: {self.pstats_path}", f"Allocations: {self.allocations_path}"]
+        return "\n".join(lines)
+
+
+class NextRunProfiler(QObject):
+    """
+    "Profile next run" switch shared by the DSS tools.
+
+    When armed, the next calculation wrapped in `run()` is profiled with
+    cProfile and tracemalloc; the .pstats file and a top-allocations report
+    are saved in the chosen folder and the switch turns itself off. When
+    not armed, `run()` only checks a flag.
+    """
+
+    # emitted when the switch is turned on or off (including after a profiled run)
+    armedChanged = pyqtSignal(bool)
+
+    SETTINGS_KEY = 'dss/profile_directory'
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.armed = False
+        self.directory = QSettings().value(self.SETTINGS_KEY, '')
+
+    def arm(self, directory):
+        QSettings().setValue(self.SETTINGS_KEY, directory)
+        self.directory = directory
+        self.armed = True
+        self.armedChanged.emit(True)
+
+    def disarm(self):
+        if self.armed:
+            self.armed = False
+            self.armedChanged.emit(False)
+
+    @contextmanager
+    def run(self, label):
+        """
+        Profiles the enclosed block if armed. Yields a ProfileReport that is
+        filled when the block exits, or None when not profiling.
+
+        :param label: Name of the run, used in the file names, e.g. 'watershed'.
+        """
+        if not self.armed:
+            yield None
+            return
+        self.disarm()
+
+        report = ProfileReport(label)
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        elif hasattr(tracemalloc, 'reset_peak'):
+            # Python >= 3.9
+            tracemalloc.reset_peak()
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            yield report
+        finally:
+            profile.disable()
+            report.wall_seconds = time.perf_counter() - start
+            report.peak_bytes = tracemalloc.get_traced_memory()[1]
+            snapshot = tracemalloc.take_snapshot()
+            if started_tracing:
+                tracemalloc.stop()
+            self._save(report, profile, snapshot)
+
+    def _save(self, report, profile, snapshot):
+        os.makedirs(self.directory, exist_ok=True)
+        base_name = os.path.join(self.directory, f"dss_{report.label}_{time.strftime('%Y%m%d_%H%M%S')}")
+
+        report.pstats_path = base_name + '.pstats'
+        profile.dump_stats(report.pstats_path)
+        stats = pstats.Stats(profile, stream=io.StringIO())
+        hottest = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:TOP_FUNCTIONS]
+        report.top_functions = [
+            (pstats.func_std_string(function), calls, own_seconds, cumulative_seconds)
+            for function, (_, calls, own_seconds, cumulative_seconds, _) in hottest
+        ]
+
+        report.allocations_path = base_name + '_allocations.txt'
+        with open(report.allocations_path, 'w', encoding='utf-8') as allocations:
+            allocations.write(f"Peak traced memory: {report.peak_bytes} bytes\n")
+            allocations.write(f"Top {TOP_ALLOCATIONS} allocation sites still alive at the end of the run:\n\n")
+            for statistic in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+                allocations.write(f"{statistic}\n")
+
+
+def show_report(parent, report):
+    """Dialog with the peak memory and the ten hottest functions of a profiled run."""
+    msg_box = QMessageBox(parent)
+    msg_box.setWindowTitle("DSS Profile")
+    msg_box.setText(report.summary())
+    msg_box.setTextInteractionFlags(Qt.TextSelectableByMouse)
+    msg_box.setStyleSheet("QLabel{font-family: monospace; min-width: 700px;}")
+    msg_box.exec_()
+
+
+def profile_run(session, label):
+    """The session profiler's run(label), or a no-op context (yielding None) without a session."""
+    if session is None:
+        return nullcontext()
+    return session.profiler.run(label)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+from bisect import bisect_left
+
+
+def is_upstream_rcode(id_value, value_given):
+    """
+    Checks whether the catchment coded `id_value` belongs to the upstream
+    basin of the catchment coded `value_given` (the catchment itself included).
+
+    RCodes are hierarchical: a catchment is upstream when it has the same
+    prefix (all but the last two digits) and a code greater or equal to the
+    given one; longer codes are compared on their first len(value_given) digits.
+
+    :param id_value:    RCode of the tested catchment (any type, may be None).
+    :param value_given: RCode of the outlet catchment.
+    :return:            True if `id_value` is upstream of `value_given`.
+    """
+    value_given_str = str(value_given)
+    try:
+        value_given_num = int(value_given_str)
+    except (TypeError, ValueError):
+        return False
+
+    if id_value is None:
+        return False
+    id_value_str = str(id_value)
+    try:
+        id_value_num = int(id_value_str)
+    except (TypeError, ValueError):
+        return False
+
+    if len(id_value_str) == len(value_given_str):
+        return id_value_str[:-2] == value_given_str[:-2] and id_value_num >= value_given_num
+
+    id_value_subset = id_value_str[:len(value_given_str)]
+    try:
+        return id_value_subset[:-2] == value_given_str[:-2] and int(id_value_subset) >= value_given_num
+    except ValueError:
+        return False
+
+
+class RCodeHierarchy:
+    """
+    The RCodes of a catchments layer sorted as strings, to list the upstream
+    catchments of a code without testing every catchment.
+
+    Every code upstream of `value_given` starts with `value_given[:-2]`, so
+    the candidates are one contiguous run of the sorted codes, found by
+    bisection; is_upstream_rcode still decides on each of them.
+    """
+
+    def __init__(self, lookup):
+        """:param lookup: Dict of catchment feature id -> RCode."""
+        entries = sorted(
+            (str(rcode), fid) for fid, rcode in lookup.items()
+            if rcode is not None and _is_integer(str(rcode))
+        )
+        self._codes = [code for code, _ in entries]
+        self._fids = [fid for _, fid in entries]
+
+    def __len__(self):
+        return len(self._codes)
+
+    def upstream(self, value_given):
+        """(RCode, feature id) of every catchment upstream of `value_given` (itself included), by code."""
+        value_given_str = str(value_given)
+        if not _is_integer(value_given_str):
+            return []
+        prefix = value_given_str[:-2]
+        result = []
+        for position in range(bisect_left(self._codes, prefix), len(self._codes)):
+            code = self._codes[position]
+            if not code.startswith(prefix):
+                break
+            if is_upstream_rcode(code, value_given_str):
+                result.append((code, self._fids[position]))
+        return result
+
+    def upstream_fids(self, value_given):
+        return [fid for _, fid in self.upstream(value_given)]
+
+
+def _is_integer(text):
+    try:
+        int(text)
+    except ValueError:
+        return False
+    return True
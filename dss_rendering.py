@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+import json
+
+from qgis.PyQt.QtCore import QSettings
+from qgis.PyQt.QtGui import QColor
+from qgis.core import (
+    QgsFillSymbol,
+    QgsGraduatedSymbolRenderer,
+    QgsLinePatternFillSymbolLayer,
+    QgsLineSymbol,
+    QgsProject,
+    QgsRendererRange,
+    QgsRuleBasedRenderer,
+    QgsSimpleLineSymbolLayer,
+    QgsSymbolLayerUtils,
+    QgsUnitTypes,
+    QgsVectorSimplifyMethod
+)
+
+SETTINGS_KEY = 'dss/lightweight_rendering'
+# Layer custom property with the style of a DSS output layer, to restyle it when the mode changes
+STYLE_PROPERTY = 'dss/render_style'
+
+# Pattern fills and full line widths are drawn only when zoomed in closer than 1:PATTERN_MAX_DENOMINATOR
+PATTERN_MAX_DENOMINATOR = 100000
+# Vertices closer than this (in pixels) are merged while drawing ...
+SIMPLIFY_THRESHOLD_PIXELS = 1.0
+# ... at scales smaller than 1:SIMPLIFY_MIN_DENOMINATOR
+SIMPLIFY_MIN_DENOMINATOR = 10000
+
+WS_STYLE = 'ws'
+COVERAGE_STYLE = 'coverage'
+
+# (lower, upper, color, label); None is an open bound
+WS_CLASSES = [
+    (None, 25, 'green', 'Not Stressed (0-25%)'),
+    (25, 50, 'yellow', 'Low Stress (25-50%)'),
+    (50, 75, 'orange', 'Moderate Stress (50-75%)'),
+    (75, 100, 'red', 'Stressed (75-100%)'),
+    (100, None, 'darkred', 'Overstressed (>100%)')
+]
+COVERAGE_CLASSES = [
+    (0, 40, 'blue', '< 40%'),
+    (40, None, 'red', '≥ 40%')
+]
+
+# (kind, color) -> symbol built once; renderers take ownership, so they get clones
+_symbols = {}
+
+
+def lightweight_rendering():
+    """Whether DSS output layers use the lightweight (scale-dependent) style; on by default."""
+    return QSettings().value(SETTINGS_KEY, True, type=bool)
+
+
+def set_lightweight_rendering(enabled):
+    """Stores the mode and restyles the DSS output layers of the project."""
+    QSettings().setValue(SETTINGS_KEY, bool(enabled))
+    for layer in QgsProject.instance().mapLayers().values():
+        if layer.customProperty(STYLE_PROPERTY):
+            restyle_layer(layer)
+
+
+def pattern_fill_symbol(color):
+    """45° hatching at 1 mm spacing with a 0.66 mm outline."""
+    symbol = QgsFillSymbol()
+
+    line_pattern_layer = QgsLinePatternFillSymbolLayer()
+    line_pattern_layer.setAngle(45)
+    line_pattern_layer.setDistance(1)  # Distance between lines in mm
+    line_pattern_layer.setDistanceUnit(QgsUnitTypes.RenderMillimeters)
+    line_pattern_layer.setLineWidth(0.26)  # Line width in mm
+    line_pattern_layer.setLineWidthUnit(QgsUnitTypes.RenderMillimeters)
+
+    line_symbol = QgsLineSymbol()
+    line_symbol.setColor(QColor(color))
+    line_symbol.setWidth(0.3)  # Line width in mm
+    line_symbol.setWidthUnit(QgsUnitTypes.RenderMillimeters)
+    line_pattern_layer.setSubSymbol(line_symbol)
+
+    outline_layer = QgsSimpleLineSymbolLayer()
+    outline_layer.setColor(QColor(color))
+    outline_layer.setWidth(0.66)  # Line width in mm
+    outline_layer.setWidthUnit(QgsUnitTypes.RenderMillimeters)
+
+    symbol.deleteSymbolLayer(0)  # Remove default layer
+    symbol.appendSymbolLayer(line_pattern_layer)
+    symbol.appendSymbolLayer(outline_layer)
+    return symbol
+
+
+def _simple_fill_symbol(color):
+    """Semi-transparent fill with a hairline outline: one polygon fill per feature."""
+    fill_color = QColor(color)
+    fill_color.setAlpha(110)
+    return QgsFillSymbol.createSimple({
+        'color': QgsSymbolLayerUtils.encodeColor(fill_color),
+        'outline_color': QColor(color).name(),
+        'outline_width': '0',
+    })
+
+
+def _line_symbol(color, width):
+    """Simple line; width 0 is a cosmetic (hairline) pen, the cheapest to draw."""
+    return QgsLineSymbol.createSimple({'color': QColor(color).name(), 'width': str(width)})
+
+
+_FACTORIES = {
+    'pattern': pattern_fill_symbol,
+    'simple_fill': _simple_fill_symbol,
+    'line': lambda color: _line_symbol(color, 0.8),
+    'hairline': lambda color: _line_symbol(color, 0),
+}
+
+
+def cached_symbol(kind, color):
+    """A copy of the `kind` symbol ('pattern', 'simple_fill', 'line', 'hairline') in `color`."""
+    symbol = _symbols.get((kind, color))
+    if symbol is None:
+        symbol = _FACTORIES[kind](color)
+        _symbols[(kind, color)] = symbol
+    return symbol.clone()
+
+
+def range_expression(field_name, lower, upper, last):
+    """Filter of a class: lower <= value < upper (<= upper for the last class); None bounds are open."""
+    field = f'"{field_name}"'
+    terms = []
+    if lower is not None:
+        terms.append(f'{field} >= {lower}')
+    if upper is not None:
+        terms.append(f'{field} {"<=" if last else "<"} {upper}')
+    return ' AND '.join(terms) or 'TRUE'
+
+
+def scale_rule_renderer(field_name, classes, small_scale_kind, large_scale_kind):
+    """
+    Rule-based renderer with one rule per class, drawn with the cheap
+    `small_scale_kind` symbol when zoomed out beyond 1:PATTERN_MAX_DENOMINATOR
+    and with `large_scale_kind` when zoomed in.
+    """
+    root = QgsRuleBasedRenderer.Rule(None)
+    for position, (lower, upper, color, label) in enumerate(classes):
+        class_rule = QgsRuleBasedRenderer.Rule(
+            None, 0, 0, range_expression(field_name, lower, upper, position == len(classes) - 1), label
+        )
+        # Rule(symbol, maximumScale (most zoomed in), minimumScale (most zoomed out), ...)
+        class_rule.appendChild(QgsRuleBasedRenderer.Rule(
+            cached_symbol(small_scale_kind, color), PATTERN_MAX_DENOMINATOR, 0, '', f"{label}, zoomed out"
+        ))
+        class_rule.appendChild(QgsRuleBasedRenderer.Rule(
+            cached_symbol(large_scale_kind, color), 0, PATTERN_MAX_DENOMINATOR, '', label
+        ))
+        root.appendChild(class_rule)
+    return QgsRuleBasedRenderer(root)
+
+
+def graduated_renderer(field_name, classes, kind):
+    """The full style: one graduated class per range, always drawn with `kind`."""
+    ranges = [
+        QgsRendererRange(
+            float('-inf') if lower is None else lower,
+            float('inf') if upper is None else upper,
+            cached_symbol(kind, color),
+            label
+        )
+        for lower, upper, color, label in classes
+    ]
+    renderer = QgsGraduatedSymbolRenderer(field_name, ranges)
+    renderer.setMode(QgsGraduatedSymbolRenderer.Custom)
+    return renderer
+
+
+def apply_simplification(layer, enabled):
+    """Draw-time simplification of `layer` when zoomed out (the features are not changed)."""
+    method = QgsVectorSimplifyMethod()
+    if enabled:
+        method.setSimplifyHints(QgsVectorSimplifyMethod.GeometrySimplification)
+        method.setThreshold(SIMPLIFY_THRESHOLD_PIXELS)
+        method.setForceLocalOptimization(True)
+        method.setMaximumScale(SIMPLIFY_MIN_DENOMINATOR)
+    else:
+        method.setSimplifyHints(QgsVectorSimplifyMethod.NoSimplification)
+    layer.setSimplifyMethod(method)
+
+
+def style_layer(layer, style, field_name, classes):
+    """
+    Styles a DSS output layer by `field_name` and remembers the style on the
+    layer, so switching the render mode can restyle it.
+
+    :param style:   WS_STYLE (polygons) or COVERAGE_STYLE (lines).
+    :param classes: List of (lower, upper, color, label); None is an open bound.
+    """
+    layer.setCustomProperty(STYLE_PROPERTY, json.dumps({
+        'style': style, 'field': field_name, 'classes': [list(entry) for entry in classes]
+    }))
+    restyle_layer(layer)
+
+
+def restyle_layer(layer):
+    """Applies the style remembered on `layer` in the current render mode."""
+    stored = json.loads(layer.customProperty(STYLE_PROPERTY))
+    field_name = stored['field']
+    classes = [tuple(entry) for entry in stored['classes']]
+    lightweight = lightweight_rendering()
+
+    if stored['style'] == WS_STYLE:
+        if lightweight:
+            renderer = scale_rule_renderer(field_name, classes, 'simple_fill', 'pattern')
+        else:
+            renderer = graduated_renderer(field_name, classes, 'pattern')
+    else:
+        if lightweight:
+            renderer = scale_rule_renderer(field_name, classes, 'hairline', 'line')
+        else:
+            renderer = graduated_renderer(field_name, classes, 'line')
+
+    apply_simplification(layer, lightweight)
+    layer.setRenderer(renderer)
+    layer.triggerRepaint()
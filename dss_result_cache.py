@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from qgis.PyQt.QtCore import QSettings
+from qgis.core import QgsApplication, QgsGeometry, QgsProviderRegistry
+
+# Bump when the watershed pipeline changes in a way that changes its results
+CACHE_VERSION = 1
+
+
+# Files next to the main file that hold part of the layer content
+SIDECAR_SUFFIXES = {
+    '.shp': ('.dbf', '.shx', '.cpg', '.prj'),
+}
+# Written next to a SQLite-based file (GeoPackage) until the next checkpoint
+WAL_SUFFIX = '-wal'
+
+
+def layer_fingerprint(layer):
+    """
+    Identifies the content of a file-backed layer: source path, modification
+    time and size of the file and of its sidecar files (.dbf of a shapefile,
+    -wal of a GeoPackage), the last change recorded by a GeoPackage, subset
+    filter, feature count, CRS and schema.
+
+    :return: A JSON-serializable dict, or None when the layer cannot be
+             fingerprinted reliably (memory layers, unsaved edits, no file).
+    """
+    if layer is None or layer.isModified():
+        return None
+    decoded = QgsProviderRegistry.instance().decodeUri(layer.providerType(), layer.source())
+    path = decoded.get('path')
+    if not path or not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return {
+        'provider': layer.providerType(),
+        'source': layer.source(),
+        'mtime': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'sidecars': _sidecar_stats(path),
+        'last_change': _geopackage_last_change(path, decoded.get('layerName')),
+        'subset': layer.subsetString(),
+        'count': layer.featureCount(),
+        'crs': layer.crs().authid() or layer.crs().toWkt(),
+        'schema': [(field.name(), field.typeName()) for field in layer.fields()],
+    }
+
+
+def _sidecar_stats(path):
+    """[suffix, mtime, size] of the existing sidecar files of `path`."""
+    base, extension = os.path.splitext(path)
+    candidates = [path + WAL_SUFFIX]
+    for suffix in SIDECAR_SUFFIXES.get(extension.lower(), ()):
+        candidates.append(base + (suffix.upper() if extension.isupper() else suffix))
+    stats = []
+    for candidate in candidates:
+        try:
+            stat = os.stat(candidate)
+        except OSError:
+            continue
+        stats.append([candidate[len(base):], stat.st_mtime_ns, stat.st_size])
+    return stats
+
+
+def _geopackage_last_change(path, table_name):
+    """gpkg_contents.last_change of a GeoPackage table (read through the WAL), or None."""
+    if os.path.splitext(path)[1].lower() != '.gpkg':
+        return None
+    try:
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=10)
+    except sqlite3.Error:
+        return None
+    try:
+        if table_name:
+            row = connection.execute(
+                "SELECT last_change FROM gpkg_contents WHERE table_name = ?", (table_name,)
+            ).fetchone()
+        else:
+            row = connection.execute("SELECT max(last_change) FROM gpkg_contents").fetchone()
+        return row[0] if row else None
+    except sqlite3.Error:
+        return None
+    finally:
+        connection.close()
+
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class WatershedResultCache:
+    """
+    On-disk (SQLite) cache of watershed query results.
+
+    A result is keyed by the fingerprints of all input layers plus the
+    snapped water body and outlet catchment, which determine everything the
+    pipeline computes after them. Changing any input layer changes its
+    fingerprint: the entries computed on the previous version of the same
+    layers are deleted on the next store, and could not be hit anyway.
+    The file is kept under a size limit by evicting the least recently
+    used entries.
+    """
+
+    SETTINGS_KEY = 'dss/result_cache_mb'
+    DEFAULT_MAX_SIZE_MB = 256
+
+    def __init__(self, path=None, max_size_mb=None):
+        if path is None:
+            path = os.path.join(QgsApplication.qgisSettingsDirPath(), 'dss', 'result_cache.sqlite')
+        if max_size_mb is None:
+            max_size_mb = int(QSettings().value(self.SETTINGS_KEY, self.DEFAULT_MAX_SIZE_MB))
+        self.path = path
+        self.max_size = max_size_mb * 1024 * 1024
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS watershed_results ("
+                " key TEXT PRIMARY KEY,"
+                " sources_key TEXT NOT NULL,"
+                " inputs_key TEXT NOT NULL,"
+                " results TEXT NOT NULL,"
+                " geometry BLOB NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS watershed_results_sources ON watershed_results (sources_key)")
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per operation: the cache may be used from worker threads
+        connection = sqlite3.connect(self.path, timeout=10)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    # ------------------------------------------------------------------- keys
+
+    @staticmethod
+    def inputs_key(layers):
+        """
+        Key of the content of the input layers, or None if one of them
+        cannot be fingerprinted (results on it are then not cached).
+        """
+        fingerprints = [layer_fingerprint(layer) for layer in layers]
+        if any(fingerprint is None for fingerprint in fingerprints):
+            return None
+        return _digest([CACHE_VERSION, fingerprints])
+
+    @staticmethod
+    def sources_key(layers):
+        """Key of the input layer sources only, shared by all versions of their content."""
+        return _digest([layer.source() for layer in layers])
+
+    @staticmethod
+    def query_key(inputs_key, water_body_id, catchment_id, parameters=None):
+        return _digest([inputs_key, water_body_id, catchment_id, parameters or {}])
+
+    # ---------------------------------------------------------------- get/put
+
+    def get(self, key):
+        """
+        :return: (results dict, union QgsGeometry) or None on a miss.
+        """
+        with self._connect() as connection:
+            row = connection.execute("SELECT results, geometry FROM watershed_results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE watershed_results SET last_used = ? WHERE key = ?", (time.time(), key))
+        geometry = QgsGeometry()
+        geometry.fromWkb(row[1])
+        return json.loads(row[0]), geometry
+
+    def put(self, key, sources_key, inputs_key, results, geometry):
+        """Stores a result, drops the results of older inputs and evicts down to the size limit."""
+        results_json = json.dumps(results)
+        wkb = bytes(geometry.asWkb())
+        size = len(results_json) + len(wkb)
+        with self._connect() as connection:
+            connection.execute(
+                "DELETE FROM watershed_results WHERE sources_key = ? AND inputs_key != ?",
+                (sources_key, inputs_key)
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO watershed_results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, sources_key, inputs_key, results_json, wkb, size, time.time())
+            )
+            self._evict(connection)
+
+    def _evict(self, connection):
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM watershed_results").fetchone()[0]
+        if total <= self.max_size:
+            return
+        for key, size in connection.execute("SELECT key, size FROM watershed_results ORDER BY last_used").fetchall():
+            connection.execute("DELETE FROM watershed_results WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_size:
+                break
+
+    def clear(self):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM watershed_results")
+        with self._connect() as connection:
+            connection.execute("VACUUM")
+
+    def stats(self):
+        """(number of entries, total size in bytes)."""
+        with self._connect() as connection:
+            return connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM watershed_results"
+            ).fetchone()
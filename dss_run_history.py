@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import sqlite3
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from qgis.core import QgsApplication, QgsGeometry
+
+from .dss_result_cache import layer_fingerprint
+
+# Bump when the schema changes; older databases are then recreated
+HISTORY_VERSION = 1
+
+WATERSHED_TOOL = 'watershed'
+HPP_TOOL = 'hpp'
+NATIONAL_TOOL = 'national'
+
+# What the keys of a run's values and geometries identify
+CATCHMENT_KIND = 'catchment'   # outlet catchment RCode
+RIVER_KIND = 'river'           # river feature id
+HPP_KIND = 'hpp'               # normalized abstraction code
+
+WS_METRICS = ('WS_Surface', 'WS_Groundwater', 'WS_Total')
+
+RunRecord = namedtuple('RunRecord', 'id tool started label crs parameters inputs summary')
+DiffRow = namedtuple('DiffRow', 'key metric old new')
+
+
+def inputs_description(layers):
+    """
+    What a run read: per layer its name, source and, for file-backed layers
+    without unsaved edits, its fingerprint (None otherwise).
+    """
+    return [
+        {'name': layer.name(), 'source': layer.source(), 'fingerprint': layer_fingerprint(layer)}
+        for layer in layers
+    ]
+
+
+class RunHistory:
+    """
+    Local (SQLite) history of the watershed and HPP runs: parameters, input
+    fingerprints, the numeric results and the result geometries.
+
+    Results are stored one row per (run, kind, key, metric), e.g.
+    ('river', '1234', 'CoveragePct'). The primary key doubles as the index
+    used by diff(), so two national runs are compared with one indexed join
+    instead of loading either of them.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(QgsApplication.qgisSettingsDirPath(), 'dss', 'run_history.sqlite')
+        self.path = path
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as connection:
+            version = connection.execute("PRAGMA user_version").fetchone()[0]
+            if version not in (0, HISTORY_VERSION):
+                for table in ('runs', 'run_values', 'run_geometries'):
+                    connection.execute(f"DROP TABLE IF EXISTS {table}")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " tool TEXT NOT NULL,"
+                " started REAL NOT NULL,"
+                " label TEXT NOT NULL,"
+                " crs TEXT,"
+                " parameters TEXT NOT NULL,"
+                " inputs TEXT NOT NULL,"
+                " summary TEXT NOT NULL)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS run_values ("
+                " run_id INTEGER NOT NULL,"
+                " kind TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " metric TEXT NOT NULL,"
+                " value REAL,"
+                " PRIMARY KEY (run_id, kind, key, metric)) WITHOUT ROWID"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS run_geometries ("
+                " run_id INTEGER NOT NULL,"
+                " kind TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " geometry BLOB NOT NULL,"
+                " PRIMARY KEY (run_id, kind, key))"
+            )
+            connection.execute(f"PRAGMA user_version = {HISTORY_VERSION}")
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per operation, as in WatershedResultCache
+        connection = sqlite3.connect(self.path, timeout=10)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    # ---------------------------------------------------------------- record
+
+    def record(self, tool, label, parameters, inputs, values, geometries=None, crs=None, summary=None):
+        """
+        Stores a run.
+
+        :param tool:       WATERSHED_TOOL, HPP_TOOL or NATIONAL_TOOL.
+        :param label:      Short description shown in the history panel.
+        :param parameters: JSON-serializable dict of the run parameters.
+        :param inputs:     inputs_description() of the input layers.
+        :param values:     Dict of kind -> {key: {metric: number}}.
+        :param geometries: Dict of kind -> {key: QgsGeometry}.
+        :param crs:        QgsCoordinateReferenceSystem of the geometries.
+        :param summary:    JSON-serializable dict of headline numbers.
+        :return:           Id of the new run.
+        """
+        crs_text = (crs.authid() or crs.toWkt()) if crs is not None else None
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "INSERT INTO runs (tool, started, label, crs, parameters, inputs, summary) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (tool, time.time(), label, crs_text, json.dumps(parameters), json.dumps(inputs), json.dumps(summary or {}))
+            )
+            run_id = cursor.lastrowid
+            connection.executemany(
+                "INSERT INTO run_values VALUES (?, ?, ?, ?, ?)",
+                (
+                    (run_id, kind, str(key), metric, _number(value))
+                    for kind, by_key in values.items()
+                    for key, metrics in by_key.items()
+                    for metric, value in metrics.items()
+                )
+            )
+            connection.executemany(
+                "INSERT INTO run_geometries VALUES (?, ?, ?, ?)",
+                (
+                    (run_id, kind, str(key), bytes(geometry.asWkb()))
+                    for kind, by_key in (geometries or {}).items()
+                    for key, geometry in by_key.items()
+                    if geometry is not None and not geometry.isNull()
+                )
+            )
+        return run_id
+
+    # ------------------------------------------------------------------ read
+
+    def runs(self, tool=None, limit=500):
+        """The most recent runs first."""
+        query = "SELECT id, tool, started, label, crs, parameters, inputs, summary FROM runs"
+        arguments = []
+        if tool is not None:
+            query += " WHERE tool = ?"
+            arguments.append(tool)
+        query += " ORDER BY id DESC LIMIT ?"
+        arguments.append(limit)
+        with self._connect() as connection:
+            return [_run_record(row) for row in connection.execute(query, arguments)]
+
+    def run(self, run_id):
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT id, tool, started, label, crs, parameters, inputs, summary FROM runs WHERE id = ?", (run_id,)
+            ).fetchone()
+        return _run_record(row) if row is not None else None
+
+    def kinds(self, run_id):
+        """Kinds with values or geometries in a run, e.g. ['hpp', 'river']."""
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT DISTINCT kind FROM run_values WHERE run_id = ?"
+                " UNION SELECT DISTINCT kind FROM run_geometries WHERE run_id = ?",
+                (run_id, run_id)
+            ).fetchall()
+        return sorted(row[0] for row in rows)
+
+    def values(self, run_id, kind):
+        """Dict of key -> {metric: value} of one kind of a run."""
+        values = {}
+        with self._connect() as connection:
+            for key, metric, value in connection.execute(
+                "SELECT key, metric, value FROM run_values WHERE run_id = ? AND kind = ?", (run_id, kind)
+            ):
+                values.setdefault(key, {})[metric] = value
+        return values
+
+    def geometries(self, run_id, kind):
+        """Dict of key -> QgsGeometry of one kind of a run."""
+        geometries = {}
+        with self._connect() as connection:
+            for key, wkb in connection.execute(
+                "SELECT key, geometry FROM run_geometries WHERE run_id = ? AND kind = ?", (run_id, kind)
+            ):
+                geometry = QgsGeometry()
+                geometry.fromWkb(wkb)
+                geometries[key] = geometry
+        return geometries
+
+    def diff(self, old_run_id, new_run_id, kind, changed_only=True):
+        """
+        Values of `kind` in two runs, matched by key and metric.
+
+        :param changed_only: Leave out the values equal in both runs.
+        :return:             List of DiffRow, by key and metric; `old` or `new`
+                             is None when the key is missing from that run.
+        """
+        query = (
+            "SELECT n.key, n.metric, o.value, n.value FROM run_values AS n"
+            " LEFT JOIN run_values AS o ON o.run_id = ? AND o.kind = n.kind AND o.key = n.key AND o.metric = n.metric"
+            " WHERE n.run_id = ? AND n.kind = ?"
+            + (" AND o.value IS NOT n.value" if changed_only else "") +
+            " UNION ALL"
+            " SELECT o.key, o.metric, o.value, NULL FROM run_values AS o"
+            " WHERE o.run_id = ? AND o.kind = ? AND NOT EXISTS ("
+            "  SELECT 1 FROM run_values AS n"
+            "  WHERE n.run_id = ? AND n.kind = o.kind AND n.key = o.key AND n.metric = o.metric)"
+            " ORDER BY 1, 2"
+        )
+        with self._connect() as connection:
+            rows = connection.execute(
+                query, (old_run_id, new_run_id, kind, old_run_id, kind, new_run_id)
+            ).fetchall()
+        return [DiffRow(*row) for row in rows]
+
+    # ---------------------------------------------------------------- delete
+
+    def delete(self, run_id):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM run_values WHERE run_id = ?", (run_id,))
+            connection.execute("DELETE FROM run_geometries WHERE run_id = ?", (run_id,))
+            connection.execute("DELETE FROM runs WHERE id = ?", (run_id,))
+
+    def clear(self):
+        with self._connect() as connection:
+            for table in ('run_values', 'run_geometries', 'runs'):
+                connection.execute(f"DELETE FROM {table}")
+        with self._connect() as connection:
+            connection.execute("VACUUM")
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _run_record(row):
+    run_id, tool, started, label, crs, parameters, inputs, summary = row
+    return RunRecord(run_id, tool, started, label, crs, json.loads(parameters), json.loads(inputs), json.loads(summary))
+
+
+# ------------------------------------------------------------- run contents
+
+def watershed_run_values(results):
+    """
+    Values and geometries of a watershed result (WatershedLoadEngine.calculate)
+    for record(): the WS metrics and the basin totals, keyed by outlet RCode.
+    """
+    key = str(results['catchment_id'])
+    metrics = {
+        'WS_Surface': results['ws_surface'],
+        'WS_Groundwater': results['ws_groundwater'],
+        'WS_Total': results['ws_total'],
+    }
+    for name in (
+        'surface_water_abstraction', 'groundwater_abstraction', 'surface_water_discharge',
+        'groundwater_discharge', 'groundwater_usable', 'natural_flow', 'ecological_flow'
+    ):
+        if name in results:
+            metrics[name] = results[name]
+    return {CATCHMENT_KIND: {key: metrics}}, {CATCHMENT_KIND: {key: results['union_geometry']}}
+
+
+def hpp_run_values(segments_layer, coverage_layer, coverage_ids_by_river, coverage_field_name):
+    """
+    Values and geometries of an HPP run for record(): the total segment
+    length and the segments of every abstraction code, and the coverage of
+    every river (keyed by river feature id).
+    """
+    from .dss_hpp_engine import normalize_code
+
+    code_field = segments_layer.fields().indexOf("AbstrCode")
+    by_code = {}
+    for feature in segments_layer.getFeatures():
+        by_code.setdefault(str(normalize_code(feature[code_field])), []).append(feature.geometry())
+    hpp_values = {
+        code: {'SegmentLength': sum(geometry.length() for geometry in geometries)}
+        for code, geometries in by_code.items()
+    }
+    hpp_geometries = {code: QgsGeometry.collectGeometry(geometries) for code, geometries in by_code.items()}
+
+    river_values = {}
+    if coverage_layer is not None:
+        coverage_field = coverage_layer.fields().indexOf(coverage_field_name)
+        river_by_coverage_id = {coverage_id: river_id for river_id, coverage_id in coverage_ids_by_river.items()}
+        for feature in coverage_layer.getFeatures():
+            river_id = river_by_coverage_id.get(feature.id())
+            if river_id is not None:
+                river_values[river_id] = {coverage_field_name: feature[coverage_field]}
+    return {HPP_KIND: hpp_values, RIVER_KIND: river_values}, {HPP_KIND: hpp_geometries}
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+import json
+import sqlite3
+import time
+
+from qgis.PyQt import QtWidgets
+from qgis.PyQt.QtCore import pyqtSignal, QVariant, Qt
+from qgis.PyQt.QtWidgets import QMessageBox
+from qgis.core import (
+    Qgis,
+    QgsFeature,
+    QgsField,
+    QgsMessageLog,
+    QgsProject,
+    QgsVectorLayer,
+    QgsWkbTypes
+)
+
+from .dss_rendering import WS_CLASSES, WS_STYLE, style_layer
+from .dss_run_history import CATCHMENT_KIND, HPP_KIND, RIVER_KIND
+from .dss_utils import load_form_class
+
+FORM_CLASS = load_form_class('dss_run_history_dockwidget_base.ui')
+
+MESSAGE_CATEGORY = 'Messages'
+
+# Name of the key field of the layers opened from the history, per kind
+KEY_FIELDS = {CATCHMENT_KIND: 'RCode', HPP_KIND: 'AbstrCode', RIVER_KIND: 'RiverId'}
+
+
+class RunHistoryDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
+    """
+    Lists the runs kept in the run history. A run opens as memory layers
+    from the stored geometries and values (nothing is recalculated); two
+    runs of the same tool are compared key by key.
+    """
+
+    closingPlugin = pyqtSignal()
+
+    COLUMNS = ["#", "Date", "Tool", "Run", "Summary"]
+
+    def __init__(self, iface, parent=None, session=None):
+        """:param session: DSSSession holding the run history."""
+        super().__init__(parent)
+        self.setupUi(self)
+        self.iface = iface
+        self.session = session
+        self.tblRuns.setColumnCount(len(self.COLUMNS))
+        self.tblRuns.setHorizontalHeaderLabels(self.COLUMNS)
+        self.btnOpen.clicked.connect(self.open_selected_run)
+        self.btnDiff.clicked.connect(self.diff_selected_runs)
+        self.btnDelete.clicked.connect(self.delete_selected_runs)
+        self.btnRefresh.clicked.connect(self.refresh)
+        self.tblRuns.itemDoubleClicked.connect(self.open_selected_run)
+
+    def showEvent(self, event):
+        self.refresh()
+        super().showEvent(event)
+
+    def closeEvent(self, event):
+        self.closingPlugin.emit()
+        event.accept()
+
+    @property
+    def history(self):
+        return self.session.run_history
+
+    def refresh(self, *args):
+        try:
+            runs = self.history.runs()
+        except sqlite3.Error as e:
+            QgsMessageLog.logMessage(f"Run history: {e}", MESSAGE_CATEGORY, Qgis.Warning)
+            runs = []
+        self.tblRuns.setRowCount(len(runs))
+        for row, run in enumerate(runs):
+            summary = ", ".join(f"{name}: {value}" for name, value in run.summary.items())
+            cells = [
+                str(run.id),
+                time.strftime('%Y-%m-%d %H:%M', time.localtime(run.started)),
+                run.tool,
+                run.label,
+                summary,
+            ]
+            for column, text in enumerate(cells):
+                item = QtWidgets.QTableWidgetItem(text)
+                item.setData(Qt.UserRole, run.id)
+                self.tblRuns.setItem(row, column, item)
+        self.tblRuns.resizeColumnsToContents()
+
+    def _selected_run_ids(self):
+        rows = sorted({index.row() for index in self.tblRuns.selectionModel().selectedRows()})
+        return [self.tblRuns.item(row, 0).data(Qt.UserRole) for row in rows]
+
+    # ------------------------------------------------------------------ open
+
+    def open_selected_run(self, *args):
+        run_ids = self._selected_run_ids()
+        if not run_ids:
+            QMessageBox.information(self, "Run history", "Select a run first.")
+            return
+        for run_id in run_ids:
+            self.open_run(run_id)
+
+    def open_run(self, run_id):
+        """Adds a memory layer per kind of geometry stored with the run."""
+        run = self.history.run(run_id)
+        for kind in self.history.kinds(run_id):
+            geometries = self.history.geometries(run_id, kind)
+            if not geometries:
+                continue
+            values = self.history.values(run_id, kind)
+            layer = self._run_layer(run, kind, geometries, values)
+            QgsProject.instance().addMapLayer(layer)
+            if kind == CATCHMENT_KIND:
+                style_layer(layer, WS_STYLE, 'WS_Total', WS_CLASSES)
+
+    def _run_layer(self, run, kind, geometries, values):
+        metrics = sorted({metric for by_metric in values.values() for metric in by_metric})
+        first = next(iter(geometries.values()))
+        geometry_type = QgsWkbTypes.displayString(QgsWkbTypes.multiType(first.wkbType()))
+        layer = QgsVectorLayer(f"{geometry_type}?crs={run.crs}", f"{run.label} (run {run.id})", "memory")
+        provider = layer.dataProvider()
+        provider.addAttributes(
+            [QgsField(KEY_FIELDS.get(kind, 'Key'), QVariant.String)]
+            + [QgsField(metric, QVariant.Double) for metric in metrics]
+        )
+        layer.updateFields()
+        features = []
+        for key, geometry in geometries.items():
+            feature = QgsFeature(layer.fields())
+            geometry.convertToMultiType()
+            feature.setGeometry(geometry)
+            by_metric = values.get(key, {})
+            feature.setAttributes([key] + [by_metric.get(metric) for metric in metrics])
+            features.append(feature)
+        provider.addFeatures(features)
+        layer.updateExtents()
+        return layer
+
+    # ------------------------------------------------------------------ diff
+
+    def diff_selected_runs(self):
+        run_ids = self._selected_run_ids()
+        if len(run_ids) != 2:
+            QMessageBox.information(self, "Run history", "Select the two runs to compare.")
+            return
+        old_run, new_run = sorted((self.history.run(run_id) for run_id in run_ids), key=lambda run: run.id)
+        if old_run.tool != new_run.tool:
+            QMessageBox.warning(self, "Run history", "Only runs of the same tool can be compared.")
+            return
+
+        rows = []
+        for kind in sorted(set(self.history.kinds(old_run.id)) | set(self.history.kinds(new_run.id))):
+            rows.extend((kind, row) for row in self.history.diff(old_run.id, new_run.id, kind))
+        show_diff(self, old_run, new_run, rows)
+
+    def delete_selected_runs(self):
+        run_ids = self._selected_run_ids()
+        if not run_ids:
+            return
+        if QMessageBox.question(self, "Run history", f"Delete {len(run_ids)} run(s) from the history?") != QMessageBox.Yes:
+            return
+        for run_id in run_ids:
+            self.history.delete(run_id)
+        self.refresh()
+
+
+def show_diff(parent, old_run, new_run, rows):
+    """
+    Dialog with the values that differ between two runs, largest changes first.
+
+    :param rows: List of (kind, DiffRow).
+    """
+    def change(diff_row):
+        if diff_row.old is None or diff_row.new is None:
+            return None
+        return diff_row.new - diff_row.old
+
+    rows = sorted(rows, key=lambda row: -abs(change(row[1]) or float('inf')))
+
+    dialog = QtWidgets.QDialog(parent)
+    dialog.setWindowTitle(f"Run {old_run.id} → run {new_run.id}")
+    layout = QtWidgets.QVBoxLayout(dialog)
+    layout.addWidget(QtWidgets.QLabel(
+        f"{len(rows)} values changed between \"{old_run.label}\" and \"{new_run.label}\".\n"
+        f"Inputs changed: {', '.join(_changed_inputs(old_run, new_run)) or 'none'}"
+    ))
+    table = QtWidgets.QTableWidget(len(rows), 6, dialog)
+    table.setHorizontalHeaderLabels(["Kind", "Key", "Metric", "Old", "New", "Change"])
+    table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+    table.verticalHeader().setVisible(False)
+
+    def number(value):
+        return "" if value is None else f"{value:.2f}"
+
+    for position, (kind, diff_row) in enumerate(rows):
+        if diff_row.old is None:
+            delta = "added"
+        elif diff_row.new is None:
+            delta = "removed"
+        else:
+            delta = number(change(diff_row))
+        cells = [kind, diff_row.key, diff_row.metric, number(diff_row.old), number(diff_row.new), delta]
+        for column, text in enumerate(cells):
+            table.setItem(position, column, QtWidgets.QTableWidgetItem(text))
+    table.resizeColumnsToContents()
+    layout.addWidget(table)
+
+    buttons = QtWidgets.QDialogButtonBox(QtWidgets.QDialogButtonBox.Close)
+    buttons.rejected.connect(dialog.reject)
+    layout.addWidget(buttons)
+    dialog.resize(700, 500)
+    dialog.exec_()
+
+
+def _changed_inputs(old_run, new_run):
+    """Names of the input layers whose source or fingerprint differ between two runs."""
+    old_inputs = {entry['name']: entry for entry in old_run.inputs}
+    changed = []
+    for entry in new_run.inputs:
+        old_entry = old_inputs.get(entry['name'])
+        if old_entry is None or json.dumps(old_entry, sort_keys=True) != json.dumps(entry, sort_keys=True):
+            changed.append(entry['name'])
+    return changed
@@ -0,0 +1,413 @@
+# -*- coding: utf-8 -*-
+"""
+Headless DSS query service: a standalone QGIS application that opens the
+input layers once, keeps the analysis structures warm (spatial indexes,
+RCode hierarchy, outlet assignment, point snapshots, result cache) and
+answers JSON queries over local HTTP or a Unix socket.
+
+The front end is an asyncio server, so any number of clients can wait on
+it without holding a thread each. All the QGIS work runs on one compute
+thread, which owns the layers and the session; queries are queued to it
+and never block the event loop.
+
+Usage, from the QGIS plugins directory (so that the plugin is importable)
+and with the QGIS Python environment set up:
+
+    python -m dss.dss_service service.json
+
+Example service.json (the layer keys are the ones of the national runner;
+the HPP queries are only available when "rivers", "hpp_abstraction" and
+"hpp_discharge" are given):
+
+    {
+        "host": "127.0.0.1",
+        "port": 8765,
+        "unix_socket": "/run/dss/dss.sock",
+        "layers": {
+            "catchments": "/data/erica.gpkg|layername=catchments",
+            "water_bodies": "/data/erica.gpkg|layername=water_bodies",
+            "water_abstraction": "/data/permits.gpkg|layername=abstraction",
+            "water_discharge": "/data/permits.gpkg|layername=discharge",
+            "groundwater": "/data/erica.gpkg|layername=groundwater",
+            "rivers": "/data/erica.gpkg|layername=rivers",
+            "hpp_abstraction": "/data/hpp.gpkg|layername=abstraction",
+            "hpp_discharge": "/data/hpp.gpkg|layername=discharge"
+        }
+    }
+
+Endpoints:
+
+    POST /query     {"type": "watershed", "x": 44.5, "y": 40.2, "crs": "EPSG:4326", "geometry": false}
+                    with "as_of": "2030-01-01", only the permits valid on that day are summed
+                    {"type": "hpp", "code": 124}
+                    or {"queries": [...]} for a batch, answered in order
+    GET  /metrics   request latency percentiles, throughput and session usage
+    GET  /health
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import sys
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from qgis.core import QgsApplication, QgsCoordinateReferenceSystem, QgsPointXY, QgsVectorLayer
+
+from .dss_diagnostics import RunDiagnostics
+from .dss_hpp_engine import HPPSegmentEngine, normalize_code
+from .dss_session import DSSSession
+from .dss_watershed_engine import (
+    ABSTRACTION_SNAPSHOT,
+    DISCHARGE_SNAPSHOT,
+    WatershedLoadEngine,
+    WatershedLoadError
+)
+
+_QGIS_APP = None
+
+MAX_BODY_BYTES = 16 * 1024 * 1024
+MAX_BATCH_SIZE = 10000
+LATENCY_WINDOW = 1000          # requests kept for the percentiles
+THROUGHPUT_WINDOW_SECONDS = 60
+
+WATERSHED_LAYER_KEYS = ('water_bodies', 'catchments', 'water_abstraction', 'water_discharge', 'groundwater')
+HPP_LAYER_KEYS = ('rivers', 'hpp_abstraction', 'hpp_discharge', 'catchments')
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large'}
+
+
+def _init_qgis():
+    """Starts a standalone (non-GUI) QGIS application once per process."""
+    global _QGIS_APP
+    if _QGIS_APP is None:
+        _QGIS_APP = QgsApplication([], False)
+        _QGIS_APP.initQgis()
+    return _QGIS_APP
+
+
+class QueryError(Exception):
+    """Raised for a malformed query; the message is returned to the client."""
+
+
+class DSSQueryService:
+    """
+    The compute side of the service: layers, session and engines, created
+    and only ever used on the compute thread.
+    """
+
+    def __init__(self, config):
+        self.session = DSSSession()
+        # the service lives for hours: keep far more structures than the desktop default
+        self.session.memory_budget = config.get('memory_budget_mb', 4096) * 1024 * 1024
+        self.layers = {}
+        for key, source in config['layers'].items():
+            layer = QgsVectorLayer(source, key, 'ogr')
+            if not layer.isValid():
+                raise RuntimeError(f"Layer '{key}' could not be opened from {source}.")
+            self.layers[key] = layer
+
+        self.watershed_engine = None
+        if all(key in self.layers for key in WATERSHED_LAYER_KEYS):
+            self.watershed_engine = WatershedLoadEngine(
+                *[self.layers[key] for key in WATERSHED_LAYER_KEYS],
+                session=self.session,
+                result_cache=self.session.result_cache
+            )
+
+        self.hpp_engine = None
+        self.hpp_features = {}
+        if all(key in self.layers for key in HPP_LAYER_KEYS):
+            self.hpp_engine = HPPSegmentEngine(*[self.layers[key] for key in HPP_LAYER_KEYS], session=self.session)
+
+        self.warm()
+
+    def warm(self):
+        """Builds every structure the queries use, before the first query comes."""
+        engine = self.watershed_engine
+        if engine is not None:
+            for layer in (engine.water_bodies_layer, engine.catchments_layer):
+                engine.spatial_index(layer)
+            engine.rcode_hierarchy()
+            engine.outlet_assignment()
+            engine.point_snapshot(engine.abstraction_layer, ABSTRACTION_SNAPSHOT)
+            engine.point_snapshot(engine.discharge_layer, DISCHARGE_SNAPSHOT)
+            engine.spatial_index(engine.working_layer(engine.groundwater_layer))
+
+        if self.hpp_engine is not None:
+            self.hpp_engine.prepare()
+            for feature in self.hpp_engine.abstraction_layer.getFeatures():
+                code = normalize_code(feature[self.hpp_engine.abstraction_code_field])
+                self.hpp_features.setdefault(code, []).append(feature)
+
+    def run_batch(self, queries):
+        """Results of `queries`, in order; a failing query does not fail the others."""
+        results = []
+        for query in queries:
+            start = time.perf_counter()
+            try:
+                result = self.run_query(query)
+                result['ok'] = True
+            except (QueryError, WatershedLoadError) as e:
+                result = {'ok': False, 'error': str(e)}
+            except Exception as e:
+                # a bug or bad data behind one query: report it, keep the batch and the service going
+                traceback.print_exc()
+                result = {'ok': False, 'error': f"Internal error: {type(e).__name__}: {e}"}
+            result['seconds'] = time.perf_counter() - start
+            results.append(result)
+        return results
+
+    def run_query(self, query):
+        if not isinstance(query, dict):
+            raise QueryError("A query is a JSON object.")
+        query_type = query.get('type', 'watershed')
+        if query_type == 'watershed':
+            return self.watershed(query)
+        if query_type == 'hpp':
+            return self.hpp(query)
+        raise QueryError(f"Unknown query type {query_type!r}.")
+
+    def watershed(self, query):
+        engine = self.watershed_engine
+        if engine is None:
+            raise QueryError("The service was started without the watershed layers.")
+        try:
+            point = QgsPointXY(float(query['x']), float(query['y']))
+        except (KeyError, TypeError, ValueError):
+            raise QueryError("A watershed query needs numeric 'x' and 'y'.")
+        target_crs = engine.water_bodies_source.crs()
+        if query.get('crs'):
+            crs = QgsCoordinateReferenceSystem(query['crs'])
+            if not crs.isValid():
+                raise QueryError(f"Unknown CRS {query['crs']!r}.")
+            if crs != target_crs:
+                point = self.session.transform(crs, target_crs).transform(point)
+
+        as_of = None
+        if query.get('as_of'):
+            try:
+                as_of = datetime.date.fromisoformat(query['as_of'])
+            except (TypeError, ValueError):
+                raise QueryError("'as_of' is a date as YYYY-MM-DD.")
+
+        results = engine.calculate(point, as_of)
+        response = {
+            key: value for key, value in results.items()
+            if isinstance(value, (int, float, str, bool))
+        }
+        response['catchment_id'] = str(results['catchment_id'])
+        response['water_body_id'] = engine.water_body_source_id(results['water_body_feature'])
+        if query.get('geometry'):
+            response['union_wkt'] = results['union_geometry'].asWkt()
+            response['union_crs'] = results['union_crs'].authid()
+        return response
+
+    def hpp(self, query):
+        if self.hpp_engine is None:
+            raise QueryError("The service was started without the HPP layers.")
+        if 'code' not in query:
+            raise QueryError("An HPP query needs the abstraction 'code'.")
+        features = self.hpp_features.get(normalize_code(query['code']))
+        if not features:
+            raise QueryError(f"No HPP abstraction with code {query['code']!r}.")
+
+        diagnostics = RunDiagnostics("HPP Load")
+        segments = self.hpp_engine.run(max_workers=1, diagnostics=diagnostics, abstraction_features=features)
+        response = {
+            'segments': [
+                dict({'length': geometry.length()}, **({'wkt': geometry.asWkt()} if query.get('geometry') else {}))
+                for _, geometry in segments
+            ],
+            'crs': self.hpp_engine.rivers_layer.crs().authid(),
+            'messages': [message for _, _, _, message in diagnostics.records],
+        }
+        return response
+
+
+class ServiceMetrics:
+    """Request latency and throughput, updated from the event loop thread only."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.requests = 0
+        self.queries = 0
+        self.errors = 0
+        self.in_flight = 0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._completions = deque()   # (time, number of queries) within the throughput window
+
+    def record(self, seconds, query_count, error_count):
+        now = time.time()
+        self.requests += 1
+        self.queries += query_count
+        self.errors += error_count
+        self._latencies.append(seconds)
+        self._completions.append((now, query_count))
+        while self._completions and self._completions[0][0] < now - THROUGHPUT_WINDOW_SECONDS:
+            self._completions.popleft()
+
+    def snapshot(self):
+        latencies = sorted(self._latencies)
+
+        def percentile(fraction):
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+        window = min(THROUGHPUT_WINDOW_SECONDS, max(time.time() - self.started, 1e-9))
+        return {
+            'uptime_seconds': time.time() - self.started,
+            'requests': self.requests,
+            'queries': self.queries,
+            'errors': self.errors,
+            'in_flight': self.in_flight,
+            'latency_seconds': {
+                'mean': sum(latencies) / len(latencies) if latencies else None,
+                'p50': percentile(0.50),
+                'p95': percentile(0.95),
+                'p99': percentile(0.99),
+                'max': latencies[-1] if latencies else None,
+            },
+            'queries_per_second': sum(count for _, count in self._completions) / window,
+        }
+
+
+class ServiceFrontEnd:
+    """Minimal HTTP/1.1 server (keep-alive, JSON bodies) on asyncio streams."""
+
+    def __init__(self, config):
+        self.config = config
+        self.metrics = ServiceMetrics()
+        # one thread owns the layers: QGIS objects are not shared between threads
+        self.compute = ThreadPoolExecutor(max_workers=1, thread_name_prefix='dss-compute')
+        self.service = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.service = await loop.run_in_executor(self.compute, DSSQueryService, self.config)
+        servers = []
+        if self.config.get('port') is not None:
+            servers.append(await asyncio.start_server(
+                self.handle_connection, self.config.get('host', '127.0.0.1'), self.config['port']
+            ))
+        if self.config.get('unix_socket'):
+            servers.append(await asyncio.start_unix_server(self.handle_connection, self.config['unix_socket']))
+        if not servers:
+            raise RuntimeError("Configure a 'port' and/or a 'unix_socket'.")
+        return servers
+
+    async def serve_forever(self):
+        servers = await self.start()
+        print("DSS service ready.", flush=True)
+        try:
+            await asyncio.gather(*(server.serve_forever() for server in servers))
+        finally:
+            self.compute.shutdown(wait=False)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                parts = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get('connection', '').lower() != 'close'
+
+                if len(parts) != 3:
+                    status, payload, keep_alive = 400, {'error': "Malformed request line."}, False
+                else:
+                    try:
+                        length = int(headers.get('content-length') or 0)
+                    except ValueError:
+                        length = -1
+                    if length < 0:
+                        status, payload, keep_alive = 400, {'error': "Invalid Content-Length."}, False
+                    elif length > MAX_BODY_BYTES:
+                        status, payload, keep_alive = 413, {'error': "Request body too large."}, False
+                    else:
+                        body = await reader.readexactly(length) if length else b''
+                        status, payload = await self.dispatch(parts[0].upper(), parts[1], body)
+
+                self._write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, path, body):
+        path = path.split('?', 1)[0]
+        if path == '/health':
+            return 200, {'status': 'ok'}
+        if path == '/metrics':
+            metrics = self.metrics.snapshot()
+            metrics['session'] = self.service.session.summary()
+            return 200, metrics
+        if path != '/query':
+            return 404, {'error': f"No endpoint {path}."}
+        if method != 'POST':
+            return 405, {'error': "Queries are POSTed."}
+
+        try:
+            request = json.loads(body.decode('utf-8'))
+        except (UnicodeDecodeError, ValueError) as e:
+            return 400, {'error': f"Invalid JSON: {e}"}
+        batch = isinstance(request, dict) and 'queries' in request
+        queries = request['queries'] if batch else [request]
+        if not isinstance(queries, list) or len(queries) > MAX_BATCH_SIZE:
+            return 400, {'error': f"'queries' is a list of at most {MAX_BATCH_SIZE} queries."}
+
+        start = time.perf_counter()
+        self.metrics.in_flight += 1
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(self.compute, self.service.run_batch, queries)
+        finally:
+            self.metrics.in_flight -= 1
+        self.metrics.record(time.perf_counter() - start, len(results), sum(1 for result in results if not result['ok']))
+        return 200, {'results': results} if batch else results[0]
+
+    @staticmethod
+    def _write_response(writer, status, payload, keep_alive):
+        body = json.dumps(payload).encode('utf-8')
+        head = (
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
+
+
+def serve(config):
+    _init_qgis()
+    asyncio.run(ServiceFrontEnd(config).serve_forever())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="DSS query service over local HTTP or a Unix socket.")
+    parser.add_argument('config', help="JSON configuration file")
+    args = parser.parse_args(argv)
+    with open(args.config, encoding='utf-8') as config_file:
+        config = json.load(config_file)
+    try:
+        serve(config)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+import threading
+from collections import OrderedDict
+
+from qgis.PyQt.QtCore import QObject, QSettings, pyqtSignal
+from qgis.core import (
+    Qgis,
+    QgsCoordinateTransform,
+    QgsFeatureRequest,
+    QgsMessageLog,
+    QgsProject,
+    QgsSpatialIndex
+)
+
+from . import dss_counters as counters
+
+MESSAGE_CATEGORY = 'Messages'
+
+# Rough per-feature footprints used to account the cached structures
+INDEX_BYTES_PER_FEATURE = 120
+LOOKUP_BYTES_PER_FEATURE = 160
+
+
+SPATIAL_INDEX_KEY = 'spatial_index'
+
+
+def lookup_key(field_name):
+    return ('lookup', field_name)
+
+
+def build_spatial_index(source, feedback=None):
+    """Spatial index of a layer or feature source (cancellable through `feedback`)."""
+    counters.count(counters.SPATIAL_INDEX_BUILDS)
+    counters.count(counters.FULL_LAYER_SCANS)
+    return QgsSpatialIndex(source.getFeatures(), feedback)
+
+
+def build_attribute_lookup(source, fields, field_name, feedback=None):
+    """Dict of feature id -> value of `field_name` of a layer or feature source, read without geometries."""
+    counters.count(counters.FULL_LAYER_SCANS)
+    request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry)
+    request.setSubsetOfAttributes([field_name], fields)
+    lookup = {}
+    for feature in source.getFeatures(request):
+        if feedback is not None and feedback.isCanceled():
+            break
+        lookup[feature.id()] = feature[field_name]
+    return lookup
+
+
+class _CacheEntry:
+
+    def __init__(self, value, size):
+        self.value = value
+        self.size = size
+
+
+class DSSSession(QObject):
+    """
+    Analysis state shared by all DSS tools for the lifetime of the plugin.
+
+    Holds the structures derived from project layers (spatial indexes,
+    attribute lookups such as RCodes, copies reprojected into a working CRS,
+    and any other per-layer cache registered through `get`) and the
+    coordinate transforms, so the Watershed and HPP tools do not rebuild them
+    on every run. Entries of a layer are dropped as soon as the layer is
+    edited, filtered or removed.
+
+    The cache is bounded by a memory budget (estimated, in MB, stored in the
+    QGIS settings); the least recently used entries are evicted first.
+    """
+
+    # emitted after clear() or an eviction, with the estimated usage in bytes
+    usageChanged = pyqtSignal(int)
+
+    SETTINGS_KEY = 'dss/session_memory_budget_mb'
+    DEFAULT_MEMORY_BUDGET_MB = 512
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.memory_budget = int(QSettings().value(self.SETTINGS_KEY, self.DEFAULT_MEMORY_BUDGET_MB)) * 1024 * 1024
+        self._entries = OrderedDict()   # (layer id, key) -> _CacheEntry, least recently used first
+        self._usage = 0                 # sum of the sizes of the entries
+        self._watched_layers = {}       # layer id -> [(signal, slot)]
+        self._generations = {}          # layer id -> number of invalidations so far
+        self._dependents = {}           # layer id -> ids of the working copies made from it
+        self._transforms = {}
+        self._lock = threading.RLock()
+        self._result_cache = None
+        self._profiler = None
+        self._run_history = None
+
+    # ----------------------------------------------------------------- budget
+
+    def set_memory_budget_mb(self, budget_mb):
+        QSettings().setValue(self.SETTINGS_KEY, int(budget_mb))
+        self.memory_budget = int(budget_mb) * 1024 * 1024
+        with self._lock:
+            self._evict()
+        self.usageChanged.emit(self.memory_usage())
+
+    def memory_usage(self):
+        """Estimated size of the cached structures, in bytes."""
+        with self._lock:
+            return self._usage
+
+    def summary(self):
+        return (
+            f"{len(self._entries)} cached structures, "
+            f"{self.memory_usage() / (1024 * 1024):.1f} of {self.memory_budget / (1024 * 1024):.0f} MB"
+        )
+
+    @property
+    def result_cache(self):
+        """On-disk cache of the watershed results, opened on first use."""
+        if self._result_cache is None:
+            from .dss_result_cache import WatershedResultCache
+            self._result_cache = WatershedResultCache()
+        return self._result_cache
+
+    @property
+    def run_history(self):
+        """Local history of the watershed and HPP runs, opened on first use."""
+        if self._run_history is None:
+            from .dss_run_history import RunHistory
+            self._run_history = RunHistory()
+        return self._run_history
+
+    @property
+    def profiler(self):
+        """The "Profile next run" switch of the DSS tools."""
+        if self._profiler is None:
+            from .dss_profiling import NextRunProfiler
+            self._profiler = NextRunProfiler(self)
+        return self._profiler
+
+    # ------------------------------------------------------------------ cache
+
+    def get(self, layer, key, factory, size=None):
+        """
+        Returns the value cached for (`layer`, `key`), building it with
+        `factory(layer)` on a miss.
+
+        :param layer:   QgsVectorLayer the value is derived from.
+        :param key:     Hashable name of the structure, e.g. ('lookup', 'RCode').
+        :param factory: Callable building the value from the layer.
+        :param size:    Estimated size in bytes, or a callable returning it
+                        from the value; defaults to the feature count times
+                        LOOKUP_BYTES_PER_FEATURE.
+        """
+        cache_key = (layer.id(), key)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                self._entries.move_to_end(cache_key)
+                return entry.value
+
+        value = factory(layer)
+        if size is None:
+            size = max(layer.featureCount(), 0) * LOOKUP_BYTES_PER_FEATURE
+        elif callable(size):
+            size = size(value)
+
+        self.put(layer, key, value, size)
+        return value
+
+    def put(self, layer, key, value, size, generation=None):
+        """
+        Stores a value built elsewhere (e.g. by a background task).
+
+        :param generation: Value of generation(layer) when the build started;
+                           the value is dropped if the layer changed since.
+        :return:           True if the value was stored.
+        """
+        cache_key = (layer.id(), key)
+        with self._lock:
+            if generation is not None and generation != self.generation(layer.id()):
+                return False
+            self._watch(layer)
+            self._drop(cache_key)
+            self._entries[cache_key] = _CacheEntry(value, size)
+            self._usage += size
+            self._evict(keep=cache_key)
+        return True
+
+    def contains(self, layer, key):
+        with self._lock:
+            return (layer.id(), key) in self._entries
+
+    def generation(self, layer_id):
+        """Number of times the structures of the layer were invalidated."""
+        return self._generations.get(layer_id, 0)
+
+    def spatial_index(self, layer):
+        """Spatial index of all the features of `layer`."""
+        return self.get(layer, SPATIAL_INDEX_KEY, build_spatial_index, size=self.spatial_index_size(layer))
+
+    @staticmethod
+    def spatial_index_size(layer):
+        return max(layer.featureCount(), 0) * INDEX_BYTES_PER_FEATURE
+
+    def attribute_lookup(self, layer, field_name):
+        """Dict of feature id -> value of `field_name`, read without geometries."""
+        return self.get(
+            layer,
+            lookup_key(field_name),
+            lambda layer: build_attribute_lookup(layer, layer.fields(), field_name)
+        )
+
+    def feature_cache(self, layer, attributes=None):
+        """FeatureCache of `layer` (batched fetch by id, LRU), dropped when the layer is edited."""
+        from .dss_feature_access import FEATURE_BYTES_ESTIMATE, FeatureCache
+        key = ('features', tuple(attributes) if attributes is not None else None)
+        return self.get(
+            layer,
+            key,
+            lambda layer: FeatureCache(layer, attributes),
+            size=FeatureCache.DEFAULT_MAX_FEATURES * FEATURE_BYTES_ESTIMATE
+        )
+
+    def working_layer(self, layer, crs):
+        """
+        WorkingLayer of `layer` in `crs`: the layer itself if already in that
+        CRS, else a reprojected memory copy, made once and dropped (with
+        everything derived from it) when the source layer changes.
+        """
+        from .dss_feature_access import FEATURE_BYTES_ESTIMATE
+        from .dss_ingest import WorkingLayer, working_copy_key
+        if layer.crs() == crs:
+            return WorkingLayer(layer)
+
+        def build(layer):
+            working = WorkingLayer.reproject(layer, crs, self.transform(layer.crs(), crs))
+            with self._lock:
+                self._dependents.setdefault(layer.id(), set()).add(working.layer.id())
+            return working
+
+        return self.get(
+            layer,
+            working_copy_key(crs),
+            build,
+            size=max(layer.featureCount(), 0) * FEATURE_BYTES_ESTIMATE
+        )
+
+    def transform(self, source_crs, target_crs):
+        """Coordinate transform between two CRSs, in the project transform context."""
+        key = (source_crs.authid() or source_crs.toWkt(), target_crs.authid() or target_crs.toWkt())
+        with self._lock:
+            transform = self._transforms.get(key)
+            if transform is None:
+                transform = QgsCoordinateTransform(source_crs, target_crs, QgsProject.instance())
+                self._transforms[key] = transform
+            return transform
+
+    def invalidate_layer(self, layer_id):
+        """Drops every structure derived from the layer."""
+        with self._lock:
+            self._generations[layer_id] = self.generation(layer_id) + 1
+            for cache_key in [cache_key for cache_key in self._entries if cache_key[0] == layer_id]:
+                self._drop(cache_key)
+            for dependent_id in self._dependents.pop(layer_id, ()):
+                self.invalidate_layer(dependent_id)
+
+    def clear(self):
+        """Drops all cached structures and transforms."""
+        with self._lock:
+            for layer_id in self._watched_layers:
+                # results of builds still running are dropped too
+                self._generations[layer_id] = self.generation(layer_id) + 1
+            self._entries.clear()
+            self._usage = 0
+            self._dependents.clear()
+            self._transforms.clear()
+            self._unwatch_all()
+        QgsMessageLog.logMessage("DSS session caches cleared.", MESSAGE_CATEGORY, Qgis.Info)
+        self.usageChanged.emit(0)
+
+    def _evict(self, keep=None):
+        """Drops least recently used entries until the usage fits the budget."""
+        evicted = False
+        while self._entries and self._usage > self.memory_budget:
+            cache_key = next(iter(self._entries))
+            if cache_key == keep:
+                # a single structure larger than the budget is still kept while in use
+                break
+            self._drop(cache_key)
+            evicted = True
+        if evicted:
+            self.usageChanged.emit(self._usage)
+
+    def _drop(self, cache_key):
+        """Removes an entry, if any, and its size from the usage."""
+        entry = self._entries.pop(cache_key, None)
+        if entry is not None:
+            self._usage -= entry.size
+
+    # ---------------------------------------------------------- invalidation
+
+    def _watch(self, layer):
+        layer_id = layer.id()
+        if layer_id in self._watched_layers:
+            return
+
+        def invalidate(*args):
+            self.invalidate_layer(layer_id)
+
+        def forget(*args):
+            self.invalidate_layer(layer_id)
+            self._watched_layers.pop(layer_id, None)
+
+        connections = [
+            (layer.dataChanged, invalidate),
+            (layer.subsetStringChanged, invalidate),
+            (layer.willBeDeleted, forget),
+        ]
+        for signal, slot in connections:
+            signal.connect(slot)
+        self._watched_layers[layer_id] = connections
+
+    def _unwatch_all(self):
+        for connections in self._watched_layers.values():
+            for signal, slot in connections:
+                try:
+                    signal.disconnect(slot)
+                except (TypeError, RuntimeError):
+                    # the layer was already deleted
+                    pass
+        self._watched_layers = {}
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+from qgis.core import QgsApplication, QgsGeometry, QgsPointXY, QgsProject
+
+from . import dss_counters as counters
+from .dss_result_cache import layer_fingerprint
+
+# Bump when the file layout or the meaning of the columns changes
+SNAPSHOT_VERSION = 1
+SNAPSHOT_DIR_NAME = '.dss_snapshots'
+
+
+def snapshot_directory():
+    """Snapshots live next to the saved project, else in the QGIS profile."""
+    project_path = QgsProject.instance().absolutePath()
+    if project_path:
+        return os.path.join(project_path, SNAPSHOT_DIR_NAME)
+    return os.path.join(QgsApplication.qgisSettingsDirPath(), 'dss', 'snapshots')
+
+
+def snapshot_key(layer, name, columns, crs):
+    """Identifies a snapshot of `layer`; None when the layer cannot be fingerprinted (it is then not saved)."""
+    fingerprint = layer_fingerprint(layer)
+    if fingerprint is None:
+        return None
+    value = [SNAPSHOT_VERSION, fingerprint, name, list(columns), crs.authid() or crs.toWkt()]
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class PointSnapshot:
+    """
+    Columnar copy of a point layer: feature ids, coordinates and the values
+    an analysis reads from each feature, as float64 NumPy arrays.
+
+    Values are extracted once by a converter (NaN where the feature has no
+    usable value), so aggregations become array sums instead of a Python
+    loop over QgsFeature objects. Snapshots are saved as .npy files, one per
+    column, and memory-mapped when loaded again for the same layer content.
+    """
+
+    def __init__(self, columns):
+        """:param columns: Dict of column name -> 1-D array; 'fid', 'x' and 'y' included."""
+        self.columns = columns
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __len__(self):
+        return len(self.columns['fid'])
+
+    def nbytes(self):
+        return sum(column.nbytes for column in self.columns.values())
+
+    def rows_in(self, geometry_filter):
+        """
+        Indexes of the rows whose point intersects the filter geometry: a
+        bounding box test and the inner/outer envelope test of the filter on
+        the coordinate arrays, then the exact test on the points left in the
+        band along the boundary only.
+
+        :param geometry_filter: TwoPhaseFilter, in the CRS of the snapshot.
+        """
+        box = geometry_filter.geometry.boundingBox()
+        x = self.columns['x']
+        y = self.columns['y']
+        in_box = (x >= box.xMinimum()) & (x <= box.xMaximum()) & (y >= box.yMinimum()) & (y <= box.yMaximum())
+        candidates = np.flatnonzero(in_box)
+        inside, band = geometry_filter.classify_points(
+            np.asarray(x[candidates], dtype=np.float64), np.asarray(y[candidates], dtype=np.float64)
+        )
+        band_rows = [
+            row for row in candidates[band]
+            if geometry_filter.exact_intersects(QgsGeometry.fromPointXY(QgsPointXY(float(x[row]), float(y[row]))))
+        ]
+        return np.sort(np.concatenate([candidates[inside], np.array(band_rows, dtype=np.int64)])).astype(np.int64)
+
+    @classmethod
+    def build(cls, layer, columns, converter, transform=None, feedback=None):
+        """
+        :param layer:     Point layer to read.
+        :param columns:   Names of the value columns.
+        :param converter: Callable returning the tuple of column values of a feature.
+        :param transform: QgsCoordinateTransform into the CRS the coordinates are stored in.
+        :return:          The snapshot, or None if a feature is not a single point.
+        """
+        counters.count(counters.FULL_LAYER_SCANS)
+        fids = []
+        xs = []
+        ys = []
+        values = []
+        for feature in layer.getFeatures():
+            if feedback is not None and feedback.isCanceled():
+                return None
+            geometry = feature.geometry()
+            if geometry.isNull():
+                x = y = float('nan')
+            elif geometry.constGet().vertexCount() != 1:
+                return None
+            else:
+                point = geometry.vertexAt(0)
+                if transform is not None:
+                    point = transform.transform(QgsPointXY(point))
+                x, y = point.x(), point.y()
+            fids.append(feature.id())
+            xs.append(x)
+            ys.append(y)
+            values.append(converter(feature))
+
+        data = {
+            'fid': np.array(fids, dtype=np.int64),
+            'x': np.array(xs, dtype=np.float64),
+            'y': np.array(ys, dtype=np.float64),
+        }
+        value_array = np.array(values, dtype=np.float64).reshape(len(values), len(columns))
+        for position, name in enumerate(columns):
+            data[name] = np.ascontiguousarray(value_array[:, position])
+        return cls(data)
+
+    def save(self, directory):
+        """Writes one .npy file per column; the directory is replaced as a whole."""
+        temporary = directory + '.tmp'
+        shutil.rmtree(temporary, ignore_errors=True)
+        os.makedirs(temporary)
+        for name, column in self.columns.items():
+            np.save(os.path.join(temporary, f'{name}.npy'), column)
+        with open(os.path.join(temporary, 'meta.json'), 'w') as meta:
+            json.dump({'version': SNAPSHOT_VERSION, 'columns': list(self.columns), 'count': len(self)}, meta)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(temporary, directory)
+
+    @classmethod
+    def load(cls, directory):
+        """The snapshot saved in `directory`, memory-mapped, or None if there is none."""
+        try:
+            with open(os.path.join(directory, 'meta.json')) as meta:
+                names = json.load(meta)['columns']
+            return cls({
+                name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+                for name in names
+            })
+        except (OSError, ValueError, KeyError):
+            return None
+
+    @classmethod
+    def for_layer(cls, layer, name, columns, converter, crs, transform=None, directory=None):
+        """
+        The saved snapshot of `layer` if its content did not change, else a
+        new one (saved when the layer can be fingerprinted).
+
+        :param name: Name of the analysis the columns are for, e.g. 'abstraction'.
+        :param crs:  CRS of the stored coordinates (`transform` goes into it).
+        """
+        key = snapshot_key(layer, name, columns, crs)
+        path = None
+        if key is not None:
+            path = os.path.join(directory or snapshot_directory(), key)
+            snapshot = cls.load(path)
+            if snapshot is not None:
+                return snapshot
+
+        snapshot = cls.build(layer, columns, converter, transform)
+        if snapshot is not None and path is not None:
+            try:
+                snapshot.save(path)
+            except OSError:
+                # e.g. a read-only project folder: the snapshot is still used for this session
+                pass
+        return snapshot
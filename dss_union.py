@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from qgis.core import QgsGeometry
+
+from . import dss_counters as counters
+
+# Below this number of geometries a single unaryUnion call is faster than splitting
+PARALLEL_MIN_GEOMETRIES = 256
+CHUNK_SIZE = 64
+MERGE_FAN_IN = 8
+
+
+def str_chunks(geometries, chunk_size=CHUNK_SIZE):
+    """
+    Splits `geometries` into spatially compact groups of about `chunk_size`,
+    in Sort-Tile-Recursive order: vertical slices by centre x, then runs of
+    `chunk_size` by centre y inside each slice. Neighbouring polygons end up
+    in the same group, so the partial unions dissolve most shared edges.
+    """
+    centres = []
+    for geometry in geometries:
+        box = geometry.boundingBox()
+        centres.append((box.center().x(), box.center().y(), geometry))
+
+    chunk_count = math.ceil(len(centres) / chunk_size)
+    slice_count = max(1, math.ceil(math.sqrt(chunk_count)))
+    slice_size = slice_count * chunk_size
+
+    centres.sort(key=lambda item: item[0])
+    chunks = []
+    for start in range(0, len(centres), slice_size):
+        vertical_slice = sorted(centres[start:start + slice_size], key=lambda item: item[1])
+        for chunk_start in range(0, len(vertical_slice), chunk_size):
+            chunks.append([item[2] for item in vertical_slice[chunk_start:chunk_start + chunk_size]])
+    return chunks
+
+
+def _timed_union(geometries):
+    counters.count(counters.UNION_CALLS)
+    start = time.perf_counter()
+    union = QgsGeometry.unaryUnion(geometries)
+    return union, time.perf_counter() - start
+
+
+def cascaded_union(geometries, max_workers=None, stats=None):
+    """
+    Union of `geometries`, as QgsGeometry.unaryUnion, computed in parallel
+    for large inputs: spatially ordered chunks are unioned on worker threads
+    (GEOS runs outside the GIL), then the partial unions are merged level by
+    level, MERGE_FAN_IN at a time, until one geometry is left.
+
+    :param geometries:  List of QgsGeometry.
+    :param max_workers: Number of threads; None uses all available cores.
+    :param stats:       Optional dict receiving 'chunks', 'workers',
+                        'work_seconds' (sum of the union calls) and
+                        'wall_seconds'; their ratio is the parallel speedup.
+    :return:            The union QgsGeometry.
+    """
+    start = time.perf_counter()
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    if len(geometries) < PARALLEL_MIN_GEOMETRIES or max_workers <= 1:
+        union, work_seconds = _timed_union(geometries)
+        if stats is not None:
+            stats.update(chunks=1, workers=1, work_seconds=work_seconds, wall_seconds=time.perf_counter() - start)
+        return union
+
+    chunks = str_chunks(geometries)
+    work_seconds = 0.0
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='dss-union') as executor:
+        level = chunks
+        while True:
+            results = list(executor.map(_timed_union, level))
+            work_seconds += sum(seconds for _, seconds in results)
+            partial_unions = [union for union, _ in results if not union.isEmpty()]
+            if len(partial_unions) <= 1:
+                break
+            level = [partial_unions[i:i + MERGE_FAN_IN] for i in range(0, len(partial_unions), MERGE_FAN_IN)]
+
+    union = partial_unions[0] if partial_unions else QgsGeometry()
+    if stats is not None:
+        stats.update(
+            chunks=len(chunks),
+            workers=max_workers,
+            work_seconds=work_seconds,
+            wall_seconds=time.perf_counter() - start
+        )
+    return union
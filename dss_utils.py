@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import importlib
+import os
+import sys
+import traceback
+
+from qgis.core import Qgis, QgsMessageLog
+
+MESSAGE_CATEGORY = 'Messages'
+
+# Set DSS_REMOTE_DEBUG=1 in the environment of QGIS to let a debugger attach to the plugin
+REMOTE_DEBUG_ENV = 'DSS_REMOTE_DEBUG'
+
+_remote_debugging_enabled = False
+
+
+def enable_remote_debugging():
+    """
+    Lets Visual Studio (ptvsd) attach to QGIS on localhost:5678.
+
+    Only runs when the DSS_REMOTE_DEBUG environment variable is set, and
+    only once per QGIS session, whichever widget asks for it first.
+    """
+    global _remote_debugging_enabled
+    if _remote_debugging_enabled or not os.environ.get(REMOTE_DEBUG_ENV):
+        return
+    _remote_debugging_enabled = True
+    try:
+        import ptvsd
+        QgsMessageLog.logMessage("ptvsd imported successfully!", MESSAGE_CATEGORY, Qgis.Info)
+        if ptvsd.is_attached():
+            QgsMessageLog.logMessage("Remote Debug for Visual Studio is already active", MESSAGE_CATEGORY, Qgis.Info)
+            return
+        ptvsd.enable_attach(address=('localhost', 5678))
+        QgsMessageLog.logMessage("Attached remote Debug for Visual Studio", MESSAGE_CATEGORY, Qgis.Info)
+    except Exception as e:
+        exc_type, exc_value, exc_traceback = sys.exc_info()
+        format_exception = traceback.format_exception(exc_type, exc_value, exc_traceback)
+        QgsMessageLog.logMessage(str(e), MESSAGE_CATEGORY, Qgis.Critical)
+        QgsMessageLog.logMessage(repr(format_exception[0]), MESSAGE_CATEGORY, Qgis.Critical)
+        QgsMessageLog.logMessage(repr(format_exception[1]), MESSAGE_CATEGORY, Qgis.Critical)
+        QgsMessageLog.logMessage(repr(format_exception[2]), MESSAGE_CATEGORY, Qgis.Critical)
+
+
+def load_form_class(ui_file_name):
+    """
+    Returns the form class of a Qt Designer file.
+
+    Uses the precompiled module `<name>_ui.py` generated by `make compile`
+    (pyuic5) when it exists, which saves parsing the XML on every widget
+    import; falls back to compiling the .ui file at runtime.
+
+    :param ui_file_name: File name of the .ui file, relative to the plugin directory.
+    :return:             The generated Ui_* form class.
+    """
+    base_name = os.path.splitext(ui_file_name)[0]
+    try:
+        module = importlib.import_module(f".{base_name}_ui", __package__)
+    except ImportError:
+        module = None
+    if module is not None:
+        form_classes = [value for name, value in vars(module).items() if name.startswith('Ui_')]
+        if form_classes:
+            return form_classes[0]
+
+    from qgis.PyQt import uic
+    form_class, _ = uic.loadUiType(os.path.join(os.path.dirname(__file__), ui_file_name))
+    return form_class
@@ -0,0 +1,827 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from qgis.PyQt.QtCore import QVariant
+from qgis.core import (
+    QgsCoordinateTransform,
+    QgsFeature,
+    QgsFeatureRequest,
+    QgsGeometry,
+    QgsProject,
+    QgsSpatialIndex
+)
+
+from . import dss_counters as counters
+from .dss_diagnostics import RunDiagnostics
+from .dss_feature_access import FeatureCache
+from .dss_filtering import TwoPhaseFilter
+from .dss_nearest import nearest_feature
+from .dss_outlets import ContainmentLookup, OutletAssignment, assignment_key
+from .dss_permits import IntervalTree, PermitTimeline, permit_interval
+from .dss_rcode import RCodeHierarchy
+from .dss_snapshot import PointSnapshot
+from .dss_union import cascaded_union
+
+CATCHMENT_ID_FIELD = 'RCode'
+NAN = float('nan')
+
+
+class WatershedLoadError(Exception):
+    """Raised when the water stress of a point cannot be calculated; the message is meant for the user."""
+
+
+class WatershedLoadEngine:
+    """
+    Calculates the water stress (WS) of the basin upstream of a point:
+    nearest water body -> its outlet catchment -> all upstream catchments
+    (by RCode) -> their union -> abstraction, discharge and groundwater
+    totals inside the union.
+
+    The engine only depends on qgis.core, so the same pipeline runs in the
+    dock widget and headless (e.g. in the national runner). Spatial indexes,
+    RCode lookups and transforms come from the DSSSession when one is given,
+    so they are shared across runs and tools; otherwise they are built on
+    first use and kept for the lifetime of the engine.
+
+    With a session, all the analysis runs in the catchments CRS: input
+    layers in another CRS are reprojected once into session-held memory
+    copies (see WorkingLayer), instead of transforming the union into each
+    layer CRS on every query, and the abstraction and discharge totals are
+    summed over columnar PointSnapshots. With a WatershedResultCache, a
+    query whose water body and outlet catchment were already computed on the
+    same input data skips the rest of the pipeline.
+    """
+
+    def __init__(
+        self,
+        water_bodies_layer,
+        catchments_layer,
+        abstraction_layer,
+        discharge_layer,
+        groundwater_layer,
+        session=None,
+        result_cache=None,
+        max_workers=None
+    ):
+        # the layers as given: they identify the input data (result cache, outlet assignment, snapshots);
+        # abstraction, discharge and groundwater are only copied into the working CRS when read (working_layer)
+        self.source_layers = [water_bodies_layer, catchments_layer, abstraction_layer, discharge_layer, groundwater_layer]
+        self.water_bodies_source = water_bodies_layer
+        self._water_bodies = None
+        if session is not None:
+            working_crs = catchments_layer.crs()
+            self._water_bodies = session.working_layer(water_bodies_layer, working_crs)
+            water_bodies_layer = self._water_bodies.layer
+
+        self.water_bodies_layer = water_bodies_layer
+        self.catchments_layer = catchments_layer
+        self.abstraction_layer = abstraction_layer
+        self.discharge_layer = discharge_layer
+        self.groundwater_layer = groundwater_layer
+        self.session = session
+        self.result_cache = result_cache
+        self.max_workers = max_workers
+        self.diagnostics = None
+        self._indexes = {}
+        self._lookups = {}
+        self._feature_caches = {}
+        self._pinned_inputs_keys = None
+
+    def calculate(self, point, as_of=None):
+        """
+        Runs the whole pipeline for a point given in the CRS of the water bodies layer.
+
+        :param point: QgsPointXY
+        :param as_of: datetime.date; when given, only the abstraction permits
+                      valid on that day are summed (see dss_permits).
+        :return:      Dict with the WS metrics and their inputs, plus 'union_geometry'
+                      and 'union_crs' (the upstream basin in the catchments CRS) and
+                      'cached' (True when read from the result cache) and
+                      'diagnostics' (RunDiagnostics with the stage timings).
+        :raises WatershedLoadError: if a step of the pipeline finds nothing.
+        """
+        diagnostics = RunDiagnostics("Watershed Load")
+        self.diagnostics = diagnostics
+        nearest_water_body_feature, intersecting_catchment, catchment_id_value = self._outlet(point)
+
+        # Everything below only depends on the water body, the outlet catchment, the date and the input data
+        cache_keys = self._result_cache_keys(nearest_water_body_feature, intersecting_catchment, as_of)
+        if cache_keys:
+            with diagnostics.stage('result_cache'):
+                cached = self.result_cache.get(cache_keys[0])
+            if cached:
+                results, union_geometry = cached
+                return self._complete_results(results, union_geometry, catchment_id_value, nearest_water_body_feature, True)
+
+        union_geometry = self._upstream_union(intersecting_catchment, catchment_id_value)
+
+        with diagnostics.stage('totals'):
+            results = self.process_intersecting_features(
+                union_geometry, self.catchments_layer.crs(), nearest_water_body_feature, as_of
+            )
+        if cache_keys:
+            self.result_cache.put(cache_keys[0], cache_keys[1], cache_keys[2], results, union_geometry)
+        return self._complete_results(results, union_geometry, catchment_id_value, nearest_water_body_feature, False)
+
+    def calculate_series(self, point, dates, window_days=None):
+        """
+        WS of the basin upstream of a point on each of `dates`: the basin,
+        discharge and groundwater totals are computed once, the permitted
+        abstraction on each date is read from the PermitTimeline of the basin.
+
+        :param point:       QgsPointXY in the CRS of the water bodies layer.
+        :param dates:       Sequence of datetime.date.
+        :param window_days: When given, each metrics dict also has 'window': the
+                            WS metrics of the permitted abstraction averaged over
+                            the `window_days` days ending on the date.
+        :return:            (results of the basin with all the permits, as calculate() returns,
+                            list of (date, WS metrics dict) in the order of `dates`)
+        :raises WatershedLoadError: if a step of the pipeline finds nothing.
+        """
+        diagnostics = RunDiagnostics("Watershed Load series")
+        self.diagnostics = diagnostics
+        nearest_water_body_feature, intersecting_catchment, catchment_id_value = self._outlet(point)
+        union_geometry = self._upstream_union(intersecting_catchment, catchment_id_value)
+        union_crs = self.catchments_layer.crs()
+
+        with diagnostics.stage('totals'):
+            results = self.process_intersecting_features(union_geometry, union_crs, nearest_water_body_feature)
+        with diagnostics.stage('permits'):
+            timeline = self.permit_timeline(union_geometry, union_crs, catchment_id_value)
+            days = [date.toordinal() for date in dates]
+            totals = timeline.totals_at(days)
+            window_totals = None
+            if window_days:
+                window_totals = [timeline.mean_between(day - window_days + 1, day) for day in days]
+        diagnostics.set_timing_note(
+            'permits', f"{timeline.permit_count} permits, {len(timeline.days)} change points, {len(dates)} dates"
+        )
+
+        def metrics(surface, groundwater):
+            return water_stress_metrics(
+                float(surface), float(groundwater),
+                results['surface_water_discharge'], results['groundwater_discharge'],
+                results['groundwater_usable'], results['natural_flow'], results['ecological_flow']
+            )
+
+        series = []
+        for position, (date, (surface, groundwater)) in enumerate(zip(dates, totals)):
+            date_metrics = metrics(surface, groundwater)
+            if window_totals is not None:
+                date_metrics['window'] = metrics(*window_totals[position])
+            series.append((date, date_metrics))
+        results = self._complete_results(results, union_geometry, catchment_id_value, nearest_water_body_feature, False)
+        return results, series
+
+    def _outlet(self, point):
+        """(nearest water body feature, outlet catchment feature, its RCode) of a point."""
+        point = self._transform_point(point, self.water_bodies_source.crs(), self.water_bodies_layer.crs())
+
+        with self.diagnostics.stage('nearest_water_body'):
+            nearest_water_body_feature = self.nearest_feature(self.water_bodies_layer, point)
+        if not nearest_water_body_feature:
+            raise WatershedLoadError("No water bodies found near the point.")
+
+        water_body_geom = nearest_water_body_feature.geometry()
+        # Ensure geometries are in the same CRS
+        water_body_geom = self._transform_geometry(water_body_geom, self.water_bodies_layer.crs(), self.catchments_layer.crs())
+
+        with self.diagnostics.stage('outlet_catchment'):
+            intersecting_catchment = self.find_outlet_catchment(water_body_geom, point, nearest_water_body_feature)
+        if not intersecting_catchment:
+            raise WatershedLoadError("No catchments intersect with the water body.")
+
+        catchment_id_value = intersecting_catchment[CATCHMENT_ID_FIELD]
+        if not catchment_id_value:
+            raise WatershedLoadError("Catchment feature has no RCode value.")
+        return nearest_water_body_feature, intersecting_catchment, catchment_id_value
+
+    def _upstream_union(self, intersecting_catchment, catchment_id_value):
+        """Union of the outlet catchment and all the catchments upstream of it."""
+        with self.diagnostics.stage('upstream_catchments'):
+            selected_catchments = self.select_upstream_catchments(catchment_id_value)
+        if not selected_catchments:
+            raise WatershedLoadError("No matching catchment features found.")
+        selected_catchments.append(intersecting_catchment)
+
+        with self.diagnostics.stage('union'):
+            union_geometry = self.unify_geometries(selected_catchments)
+        if not union_geometry:
+            raise WatershedLoadError("Union of geometries failed.")
+        return union_geometry
+
+    def _complete_results(self, results, union_geometry, catchment_id_value, water_body_feature, cached):
+        results['union_geometry'] = union_geometry
+        results['union_crs'] = self.catchments_layer.crs()
+        results['catchment_id'] = catchment_id_value
+        results['water_body_feature'] = water_body_feature
+        results['cached'] = cached
+        results['diagnostics'] = self.diagnostics
+        return results
+
+    def basin_key(self, point):
+        """
+        (water body source id, outlet catchment id) of a point: two points with
+        the same key have the same upstream basin and the same results.
+
+        :raises WatershedLoadError: if the point has no water body or outlet catchment.
+        """
+        self.diagnostics = RunDiagnostics("Watershed Load")
+        water_body_feature, catchment_feature, _ = self._outlet(point)
+        return self.water_body_source_id(water_body_feature), catchment_feature.id()
+
+    def pin_inputs_keys(self):
+        """
+        Fingerprints the input layers once for all the following queries,
+        instead of on every query. Only for a caller that drops the engine
+        when a layer changes (see dss_expressions.watershed_engine).
+        """
+        if self.result_cache is not None:
+            layers = self.source_layers
+            self._pinned_inputs_keys = (self.result_cache.inputs_key(layers), self.result_cache.sources_key(layers))
+
+    def _result_cache_keys(self, water_body_feature, catchment_feature, as_of=None):
+        """(query key, sources key, inputs key) for the result cache, or None when not cacheable."""
+        if self.result_cache is None:
+            return None
+        if self._pinned_inputs_keys is not None:
+            inputs_key, sources_key = self._pinned_inputs_keys
+        else:
+            layers = self.source_layers
+            inputs_key = self.result_cache.inputs_key(layers)
+            sources_key = self.result_cache.sources_key(layers) if inputs_key is not None else None
+        if inputs_key is None:
+            return None
+        query_key = self.result_cache.query_key(
+            inputs_key, self.water_body_source_id(water_body_feature), catchment_feature.id(),
+            {'as_of': as_of.isoformat()} if as_of is not None else None
+        )
+        return query_key, sources_key, inputs_key
+
+    # ------------------------------------------------------------- pipeline
+
+    def spatial_index(self, layer):
+        """Spatial index of `layer`, from the session or built once per engine."""
+        if self.session is not None:
+            return self.session.spatial_index(layer)
+        index = self._indexes.get(layer.id())
+        if index is None:
+            counters.count(counters.SPATIAL_INDEX_BUILDS)
+            counters.count(counters.FULL_LAYER_SCANS)
+            index = QgsSpatialIndex(layer.getFeatures())
+            self._indexes[layer.id()] = index
+        return index
+
+    def feature_cache(self, layer):
+        """FeatureCache of `layer`, from the session or kept for the lifetime of the engine."""
+        if self.session is not None:
+            return self.session.feature_cache(layer)
+        cache = self._feature_caches.get(layer.id())
+        if cache is None:
+            cache = FeatureCache(layer)
+            self._feature_caches[layer.id()] = cache
+        return cache
+
+    def nearest_feature(self, layer, point, batch_size=8):
+        """
+        Finds the nearest feature in `layer` to the given `point` by geometry
+        distance (exact best-first search over the spatial index).
+
+        :param layer:      QgsVectorLayer to search in.
+        :param point:      QgsPointXY for the query.
+        :param batch_size: Number of bounding-box neighbors asked for at first.
+        :return:           The nearest QgsFeature, or None if the layer is empty.
+        """
+        feature, _ = nearest_feature(
+            self.spatial_index(layer), point, self.feature_cache(layer).features, batch_size
+        )
+        return feature
+
+    def find_outlet_catchment(self, geometry, point, water_body_feature=None):
+        """
+        The catchment the water body `geometry` drains through: the candidate
+        containing `point` if any, else the one sharing the longest stretch
+        with the water body (closest to the point on ties).
+
+        With `water_body_feature`, the longest-stretch candidates come from the
+        outlet assignment table and the containment test from the cached
+        prepared catchments, so no polygon overlay runs per click.
+        """
+        layer = self.catchments_layer
+        if water_body_feature is not None:
+            fetch = self.feature_cache(layer).features
+            containing = self.containment_lookup().catchment_at(point)
+            if containing is not None and containing.geometry().boundingBox().intersects(geometry.boundingBox()):
+                return containing
+            candidates = fetch(self.outlet_assignment().candidates(self.water_body_source_id(water_body_feature)))
+            point_geom = QgsGeometry.fromPointXY(point)
+            best_feature = None
+            min_distance = float('inf')
+            for feature in candidates:
+                distance = feature.geometry().distance(point_geom)
+                if distance < min_distance:
+                    min_distance = distance
+                    best_feature = feature
+            return best_feature
+
+        candidate_ids = self.spatial_index(layer).intersects(geometry.boundingBox())
+        max_intersection_length = 0
+        best_feature = None
+        min_distance = float('inf')
+
+        for feature in self.feature_cache(layer).features(candidate_ids):
+            if feature.geometry().contains(QgsGeometry.fromPointXY(point)):
+                return feature
+
+            intersection = feature.geometry().intersection(geometry)
+            distance = feature.geometry().distance(QgsGeometry.fromPointXY(point))
+            if intersection.length() > max_intersection_length or (intersection.length() == max_intersection_length and distance < min_distance):
+                max_intersection_length = intersection.length()
+                min_distance = distance
+                best_feature = feature
+
+        return best_feature
+
+    def outlet_assignment(self):
+        """
+        Water body -> outlet catchment table, stored with the water bodies
+        layer and kept in the session (the prewarmer builds it in the
+        background when both layers are selected, see dss_prewarm).
+        """
+        catchments_layer = self.catchments_layer
+
+        def build(water_bodies_layer):
+            transform = None
+            if water_bodies_layer.crs() != catchments_layer.crs():
+                transform = self._transformer(water_bodies_layer.crs(), catchments_layer.crs())
+            return OutletAssignment.for_layers(
+                water_bodies_layer,
+                catchments_layer,
+                self.spatial_index(catchments_layer),
+                self.feature_cache(catchments_layer).features,
+                transform
+            )
+
+        # the table also depends on the catchments: their generation is part of the key
+        generation = self.session.generation(catchments_layer.id()) if self.session is not None else 0
+        return self._derived(self.water_bodies_source, assignment_key(catchments_layer.id(), generation), build)
+
+    def containment_lookup(self):
+        """Point-in-catchment lookup keeping the prepared catchments tested so far."""
+        layer = self.catchments_layer
+        return self._derived(
+            layer,
+            'containment',
+            lambda layer: ContainmentLookup(self.spatial_index(layer), self.feature_cache(layer).features)
+        )
+
+    def _derived(self, layer, key, factory):
+        """A structure derived from `layer`: from the session if any, else kept for the lifetime of the engine."""
+        if self.session is not None:
+            return self.session.get(layer, key, factory)
+        value = self._lookups.get((layer.id(), key))
+        if value is None:
+            value = factory(layer)
+            self._lookups[(layer.id(), key)] = value
+        return value
+
+    def rcode_lookup(self):
+        """Dict of catchment feature id -> RCode, read without geometries."""
+        layer = self.catchments_layer
+        if self.session is not None:
+            return self.session.attribute_lookup(layer, CATCHMENT_ID_FIELD)
+        lookup = self._lookups.get(layer.id())
+        if lookup is None:
+            counters.count(counters.FULL_LAYER_SCANS)
+            request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry)
+            request.setSubsetOfAttributes([CATCHMENT_ID_FIELD], layer.fields())
+            lookup = {feature.id(): feature[CATCHMENT_ID_FIELD] for feature in layer.getFeatures(request)}
+            self._lookups[layer.id()] = lookup
+        return lookup
+
+    def rcode_hierarchy(self):
+        """RCodeHierarchy of the catchments, built from the RCode lookup."""
+        return self._derived(
+            self.catchments_layer,
+            'rcode_hierarchy',
+            lambda layer: RCodeHierarchy(self.rcode_lookup())
+        )
+
+    def select_upstream_catchments(self, value_given):
+        """All catchment features upstream of the catchment coded `value_given`."""
+        # The RCode test runs on the sorted codes; only the matches are read with geometry
+        fids = self.rcode_hierarchy().upstream_fids(value_given)
+        if not fids:
+            return []
+        features = list(self.catchments_layer.getFeatures(QgsFeatureRequest().setFilterFids(fids)))
+        counters.count(counters.FEATURES_FETCHED, len(features))
+        return features
+
+    def unify_geometries(self, features):
+        geometries = [feature.geometry() for feature in features]
+        stats = {}
+        union_geom = cascaded_union(geometries, max_workers=self.max_workers, stats=stats)
+        if stats['chunks'] > 1 and self.diagnostics is not None:
+            self.diagnostics.set_timing_note(
+                'union',
+                f"{len(geometries)} polygons in {stats['chunks']} chunks on {stats['workers']} threads, "
+                f"{stats['work_seconds'] / max(stats['wall_seconds'], 1e-9):.1f}x parallel speedup"
+            )
+        return union_geom if not union_geom.isEmpty() else None
+
+    def process_intersecting_features(self, union_geometry, union_crs, water_body_feature, as_of=None):
+        """
+        Sums abstraction, discharge and groundwater inside the union and derives the WS metrics.
+
+        :param as_of: datetime.date; only the abstraction permits valid on that day are summed.
+        """
+        filters = {}   # layer CRS -> TwoPhaseFilter of the union in that CRS, shared by layers in the same CRS
+
+        # ========================== process water abstraction
+        if as_of is not None:
+            surface_water_abstraction, groundwater_abstraction = self._abstraction_as_of(
+                union_geometry, union_crs, filters, as_of
+            )
+        else:
+            surface_water_abstraction, groundwater_abstraction = self._abstraction(union_geometry, union_crs, filters)
+
+        total_water_abstraction = surface_water_abstraction + groundwater_abstraction
+
+        # ========================== process water discharge
+        snapshot = self.point_snapshot(self.discharge_layer, DISCHARGE_SNAPSHOT)
+        if snapshot is not None:
+            rows = snapshot.rows_in(self._union_filter(union_geometry, union_crs, self.catchments_layer.crs(), filters))
+            surface = snapshot['surface'][rows]
+            groundwater = snapshot['groundwater'][rows]
+            valid = ~np.isnan(surface)
+            surface_water_discharge = float(surface[valid].sum())
+            groundwater_discharge = float(groundwater[valid & ~np.isnan(groundwater)].sum())
+        else:
+            surface_water_discharge = 0
+            groundwater_discharge = 0
+            for feature in self._features_in_union(self.discharge_layer, union_geometry, union_crs, filters):
+                surface_value, groundwater_value = discharge_values(feature)
+                if surface_value != surface_value:
+                    continue
+                surface_water_discharge += surface_value
+                if groundwater_value != groundwater_value:
+                    continue
+                groundwater_discharge += groundwater_value
+
+        total_water_discharge = surface_water_discharge + groundwater_discharge
+
+        # ========================== process groundwater
+        groundwater_usable = 0
+        for feature in self._features_in_union(self.groundwater_layer, union_geometry, union_crs, filters):
+            value = groundwater_usable_value(feature)
+            if value is None:
+                continue
+            groundwater_usable += value
+
+        counters.count(counters.EXACT_PREDICATES, sum(geometry_filter.exact_count for geometry_filter in filters.values()))
+        if self.diagnostics is not None:
+            self.diagnostics.set_timing_note(
+                'totals',
+                '; '.join(geometry_filter.summary() for geometry_filter in filters.values())
+            )
+
+        # ========================== process water bodies
+        # Use the nearest water body feature, with its geometry in the union CRS
+        feature = self._transform_features([water_body_feature], self.water_bodies_layer.crs(), union_crs)[0]
+
+        natural_flow = 0.0
+        ecological_flow = 0.0
+        try:
+            natural_flow = float(feature['W_av'])
+            if isinstance(natural_flow, QVariant):
+                # this means it is a NULL value
+                natural_flow = 0
+        except:
+            natural_flow = 0.0
+
+        try:
+            ecological_flow = float(feature['W_ef'])
+            if isinstance(ecological_flow, QVariant):
+                # this means it is a NULL value
+                ecological_flow = 0
+        except:
+            ecological_flow = 0.0
+
+        # ========================== Calculate Water Stress (WS) metrics
+        results = water_stress_metrics(
+            surface_water_abstraction,
+            groundwater_abstraction,
+            surface_water_discharge,
+            groundwater_discharge,
+            groundwater_usable,
+            natural_flow,
+            ecological_flow
+        )
+        results['as_of'] = as_of.isoformat() if as_of is not None else None
+        return results
+
+    def _abstraction(self, union_geometry, union_crs, filters):
+        """(surface, groundwater) m3/yr of all the abstraction points inside the union."""
+        snapshot = self.point_snapshot(self.abstraction_layer, ABSTRACTION_SNAPSHOT)
+        if snapshot is not None:
+            rows = snapshot.rows_in(self._union_filter(union_geometry, union_crs, self.catchments_layer.crs(), filters))
+            values = snapshot['value'][rows]
+            groundwater = snapshot['groundwater'][rows]
+            valid = ~np.isnan(values)
+            return float(values[valid & (groundwater == 0)].sum()), float(values[valid & (groundwater == 1)].sum())
+
+        surface_water_abstraction = 0
+        groundwater_abstraction = 0
+        for feature in self._features_in_union(self.abstraction_layer, union_geometry, union_crs, filters):
+            value, is_groundwater = abstraction_values(feature)
+            if value != value:
+                # NaN: no usable value
+                continue
+            if is_groundwater:
+                groundwater_abstraction += value
+            else:
+                surface_water_abstraction += value
+        return surface_water_abstraction, groundwater_abstraction
+
+    def _abstraction_as_of(self, union_geometry, union_crs, filters, as_of):
+        """
+        (surface, groundwater) m3/yr of the abstraction permits inside the
+        union and valid on `as_of`: the rows inside the union are intersected
+        with the rows the permit IntervalTree finds valid on that day.
+        """
+        day = as_of.toordinal()
+        snapshot = self.point_snapshot(self.abstraction_layer, PERMIT_SNAPSHOT)
+        if snapshot is not None:
+            rows = snapshot.rows_in(self._union_filter(union_geometry, union_crs, self.catchments_layer.crs(), filters))
+            rows = np.intersect1d(rows, self.permit_index().at(day), assume_unique=True)
+            values = snapshot['value'][rows]
+            groundwater = snapshot['groundwater'][rows]
+            valid = ~np.isnan(values)
+            return float(values[valid & (groundwater == 0)].sum()), float(values[valid & (groundwater == 1)].sum())
+
+        surface_water_abstraction = 0
+        groundwater_abstraction = 0
+        for feature in self._features_in_union(self.abstraction_layer, union_geometry, union_crs, filters):
+            value, is_groundwater, valid_from, valid_to = permit_values(feature)
+            if value != value or not valid_from <= day <= valid_to:
+                continue
+            if is_groundwater:
+                groundwater_abstraction += value
+            else:
+                surface_water_abstraction += value
+        return surface_water_abstraction, groundwater_abstraction
+
+    def permit_index(self):
+        """IntervalTree over the validity of the permits of the abstraction layer (rows of PERMIT_SNAPSHOT)."""
+        snapshot = self.point_snapshot(self.abstraction_layer, PERMIT_SNAPSHOT)
+        crs = self.catchments_layer.crs()
+        return self.session.get(
+            self.abstraction_layer,
+            ('permit_index', crs.authid() or crs.toWkt()),
+            lambda layer: IntervalTree(snapshot['valid_from'], snapshot['valid_to']),
+            size=lambda tree: 4 * 8 * len(tree)
+        )
+
+    def permit_timeline(self, union_geometry, union_crs, catchment_id_value):
+        """
+        PermitTimeline of the abstraction permits inside the union. With a
+        session it is kept per outlet catchment, so further dates and series
+        of the same basin are lookups.
+        """
+        def build(layer):
+            filters = {}
+            snapshot = self.point_snapshot(layer, PERMIT_SNAPSHOT)
+            if snapshot is not None:
+                rows = snapshot.rows_in(self._union_filter(union_geometry, union_crs, self.catchments_layer.crs(), filters))
+                columns = [snapshot[name][rows] for name in PERMIT_SNAPSHOT[1]]
+            else:
+                features = self._features_in_union(layer, union_geometry, union_crs, filters)
+                columns = np.array([permit_values(feature) for feature in features]).reshape(-1, 4).T
+            counters.count(counters.EXACT_PREDICATES, sum(geometry_filter.exact_count for geometry_filter in filters.values()))
+            return PermitTimeline(*columns)
+
+        if self.session is None:
+            return build(self.abstraction_layer)
+        crs = self.catchments_layer.crs()
+        # the basin also depends on the catchments: their generation is part of the key
+        generation = self.session.generation(self.catchments_layer.id())
+        return self.session.get(
+            self.abstraction_layer,
+            ('permit_timeline', str(catchment_id_value), crs.authid() or crs.toWkt(), generation),
+            build,
+            size=lambda timeline: timeline.days.nbytes + timeline.levels.nbytes * 2
+        )
+
+    # -------------------------------------------------------------- helpers
+
+    def water_body_source_id(self, water_body_feature):
+        """Id of the water body in the layer given to the engine (it differs in a working copy)."""
+        if self._water_bodies is None:
+            return water_body_feature.id()
+        return self._water_bodies.source_id(water_body_feature.id())
+
+    def _transform_point(self, point, source_crs, target_crs):
+        if source_crs != target_crs:
+            return self._transformer(source_crs, target_crs).transform(point)
+        return point
+
+    def _transformer(self, source_crs, target_crs):
+        if self.session is not None:
+            return self.session.transform(source_crs, target_crs)
+        return QgsCoordinateTransform(source_crs, target_crs, QgsProject.instance())
+
+    def _transform_geometry(self, geometry, source_crs, target_crs):
+        if source_crs != target_crs:
+            transformer = self._transformer(source_crs, target_crs)
+            transformed_geom = QgsGeometry(geometry)
+            transformed_geom.transform(transformer)
+            return transformed_geom
+        return geometry
+
+    def _transform_features(self, features, source_crs, target_crs):
+        """Transforms the geometries of features from source CRS to target CRS."""
+        transformed_features = []
+        for feature in features:
+            geom = QgsGeometry(feature.geometry())
+            if source_crs != target_crs:
+                geom.transform(self._transformer(source_crs, target_crs))
+            feature_copy = QgsFeature(feature)
+            feature_copy.setGeometry(geom)
+            transformed_features.append(feature_copy)
+        return transformed_features
+
+    def point_snapshot(self, layer, spec):
+        """
+        PointSnapshot of `layer` for the given (name, columns, converter)
+        spec, with the coordinates in the catchments CRS; kept in the session
+        and on disk. None without a session or for non-point layers.
+        """
+        if self.session is None:
+            return None
+        name, columns, converter = spec
+        crs = self.catchments_layer.crs()
+        transform = self._transformer(layer.crs(), crs) if layer.crs() != crs else None
+        return self.session.get(
+            layer,
+            ('snapshot', name, crs.authid() or crs.toWkt()),
+            lambda layer: PointSnapshot.for_layer(layer, name, columns, converter, crs, transform),
+            size=lambda snapshot: snapshot.nbytes() if snapshot is not None else 0
+        )
+
+    def _union_filter(self, union_geometry, union_crs, crs, filters):
+        crs_key = crs.toWkt()
+        geometry_filter = filters.get(crs_key)
+        if geometry_filter is None:
+            geometry_filter = TwoPhaseFilter(self._transform_geometry(union_geometry, union_crs, crs))
+            filters[crs_key] = geometry_filter
+        return geometry_filter
+
+    def working_layer(self, layer):
+        """`layer` in the catchments CRS: a session-held copy if it is in another CRS."""
+        if self.session is None:
+            return layer
+        return self.session.working_layer(layer, self.catchments_layer.crs()).layer
+
+    def _features_in_union(self, layer, union_geometry, union_crs, filters):
+        layer = self.working_layer(layer)
+        geometry_filter = self._union_filter(union_geometry, union_crs, layer.crs(), filters)
+        return self.get_intersecting_features(layer, geometry_filter.geometry, geometry_filter)
+
+    def get_intersecting_features(self, layer, geometry, geometry_filter=None):
+        """
+        Features of `layer` intersecting `geometry` (in the layer CRS). A
+        TwoPhaseFilter built on `geometry` gives the same result while
+        settling most candidates on its simplified band.
+        """
+        intersects = geometry_filter.intersects if geometry_filter is not None else geometry.intersects
+        candidate_ids = self.spatial_index(layer).intersects(geometry.boundingBox())
+        counters.count(counters.FEATURES_FETCHED, len(candidate_ids))
+        intersecting_features = [
+            feature for feature in layer.getFeatures(QgsFeatureRequest().setFilterFids(candidate_ids))
+            if intersects(feature.geometry())
+        ]
+        return intersecting_features
+
+
+def abstraction_values(feature):
+    """(m3/yr, 1.0 for groundwater else 0.0) of an abstraction feature; the value is NaN when unusable."""
+    # if feature['Purpose'].lower() == 'շահագործում' or feature['purpose'].lower() == 'կառուցում' or 'հէկ' in feature['Purpose'].lower():
+    #     return NAN, NAN
+    value = feature['abs_m3_yr']
+    if value is None:
+        return NAN, NAN
+    try:
+        value = float(value)
+    except:
+        return NAN, NAN
+
+    if not isinstance(feature['Groundwate'], str):
+        if feature['Groundwate'].isNull():
+            # then it is surface water abstraction
+            return value, 0.0
+        return value, 1.0
+    return value, 1.0
+
+
+def discharge_values(feature):
+    """
+    (surface, groundwater) m3/yr of a discharge feature. A NaN surface value
+    discards the feature; a NaN groundwater value only its groundwater part.
+    """
+    surface_value = feature['Tm3_y']
+    groundwater_value = feature['Swg_m3_y']
+
+    if isinstance(surface_value, QVariant):
+        # this means it is a NULL value
+        surface_value = 0
+
+    if isinstance(groundwater_value, QVariant):
+        # this means it is a NULL value
+        groundwater_value = 0
+
+    if surface_value is None:
+        return NAN, NAN
+    try:
+        surface_value = float(surface_value)
+    except:
+        return NAN, NAN
+
+    if groundwater_value is None:
+        return surface_value, NAN
+    try:
+        groundwater_value = float(groundwater_value)
+    except:
+        return surface_value, NAN
+    return surface_value, groundwater_value
+
+
+def groundwater_usable_value(feature):
+    """Usable groundwater of a groundwater body, or None when unusable."""
+    value = feature['GW_Usable']
+
+    if isinstance(value, QVariant):
+        # this means it is a NULL value
+        value = 0
+
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except:
+        return None
+
+
+def permit_values(feature):
+    """(m3/yr, groundwater, first valid day, last valid day) of an abstraction permit (see abstraction_values, permit_interval)."""
+    return abstraction_values(feature) + permit_interval(feature)
+
+
+# (snapshot name, value columns, converter) of the point layers read by the totals
+ABSTRACTION_SNAPSHOT = ('abstraction', ('value', 'groundwater'), abstraction_values)
+PERMIT_SNAPSHOT = ('permits', ('value', 'groundwater', 'valid_from', 'valid_to'), permit_values)
+DISCHARGE_SNAPSHOT = ('discharge', ('surface', 'groundwater'), discharge_values)
+
+
+def water_stress_metrics(
+    surface_water_abstraction,
+    groundwater_abstraction,
+    surface_water_discharge,
+    groundwater_discharge,
+    groundwater_usable,
+    natural_flow,
+    ecological_flow
+):
+    """Derives the WS metrics (in %) from the basin totals; a zero denominator gives 0."""
+    total_water_abstraction = surface_water_abstraction + groundwater_abstraction
+    total_water_discharge = surface_water_discharge + groundwater_discharge
+
+    try:
+        ws_surface = ((surface_water_abstraction - surface_water_discharge) / (natural_flow - ecological_flow)) * 100
+    except ZeroDivisionError:
+        ws_surface = 0
+
+    try:
+        ws_groundwater = ((groundwater_abstraction - groundwater_discharge) / groundwater_usable) * 100
+    except ZeroDivisionError:
+        ws_groundwater = 0
+
+    try:
+        ws_total = ((total_water_abstraction - total_water_discharge) / (natural_flow - ecological_flow + groundwater_usable)) * 100
+    except ZeroDivisionError:
+        ws_total = 0
+
+    return {
+        'ws_surface': ws_surface,
+        'ws_groundwater': ws_groundwater,
+        'ws_total': ws_total,
+        'surface_water_abstraction': surface_water_abstraction,
+        'surface_water_discharge': surface_water_discharge,
+        'groundwater_abstraction': groundwater_abstraction,
+        'groundwater_discharge': groundwater_discharge,
+        'total_water_abstraction': total_water_abstraction,
+        'total_water_discharge': total_water_discharge,
+        'natural_flow': natural_flow,
+        'ecological_flow': ecological_flow,
+        'groundwater_usable': groundwater_usable
+    }
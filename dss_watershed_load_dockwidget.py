@@ -22,71 +22,71 @@
  ***************************************************************************/
 """
 
-import os
-import sys
-import traceback
-from qgis.PyQt import QtWidgets, uic, QtGui
-from qgis.PyQt.QtCore import pyqtSignal, QVariant, Qt
+import datetime
+import sqlite3
+from qgis.PyQt import QtWidgets
+from qgis.PyQt.QtCore import pyqtSignal, QDate, QVariant, Qt
 from qgis.PyQt.QtWidgets import QMessageBox
 from qgis.core import (
     QgsPointXY,
-    QgsSpatialIndex,
-    QgsFeatureRequest,
-    QgsCoordinateTransform,
     QgsProject,
-    QgsGeometry,
     QgsFeature,
     QgsVectorLayer,
-    QgsWkbTypes,
     Qgis,
     QgsMessageLog,
-    QgsField,
-    QgsGraduatedSymbolRenderer, 
-    QgsRendererRange, 
-    QgsSymbol,
-    QgsFillSymbol,
-    QgsLinePatternFillSymbolLayer,
-    QgsLineSymbol,
-    QgsSimpleLineSymbolLayer,
-    QgsUnitTypes
+    QgsField
 )
 from qgis.gui import QgsMapToolEmitPoint
-from PyQt5.QtGui import QColor
+from .dss_expressions import store_watershed_layers
+from .dss_permits import month_starts
+from .dss_prewarm import SessionPrewarmer
+from .dss_profiling import profile_run, show_report
+from .dss_rendering import WS_CLASSES, WS_STYLE, style_layer
+from .dss_run_history import WATERSHED_TOOL, inputs_description, watershed_run_values
+from .dss_watershed_engine import CATCHMENT_ID_FIELD, WatershedLoadEngine, WatershedLoadError
+from .dss_utils import enable_remote_debugging, load_form_class
 
-FORM_CLASS, _ = uic.loadUiType(os.path.join(os.path.dirname(__file__), 'dss_watershed_load_dockwidget_base.ui'))
+FORM_CLASS = load_form_class('dss_watershed_load_dockwidget_base.ui')
 
 MESSAGE_CATEGORY = 'Messages'
 
-def enable_remote_debugging():
-    try:
-        import ptvsd
-        QgsMessageLog.logMessage("ptvsd imported successfully!", MESSAGE_CATEGORY, Qgis.Info)
-        if ptvsd.is_attached():
-            QgsMessageLog.logMessage("Remote Debug for Visual Studio is already active", MESSAGE_CATEGORY, Qgis.Info)
-            return
-        ptvsd.enable_attach(address=('localhost', 5678))
-        QgsMessageLog.logMessage("Attached remote Debug for Visual Studio", MESSAGE_CATEGORY, Qgis.Info)
-    except Exception as e:
-        exc_type, exc_value, exc_traceback = sys.exc_info()
-        format_exception = traceback.format_exception(exc_type, exc_value, exc_traceback)
-        QgsMessageLog.logMessage(str(e), MESSAGE_CATEGORY, Qgis.Critical)        
-        QgsMessageLog.logMessage(repr(format_exception[0]), MESSAGE_CATEGORY, Qgis.Critical)
-        QgsMessageLog.logMessage(repr(format_exception[1]), MESSAGE_CATEGORY, Qgis.Critical)
-        QgsMessageLog.logMessage(repr(format_exception[2]), MESSAGE_CATEGORY, Qgis.Critical)
+# Length of the monthly WS series, and of the trailing window averaged in it
+SERIES_MONTHS = 120
+SERIES_WINDOW_DAYS = 365
 
 
 class WatershedLoadDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
     closingPlugin = pyqtSignal()
 
-    def __init__(self, iface, parent=None):
-        """Constructor."""
+    def __init__(self, iface, parent=None, session=None):
+        """Constructor.
+
+        :param session: DSSSession shared by the DSS tools (indexes, lookups, transforms).
+        """
         enable_remote_debugging()
         super().__init__(parent)
         self.setupUi(self)
         self.iface = iface
+        self.session = session
         self.btnCalculate.clicked.connect(self.calculate_closest_waterbody)
         self.nearest_water_body_feature = None  # Initialize the variable
         self.btnPickPoint.clicked.connect(self.pick_point_from_canvas)
+        self.btnSeries.clicked.connect(self.calculate_series)
+        self.dateAsOf.setDate(QDate.currentDate())
+        self.chkAsOf.toggled.connect(self.dateAsOf.setEnabled)
+
+        # Build the indexes and the RCode lookup as soon as the layers are chosen
+        self.prewarmer = None
+        if self.session is not None:
+            self.prewarmer = SessionPrewarmer(self.session, self)
+            self.prewarmer.readinessChanged.connect(self.lblReadiness.setText)
+            self.prewarmer.watch(self.cmbWaterBodies)
+            self.prewarmer.watch(self.cmbCatchments, lookups=[CATCHMENT_ID_FIELD])
+            self.prewarmer.watch(self.cmbWaterAbstraction)
+            self.prewarmer.watch(self.cmbWaterDischarge)
+            self.prewarmer.watch(self.cmbGroundwater)
+            # the water body -> outlet catchment table, otherwise built on the first Calculate
+            self.prewarmer.watch_outlets(self.cmbWaterBodies, self.cmbCatchments)
         
     def pick_point_from_canvas(self):
         """Activates the map tool to pick a point from the canvas."""
@@ -101,7 +101,14 @@ class WatershedLoadDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
         self.spinBoxLon.setValue(point.y())
         self.canvas.unsetMapTool(self.tool)
 
+    def showEvent(self, event):
+        if self.prewarmer:
+            self.prewarmer.schedule()
+        super().showEvent(event)
+
     def closeEvent(self, event):
+        if self.prewarmer:
+            self.prewarmer.stop()
         self.closingPlugin.emit()
         event.accept()
 
@@ -111,60 +118,96 @@ class WatershedLoadDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
         lon = self.spinBoxLon.value()
         point = QgsPointXY(lat, lon)
 
-        water_bodies_layer = self.cmbWaterBodies.currentLayer()
-        if not self._validate_layer(water_bodies_layer, "water bodies"):
+        engine = self._create_engine()
+        if not engine:
             return
 
-        nearest_water_body_feature = self._get_nearest_feature_precise(water_bodies_layer, point)
-        if not nearest_water_body_feature:
-            QMessageBox.warning(self, "Error", "No water bodies found near the point.")
+        try:
+            # profiled only when "Profile Next Run" is checked in the DSS menu
+            with profile_run(self.session, 'watershed') as profile_report:
+                results = engine.calculate(point, self._as_of())
+        except WatershedLoadError as e:
+            QMessageBox.warning(self, "Error", str(e))
             return
 
-        self.nearest_water_body_feature = nearest_water_body_feature  # Store for later use
+        self.nearest_water_body_feature = results['water_body_feature']  # Store for later use
+        # One line with the stage timings (and the union speedup) in the message log
+        results['diagnostics'].log_summary()
 
-        water_body_geom = nearest_water_body_feature.geometry()
-        catchments_layer = self.cmbCatchments.currentLayer()
-        if not self._validate_layer(catchments_layer, "catchments"):
-            return
+        # Add the union geometry as a new layer with WS attributes
+        self.add_geometry_as_layer_with_attributes(results['union_geometry'], results['union_crs'], results['ws_surface'], results['ws_groundwater'], results['ws_total'])
 
-        # Ensure geometries are in the same CRS
-        if catchments_layer.crs() != water_bodies_layer.crs():
-            transformer = QgsCoordinateTransform(water_bodies_layer.crs(), catchments_layer.crs(), QgsProject.instance())
-            water_body_geom.transform(transformer)
+        self.record_run(engine, point, results)
 
-        # intersecting_catchment = self._find_intersecting_feature(catchments_layer, water_body_geom)
-        intersecting_catchment = self._find_intersecting_feature(catchments_layer, water_body_geom, point)
-        if not intersecting_catchment:
-            QMessageBox.warning(self, "Error", "No catchments intersect with the water body.")
+        self.display_results(results)
+        if profile_report is not None:
+            show_report(self, profile_report)
+
+    def calculate_series(self):
+        """WS of the basin upstream of the point on the first day of every month over SERIES_MONTHS months."""
+        point = QgsPointXY(self.spinBoxLat.value(), self.spinBoxLon.value())
+        engine = self._create_engine()
+        if not engine:
             return
 
-        catchment_id_field = 'RCode'  # Replace with your actual field name
-        catchment_id_value = intersecting_catchment[catchment_id_field]
-        if not catchment_id_value:
-            QMessageBox.warning(self, "Error", "Catchment feature has no RCode value.")
+        dates = month_starts(self._as_of() or datetime.date.today(), SERIES_MONTHS)
+        try:
+            results, series = engine.calculate_series(point, dates, window_days=SERIES_WINDOW_DAYS)
+        except WatershedLoadError as e:
+            QMessageBox.warning(self, "Error", str(e))
             return
+        results['diagnostics'].log_summary()
+        self.display_series(results, series)
 
-        selected_catchments = self.select_catchment_features_by_id(catchments_layer, catchment_id_field, catchment_id_value)
-        if not selected_catchments:
-            QMessageBox.warning(self, "Error", "No matching catchment features found.")
-            return
-        selected_catchments.append(intersecting_catchment)
+    def _as_of(self):
+        """The permit date chosen in the panel, or None to sum every permit."""
+        if not self.chkAsOf.isChecked():
+            return None
+        return self.dateAsOf.date().toPyDate()
 
-        union_geometry = self._unify_geometries(selected_catchments)
-        if not union_geometry:
-            QMessageBox.warning(self, "Error", "Union of geometries failed.")
+    def record_run(self, engine, point, results):
+        """Keeps the result in the run history (see the DSS Run History panel)."""
+        if self.session is None:
             return
-
-        # Add the union geometry as a new layer
-        # self.add_geometry_as_layer(union_geometry, catchments_layer.crs())
-
-        # Process intersecting features, including water bodies
-        results = self.process_intersecting_features(union_geometry, catchments_layer.crs())
-        
-        # Add the union geometry as a new layer with WS attributes
-        self.add_geometry_as_layer_with_attributes(union_geometry, catchments_layer.crs(), results['ws_surface'], results['ws_groundwater'], results['ws_total'])
-
-        self.display_results(results)
+        values, geometries = watershed_run_values(results)
+        try:
+            self.session.run_history.record(
+                WATERSHED_TOOL,
+                f"WS {results['catchment_id']}" + (f" on {results['as_of']}" if results.get('as_of') else ""),
+                {
+                    'x': point.x(),
+                    'y': point.y(),
+                    'crs': engine.water_bodies_source.crs().authid(),
+                    'as_of': results.get('as_of'),
+                },
+                inputs_description(engine.source_layers),
+                values,
+                geometries,
+                results['union_crs'],
+                {'WS_Total': round(results['ws_total'], 1)}
+            )
+        except sqlite3.Error as e:
+            QgsMessageLog.logMessage(f"Run history: {e}", MESSAGE_CATEGORY, Qgis.Warning)
+
+    def _create_engine(self):
+        """Validates the selected layers and returns a WatershedLoadEngine on them, or None."""
+        layers = [
+            (self.cmbWaterBodies.currentLayer(), "water bodies"),
+            (self.cmbCatchments.currentLayer(), "catchments"),
+            (self.cmbWaterAbstraction.currentLayer(), "Water Abstraction"),
+            (self.cmbWaterDischarge.currentLayer(), "Water Discharge"),
+            (self.cmbGroundwater.currentLayer(), "Groundwater Bodies"),
+        ]
+        for layer, layer_name in layers:
+            if not self._validate_layer(layer, layer_name):
+                return None
+        # dss_water_stress() and dss_upstream_rcodes() work on the layers of the last run
+        store_watershed_layers([layer for layer, _ in layers])
+        return WatershedLoadEngine(
+            *[layer for layer, _ in layers],
+            session=self.session,
+            result_cache=self.session.result_cache if self.session else None
+        )
 
 
     def display_results(self, results):
@@ -173,6 +216,10 @@ class WatershedLoadDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
         message += f"  - WS Surface: (({results['surface_water_abstraction']:.0f} - {results['surface_water_discharge']:.0f}) / ({results['natural_flow']:.0f} - {results['ecological_flow']:.0f})) * 100 = {results['ws_surface']:.0f} %\n"
         message += f"  - WS Groundwater: (({results['groundwater_abstraction']:.0f} - {results['groundwater_discharge']:.0f}) / {results['groundwater_usable']:.0f}) * 100 = {results['ws_groundwater']:.0f} %\n"
         message += f"  - WS Total: (({results['total_water_abstraction']:.0f} - {results['total_water_discharge']:.0f}) / ({results['natural_flow']:.0f} - {results['ecological_flow']:.0f} + {results['groundwater_usable']:.0f})) * 100 = {results['ws_total']:.0f} %\n\n"
+        if results.get('as_of'):
+            message += f"Only the abstraction permits valid on {results['as_of']} are counted.\n"
+        if results.get('cached'):
+            message += "(Read from the result cache: the input layers have not changed since this basin was calculated.)\n"
 
         # Set a fixed width for the message box
         msg_box = QMessageBox(self)
@@ -182,39 +229,41 @@ class WatershedLoadDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
         msg_box.setStyleSheet("QLabel{min-width: 700px;}")
         msg_box.exec_()
 
-    def create_custom_symbol(self, color):
-        # Create the main fill symbol
-        symbol = QgsFillSymbol()
-
-        # 1. Line Pattern Fill Layer
-        line_pattern_layer = QgsLinePatternFillSymbolLayer()
-        line_pattern_layer.setAngle(45)
-        line_pattern_layer.setDistance(1)  # Distance between lines in mm
-        line_pattern_layer.setDistanceUnit(QgsUnitTypes.RenderMillimeters)
-        line_pattern_layer.setLineWidth(0.26)  # Line width in mm
-        line_pattern_layer.setLineWidthUnit(QgsUnitTypes.RenderMillimeters)
-
-        # Create a line symbol for the pattern
-        line_symbol = QgsLineSymbol()
-        line_symbol.setColor(QColor(color))
-        line_symbol.setWidth(0.3)  # Line width in mm
-        line_symbol.setWidthUnit(QgsUnitTypes.RenderMillimeters)
-
-        # Set the sub-symbol for the line pattern
-        line_pattern_layer.setSubSymbol(line_symbol)
-
-        # 2. Simple Line Layer (Outline)
-        outline_layer = QgsSimpleLineSymbolLayer()
-        outline_layer.setColor(QColor(color))
-        outline_layer.setWidth(0.66)  # Line width in mm
-        outline_layer.setWidthUnit(QgsUnitTypes.RenderMillimeters)
-
-        # Clear existing layers and add our custom layers
-        symbol.deleteSymbolLayer(0)  # Remove default layer
-        symbol.appendSymbolLayer(line_pattern_layer)
-        symbol.appendSymbolLayer(outline_layer)
-
-        return symbol
+    def display_series(self, results, series):
+        """
+        Table of the monthly WS, with the WS Total of the permitted abstraction
+        averaged over the SERIES_WINDOW_DAYS days ending on each date.
+        """
+        dialog = QtWidgets.QDialog(self)
+        dialog.setWindowTitle(f"Monthly WS of the basin of {results['catchment_id']}")
+        layout = QtWidgets.QVBoxLayout(dialog)
+        layout.addWidget(QtWidgets.QLabel(
+            "Abstraction from the permits valid on each date; discharge, groundwater and flows as today."
+        ))
+        table = QtWidgets.QTableWidget(len(series), 5, dialog)
+        table.setHorizontalHeaderLabels(
+            ["Date", "WS Surface %", "WS Groundwater %", "WS Total %", f"WS Total, {SERIES_WINDOW_DAYS}-day mean %"]
+        )
+        table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        table.verticalHeader().setVisible(False)
+        for row, (date, metrics) in enumerate(series):
+            cells = [
+                date.isoformat(),
+                f"{metrics['ws_surface']:.1f}",
+                f"{metrics['ws_groundwater']:.1f}",
+                f"{metrics['ws_total']:.1f}",
+                f"{metrics['window']['ws_total']:.1f}",
+            ]
+            for column, text in enumerate(cells):
+                table.setItem(row, column, QtWidgets.QTableWidgetItem(text))
+        table.resizeColumnsToContents()
+        layout.addWidget(table)
+
+        buttons = QtWidgets.QDialogButtonBox(QtWidgets.QDialogButtonBox.Close)
+        buttons.rejected.connect(dialog.reject)
+        layout.addWidget(buttons)
+        dialog.resize(700, 500)
+        dialog.exec_()
 
     def add_geometry_as_layer_with_attributes(self, geometry, crs, ws_surface, ws_groundwater, ws_total):
         """Adds the given geometry as a new layer to the map with WS attributes."""
@@ -239,31 +288,8 @@ class WatershedLoadDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
         # Add the layer to the project
         QgsProject.instance().addMapLayer(layer)
         
-        # Apply a graduated renderer to color the layer based on WS_Total
-
-        # Define color ranges
-        ranges = [
-            (float('-inf'), 25, 'green', 'Not Stressed (0-25%)'),
-            (25, 50, 'yellow', 'Low Stress (25-50%)'),
-            (50, 75, 'orange', 'Moderate Stress (50-75%)'),
-            (75, 100, 'red', 'Stressed (75-100%)'),
-            (100, float('inf'), 'darkred', 'Overstressed (>100%)')
-        ]
-
-        # Create ranges for the renderer
-        renderer_ranges = []
-        for min_val, max_val, color_name, label in ranges:
-            # Create the custom symbol with the specified color
-            symbol = self.create_custom_symbol(color_name)
-            # Create the renderer range
-            range = QgsRendererRange(min_val, max_val, symbol, label)
-            renderer_ranges.append(range)
-
-        # Create and apply the renderer
-        renderer = QgsGraduatedSymbolRenderer('WS_Total', renderer_ranges)
-        renderer.setMode(QgsGraduatedSymbolRenderer.Custom)
-        layer.setRenderer(renderer)
-        layer.triggerRepaint()
+        # Color the layer by WS_Total; hatched fills only when zoomed in (see dss_rendering)
+        style_layer(layer, WS_STYLE, 'WS_Total', WS_CLASSES)
 
     
 
@@ -275,300 +301,3 @@ class WatershedLoadDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
             QMessageBox.warning(self, "Error", f"Selected {layer_name} layer is not spatial.")
             return False
         return True
-
-    # def _get_nearest_feature(self, layer, point):
-    #     index = QgsSpatialIndex(layer.getFeatures())
-    #     nearest_ids = index.nearestNeighbor(point, 1)
-    #     if nearest_ids:
-    #         request = QgsFeatureRequest(nearest_ids[0])
-    #         return next(layer.getFeatures(request), None)
-    #     return None
-
-    def _get_nearest_feature_precise(self, layer, point, k=5):
-        """
-        Finds the truly nearest feature in `layer` to the given `point`
-        by first retrieving up to `k` bounding-box neighbors, then doing
-        a real geometry distance check.
-
-        :param layer: QgsVectorLayer to search in.
-        :param point: QgsPointXY for the query.
-        :param k:     Number of bounding-box neighbors to retrieve.
-        :return:      The nearest QgsFeature by geometry distance, or None if none found.
-        """
-        # Build the spatial index if not done. For repeated calls, you might want to build it once.
-        index = QgsSpatialIndex(layer.getFeatures())
-
-        # 1) Find the K nearest bounding boxes
-        candidate_ids = index.nearestNeighbor(point, k)
-        if not candidate_ids:
-            return None
-
-        point_geom = QgsGeometry.fromPointXY(point)
-
-        best_feat = None
-        best_dist = float('inf')
-
-        # 2) Among those K candidates, find the actual closest geometry
-        for fid in candidate_ids:
-            request = QgsFeatureRequest(fid)
-            candidate_feat = next(layer.getFeatures(request), None)
-            if not candidate_feat:
-                continue
-
-            dist = candidate_feat.geometry().distance(point_geom)
-            if dist < best_dist:
-                best_dist = dist
-                best_feat = candidate_feat
-
-        return best_feat
-
-    def _find_intersecting_feature(self, layer, geometry, point):
-        index = QgsSpatialIndex(layer.getFeatures())
-        candidate_ids = index.intersects(geometry.boundingBox())
-        max_intersection_length = 0
-        best_feature = None
-        min_distance = float('inf')
-
-        for feature_id in candidate_ids:
-            request = QgsFeatureRequest(feature_id)
-            feature = next(layer.getFeatures(request))
-            
-            if feature.geometry().contains(QgsGeometry.fromPointXY(point)):
-                return feature
-            
-            intersection = feature.geometry().intersection(geometry)
-            distance = feature.geometry().distance(QgsGeometry.fromPointXY(point))
-            if intersection.length() > max_intersection_length or (intersection.length() == max_intersection_length and distance < min_distance):
-                max_intersection_length = intersection.length()
-                min_distance = distance
-                best_feature = feature
-
-        return best_feature
-
-    def _unify_geometries(self, features):
-        geometries = [feature.geometry() for feature in features]
-        union_geom = QgsGeometry.unaryUnion(geometries)
-        return union_geom if not union_geom.isEmpty() else None
-
-    def select_catchment_features_by_id(self, layer, id_field, value_given):
-        selected_features = []
-        value_given_str = str(value_given)
-        try:
-            value_given_num = int(value_given_str)
-        except:
-            return selected_features
-
-        for feature in layer.getFeatures():
-            id_value = feature[id_field]
-            if id_value is None:
-                continue
-            id_value_str = str(id_value)
-            try:
-                id_value_num = int(id_value_str)
-            except:
-                continue
-
-            if len(id_value_str) == len(value_given_str):
-                if id_value_str[:-2] == value_given_str[:-2] and id_value_num >= value_given_num:
-                    selected_features.append(feature)
-            else:
-                id_value_subset = id_value_str[:len(value_given_str)]
-                if id_value_subset[:-2] == value_given_str[:-2] and int(id_value_subset) >= value_given_num:
-                    selected_features.append(feature)
-        return selected_features
-      
-    def process_intersecting_features(self, union_geometry, union_crs):       
-        # ========================== process water abstraction
-        layer = self.cmbWaterAbstraction.currentLayer()
-        if not self._validate_layer(layer, 'Water Abstraction'):
-            return
-        transformed_geom = self._transform_geometry(union_geometry, union_crs, layer.crs())
-        features = self._get_intersecting_features(layer, transformed_geom)
-        
-        surface_water_abstraction = 0
-        groundwater_abstraction = 0
-        total_water_abstraction = 0
-        for feature in features:
-            # if feature['Purpose'].lower() == 'շահագործում' or feature['purpose'].lower() == 'կառուցում' or 'հէկ' in feature['Purpose'].lower():
-            #     continue
-            value = feature['abs_m3_yr']
-            if value is None:
-                continue
-            try:
-                value = float(value)
-            except:
-                continue
-            
-            if not isinstance(feature['Groundwate'],str):
-                if feature['Groundwate'].isNull():
-                    # then it is surface water abstraction
-                    surface_water_abstraction += value
-                else:
-                    groundwater_abstraction += value
-            else:
-                groundwater_abstraction += value
-
-        total_water_abstraction = surface_water_abstraction + groundwater_abstraction
-        
-        # ========================== process water discharge
-        layer = self.cmbWaterDischarge.currentLayer()
-        if not self._validate_layer(layer, 'Water Discharge'):
-            return
-        transformed_geom = self._transform_geometry(union_geometry, union_crs, layer.crs())
-        features = self._get_intersecting_features(layer, transformed_geom)
-        
-        surface_water_discharge = 0
-        groundwater_discharge = 0
-        total_water_discharge = 0
-        for feature in features:
-            surface_value = feature['Tm3_y']
-            groundwater_value = feature['Swg_m3_y']
-            
-            if isinstance(surface_value, QVariant):
-                # this means it is a NULL value
-                surface_value = 0
-                
-            if isinstance(groundwater_value, QVariant):
-                # this means it is a NULL value
-                groundwater_value = 0
-            
-            if surface_value is None:
-                continue
-            try:
-                surface_value = float(surface_value)
-            except:
-                continue
-            
-            surface_water_discharge += surface_value
-            
-            if groundwater_value is None:
-                continue
-            try:
-                groundwater_value = float(groundwater_value)
-            except:
-                continue
-            
-            groundwater_discharge += groundwater_value
-            
-        total_water_discharge = surface_water_discharge + groundwater_discharge
-        
-        # ========================== process groundwater
-        layer = self.cmbGroundwater.currentLayer()
-        if not self._validate_layer(layer, 'Groundwater Bodies'):
-            return
-        transformed_geom = self._transform_geometry(union_geometry, union_crs, layer.crs())
-        features = self._get_intersecting_features(layer, transformed_geom)
-        
-        groundwater_usable = 0
-        for feature in features:
-            value = feature['GW_Usable']
-            
-            if isinstance(value, QVariant):
-                # this means it is a NULL value
-                value = 0
-            
-            if value is None:
-                continue
-            try:
-                value = float(value)
-            except:
-                continue
-            
-            groundwater_usable += value
-            
-        # ========================== process water bodies
-        layer = self.cmbWaterBodies.currentLayer()
-        if not self._validate_layer(layer, 'Water Bodies'):
-            return
-        # Use the nearest water body feature
-        features = [self.nearest_water_body_feature]
-        # Transform the feature's geometry to match the union CRS
-        source_crs = layer.crs()
-        target_crs = union_crs
-        features = self._transform_features(features, source_crs, target_crs)
-        
-        """Processes only the nearest water body feature."""
-        natural_flow = 0.0
-        ecological_flow = 0.0
-        if not features:
-            return 
-        
-        feature = features[0]  # We only consider the nearest feature
-        try:
-            natural_flow = float(feature['W_av'])
-            if isinstance(natural_flow, QVariant):
-                # this means it is a NULL value
-                natural_flow = 0
-        except:
-            natural_flow = 0.0
-
-        try:
-            ecological_flow = float(feature['W_ef'])
-            if isinstance(ecological_flow, QVariant):
-                # this means it is a NULL value
-                ecological_flow = 0 
-        except:
-            ecological_flow = 0.0
-
-        # ========================== Calculate Water Stress (WS) metrics
-        # Calculate Water Stress (WS) metrics
-        try:
-            ws_surface = ((surface_water_abstraction - surface_water_discharge) / (natural_flow - ecological_flow)) * 100
-        except ZeroDivisionError:
-            ws_surface = 0
-
-        try:
-            ws_groundwater = ((groundwater_abstraction - groundwater_discharge) / groundwater_usable) * 100
-        except ZeroDivisionError:
-            ws_groundwater = 0
-
-        try:
-            ws_total = ((total_water_abstraction - total_water_discharge) / (natural_flow - ecological_flow + groundwater_usable)) * 100
-        except ZeroDivisionError:
-            ws_total = 0
-
-        return {
-            'ws_surface': ws_surface,
-            'ws_groundwater': ws_groundwater,
-            'ws_total': ws_total,
-            'surface_water_abstraction': surface_water_abstraction,
-            'surface_water_discharge': surface_water_discharge,
-            'groundwater_abstraction': groundwater_abstraction,
-            'groundwater_discharge': groundwater_discharge,
-            'total_water_abstraction': total_water_abstraction,
-            'total_water_discharge': total_water_discharge,
-            'natural_flow': natural_flow,
-            'ecological_flow': ecological_flow,
-            'groundwater_usable': groundwater_usable
-        }
-
-    def _transform_geometry(self, geometry, source_crs, target_crs):
-        if source_crs != target_crs:
-            transformer = QgsCoordinateTransform(source_crs, target_crs, QgsProject.instance())
-            transformed_geom = QgsGeometry(geometry)
-            transformed_geom.transform(transformer)
-            return transformed_geom
-        return geometry
-
-    def _transform_features(self, features, source_crs, target_crs):
-        """Transforms the geometries of features from source CRS to target CRS."""
-        transformed_features = []
-        for feature in features:
-            geom = QgsGeometry(feature.geometry())
-            if source_crs != target_crs:
-                transformer = QgsCoordinateTransform(source_crs, target_crs, QgsProject.instance())
-                geom.transform(transformer)
-            feature_copy = QgsFeature(feature)
-            feature_copy.setGeometry(geom)
-            transformed_features.append(feature_copy)
-        return transformed_features
-
-
-    def _get_intersecting_features(self, layer, geometry):
-        index = QgsSpatialIndex(layer.getFeatures())
-        candidate_ids = index.intersects(geometry.boundingBox())
-        intersecting_features = [
-            feature for feature in layer.getFeatures(QgsFeatureRequest(candidate_ids))
-            if feature.geometry().intersects(geometry)
-        ]
-        return intersecting_features
\ No newline at end of file
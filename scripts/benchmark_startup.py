@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the share of the DSS plugin in QGIS startup time.
+
+Every sample runs in a fresh Python process (imports are only paid once per
+process) and times:
+
+  * qgis:    QgsApplication() + initQgis()
+  * plugin:  import of the plugin package + classFactory() + initGui(),
+             i.e. what QGIS runs for DSS at launch
+  * open_*:  first opening of each dock widget (the deferred imports and
+             UI compilation)
+
+It also checks that no dock widget or analysis module was imported by the
+plugin at launch.
+
+Usage, with the QGIS Python environment set up (see run-env-linux.sh):
+
+    python scripts/benchmark_startup.py [--runs 5]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLUGIN_PACKAGE = os.path.basename(PLUGIN_DIR)
+
+# Modules that must not be loaded before the user opens a tool
+DEFERRED_MODULES = [
+    'dss_watershed_load_dockwidget',
+    'dss_hpp_load_dockwidget',
+    'dss_watershed_engine',
+    'dss_hpp_engine',
+]
+
+
+class _Iface:
+    """The part of QgisInterface used by DSSMenuPlugin."""
+
+    def __init__(self, main_window):
+        self._main_window = main_window
+        self._help_menu = main_window.menuBar().addMenu("Help")
+
+    def mainWindow(self):
+        return self._main_window
+
+    def firstRightStandardMenu(self):
+        return self._help_menu
+
+    def addDockWidget(self, area, widget):
+        self._main_window.addDockWidget(area, widget)
+
+
+def _sample():
+    """Runs one cold start in this process and prints the timings as JSON."""
+    timings = {}
+
+    start = time.perf_counter()
+    from qgis.core import QgsApplication
+    app = QgsApplication([], True)
+    app.initQgis()
+    timings['qgis'] = time.perf_counter() - start
+
+    from qgis.PyQt.QtWidgets import QMainWindow
+    iface = _Iface(QMainWindow())
+
+    sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+    start = time.perf_counter()
+    package = __import__(PLUGIN_PACKAGE)
+    plugin = package.classFactory(iface)
+    plugin.initGui()
+    timings['plugin'] = time.perf_counter() - start
+
+    timings['deferred_loaded_at_startup'] = [
+        name for name in DEFERRED_MODULES if f"{PLUGIN_PACKAGE}.{name}" in sys.modules
+    ]
+
+    start = time.perf_counter()
+    plugin.open_watershed_load_widget()
+    timings['open_watershed'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    plugin.open_hpp_load_widget()
+    timings['open_hpp'] = time.perf_counter() - start
+
+    plugin.unload()
+    print(json.dumps(timings))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="DSS plugin startup benchmark.")
+    parser.add_argument('--runs', type=int, default=5, help="number of cold starts")
+    parser.add_argument('--sample', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.sample:
+        _sample()
+        return 0
+
+    samples = []
+    for _ in range(args.runs):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--sample'],
+            check=True, capture_output=True, text=True
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    def median_ms(key):
+        return statistics.median(sample[key] for sample in samples) * 1000
+
+    qgis_ms = median_ms('qgis')
+    plugin_ms = median_ms('plugin')
+    print(f"Runs:                     {len(samples)} (medians)")
+    print(f"QGIS initialisation:      {qgis_ms:8.1f} ms")
+    print(f"DSS at startup:           {plugin_ms:8.1f} ms ({plugin_ms / (qgis_ms + plugin_ms) * 100:.1f}% of launch)")
+    print(f"First Watershed opening:  {median_ms('open_watershed'):8.1f} ms")
+    print(f"First HPP opening:        {median_ms('open_hpp'):8.1f} ms")
+
+    eager = sorted({name for sample in samples for name in sample['deferred_loaded_at_startup']})
+    if eager:
+        print(f"Imported at startup although deferred: {', '.join(eager)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+# coding=utf-8
+"""Run diagnostics test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'mkrtchyan.mushegh@gmail.com'
+__date__ = '2025-10-19'
+__copyright__ = 'Copyright 2024, Mushegh Mkrtchyan'
+
+import csv
+import os
+import tempfile
+import unittest
+
+from qgis.core import Qgis
+
+from dss_diagnostics import RunDiagnostics
+
+from utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+
+class RunDiagnosticsTest(unittest.TestCase):
+    """Test diagnostics are collected, summarized and exported."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.diagnostics = RunDiagnostics("HPP Load")
+        self.diagnostics.add("no_discharge", "Found no discharge points for abstraction code 12.", Qgis.Warning, 12)
+        self.diagnostics.add("same_river", "Abstraction code 13 uses the same river feature for both points.", Qgis.Info, 13)
+        self.diagnostics.add("no_discharge", "Found no discharge points for abstraction code 14.", Qgis.Warning, 14)
+
+    def test_counts_per_category(self):
+        """Counts are kept per category and per level."""
+        self.assertEqual(len(self.diagnostics), 3)
+        self.assertEqual(self.diagnostics.counts["no_discharge"], 2)
+        self.assertEqual(self.diagnostics.count(Qgis.Warning), 2)
+        self.assertIn("no_discharge=2", self.diagnostics.summary())
+
+    def test_stage_timings(self):
+        """Stage timings accumulate and appear in the summary."""
+        with self.diagnostics.stage("union"):
+            pass
+        self.diagnostics.add_timing("union", 1.0, "2.0x parallel speedup")
+        seconds, note = self.diagnostics.timings["union"]
+        self.assertGreaterEqual(seconds, 1.0)
+        self.assertIn("union=1.", self.diagnostics.summary())
+        self.assertIn("2.0x parallel speedup", self.diagnostics.summary())
+
+    def test_to_csv(self):
+        """All records are written to CSV in insertion order."""
+        path = os.path.join(tempfile.mkdtemp(), "diagnostics.csv")
+        self.diagnostics.to_csv(path)
+        with open(path, encoding='utf-8') as csv_file:
+            rows = list(csv.reader(csv_file))
+        self.assertEqual(rows[0], RunDiagnostics.FIELD_NAMES)
+        self.assertEqual([row[2] for row in rows[1:]], ["12", "13", "14"])
+
+    def test_to_layer(self):
+        """The records can be loaded as an attribute table."""
+        layer = self.diagnostics.to_layer()
+        self.assertTrue(layer.isValid())
+        self.assertEqual(layer.featureCount(), 3)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(RunDiagnosticsTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
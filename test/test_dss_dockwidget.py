@@ -16,7 +16,7 @@ import unittest
 
 from qgis.PyQt.QtGui import QDockWidget
 
-from dss_watershed_load_dockwidget import DSSDockWidget
+from dss_watershed_load_dockwidget import WatershedLoadDockWidget
 
 from utilities import get_qgis_app
 
@@ -28,7 +28,7 @@ class DSSDockWidgetTest(unittest.TestCase):
 
     def setUp(self):
         """Runs before each test."""
-        self.dockwidget = DSSDockWidget(None)
+        self.dockwidget = WatershedLoadDockWidget(None)
 
     def tearDown(self):
         """Runs after each test."""
@@ -0,0 +1,88 @@
+# coding=utf-8
+"""Parquet/Arrow export test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'mkrtchyan.mushegh@gmail.com'
+__date__ = '2025-10-19'
+__copyright__ = 'Copyright 2024, Mushegh Mkrtchyan'
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from qgis.core import QgsFeature, QgsGeometry, QgsVectorLayer
+
+from dss_export import ResultWriter, arrow_available, export_layer
+
+from utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+
+@unittest.skipUnless(arrow_available(), "pyarrow is not installed")
+class ExportTest(unittest.TestCase):
+    """Test results are written with a stable schema and metadata."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.directory = tempfile.mkdtemp()
+        self.layer = QgsVectorLayer(
+            'LineString?crs=EPSG:32638&field=AbstrCode:string&field=Length:double&field=Count:integer',
+            'HPP Load Segments', 'memory'
+        )
+        features = []
+        for i in range(25):
+            feature = QgsFeature(self.layer.fields())
+            feature.setAttributes([str(i), float(i) * 1.5, None if i == 3 else i])
+            feature.setGeometry(QgsGeometry.fromWkt(f'LineString({i} 0, {i} 10)'))
+            features.append(feature)
+        self.layer.dataProvider().addFeatures(features)
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_geoparquet(self):
+        """Columns, values, GeoParquet and run metadata of a Parquet export."""
+        import pyarrow.parquet
+        path = os.path.join(self.directory, 'segments.parquet')
+        self.assertEqual(export_layer(self.layer, path, {'tool': 'test'}, batch_size=10), 25)
+
+        table = pyarrow.parquet.read_table(path)
+        self.assertEqual(table.column_names, ['AbstrCode', 'Length', 'Count', 'geometry'])
+        self.assertEqual(str(table.schema.field('Count').type), 'int64')
+        self.assertEqual(table.column('Count').to_pylist()[3], None)
+        self.assertEqual(table.column('Length').to_pylist()[2], 3.0)
+        geometry = QgsGeometry()
+        geometry.fromWkb(table.column('geometry').to_pylist()[4])
+        self.assertEqual(geometry.asWkt(), 'LineString (4 0, 4 10)')
+
+        metadata = table.schema.metadata
+        geo = json.loads(metadata[b'geo'])
+        self.assertEqual(geo['primary_column'], 'geometry')
+        self.assertEqual(geo['columns']['geometry']['geometry_types'], ['LineString'])
+        self.assertEqual(json.loads(metadata[b'dss'])['tool'], 'test')
+
+    def test_arrow(self):
+        """The .arrow extension writes an Arrow IPC file."""
+        import pyarrow
+        path = os.path.join(self.directory, 'segments.arrow')
+        with ResultWriter(path, self.layer.fields(), self.layer.crs(), self.layer.wkbType()) as writer:
+            writer.add_features(self.layer.getFeatures())
+        with pyarrow.OSFile(path, 'rb') as source:
+            table = pyarrow.ipc.open_file(source).read_all()
+        self.assertEqual(table.num_rows, 25)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(ExportTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,128 @@
+# coding=utf-8
+"""DSS expression functions test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'mkrtchyan.mushegh@gmail.com'
+__date__ = '2025-10-19'
+__copyright__ = 'Copyright 2024, Mushegh Mkrtchyan'
+
+import threading
+import unittest
+
+from qgis.core import QgsExpression, QgsExpressionContext, QgsPointXY, QgsProject
+
+import dss_expressions
+from dss_expressions import (
+    THREAD_ERROR,
+    register_functions,
+    store_watershed_layers,
+    unregister_functions,
+    watershed_layers
+)
+from dss_session import DSSSession
+from dss_watershed_engine import WatershedLoadEngine
+
+from utilities import get_qgis_app, strip_dataset
+
+QGIS_APP = get_qgis_app()
+
+
+class ExpressionFunctionsTest(unittest.TestCase):
+    """Test the functions evaluate on the saved Watershed layers, on the main thread only."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.layers = list(strip_dataset())
+        QgsProject.instance().addMapLayers(self.layers)
+        register_functions(None)
+
+    def tearDown(self):
+        """Runs after each test."""
+        unregister_functions()
+        QgsProject.instance().clear()
+
+    def _evaluate(self, text):
+        expression = QgsExpression(text)
+        value = expression.evaluate(QgsExpressionContext())
+        return value, expression.evalErrorString()
+
+    def test_stored_layers(self):
+        """The saved layer ids resolve to the layers, in role order."""
+        self.assertIsNone(watershed_layers())
+        store_watershed_layers(self.layers)
+        self.assertEqual([layer.id() for layer in watershed_layers()], [layer.id() for layer in self.layers])
+        QgsProject.instance().removeMapLayer(self.layers[-1].id())
+        self.assertIsNone(watershed_layers())
+
+    def test_without_stored_layers(self):
+        """Before a Watershed run the functions return an error."""
+        value, error = self._evaluate("dss_water_stress(make_point(55, 5))")
+        self.assertIsNone(value)
+        self.assertTrue(error)
+
+    def test_water_stress(self):
+        """The value is the one of the Watershed tool at the point."""
+        store_watershed_layers(self.layers)
+        expected = WatershedLoadEngine(*self.layers).calculate(QgsPointXY(55, 5))
+        value, error = self._evaluate("dss_water_stress(make_point(55, 5))")
+        self.assertEqual(error, '')
+        self.assertAlmostEqual(value, expected['ws_total'])
+        value, error = self._evaluate("dss_water_stress(make_point(55, 5), 'ws_surface')")
+        self.assertAlmostEqual(value, expected['ws_surface'])
+        value, error = self._evaluate("dss_water_stress(make_point(55, 5), 'ws_other')")
+        self.assertIsNone(value)
+        self.assertIn('ws_other', error)
+
+    def test_repeated_basin(self):
+        """A basin already evaluated is read from the memo until one of its layers changes."""
+        session = DSSSession()
+        self.addCleanup(session.clear)
+        register_functions(session)
+        store_watershed_layers(self.layers)
+        value, error = self._evaluate("dss_water_stress(make_point(55, 5))")
+        self.assertEqual(error, '')
+
+        engine = dss_expressions.watershed_engine()
+        calls = []
+        calculate = engine.calculate
+        engine.calculate = lambda point, as_of=None: calls.append(point) or calculate(point, as_of)
+        self.assertEqual(self._evaluate("dss_water_stress(make_point(55, 5), 'ws_total')"), (value, ''))
+        self.assertEqual(calls, [])
+
+        session.invalidate_layer(self.layers[1].id())
+        self.assertEqual(self._evaluate("dss_water_stress(make_point(55, 5))"), (value, ''))
+        # calculated again by a new engine
+        self.assertIsNot(dss_expressions.watershed_engine(), engine)
+        self.assertEqual(len(dss_expressions._memo), 1)
+
+    def test_upstream_rcodes(self):
+        """The codes are the upstream catchments of the saved catchments layer."""
+        store_watershed_layers(self.layers)
+        engine = WatershedLoadEngine(*self.layers)
+        expected = [code for code, _ in engine.rcode_hierarchy().upstream('1105')]
+        self.assertIn('1105', expected)
+        value, error = self._evaluate("dss_upstream_rcodes('1105')")
+        self.assertEqual(error, '')
+        self.assertEqual(value, expected)
+
+    def test_worker_thread(self):
+        """Evaluated outside the main thread, as while rendering, the functions return an error."""
+        store_watershed_layers(self.layers)
+        results = []
+        for text in ("dss_water_stress(make_point(55, 5))", "dss_upstream_rcodes('1105')"):
+            thread = threading.Thread(target=lambda text=text: results.append(self._evaluate(text)))
+            thread.start()
+            thread.join()
+        self.assertEqual(results, [(None, THREAD_ERROR), (None, THREAD_ERROR)])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(ExpressionFunctionsTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,74 @@
+# coding=utf-8
+"""Feature cache test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'mkrtchyan.mushegh@gmail.com'
+__date__ = '2025-10-19'
+__copyright__ = 'Copyright 2024, Mushegh Mkrtchyan'
+
+import unittest
+
+from qgis.core import QgsFeature, QgsGeometry, QgsPointXY, QgsVectorLayer
+
+from dss_feature_access import FeatureCache
+
+from utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+
+class FeatureCacheTest(unittest.TestCase):
+    """Test candidates are fetched in one request and the cache stays bounded."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.layer = QgsVectorLayer('Point?crs=EPSG:32638&field=name:string', 'points', 'memory')
+        features = []
+        for i in range(10):
+            feature = QgsFeature(self.layer.fields())
+            feature.setAttribute('name', f'p{i}')
+            feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(i, i)))
+            features.append(feature)
+        _, features = self.layer.dataProvider().addFeatures(features)
+        self.fids = [feature.id() for feature in features]
+
+    def test_batched_fetch_keeps_order(self):
+        """A candidate set costs one request and comes back in the asked order."""
+        cache = FeatureCache(self.layer)
+        wanted = [self.fids[3], self.fids[1], self.fids[7]]
+        self.assertEqual([feature.id() for feature in cache.features(wanted)], wanted)
+        self.assertEqual(cache.requests, 1)
+        cache.features(wanted)
+        self.assertEqual(cache.requests, 1)
+        self.assertEqual(cache.hits, 3)
+
+    def test_missing_ids_are_skipped(self):
+        """Ids absent from the layer are skipped."""
+        cache = FeatureCache(self.layer)
+        self.assertEqual(len(cache.features([self.fids[0], 12345])), 1)
+        self.assertIsNone(cache.feature(12345))
+
+    def test_lru_bound(self):
+        """The least recently used features are evicted over the bound."""
+        cache = FeatureCache(self.layer, max_features=3)
+        cache.features(self.fids[:3])
+        cache.feature(self.fids[0])
+        cache.feature(self.fids[5])
+        self.assertEqual(len(cache), 3)
+        requests = cache.requests
+        cache.feature(self.fids[0])
+        self.assertEqual(cache.requests, requests)
+        cache.feature(self.fids[1])
+        self.assertEqual(cache.requests, requests + 1)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(FeatureCacheTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,99 @@
+# coding=utf-8
+"""Two-phase filter test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'mkrtchyan.mushegh@gmail.com'
+__date__ = '2025-10-19'
+__copyright__ = 'Copyright 2024, Mushegh Mkrtchyan'
+
+import math
+import random
+import unittest
+
+import numpy as np
+
+from qgis.core import QgsGeometry, QgsPointXY
+
+from dss_filtering import TwoPhaseFilter, _rings, points_in_rings
+
+from utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+
+def jagged_polygon(vertex_count=2000, radius=1000.0):
+    """A star-like polygon with a noisy boundary, like a dissolved basin outline."""
+    generator = random.Random(3)
+    points = []
+    for i in range(vertex_count):
+        angle = 2 * math.pi * i / vertex_count
+        r = radius * (1 + 0.3 * math.sin(7 * angle)) + generator.uniform(-5, 5)
+        points.append(QgsPointXY(r * math.cos(angle), r * math.sin(angle)))
+    return QgsGeometry.fromPolygonXY([points])
+
+
+class TwoPhaseFilterTest(unittest.TestCase):
+    """Test the filter gives the same answers as the exact predicate."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.polygon = jagged_polygon()
+        self.filter = TwoPhaseFilter(self.polygon)
+
+    def test_points_match_exact(self):
+        """Points everywhere around the polygon, including the boundary band."""
+        generator = random.Random(11)
+        for _ in range(2000):
+            point = QgsGeometry.fromPointXY(QgsPointXY(generator.uniform(-1400, 1400), generator.uniform(-1400, 1400)))
+            self.assertEqual(self.filter.intersects(point), self.polygon.intersects(point))
+        # most of the points never reach the full-resolution geometry
+        self.assertLess(self.filter.exact_count, 2000 // 4)
+
+    def test_polygons_match_exact(self):
+        """Small polygons (e.g. groundwater bodies) across the boundary."""
+        generator = random.Random(5)
+        for _ in range(300):
+            x, y = generator.uniform(-1400, 1400), generator.uniform(-1400, 1400)
+            square = QgsGeometry.fromWkt(f'Polygon(({x} {y}, {x + 20} {y}, {x + 20} {y + 20}, {x} {y + 20}, {x} {y}))')
+            self.assertEqual(self.filter.intersects(square), self.polygon.intersects(square))
+
+    def test_classify_points(self):
+        """The vectorized first phase never contradicts the exact predicate and leaves a thin band."""
+        generator = random.Random(17)
+        x = np.array([generator.uniform(-1400, 1400) for _ in range(5000)])
+        y = np.array([generator.uniform(-1400, 1400) for _ in range(5000)])
+        inside, band = self.filter.classify_points(x, y)
+        self.assertFalse((inside & band).any())
+        for i in range(len(x)):
+            if band[i]:
+                continue
+            point = QgsGeometry.fromPointXY(QgsPointXY(x[i], y[i]))
+            self.assertEqual(bool(inside[i]), self.polygon.intersects(point))
+        self.assertLess(int(band.sum()), len(x) // 4)
+
+    def test_points_in_rings(self):
+        """The even-odd test handles holes and several parts."""
+        geometry = QgsGeometry.fromWkt(
+            'MultiPolygon(((0 0, 10 0, 10 10, 0 10, 0 0), (4 4, 6 4, 6 6, 4 6, 4 4)), ((20 0, 30 0, 30 10, 20 0)))'
+        )
+        x = np.array([1.0, 5.0, 28.0, 22.0, 15.0])
+        y = np.array([1.0, 5.0, 2.0, 8.0, 5.0])
+        self.assertEqual(points_in_rings(x, y, _rings(geometry)).tolist(), [True, False, True, False, False])
+
+    def test_degenerate_geometry(self):
+        """A geometry without extent falls back to the exact test."""
+        point_filter = TwoPhaseFilter(QgsGeometry.fromPointXY(QgsPointXY(1, 1)))
+        self.assertTrue(point_filter.intersects(QgsGeometry.fromPointXY(QgsPointXY(1, 1))))
+        self.assertFalse(point_filter.intersects(QgsGeometry.fromPointXY(QgsPointXY(2, 1))))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(TwoPhaseFilterTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,135 @@
+# coding=utf-8
+"""HPP live update test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'mkrtchyan.mushegh@gmail.com'
+__date__ = '2025-10-19'
+__copyright__ = 'Copyright 2024, Mushegh Mkrtchyan'
+
+import unittest
+
+from qgis.core import QgsFeature, QgsGeometry, QgsPointXY, QgsSpatialIndex
+
+from dss_hpp_engine import HPPSegmentEngine, normalize_code
+from dss_hpp_live import HPPLiveUpdater, patch_coverage
+
+from utilities import get_qgis_app, memory_layer
+
+QGIS_APP = get_qgis_app()
+
+
+class HPPLiveUpdaterTest(unittest.TestCase):
+    """Test an abstraction edit only recomputes its code and the rivers it touches."""
+
+    def setUp(self):
+        """Runs before each test."""
+        crs = 'crs=EPSG:32638'
+        # river A (y = 5) carries the HPPs 1 and 2, river B (y = 50) the HPP 3
+        self.rivers = memory_layer(f'LineString?{crs}', 'rivers', [
+            ('LineString(0 5, 30 5)', {}),
+            ('LineString(0 50, 30 50)', {}),
+        ])
+        self.abstraction = memory_layer(f'Point?{crs}&field=N_Jrar:string', 'abstraction', [
+            ('Point(2 5.5)', {'N_Jrar': '1'}),
+            ('Point(12 5.5)', {'N_Jrar': '2'}),
+            ('Point(2 50.5)', {'N_Jrar': '3'}),
+        ])
+        discharge = memory_layer(f'Point?{crs}&field=N_Jrher:string', 'discharge', [
+            ('Point(8 4.5)', {'N_Jrher': '1'}),
+            ('Point(18 4.5)', {'N_Jrher': '2'}),
+            ('Point(8 49.5)', {'N_Jrher': '3'}),
+        ])
+        catchments = memory_layer(f'Polygon?{crs}&field=RCode:string', 'catchments', [
+            ('Polygon((-10 -10, 40 -10, 40 60, -10 60, -10 -10))', {'RCode': '1100'})
+        ])
+        self.engine = HPPSegmentEngine(self.rivers, self.abstraction, discharge, catchments)
+
+        # the output of a full run, as the dock widget builds it
+        self.segments_layer = memory_layer(f'LineString?{crs}&field=AbstrCode:string', 'segments', [])
+        features = []
+        codes = []
+        for code, geometry in self.engine.run(max_workers=1):
+            feature = QgsFeature(self.segments_layer.fields())
+            feature.setGeometry(geometry)
+            feature.setAttribute('AbstrCode', str(code))
+            features.append(feature)
+            codes.append(code)
+        _, added = self.segments_layer.dataProvider().addFeatures(features)
+        self.segment_ids_by_code = {}
+        for code, feature in zip(codes, added):
+            self.segment_ids_by_code.setdefault(normalize_code(code), []).append(feature.id())
+
+        self.coverage_layer = memory_layer(f'LineString?{crs}&field=CoveragePct:double', 'coverage', [
+            (river.geometry().asWkt(), {'CoveragePct': 0.0}) for river in self.rivers.getFeatures()
+        ])
+        self.coverage_ids_by_river = {
+            river.id(): coverage.id()
+            for river, coverage in zip(self.rivers.getFeatures(), self.coverage_layer.getFeatures())
+        }
+        patch_coverage(
+            self.rivers, list(self.coverage_ids_by_river), self.segments_layer,
+            QgsSpatialIndex(self.segments_layer.getFeatures()), self.coverage_layer,
+            self.coverage_ids_by_river, self.coverage_layer.fields().indexOf('CoveragePct')
+        )
+
+    def _coverage(self):
+        return {
+            river_id: self.coverage_layer.getFeature(coverage_id)['CoveragePct']
+            for river_id, coverage_id in self.coverage_ids_by_river.items()
+        }
+
+    def test_initial_coverage(self):
+        """patch_coverage writes the share of each river covered by its segments."""
+        river_a, river_b = sorted(self.coverage_ids_by_river)
+        coverage = self._coverage()
+        self.assertAlmostEqual(coverage[river_a], 40.0, places=3)
+        self.assertAlmostEqual(coverage[river_b], 20.0, places=3)
+
+    def test_moved_abstraction_point(self):
+        """Moving the abstraction of HPP 1 only replaces its segments and updates river A."""
+        river_a, river_b = sorted(self.coverage_ids_by_river)
+        code_1, code_2, code_3 = (normalize_code(code) for code in ('1', '2', '3'))
+        untouched = {code: list(self.segment_ids_by_code[code]) for code in (code_2, code_3)}
+        old_ids = list(self.segment_ids_by_code[code_1])
+        coverage_before = self._coverage()
+
+        updater = HPPLiveUpdater(
+            self.engine, self.segments_layer, self.segment_ids_by_code, self.coverage_layer,
+            self.coverage_ids_by_river, 'CoveragePct', max_workers=1
+        )
+        updated = []
+        updater.updated.connect(lambda codes, rivers: updated.append((codes, rivers)))
+        updater.start()
+        try:
+            fid = next(feature.id() for feature in self.abstraction.getFeatures() if feature['N_Jrar'] == '1')
+            self.abstraction.startEditing()
+            self.abstraction.changeGeometry(fid, QgsGeometry.fromPointXY(QgsPointXY(5, 5.5)))
+            updater.flush()
+        finally:
+            updater.stop()
+            self.abstraction.rollBack()
+
+        self.assertEqual(updated, [(1, 1)])
+        for code, ids in untouched.items():
+            self.assertEqual(self.segment_ids_by_code[code], ids)
+        new_ids = self.segment_ids_by_code[code_1]
+        self.assertTrue(new_ids)
+        self.assertFalse(set(new_ids) & set(old_ids))
+        length = sum(self.segments_layer.getFeature(fid).geometry().length() for fid in new_ids)
+        self.assertAlmostEqual(length, 3.0, places=3)
+
+        coverage = self._coverage()
+        self.assertAlmostEqual(coverage[river_a], 30.0, places=3)
+        self.assertEqual(coverage[river_b], coverage_before[river_b])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(HPPLiveUpdaterTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
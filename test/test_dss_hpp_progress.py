@@ -0,0 +1,153 @@
+# coding=utf-8
+"""Progressive HPP run test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'mkrtchyan.mushegh@gmail.com'
+__date__ = '2025-10-19'
+__copyright__ = 'Copyright 2024, Mushegh Mkrtchyan'
+
+import unittest
+
+from qgis.core import QgsCoordinateReferenceSystem, QgsProject, QgsRectangle
+
+from dss_diagnostics import RunDiagnostics
+from dss_hpp_engine import HPPSegmentEngine, normalize_code
+from dss_hpp_progress import HPPRunTask, ProgressiveHPPRun
+
+from utilities import get_qgis_app, hpp_dataset, memory_layer
+
+QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
+
+PAIRS = 6
+
+
+class HPPRunTaskTest(unittest.TestCase):
+    """Test the background run yields the results of a serial run, in order, and stops when canceled."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.layers = hpp_dataset(PAIRS)
+
+    def test_results_in_order(self):
+        """Results collected from the task match a serial run."""
+        expected = HPPSegmentEngine(*self.layers).run(max_workers=1)
+
+        engine = HPPSegmentEngine(*self.layers)
+        features, max_workers = engine.start_run(2)
+        task = HPPRunTask(engine, features, max_workers)
+        self.assertTrue(task.run())
+        segments = [(result.code, geom) for result in task.take_results() for geom in result.segments]
+        self.assertEqual([code for code, _ in segments], [code for code, _ in expected])
+        for (_, geom), (_, expected_geom) in zip(segments, expected):
+            self.assertTrue(geom.equals(expected_geom))
+        self.assertEqual(task.take_results(), [])
+
+    def test_cancel_skips_the_rest(self):
+        """Nothing more is processed once canceled."""
+        engine = HPPSegmentEngine(*self.layers)
+        features, max_workers = engine.start_run(1)
+        processed = []
+        for result in engine.process(features, max_workers, lambda: len(processed) >= 2):
+            processed.append(result)
+        self.assertEqual(len(processed), 2)
+
+
+class ProgressiveHPPRunTest(unittest.TestCase):
+    """Test the batches reach the output layers and repaint only when visible."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.layers = hpp_dataset(PAIRS)
+        self.engine = HPPSegmentEngine(*self.layers)
+        rivers = self.layers[0]
+        crs = 'crs=EPSG:32638'
+        self.segments_layer = memory_layer(f'LineString?{crs}&field=AbstrCode:string', 'segments', [])
+        self.coverage_layer = memory_layer(f'LineString?{crs}&field=CoveragePct:double', 'coverage', [
+            (feature.geometry().asWkt(), {'CoveragePct': 0.0}) for feature in rivers.getFeatures()
+        ])
+        self.coverage_ids_by_river = {
+            river.id(): coverage.id()
+            for river, coverage in zip(rivers.getFeatures(), self.coverage_layer.getFeatures())
+        }
+        self.run = ProgressiveHPPRun(
+            self.engine, self.segments_layer, self.coverage_layer, self.coverage_ids_by_river,
+            'CoveragePct', RunDiagnostics("HPP Load"), max_workers=1
+        )
+
+    def _computed_task(self):
+        """A finished task of the run, processed in the foreground."""
+        features, max_workers = self.engine.start_run(1)
+        task = HPPRunTask(self.engine, features, max_workers)
+        task.run()
+        self.run.task = task
+        self.run.total = len(features)
+        return task
+
+    def test_flush_adds_segments_and_coverage(self):
+        """A flush adds the segments by code and updates the coverage of the river."""
+        self._computed_task()
+        progress = []
+        self.run.progressed.connect(lambda processed, total: progress.append((processed, total)))
+        self.run.flush()
+
+        self.assertEqual(self.segments_layer.featureCount(), PAIRS)
+        self.assertEqual(
+            sorted(self.run.segment_ids_by_code),
+            sorted(normalize_code(str(i + 1)) for i in range(PAIRS))
+        )
+        coverage = next(self.coverage_layer.getFeatures())['CoveragePct']
+        self.assertGreater(coverage, 0)
+        self.assertEqual(progress, [(PAIRS, PAIRS)])
+
+        # nothing new: no second batch
+        self.run.flush()
+        self.assertEqual(self.segments_layer.featureCount(), PAIRS)
+        self.assertEqual(len(progress), 1)
+
+    def test_is_visible(self):
+        """Only a batch extent meeting the canvas extent is visible."""
+        self.assertTrue(self.run._is_visible(QgsRectangle(0, 0, 10, 10)))
+        CANVAS.setDestinationCrs(QgsCoordinateReferenceSystem('EPSG:32638'))
+        CANVAS.setExtent(QgsRectangle(1000, 1000, 2000, 2000))
+        self.run.canvas = CANVAS
+        self.assertFalse(self.run._is_visible(QgsRectangle(0, 0, 10, 10)))
+        self.assertTrue(self.run._is_visible(QgsRectangle(900, 900, 1100, 1100)))
+
+    def test_removed_layer_stops_the_run(self):
+        """Removing an output layer cancels the task and stops writing to the layers."""
+        task = self._computed_task()
+        QgsProject.instance().addMapLayer(self.coverage_layer)
+        QgsProject.instance().removeMapLayer(self.coverage_layer.id())
+        self.assertTrue(self.run.layers_removed)
+        self.assertTrue(task.isCanceled())
+        self.run.flush()
+        self.assertEqual(self.segments_layer.featureCount(), 0)
+
+    def test_layer_removed_after_the_task_returned(self):
+        """A layer removed before the completion signal arrives makes the run incomplete."""
+        task = self._computed_task()
+        self.run._tasks.add(task)
+        finished = []
+        self.run.finished.connect(finished.append)
+        # the task already returned: canceling it now changes nothing
+        QgsProject.instance().addMapLayer(self.segments_layer)
+        QgsProject.instance().removeMapLayer(self.segments_layer.id())
+        self.run._task_finished(task, True)
+        self.assertEqual(finished, [False])
+        self.assertFalse(self.run.completed)
+        self.assertTrue(self.run.layers_removed)
+        self.assertIsNone(self.run.task)
+
+
+if __name__ == "__main__":
+    suite = unittest.TestSuite()
+    suite.addTests(unittest.makeSuite(HPPRunTaskTest))
+    suite.addTests(unittest.makeSuite(ProgressiveHPPRunTest))
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
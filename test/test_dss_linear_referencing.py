@@ -0,0 +1,61 @@
+# coding=utf-8
+"""Linear referencing cache test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'mkrtchyan.mushegh@gmail.com'
+__date__ = '2025-10-19'
+__copyright__ = 'Copyright 2024, Mushegh Mkrtchyan'
+
+import unittest
+
+from qgis.core import QgsFeature, QgsGeometry, QgsPointXY
+
+from dss_linear_referencing import LinearReferencingCache
+
+from utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+
+class LinearReferencingCacheTest(unittest.TestCase):
+    """Test the cached arrays give the same results as lineLocatePoint/curveSubstring."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.river = QgsFeature(7)
+        self.river.setGeometry(QgsGeometry.fromWkt(
+            'MultiLineString((100 100, 110 100), (0 0, 10 0, 10 10, 20 10))'
+        ))
+        self.cache = LinearReferencingCache()
+
+    def test_locate_matches_line_locate_point(self):
+        """Distances along a part match QgsGeometry.lineLocatePoint."""
+        part_geom = QgsGeometry.fromWkt('LineString(0 0, 10 0, 10 10, 20 10)')
+        part = self.cache.parts(self.river)[1]
+        for x, y in [(5, 3), (12, 5), (-3, -3), (25, 12), (10, 0)]:
+            expected = part_geom.lineLocatePoint(QgsGeometry.fromPointXY(QgsPointXY(x, y)))
+            self.assertAlmostEqual(part.locate(x, y), expected)
+
+    def test_substring_between(self):
+        """The sub-segment is cut from the part containing both points."""
+        sub_geom = self.cache.substring_between(self.river, QgsPointXY(12, 5), QgsPointXY(5, 1))
+        expected = QgsGeometry.fromWkt('LineString(5 0, 10 0, 10 5)')
+        self.assertTrue(sub_geom.equals(expected), sub_geom.asWkt())
+
+    def test_parts_are_cached(self):
+        """Repeated queries on the same river reuse the arrays."""
+        parts = self.cache.parts(self.river)
+        self.assertIs(self.cache.parts(self.river), parts)
+        self.assertEqual(len(self.cache), 1)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(LinearReferencingCacheTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,118 @@
+# coding=utf-8
+"""National runner test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'mkrtchyan.mushegh@gmail.com'
+__date__ = '2025-10-19'
+__copyright__ = 'Copyright 2024, Mushegh Mkrtchyan'
+
+import os
+import shutil
+import tempfile
+import unittest
+from collections import Counter
+
+from qgis.core import QgsVectorLayer
+
+from dss_national_runner import _write_layer, run
+from dss_run_history import RIVER_KIND, RunHistory
+
+from utilities import get_qgis_app, memory_layer
+
+QGIS_APP = get_qgis_app()
+
+
+class SerialExecutor:
+    """Runs the workers one after the other in this process."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def map(self, function, *iterables):
+        return list(map(function, *iterables))
+
+
+class NationalRunTest(unittest.TestCase):
+    """Test a two-basin run merges the basin outputs without duplicates."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.directory = tempfile.mkdtemp()
+        crs = 'crs=EPSG:32638'
+        # basin 11 is x 0..10, basin 12 is x 10..20
+        sources = {
+            'catchments': memory_layer(f'Polygon?{crs}&field=RCode:string', 'catchments', [
+                ('Polygon((0 0, 10 0, 10 10, 0 10, 0 0))', {'RCode': '1100'}),
+                ('Polygon((10 0, 20 0, 20 10, 10 10, 10 0))', {'RCode': '1200'}),
+            ]),
+            # river A crosses the boundary (its midpoint is in basin 11), river B is in basin 12
+            'rivers': memory_layer(f'LineString?{crs}', 'rivers', [
+                ('LineString(1 5, 17 5)', {}),
+                ('LineString(12 2, 18 2)', {}),
+            ]),
+            # HPP 1 abstracts on the boundary and discharges in basin 12: basin 12 computes it
+            # and so does the cross-basin round for basin 11; HPP 2 is inside basin 12
+            'hpp_abstraction': memory_layer(f'Point?{crs}&field=N_Jrar:string', 'hpp_abstraction', [
+                ('Point(10 5.5)', {'N_Jrar': '1'}),
+                ('Point(13 2.5)', {'N_Jrar': '2'}),
+            ]),
+            'hpp_discharge': memory_layer(f'Point?{crs}&field=N_Jrher:string', 'hpp_discharge', [
+                ('Point(14 4.5)', {'N_Jrher': '1'}),
+                ('Point(17 1.5)', {'N_Jrher': '2'}),
+            ]),
+        }
+        layers = {}
+        for key, layer in sources.items():
+            path = os.path.join(self.directory, f'{key}.gpkg')
+            _write_layer(path, key, layer.fields(), layer.wkbType(), layer.crs(), list(layer.getFeatures()))
+            layers[key] = f'{path}|layername={key}'
+        self.config = {
+            'output': os.path.join(self.directory, 'national.gpkg'),
+            'work_dir': os.path.join(self.directory, 'work'),
+            'basin_digits': 2,
+            'layers': layers,
+        }
+        os.makedirs(self.config['work_dir'])
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.directory)
+
+    def _output(self, layer_name):
+        layer = QgsVectorLayer(f"{self.config['output']}|layername={layer_name}", layer_name, 'ogr')
+        self.assertTrue(layer.isValid())
+        return list(layer.getFeatures())
+
+    def test_merged_output_has_no_duplicates(self):
+        """Every HPP and every river is in the merged output once."""
+        summary = run(self.config, executor=SerialExecutor())
+        self.assertEqual(summary['basins'], 2)
+
+        segment_codes = Counter(feature['AbstrCode'] for feature in self._output('hpp_segments'))
+        self.assertEqual(segment_codes, Counter({'1': 1, '2': 1}))
+        self.assertEqual(summary['segments'], 2)
+
+        coverage = self._output('rivers_coverage')
+        self.assertEqual(sorted(feature['RiverFid'] for feature in coverage), [1, 2])
+
+    def test_history_keys_rivers_by_input_fid(self):
+        """The coverage kept in the run history is keyed by the river fid of the input layer."""
+        self.config['history'] = os.path.join(self.directory, 'history.sqlite')
+        summary = run(self.config, executor=SerialExecutor())
+        values = RunHistory(self.config['history']).values(summary['history_run'], RIVER_KIND)
+        self.assertEqual(sorted(values), ['1', '2'])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(NationalRunTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
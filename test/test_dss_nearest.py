@@ -0,0 +1,75 @@
+# coding=utf-8
+"""Nearest feature search test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'mkrtchyan.mushegh@gmail.com'
+__date__ = '2025-10-19'
+__copyright__ = 'Copyright 2024, Mushegh Mkrtchyan'
+
+import random
+import unittest
+
+from qgis.core import QgsFeature, QgsGeometry, QgsPointXY, QgsSpatialIndex, QgsVectorLayer
+
+from dss_feature_access import FeatureCache
+from dss_nearest import nearest_feature
+
+from utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+
+class NearestFeatureTest(unittest.TestCase):
+    """Test the best-first search finds the true nearest geometry."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.layer = QgsVectorLayer('LineString?crs=EPSG:32638', 'rivers', 'memory')
+        generator = random.Random(42)
+        wkts = [
+            # long diagonal rivers: their boxes cover the whole area but the lines are far from most points
+            'LineString(0 0, 1000 1000)',
+            'LineString(0 1000, 1000 0)',
+        ]
+        for _ in range(200):
+            x, y = generator.uniform(0, 1000), generator.uniform(0, 1000)
+            wkts.append(f'LineString({x} {y}, {x + 5} {y + 5})')
+        features = []
+        for wkt in wkts:
+            feature = QgsFeature()
+            feature.setGeometry(QgsGeometry.fromWkt(wkt))
+            features.append(feature)
+        self.layer.dataProvider().addFeatures(features)
+        self.index = QgsSpatialIndex(self.layer.getFeatures())
+        self.cache = FeatureCache(self.layer)
+
+    def brute_force(self, point):
+        point_geom = QgsGeometry.fromPointXY(point)
+        return min(feature.geometry().distance(point_geom) for feature in self.layer.getFeatures())
+
+    def test_matches_brute_force(self):
+        """The distance found is the minimum over all the features."""
+        generator = random.Random(7)
+        for _ in range(50):
+            point = QgsPointXY(generator.uniform(0, 1000), generator.uniform(0, 1000))
+            feature, dist = nearest_feature(self.index, point, self.cache.features, batch_size=2)
+            self.assertAlmostEqual(dist, self.brute_force(point))
+            self.assertAlmostEqual(feature.geometry().distance(QgsGeometry.fromPointXY(point)), dist)
+
+    def test_empty_index(self):
+        """An empty index gives no feature."""
+        feature, dist = nearest_feature(QgsSpatialIndex(), QgsPointXY(0, 0), self.cache.features)
+        self.assertIsNone(feature)
+        self.assertEqual(dist, float('inf'))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(NearestFeatureTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,120 @@
+# coding=utf-8
+"""Outlet assignment test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'mkrtchyan.mushegh@gmail.com'
+__date__ = '2025-10-19'
+__copyright__ = 'Copyright 2024, Mushegh Mkrtchyan'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from qgis.core import QgsFeatureRequest, QgsGeometry, QgsSpatialIndex
+
+from dss_outlets import ASSIGNMENT_PROPERTY, OutletAssignment, assignment_signature
+
+from utilities import file_layer, get_qgis_app, memory_layer
+
+QGIS_APP = get_qgis_app()
+
+
+class OutletAssignmentTest(unittest.TestCase):
+    """Test the table keeps the longest-stretch catchments and is reused only on the same data."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.directory = tempfile.mkdtemp()
+        crs = 'crs=EPSG:32638'
+        # catchment 1 is x 0..10, catchment 2 is x 10..20
+        self.catchments = memory_layer(f'Polygon?{crs}&field=RCode:string', 'catchments', [
+            ('Polygon((0 0, 10 0, 10 10, 0 10, 0 0))', {'RCode': '1100'}),
+            ('Polygon((10 0, 20 0, 20 10, 10 10, 10 0))', {'RCode': '1200'}),
+        ])
+        # mostly in catchment 1, evenly shared, away from both
+        self.water_bodies = memory_layer(f'LineString?{crs}', 'water_bodies', [
+            ('LineString(2 5, 14 5)', {}),
+            ('LineString(5 5, 15 5)', {}),
+            ('LineString(30 5, 40 5)', {}),
+        ])
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.directory)
+
+    def _build(self, water_bodies, catchments):
+        return OutletAssignment.build(
+            water_bodies,
+            QgsSpatialIndex(catchments.getFeatures()),
+            lambda ids: catchments.getFeatures(QgsFeatureRequest().setFilterFids(ids))
+        )
+
+    def _for_layers(self, water_bodies, catchments):
+        return OutletAssignment.for_layers(
+            water_bodies,
+            catchments,
+            QgsSpatialIndex(catchments.getFeatures()),
+            lambda ids: catchments.getFeatures(QgsFeatureRequest().setFilterFids(ids))
+        )
+
+    def test_ties(self):
+        """Only the longest stretch is kept, every catchment of an exact tie is."""
+        assignment = self._build(self.water_bodies, self.catchments)
+        first, second = (feature.id() for feature in self.catchments.getFeatures())
+        mostly_first, shared, away = (feature.id() for feature in self.water_bodies.getFeatures())
+        self.assertEqual(assignment.candidates(mostly_first), [first])
+        self.assertEqual(sorted(assignment.candidates(shared)), [first, second])
+        self.assertEqual(assignment.candidates(away), [])
+        self.assertEqual(assignment.candidates(-1), [])
+
+    def test_json_round_trip(self):
+        """The stored table reads back the same for the same signature only."""
+        assignment = self._build(self.water_bodies, self.catchments)
+        text = assignment.to_json('signature')
+        self.assertEqual(OutletAssignment.from_json(text, 'signature').table, assignment.table)
+        self.assertIsNone(OutletAssignment.from_json(text, 'other'))
+        self.assertIsNone(OutletAssignment.from_json('not json', 'signature'))
+        self.assertIsNone(OutletAssignment.from_json(None, 'signature'))
+
+    def test_memory_layers_are_not_stored(self):
+        """Without a signature the table is only kept in memory."""
+        self.assertIsNone(assignment_signature(self.water_bodies, self.catchments))
+        self._for_layers(self.water_bodies, self.catchments)
+        self.assertFalse(self.water_bodies.customProperty(ASSIGNMENT_PROPERTY))
+
+    def test_signature_invalidation(self):
+        """The stored table is reused until one of the layers changes."""
+        water_bodies = file_layer(os.path.join(self.directory, 'water_bodies.gpkg'), self.water_bodies)
+        catchments = file_layer(os.path.join(self.directory, 'catchments.gpkg'), self.catchments)
+        signature = assignment_signature(water_bodies, catchments)
+        self.assertIsNotNone(signature)
+        self.assertIsNone(OutletAssignment.stored(water_bodies, signature))
+
+        assignment = self._for_layers(water_bodies, catchments)
+        self.assertEqual(OutletAssignment.stored(water_bodies, signature).table, assignment.table)
+
+        # move catchment 1 so it no longer shares the water bodies
+        fid = next(catchments.getFeatures()).id()
+        catchments.startEditing()
+        catchments.changeGeometry(fid, QgsGeometry.fromWkt('Polygon((0 20, 10 20, 10 30, 0 30, 0 20))'))
+        self.assertTrue(catchments.commitChanges())
+
+        new_signature = assignment_signature(water_bodies, catchments)
+        self.assertNotEqual(new_signature, signature)
+        self.assertIsNone(OutletAssignment.stored(water_bodies, new_signature))
+        rebuilt = self._for_layers(water_bodies, catchments)
+        self.assertNotEqual(rebuilt.table, assignment.table)
+        self.assertEqual(OutletAssignment.stored(water_bodies, new_signature).table, rebuilt.table)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(OutletAssignmentTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
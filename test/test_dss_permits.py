@@ -0,0 +1,158 @@
+# coding=utf-8
+"""Time-indexed abstraction permits test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'mkrtchyan.mushegh@gmail.com'
+__date__ = '2025-10-19'
+__copyright__ = 'Copyright 2024, Mushegh Mkrtchyan'
+
+import datetime
+import unittest
+
+from qgis.PyQt.QtCore import QDate
+from qgis.core import QgsPointXY
+
+from dss_permits import IntervalTree, PermitTimeline, month_starts
+from dss_session import DSSSession
+from dss_watershed_engine import WatershedLoadEngine
+
+from utilities import get_qgis_app, memory_layer, strip_dataset
+
+QGIS_APP = get_qgis_app()
+
+INF = float('inf')
+
+
+class IntervalTreeTest(unittest.TestCase):
+    """Test the tree finds the same intervals as a scan of all of them."""
+
+    def test_matches_a_scan(self):
+        """Overlap queries agree with a linear scan, open bounds included."""
+        starts = [(i * 7) % 50 if i % 5 else -INF for i in range(200)]
+        ends = [start + (i % 13) if i % 7 else INF for i, start in enumerate(starts)]
+        tree = IntervalTree(starts, ends)
+        for first in range(-5, 60, 3):
+            for length in (0, 4):
+                last = first + length
+                expected = [i for i in range(200) if starts[i] <= last and ends[i] >= first]
+                self.assertEqual(list(tree.overlapping(first, last)), expected)
+
+    def test_invalid_intervals_are_ignored(self):
+        """An interval ending before it starts is never found."""
+        tree = IntervalTree([5, 0], [1, 10])
+        self.assertEqual(list(tree.at(3)), [1])
+
+
+class PermitTimelineTest(unittest.TestCase):
+    """Test the totals at change points and over windows."""
+
+    def setUp(self):
+        """Runs before each test."""
+        # surface 100 valid on days 10..19, groundwater 5 from day 15 on, surface 1 always
+        self.timeline = PermitTimeline([100, 5, 1], [0, 1, 0], [10, 15, -INF], [19, INF, INF])
+
+    def test_totals_at(self):
+        """The totals step at the first day of a permit and the day after its last."""
+        totals = self.timeline.totals_at([0, 10, 15, 19, 20])
+        self.assertEqual(totals.tolist(), [[1, 0], [101, 0], [101, 5], [101, 5], [1, 5]])
+
+    def test_mean_between(self):
+        """The window mean weighs each level by its number of days."""
+        surface, groundwater = self.timeline.mean_between(10, 29)
+        self.assertAlmostEqual(surface, (10 * 101 + 10 * 1) / 20)
+        self.assertAlmostEqual(groundwater, 15 * 5 / 20)
+
+    def test_month_starts(self):
+        """Monthly dates roll over the year."""
+        self.assertEqual(
+            month_starts(datetime.date(2025, 11, 15), 3),
+            [datetime.date(2025, 11, 1), datetime.date(2025, 12, 1), datetime.date(2026, 1, 1)]
+        )
+
+
+class WatershedAsOfTest(unittest.TestCase):
+    """Test the watershed totals only count the permits valid on the chosen date."""
+
+    def setUp(self):
+        """Runs before each test."""
+        water_bodies, catchments, _, discharge, groundwater = strip_dataset()
+        # in the basin of 1105 (x >= 50): a surface permit for 2020-2024 and a groundwater
+        # permit from 2023 on; outside of it, a permit without dates
+        abstraction = memory_layer(
+            'Point?crs=EPSG:32638&field=abs_m3_yr:double&field=Groundwate:string'
+            '&field=Valid_from:date&field=Valid_to:date',
+            'abstraction',
+            [
+                ('Point(55 3)', {'abs_m3_yr': 100.0, 'Groundwate': None,
+                                 'Valid_from': QDate(2020, 1, 1), 'Valid_to': QDate(2024, 12, 31)}),
+                ('Point(65 3)', {'abs_m3_yr': 10.0, 'Groundwate': 'yes', 'Valid_from': QDate(2023, 1, 1)}),
+                ('Point(5 3)', {'abs_m3_yr': 1000.0, 'Groundwate': None}),
+            ]
+        )
+        self.layers = (water_bodies, catchments, abstraction, discharge, groundwater)
+        self.point = QgsPointXY(55, 5)
+
+    def _check(self, session):
+        engine = WatershedLoadEngine(*self.layers, session=session)
+        results = engine.calculate(self.point, datetime.date(2022, 6, 1))
+        self.assertEqual((results['surface_water_abstraction'], results['groundwater_abstraction']), (100, 0))
+        self.assertEqual(results['as_of'], '2022-06-01')
+        results = engine.calculate(self.point, datetime.date(2025, 6, 1))
+        self.assertEqual((results['surface_water_abstraction'], results['groundwater_abstraction']), (0, 10))
+
+        results, series = engine.calculate_series(self.point, [datetime.date(2019, 1, 1), datetime.date(2023, 6, 1)])
+        self.assertEqual(results['surface_water_abstraction'], 100)
+        self.assertEqual(
+            [(metrics['surface_water_abstraction'], metrics['groundwater_abstraction']) for _, metrics in series],
+            [(0, 0), (100, 10)]
+        )
+
+        # a year to 2023-06-01: the surface permit all along, the groundwater one for 152 days
+        _, series = engine.calculate_series(self.point, [datetime.date(2023, 6, 1)], window_days=365)
+        window = series[0][1]['window']
+        self.assertAlmostEqual(window['surface_water_abstraction'], 100)
+        self.assertAlmostEqual(window['groundwater_abstraction'], 10 * 152 / 365)
+
+    def test_with_session(self):
+        """Snapshot, interval tree and cached timeline give the permits in force."""
+        session = DSSSession()
+        try:
+            self._check(session)
+        finally:
+            session.clear()
+
+    def test_without_session(self):
+        """The feature loop gives the same totals."""
+        self._check(None)
+
+    def test_catchment_edit(self):
+        """An edit of the catchments drops the cached timeline of the basin."""
+        session = DSSSession()
+        catchments = self.layers[1]
+        try:
+            engine = WatershedLoadEngine(*self.layers, session=session)
+            self.assertEqual(engine.calculate(self.point, datetime.date(2025, 6, 1))['groundwater_abstraction'], 10)
+            # the groundwater permit is in 1106, upstream of the basin of the point
+            fid = next(feature.id() for feature in catchments.getFeatures() if feature['RCode'] == '1106')
+            catchments.startEditing()
+            catchments.deleteFeature(fid)
+            engine = WatershedLoadEngine(*self.layers, session=session)
+            self.assertEqual(engine.calculate(self.point, datetime.date(2025, 6, 1))['groundwater_abstraction'], 0)
+        finally:
+            catchments.rollBack()
+            session.clear()
+
+
+if __name__ == "__main__":
+    suite = unittest.TestSuite()
+    suite.addTests(unittest.makeSuite(IntervalTreeTest))
+    suite.addTests(unittest.makeSuite(PermitTimelineTest))
+    suite.addTests(unittest.makeSuite(WatershedAsOfTest))
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
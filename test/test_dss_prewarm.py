@@ -0,0 +1,225 @@
+# coding=utf-8
+"""Session prewarming test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'mkrtchyan.mushegh@gmail.com'
+__date__ = '2025-10-19'
+__copyright__ = 'Copyright 2024, Mushegh Mkrtchyan'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from qgis.core import QgsFeatureRequest, QgsProject, QgsSpatialIndex
+from qgis.gui import QgsMapLayerComboBox
+
+from dss_outlets import ASSIGNMENT_PROPERTY, OutletAssignment, assignment_key
+from dss_prewarm import PrewarmTask, SessionPrewarmer, _outlet_job, _PrewarmJob
+from dss_session import SPATIAL_INDEX_KEY, DSSSession, build_attribute_lookup, build_spatial_index, lookup_key
+
+from utilities import file_layer, get_qgis_app, memory_layer
+
+QGIS_APP = get_qgis_app()
+
+
+def catchments_layer():
+    return memory_layer('Polygon?crs=EPSG:32638&field=RCode:string', 'catchments', [
+        ('Polygon((0 0, 10 0, 10 10, 0 10, 0 0))', {'RCode': '1100'}),
+        ('Polygon((10 0, 20 0, 20 10, 10 10, 10 0))', {'RCode': '1101'}),
+    ])
+
+
+def water_bodies_layer():
+    return memory_layer('LineString?crs=EPSG:32638', 'water_bodies', [
+        ('LineString(2 5, 14 5)', {}),
+        ('LineString(12 5, 18 5)', {}),
+    ])
+
+
+def expected_assignment(water_bodies, catchments):
+    return OutletAssignment.build(
+        water_bodies,
+        QgsSpatialIndex(catchments.getFeatures()),
+        lambda ids: catchments.getFeatures(QgsFeatureRequest().setFilterFids(ids))
+    )
+
+
+class PrewarmTaskTest(unittest.TestCase):
+    """Test the task builds every job from its feature source and stops when canceled."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.layer = catchments_layer()
+        fields = self.layer.fields()
+        self.jobs = [
+            _PrewarmJob(self.layer, SPATIAL_INDEX_KEY, build_spatial_index, 1, 0),
+            _PrewarmJob(
+                self.layer, lookup_key('RCode'),
+                lambda source, feedback: build_attribute_lookup(source, fields, 'RCode', feedback), 1, 0
+            ),
+        ]
+
+    def test_builds_every_job(self):
+        """Each job gets the value of its builder."""
+        task = PrewarmTask(self.jobs)
+        self.assertTrue(task.run())
+        self.assertEqual(len(self.jobs[0].value.intersects(self.layer.extent())), 2)
+        self.assertEqual(sorted(self.jobs[1].value.values()), ['1100', '1101'])
+
+    def test_cancel(self):
+        """A canceled task builds nothing and cancels its feedback."""
+        task = PrewarmTask(self.jobs)
+        task.cancel()
+        self.assertFalse(task.run())
+        self.assertTrue(task.feedback.isCanceled())
+        self.assertEqual([job.value for job in self.jobs], [None, None])
+
+
+class SessionPrewarmerTest(unittest.TestCase):
+    """Test the prewarmer debounces selections and stores only what is still current."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.catchments = catchments_layer()
+        self.water_bodies = water_bodies_layer()
+        QgsProject.instance().addMapLayers([self.catchments, self.water_bodies])
+        self.session = DSSSession()
+        self.catchments_combo = QgsMapLayerComboBox()
+        self.catchments_combo.setLayer(self.catchments)
+        self.water_bodies_combo = QgsMapLayerComboBox()
+        self.water_bodies_combo.setLayer(self.water_bodies)
+
+        self.prewarmer = SessionPrewarmer(self.session)
+        self.prewarmer.watch(self.catchments_combo, lookups=['RCode', 'Missing'])
+        self.prewarmer.watch_outlets(self.water_bodies_combo, self.catchments_combo)
+        self.messages = []
+        self.prewarmer.readinessChanged.connect(self.messages.append)
+
+    def tearDown(self):
+        """Runs after each test."""
+        QgsProject.instance().removeAllMapLayers()
+        # after the layer removal, which reschedules through the combo boxes
+        self.prewarmer.stop()
+        self.session.clear()
+
+    def _outlet_key(self):
+        return assignment_key(self.catchments.id(), self.session.generation(self.catchments.id()))
+
+    def test_debounce(self):
+        """Selections only restart the timer; nothing is built before it fires."""
+        self.prewarmer.schedule()
+        self.prewarmer.schedule()
+        self.assertTrue(self.prewarmer._timer.isActive())
+        self.assertEqual(self.prewarmer._timer.interval(), SessionPrewarmer.DEBOUNCE_MS)
+        self.assertIsNone(self.prewarmer._task)
+        self.assertEqual(self.messages, ["Preparing layers…", "Preparing layers…"])
+
+    def test_jobs(self):
+        """Only the missing structures of existing fields are built."""
+        keys = [(job.layer_id, job.key) for job in self.prewarmer._jobs()]
+        self.assertEqual(keys, [
+            (self.catchments.id(), SPATIAL_INDEX_KEY),
+            (self.catchments.id(), lookup_key('RCode')),
+            (self.water_bodies.id(), self._outlet_key()),
+        ])
+        self.session.spatial_index(self.catchments)
+        keys = [(job.layer_id, job.key) for job in self.prewarmer._jobs()]
+        self.assertNotIn((self.catchments.id(), SPATIAL_INDEX_KEY), keys)
+
+    def test_reselection_cancels_the_task(self):
+        """A new selection cancels the running task."""
+        self.prewarmer._start()
+        task = self.prewarmer._task
+        self.assertIsNotNone(task)
+        self.prewarmer.schedule()
+        self.assertTrue(task.isCanceled())
+        self.assertIsNone(self.prewarmer._task)
+        task.waitForFinished()
+
+    def test_completed(self):
+        """The built structures reach the session and the outlet table matches a direct build."""
+        task = PrewarmTask(self.prewarmer._jobs())
+        self.assertTrue(task.run())
+        self.prewarmer._task = task
+        self.prewarmer._completed(task)
+        self.assertTrue(self.session.contains(self.catchments, SPATIAL_INDEX_KEY))
+        self.assertTrue(self.session.contains(self.catchments, lookup_key('RCode')))
+        assignment = self.session.get(self.water_bodies, self._outlet_key(), lambda layer: None)
+        self.assertEqual(assignment.table, expected_assignment(self.water_bodies, self.catchments).table)
+        self.assertEqual(self.messages[-1], "Ready")
+        self.assertIsNone(self.prewarmer._task)
+        self.assertEqual(self.prewarmer._jobs(), [])
+
+    def test_layer_changed_while_building(self):
+        """Structures of a layer edited during the build are dropped and scheduled again."""
+        task = PrewarmTask(self.prewarmer._jobs())
+        self.assertTrue(task.run())
+        self.session.invalidate_layer(self.catchments.id())
+        self.prewarmer._task = task
+        self.prewarmer._completed(task)
+        self.assertFalse(self.session.contains(self.catchments, SPATIAL_INDEX_KEY))
+        self.assertFalse(self.session.contains(self.catchments, lookup_key('RCode')))
+        self.assertTrue(self.prewarmer._timer.isActive())
+        self.assertNotIn("Ready", self.messages)
+
+
+class OutletJobTest(unittest.TestCase):
+    """Test the outlet table job is only created when no valid table exists."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.directory = tempfile.mkdtemp()
+        self.session = DSSSession()
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.session.clear()
+        shutil.rmtree(self.directory)
+
+    def _build(self, job):
+        task = PrewarmTask([job])
+        self.assertTrue(task.run())
+        return job.value
+
+    def test_memory_layers(self):
+        """Without a signature the table is built but not stored with the layer."""
+        water_bodies, catchments = water_bodies_layer(), catchments_layer()
+        job = _outlet_job(self.session, water_bodies, catchments)
+        self.assertIsNotNone(job)
+        assignment = self._build(job)
+        self.assertEqual(assignment.table, expected_assignment(water_bodies, catchments).table)
+        job.on_stored(water_bodies, assignment)
+        self.assertFalse(water_bodies.customProperty(ASSIGNMENT_PROPERTY))
+
+    def test_stored_table_needs_no_task(self):
+        """A table stored with the layer and still valid goes to the session right away."""
+        water_bodies = file_layer(os.path.join(self.directory, 'water_bodies.gpkg'), water_bodies_layer())
+        catchments = file_layer(os.path.join(self.directory, 'catchments.gpkg'), catchments_layer())
+        job = _outlet_job(self.session, water_bodies, catchments)
+        assignment = self._build(job)
+        job.on_stored(water_bodies, assignment)
+        self.assertTrue(water_bodies.customProperty(ASSIGNMENT_PROPERTY))
+
+        key = assignment_key(catchments.id(), self.session.generation(catchments.id()))
+        self.assertIsNone(_outlet_job(self.session, water_bodies, catchments))
+        self.assertTrue(self.session.contains(water_bodies, key))
+        stored = self.session.get(water_bodies, key, lambda layer: None)
+        self.assertEqual(stored.table, assignment.table)
+        # already in the session
+        self.assertIsNone(_outlet_job(self.session, water_bodies, catchments))
+
+
+if __name__ == "__main__":
+    suite = unittest.TestSuite()
+    suite.addTests(unittest.makeSuite(PrewarmTaskTest))
+    suite.addTests(unittest.makeSuite(SessionPrewarmerTest))
+    suite.addTests(unittest.makeSuite(OutletJobTest))
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,76 @@
+# coding=utf-8
+"""Profile next run test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'mkrtchyan.mushegh@gmail.com'
+__date__ = '2025-10-19'
+__copyright__ = 'Copyright 2024, Mushegh Mkrtchyan'
+
+import os
+import pstats
+import shutil
+import tempfile
+import unittest
+
+from dss_profiling import NextRunProfiler
+
+from utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+
+def busy_work():
+    return sorted(str(i) for i in range(20000))
+
+
+class NextRunProfilerTest(unittest.TestCase):
+    """Test only the next run is profiled, and what is saved for it."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.directory = tempfile.mkdtemp()
+        self.profiler = NextRunProfiler()
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_off_by_default(self):
+        """Without arming, nothing is profiled."""
+        with self.profiler.run('watershed') as report:
+            busy_work()
+        self.assertIsNone(report)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_next_run_only(self):
+        """An armed profiler profiles one run, saves its files and turns off."""
+        armed = []
+        self.profiler.armedChanged.connect(armed.append)
+        self.profiler.arm(self.directory)
+        with self.profiler.run('watershed') as report:
+            busy_work()
+        self.assertEqual(armed, [True, False])
+        self.assertFalse(self.profiler.armed)
+
+        self.assertTrue(os.path.exists(report.pstats_path))
+        self.assertTrue(os.path.exists(report.allocations_path))
+        pstats.Stats(report.pstats_path)
+        self.assertLessEqual(len(report.top_functions), 10)
+        self.assertGreater(report.peak_bytes, 0)
+        self.assertIn('busy_work', report.summary())
+
+        with self.profiler.run('watershed') as second_report:
+            busy_work()
+        self.assertIsNone(second_report)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(NextRunProfilerTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
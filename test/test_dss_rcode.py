@@ -0,0 +1,52 @@
+# coding=utf-8
+"""RCode hierarchy test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'mkrtchyan.mushegh@gmail.com'
+__date__ = '2025-10-19'
+__copyright__ = 'Copyright 2024, Mushegh Mkrtchyan'
+
+import random
+import unittest
+
+from dss_rcode import RCodeHierarchy, is_upstream_rcode
+
+
+class RCodeHierarchyTest(unittest.TestCase):
+    """Test the sorted hierarchy finds the same catchments as the full scan."""
+
+    def setUp(self):
+        """Runs before each test."""
+        generator = random.Random(1)
+        self.lookup = {
+            fid: generator.choice(['', '0', '1']) + ''.join(
+                generator.choice('0123456789') for _ in range(generator.randint(1, 8))
+            )
+            for fid in range(3000)
+        }
+        self.lookup[3000] = None
+        self.lookup[3001] = 'x12'
+        self.hierarchy = RCodeHierarchy(self.lookup)
+
+    def test_matches_full_scan(self):
+        """Upstream ids equal those of is_upstream_rcode over every catchment."""
+        for value_given in list(self.lookup.values())[:300] + ['5', '05', '12', 'abc']:
+            expected = sorted(fid for fid, rcode in self.lookup.items() if is_upstream_rcode(rcode, value_given))
+            self.assertEqual(sorted(self.hierarchy.upstream_fids(value_given)), expected)
+
+    def test_codes_are_returned(self):
+        """The outlet itself is part of its upstream basin."""
+        hierarchy = RCodeHierarchy({1: '1100', 2: '1102', 3: '110201', 4: '1200'})
+        self.assertEqual(hierarchy.upstream('1102'), [('1102', 2), ('110201', 3)])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(RCodeHierarchyTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,85 @@
+# coding=utf-8
+"""Render mode test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'mkrtchyan.mushegh@gmail.com'
+__date__ = '2025-10-19'
+__copyright__ = 'Copyright 2024, Mushegh Mkrtchyan'
+
+import unittest
+
+from qgis.PyQt.QtCore import QSettings
+from qgis.core import QgsGraduatedSymbolRenderer, QgsRuleBasedRenderer, QgsVectorLayer, QgsVectorSimplifyMethod
+
+from dss_rendering import (
+    PATTERN_MAX_DENOMINATOR,
+    SETTINGS_KEY,
+    WS_CLASSES,
+    WS_STYLE,
+    cached_symbol,
+    range_expression,
+    restyle_layer,
+    style_layer
+)
+
+from utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+
+class DSSRenderingTest(unittest.TestCase):
+    """Test the lightweight style draws patterns only when zoomed in."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.mode = QSettings().value(SETTINGS_KEY)
+        self.layer = QgsVectorLayer('Polygon?crs=EPSG:32638&field=WS_Total:double', 'ws', 'memory')
+
+    def tearDown(self):
+        """Runs after each test."""
+        if self.mode is None:
+            QSettings().remove(SETTINGS_KEY)
+        else:
+            QSettings().setValue(SETTINGS_KEY, self.mode)
+
+    def test_range_expression(self):
+        """Open bounds are dropped and only the last class includes its upper bound."""
+        self.assertEqual(range_expression('WS_Total', None, 25, False), '"WS_Total" < 25')
+        self.assertEqual(range_expression('WS_Total', 75, 100, True), '"WS_Total" >= 75 AND "WS_Total" <= 100')
+        self.assertEqual(range_expression('WS_Total', None, None, True), 'TRUE')
+
+    def test_cached_symbols_are_copies(self):
+        """Each call returns a separate copy of the same symbol."""
+        first = cached_symbol('pattern', 'red')
+        second = cached_symbol('pattern', 'red')
+        self.assertIsNot(first, second)
+        self.assertEqual(first.symbolLayerCount(), second.symbolLayerCount())
+
+    def test_mode_switch_restyles(self):
+        """Switching the mode replaces the renderer of a styled layer."""
+        QSettings().setValue(SETTINGS_KEY, True)
+        style_layer(self.layer, WS_STYLE, 'WS_Total', WS_CLASSES)
+        renderer = self.layer.renderer()
+        self.assertIsInstance(renderer, QgsRuleBasedRenderer)
+        class_rule = renderer.rootRule().children()[0]
+        simple_rule, pattern_rule = class_rule.children()
+        self.assertEqual(simple_rule.maximumScale(), PATTERN_MAX_DENOMINATOR)
+        self.assertEqual(pattern_rule.minimumScale(), PATTERN_MAX_DENOMINATOR)
+        self.assertNotEqual(self.layer.simplifyMethod().simplifyHints(), QgsVectorSimplifyMethod.NoSimplification)
+
+        QSettings().setValue(SETTINGS_KEY, False)
+        restyle_layer(self.layer)
+        self.assertIsInstance(self.layer.renderer(), QgsGraduatedSymbolRenderer)
+        self.assertEqual(len(self.layer.renderer().ranges()), len(WS_CLASSES))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(DSSRenderingTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
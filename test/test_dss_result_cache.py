@@ -0,0 +1,122 @@
+# coding=utf-8
+"""Watershed result cache test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'mkrtchyan.mushegh@gmail.com'
+__date__ = '2025-10-19'
+__copyright__ = 'Copyright 2024, Mushegh Mkrtchyan'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from qgis.core import QgsGeometry
+
+from dss_result_cache import WatershedResultCache
+
+from utilities import file_layer, get_qgis_app, memory_layer
+
+QGIS_APP = get_qgis_app()
+
+
+class WatershedResultCacheTest(unittest.TestCase):
+    """Test results are stored, replaced on input changes and evicted."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.directory = tempfile.mkdtemp()
+        self.cache = WatershedResultCache(os.path.join(self.directory, 'cache.sqlite'), max_size_mb=1)
+        self.geometry = QgsGeometry.fromWkt('Polygon((0 0, 10 0, 10 10, 0 10, 0 0))')
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        """A stored result is read back with its geometry."""
+        self.cache.put('q1', 'sources', 'inputs-1', {'ws_total': 12.5}, self.geometry)
+        results, geometry = self.cache.get('q1')
+        self.assertEqual(results, {'ws_total': 12.5})
+        self.assertTrue(geometry.equals(self.geometry))
+        self.assertIsNone(self.cache.get('q2'))
+
+    def test_changed_inputs_drop_old_results(self):
+        """Storing a result on new input data removes the results of the old data."""
+        self.cache.put('q1', 'sources', 'inputs-1', {'ws_total': 1.0}, self.geometry)
+        self.cache.put('q2', 'sources', 'inputs-2', {'ws_total': 2.0}, self.geometry)
+        self.assertIsNone(self.cache.get('q1'))
+        self.assertIsNotNone(self.cache.get('q2'))
+
+    def test_size_eviction(self):
+        """The least recently used results are evicted over the size limit."""
+        padding = 'x' * (400 * 1024)
+        self.cache.put('q1', 'sources', 'inputs', {'padding': padding}, self.geometry)
+        self.cache.put('q2', 'sources', 'inputs', {'padding': padding}, self.geometry)
+        self.cache.get('q1')
+        self.cache.put('q3', 'sources', 'inputs', {'padding': padding}, self.geometry)
+        self.assertIsNotNone(self.cache.get('q1'))
+        self.assertIsNone(self.cache.get('q2'))
+        self.assertEqual(self.cache.stats()[0], 2)
+
+
+class LayerFingerprintTest(unittest.TestCase):
+    """Test an edit committed to a file-backed layer changes the cache keys."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.directory = tempfile.mkdtemp()
+        self.cache = WatershedResultCache(os.path.join(self.directory, 'cache.sqlite'), max_size_mb=1)
+        self.source = memory_layer('Point?crs=EPSG:32638&field=abs_m3_yr:double', 'abstraction', [
+            ('Point(1 1)', {'abs_m3_yr': 100.0}),
+            ('Point(2 2)', {'abs_m3_yr': 200.0}),
+        ])
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.directory)
+
+    def _write(self, file_name, driver_name):
+        layer = file_layer(os.path.join(self.directory, file_name), self.source, driver_name)
+        self.assertTrue(layer.isValid())
+        return layer
+
+    def _check_edit_misses(self, layer):
+        inputs_key = WatershedResultCache.inputs_key([layer])
+        self.assertIsNotNone(inputs_key)
+        sources_key = WatershedResultCache.sources_key([layer])
+        query_key = WatershedResultCache.query_key(inputs_key, 1, 1)
+        self.cache.put(query_key, sources_key, inputs_key, {'ws_total': 1.0}, QgsGeometry.fromWkt('Point(1 1)'))
+
+        # same size, same feature count and schema: only the content changes
+        fid = next(layer.getFeatures()).id()
+        layer.startEditing()
+        layer.changeAttributeValue(fid, layer.fields().indexOf('abs_m3_yr'), 300.0)
+        self.assertTrue(layer.commitChanges())
+
+        new_inputs_key = WatershedResultCache.inputs_key([layer])
+        self.assertIsNotNone(new_inputs_key)
+        self.assertNotEqual(new_inputs_key, inputs_key)
+        self.assertIsNone(self.cache.get(WatershedResultCache.query_key(new_inputs_key, 1, 1)))
+
+    def test_shapefile_attribute_edit(self):
+        """Editing the .dbf of a shapefile is a cache miss."""
+        self._check_edit_misses(self._write('abstraction.shp', 'ESRI Shapefile'))
+
+    def test_geopackage_attribute_edit(self):
+        """Editing a GeoPackage table (possibly only its -wal so far) is a cache miss."""
+        self._check_edit_misses(self._write('abstraction.gpkg', 'GPKG'))
+
+
+if __name__ == "__main__":
+    suite = unittest.TestSuite()
+    suite.addTests(unittest.makeSuite(WatershedResultCacheTest))
+    suite.addTests(unittest.makeSuite(LayerFingerprintTest))
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,95 @@
+# coding=utf-8
+"""Run history test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'mkrtchyan.mushegh@gmail.com'
+__date__ = '2025-10-19'
+__copyright__ = 'Copyright 2024, Mushegh Mkrtchyan'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from qgis.core import QgsCoordinateReferenceSystem, QgsGeometry
+
+from dss_run_history import HPP_TOOL, RIVER_KIND, WATERSHED_TOOL, CATCHMENT_KIND, DiffRow, RunHistory
+
+from utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+
+class RunHistoryTest(unittest.TestCase):
+    """Test runs are stored, read back and compared key by key."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.directory = tempfile.mkdtemp()
+        self.history = RunHistory(os.path.join(self.directory, 'history.sqlite'))
+        self.geometry = QgsGeometry.fromWkt('Polygon((0 0, 10 0, 10 10, 0 10, 0 0))')
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.directory)
+
+    def _record_rivers(self, coverage):
+        return self.history.record(
+            HPP_TOOL, 'rivers', {'max_workers': 1}, [],
+            {RIVER_KIND: {key: {'CoveragePct': value} for key, value in coverage.items()}}
+        )
+
+    def test_round_trip(self):
+        """A run is read back with its parameters, values and geometries."""
+        run_id = self.history.record(
+            WATERSHED_TOOL, 'WS 1105', {'x': 1.0}, [{'name': 'catchments', 'source': 'c.shp', 'fingerprint': None}],
+            {CATCHMENT_KIND: {1105: {'WS_Total': 42.5}}},
+            {CATCHMENT_KIND: {1105: self.geometry}},
+            QgsCoordinateReferenceSystem('EPSG:32638'),
+            {'ws_total': 42.5}
+        )
+        run = self.history.run(run_id)
+        self.assertEqual(run.tool, WATERSHED_TOOL)
+        self.assertEqual(run.parameters, {'x': 1.0})
+        self.assertEqual(run.crs, 'EPSG:32638')
+        self.assertEqual(run.summary, {'ws_total': 42.5})
+        self.assertEqual(self.history.kinds(run_id), [CATCHMENT_KIND])
+        self.assertEqual(self.history.values(run_id, CATCHMENT_KIND), {'1105': {'WS_Total': 42.5}})
+        self.assertTrue(self.history.geometries(run_id, CATCHMENT_KIND)['1105'].equals(self.geometry))
+
+    def test_runs_most_recent_first(self):
+        """The run list starts with the latest run and filters by tool."""
+        first = self._record_rivers({'1': 10.0})
+        second = self._record_rivers({'1': 20.0})
+        self.assertEqual([run.id for run in self.history.runs()], [second, first])
+        self.assertEqual(self.history.runs(tool=WATERSHED_TOOL), [])
+
+    def test_diff(self):
+        """Changed, added and removed keys are reported; equal values only on request."""
+        old = self._record_rivers({'1': 10.0, '2': 50.0, '3': 30.0})
+        new = self._record_rivers({'1': 10.0, '2': 55.0, '4': 5.0})
+        self.assertEqual(self.history.diff(old, new, RIVER_KIND), [
+            DiffRow('2', 'CoveragePct', 50.0, 55.0),
+            DiffRow('3', 'CoveragePct', 30.0, None),
+            DiffRow('4', 'CoveragePct', None, 5.0),
+        ])
+        self.assertEqual(len(self.history.diff(old, new, RIVER_KIND, changed_only=False)), 4)
+
+    def test_delete(self):
+        """A deleted run leaves no values behind."""
+        run_id = self._record_rivers({'1': 10.0})
+        self.history.delete(run_id)
+        self.assertIsNone(self.history.run(run_id))
+        self.assertEqual(self.history.values(run_id, RIVER_KIND), {})
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(RunHistoryTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,162 @@
+# coding=utf-8
+"""Query service front end test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'mkrtchyan.mushegh@gmail.com'
+__date__ = '2025-10-19'
+__copyright__ = 'Copyright 2024, Mushegh Mkrtchyan'
+
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from dss_service import WATERSHED_LAYER_KEYS, DSSQueryService, ServiceFrontEnd, ServiceMetrics
+
+from utilities import file_layer, get_qgis_app, strip_dataset
+
+QGIS_APP = get_qgis_app()
+
+
+class _EchoService:
+    """Stands for DSSQueryService: answers every query with its own 'x'."""
+
+    class session:
+        @staticmethod
+        def summary():
+            return "0 cached structures"
+
+    @staticmethod
+    def run_batch(queries):
+        return [{'ok': 'x' in query, 'x': query.get('x')} for query in queries]
+
+
+class ServiceTest(unittest.TestCase):
+    """Test the HTTP front end and its metrics."""
+
+    def test_metrics_percentiles(self):
+        """Latency percentiles and counters follow the recorded requests."""
+        metrics = ServiceMetrics()
+        for i in range(100):
+            metrics.record(i / 100, 2, 1 if i % 10 == 0 else 0)
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['requests'], 100)
+        self.assertEqual(snapshot['queries'], 200)
+        self.assertEqual(snapshot['errors'], 10)
+        self.assertAlmostEqual(snapshot['latency_seconds']['p50'], 0.5)
+        self.assertAlmostEqual(snapshot['latency_seconds']['max'], 0.99)
+
+    def test_http_round_trip(self):
+        """Single and batched queries over a keep-alive connection, then the metrics."""
+
+        async def exchange():
+            front_end = ServiceFrontEnd({})
+            front_end.service = _EchoService()
+            server = await asyncio.start_server(front_end.handle_connection, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+
+            async def request(method, path, payload=None, close=False):
+                body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+                writer.write(
+                    f"{method} {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\n"
+                    f"{'Connection: close' if close else 'Connection: keep-alive'}\r\n\r\n".encode('latin-1') + body
+                )
+                status = int((await reader.readline()).split()[1])
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line == b'\r\n':
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                return status, json.loads(await reader.readexactly(int(headers['content-length'])))
+
+            single = await request('POST', '/query', {'x': 1})
+            batch = await request('POST', '/query', {'queries': [{'x': 2}, {'y': 3}]})
+            missing = await request('GET', '/nowhere')
+            metrics = await request('GET', '/metrics', close=True)
+            writer.close()
+            server.close()
+            await server.wait_closed()
+            front_end.compute.shutdown()
+            return single, batch, missing, metrics
+
+        single, batch, missing, metrics = asyncio.run(exchange())
+        self.assertEqual(single, (200, {'ok': True, 'x': 1}))
+        self.assertEqual(batch[1]['results'], [{'ok': True, 'x': 2}, {'ok': False, 'x': None}])
+        self.assertEqual(missing[0], 404)
+        self.assertEqual(metrics[1]['queries'], 3)
+        self.assertEqual(metrics[1]['errors'], 1)
+
+    def test_invalid_content_length(self):
+        """A non-numeric Content-Length is answered with a 400, not a dropped connection."""
+
+        async def exchange():
+            front_end = ServiceFrontEnd({})
+            front_end.service = _EchoService()
+            server = await asyncio.start_server(front_end.handle_connection, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b"POST /query HTTP/1.1\r\nContent-Length: ten\r\n\r\n")
+            response = await reader.read()
+            writer.close()
+            server.close()
+            await server.wait_closed()
+            front_end.compute.shutdown()
+            return response
+
+        head, _, body = asyncio.run(exchange()).partition(b'\r\n\r\n')
+        self.assertTrue(head.startswith(b'HTTP/1.1 400'))
+        self.assertEqual(json.loads(body), {'error': "Invalid Content-Length."})
+
+
+class QueryServiceTest(unittest.TestCase):
+    """Test a batch answers every query, whatever the others do."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.directory = tempfile.mkdtemp()
+        layers = {}
+        for key, layer in zip(WATERSHED_LAYER_KEYS, strip_dataset()):
+            path = os.path.join(self.directory, f'{key}.gpkg')
+            layers[key] = file_layer(path, layer).source()
+        self.service = DSSQueryService({'layers': layers})
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.service = None
+        shutil.rmtree(self.directory)
+
+    def test_run_batch(self):
+        """Malformed and failing queries get an error in their place, the others their result."""
+        results = self.service.run_batch([
+            {'x': 55, 'y': 5},
+            {'type': 'unknown'},
+            {'x': 55, 'y': 5, 'crs': ['EPSG:4326']},
+            {'type': 'hpp', 'code': 1},
+            {'x': 55, 'y': 5, 'geometry': True},
+        ])
+        self.assertEqual([result['ok'] for result in results], [True, False, False, False, True])
+        self.assertIn('unknown', results[1]['error'])
+        self.assertTrue(results[2]['error'].startswith('Internal error: TypeError'))
+        self.assertEqual(results[4]['ws_total'], results[0]['ws_total'])
+        self.assertIn('union_wkt', results[4])
+        for result in results:
+            self.assertGreaterEqual(result['seconds'], 0)
+
+
+if __name__ == "__main__":
+    suite = unittest.TestSuite()
+    suite.addTests(unittest.makeSuite(ServiceTest))
+    suite.addTests(unittest.makeSuite(QueryServiceTest))
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
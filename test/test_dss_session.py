@@ -0,0 +1,106 @@
+# coding=utf-8
+"""Session cache test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'mkrtchyan.mushegh@gmail.com'
+__date__ = '2025-10-19'
+__copyright__ = 'Copyright 2024, Mushegh Mkrtchyan'
+
+import unittest
+
+from qgis.core import QgsCoordinateReferenceSystem, QgsFeature, QgsGeometry, QgsVectorLayer
+
+from dss_session import DSSSession
+
+from utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+
+class DSSSessionTest(unittest.TestCase):
+    """Test the session shares structures until a layer changes."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.layer = QgsVectorLayer('Polygon?crs=EPSG:32638&field=RCode:string', 'catchments', 'memory')
+        features = []
+        for rcode, wkt in (('1100', 'Polygon((0 0, 1 0, 1 1, 0 1, 0 0))'), ('1102', 'Polygon((1 0, 2 0, 2 1, 1 1, 1 0))')):
+            feature = QgsFeature(self.layer.fields())
+            feature.setAttribute('RCode', rcode)
+            feature.setGeometry(QgsGeometry.fromWkt(wkt))
+            features.append(feature)
+        self.layer.dataProvider().addFeatures(features)
+        self.session = DSSSession()
+        self.session.memory_budget = 1024 * 1024
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.session.clear()
+        self.session = None
+
+    def test_structures_are_shared(self):
+        """A second request returns the cached structure."""
+        index = self.session.spatial_index(self.layer)
+        self.assertIs(self.session.spatial_index(self.layer), index)
+        lookup = self.session.attribute_lookup(self.layer, 'RCode')
+        self.assertEqual(sorted(lookup.values()), ['1100', '1102'])
+        self.assertIs(self.session.attribute_lookup(self.layer, 'RCode'), lookup)
+
+    def test_edit_invalidates(self):
+        """Editing the layer drops its structures."""
+        lookup = self.session.attribute_lookup(self.layer, 'RCode')
+        self.layer.startEditing()
+        self.layer.changeAttributeValue(next(iter(lookup)), 0, '1104')
+        self.assertIsNot(self.session.attribute_lookup(self.layer, 'RCode'), lookup)
+        self.layer.rollBack()
+
+    def test_budget_evicts_least_recently_used(self):
+        """Entries over the budget are evicted, oldest first."""
+        self.session.get(self.layer, 'a', lambda layer: 'a', size=600 * 1024)
+        self.session.get(self.layer, 'b', lambda layer: 'b', size=600 * 1024)
+        self.assertEqual(self.session.memory_usage(), 600 * 1024)
+        built = []
+        self.session.get(self.layer, 'a', lambda layer: built.append('a') or 'a', size=1)
+        self.assertEqual(built, ['a'])
+
+    def test_usage_follows_the_entries(self):
+        """Replaced and invalidated entries are taken off the usage."""
+        self.session.put(self.layer, 'a', 'a', 100)
+        self.session.put(self.layer, 'b', 'b', 10)
+        self.session.put(self.layer, 'a', 'a', 50)
+        self.assertEqual(self.session.memory_usage(), 60)
+        self.session.invalidate_layer(self.layer.id())
+        self.assertEqual(self.session.memory_usage(), 0)
+
+    def test_working_layer(self):
+        """Layers in another CRS are reprojected once, and dropped with their source."""
+        self.assertIs(self.session.working_layer(self.layer, self.layer.crs()).layer, self.layer)
+
+        crs = QgsCoordinateReferenceSystem('EPSG:4326')
+        working = self.session.working_layer(self.layer, crs)
+        self.assertTrue(working.is_copy)
+        self.assertEqual(working.layer.crs(), crs)
+        self.assertEqual(working.layer.featureCount(), 2)
+        source_rcodes = {feature.id(): feature['RCode'] for feature in self.layer.getFeatures()}
+        for feature in working.layer.getFeatures():
+            self.assertEqual(source_rcodes[working.source_id(feature.id())], feature['RCode'])
+            self.assertLess(feature.geometry().boundingBox().xMaximum(), 180)
+        self.assertIs(self.session.working_layer(self.layer, crs), working)
+
+        index = self.session.spatial_index(working.layer)
+        self.session.invalidate_layer(self.layer.id())
+        self.assertFalse(self.session.contains(working.layer, 'spatial_index'))
+        self.assertIsNot(self.session.spatial_index(working.layer), index)
+        self.assertIsNot(self.session.working_layer(self.layer, crs), working)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(DSSSessionTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,101 @@
+# coding=utf-8
+"""Columnar point snapshot test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'mkrtchyan.mushegh@gmail.com'
+__date__ = '2025-10-19'
+__copyright__ = 'Copyright 2024, Mushegh Mkrtchyan'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from qgis.core import QgsFeature, QgsGeometry, QgsPointXY, QgsVectorLayer
+
+from dss_filtering import TwoPhaseFilter
+from dss_snapshot import PointSnapshot
+
+from utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+
+def value_of(feature):
+    value = feature['abs_m3_yr']
+    return (float(value) if value is not None else float('nan'),)
+
+
+class PointSnapshotTest(unittest.TestCase):
+    """Test the snapshot selects and sums like the feature loop."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.directory = tempfile.mkdtemp()
+        self.layer = QgsVectorLayer('Point?crs=EPSG:32638&field=abs_m3_yr:double', 'abstraction', 'memory')
+        features = []
+        for i in range(100):
+            feature = QgsFeature(self.layer.fields())
+            feature.setAttribute('abs_m3_yr', None if i % 10 == 0 else float(i))
+            feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(i % 10 * 10 + 5, i // 10 * 10 + 5)))
+            features.append(feature)
+        self.layer.dataProvider().addFeatures(features)
+        self.polygon = QgsGeometry.fromWkt('Polygon((0 0, 50 0, 50 50, 0 0))')
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def expected_total(self):
+        return sum(
+            feature['abs_m3_yr'] for feature in self.layer.getFeatures()
+            if feature.geometry().intersects(self.polygon) and feature['abs_m3_yr'] is not None
+        )
+
+    def test_sum_matches_features(self):
+        """Selected rows sum to the same total as the features."""
+        snapshot = PointSnapshot.build(self.layer, ('value',), value_of)
+        self.assertEqual(len(snapshot), 100)
+        values = snapshot['value'][snapshot.rows_in(TwoPhaseFilter(self.polygon))]
+        self.assertAlmostEqual(float(np.nansum(values)), self.expected_total())
+
+    def test_rows_in_matches_features(self):
+        """Rows of points inside, outside and on the edge of a slanted polygon match the exact test."""
+        polygon = QgsGeometry.fromWkt('Polygon((0 0, 100 0, 100 100, 0 0))')
+        snapshot = PointSnapshot.build(self.layer, ('value',), value_of)
+        fids = set(snapshot['fid'][snapshot.rows_in(TwoPhaseFilter(polygon))].tolist())
+        expected = {feature.id() for feature in self.layer.getFeatures() if feature.geometry().intersects(polygon)}
+        self.assertEqual(fids, expected)
+
+    def test_save_and_mmap(self):
+        """A saved snapshot is loaded memory-mapped with the same columns."""
+        snapshot = PointSnapshot.build(self.layer, ('value',), value_of)
+        path = os.path.join(self.directory, 'abstraction')
+        snapshot.save(path)
+        loaded = PointSnapshot.load(path)
+        self.assertIsInstance(loaded['value'], np.memmap)
+        np.testing.assert_array_equal(loaded['fid'], snapshot['fid'])
+        np.testing.assert_array_equal(loaded['value'], snapshot['value'])
+        self.assertIsNone(PointSnapshot.load(os.path.join(self.directory, 'missing')))
+
+    def test_non_point_layer(self):
+        """Layers that are not single points get no snapshot."""
+        lines = QgsVectorLayer('LineString?crs=EPSG:32638&field=abs_m3_yr:double', 'lines', 'memory')
+        feature = QgsFeature(lines.fields())
+        feature.setGeometry(QgsGeometry.fromWkt('LineString(0 0, 1 1)'))
+        lines.dataProvider().addFeatures([feature])
+        self.assertIsNone(PointSnapshot.build(lines, ('value',), value_of))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(PointSnapshotTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,63 @@
+# coding=utf-8
+"""Cascaded union test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'mkrtchyan.mushegh@gmail.com'
+__date__ = '2025-10-19'
+__copyright__ = 'Copyright 2024, Mushegh Mkrtchyan'
+
+import unittest
+
+from qgis.core import QgsGeometry
+
+from dss_union import PARALLEL_MIN_GEOMETRIES, cascaded_union, str_chunks
+
+from utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+
+class CascadedUnionTest(unittest.TestCase):
+    """Test the parallel union gives the same geometry as unaryUnion."""
+
+    def setUp(self):
+        """Runs before each test."""
+        # a 25 x 20 grid of unit squares
+        self.squares = [
+            QgsGeometry.fromWkt(f'Polygon(({x} {y}, {x + 1} {y}, {x + 1} {y + 1}, {x} {y + 1}, {x} {y}))')
+            for x in range(25) for y in range(20)
+        ]
+        self.assertGreaterEqual(len(self.squares), PARALLEL_MIN_GEOMETRIES)
+
+    def test_chunks_cover_input(self):
+        """Every geometry lands in exactly one chunk."""
+        chunks = str_chunks(self.squares, chunk_size=16)
+        self.assertEqual(sum(len(chunk) for chunk in chunks), len(self.squares))
+        self.assertTrue(all(len(chunk) <= 16 for chunk in chunks))
+
+    def test_same_result_as_unary_union(self):
+        """The parallel union equals the single call."""
+        stats = {}
+        union = cascaded_union(self.squares, max_workers=4, stats=stats)
+        self.assertGreater(stats['chunks'], 1)
+        self.assertTrue(union.isGeosEqual(QgsGeometry.unaryUnion(self.squares)))
+        self.assertAlmostEqual(union.area(), 500.0)
+
+    def test_small_input_falls_back(self):
+        """Small inputs use a single unaryUnion call."""
+        stats = {}
+        union = cascaded_union(self.squares[:10], max_workers=4, stats=stats)
+        self.assertEqual(stats['chunks'], 1)
+        self.assertAlmostEqual(union.area(), 10.0)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(CascadedUnionTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
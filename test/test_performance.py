@@ -0,0 +1,144 @@
+# coding=utf-8
+"""Performance regression tests: work and memory budgets of the pipelines.
+
+The tests count work (index builds, full layer scans, features fetched,
+exact predicates, unions) through dss_counters instead of timing the runs,
+so they fail on a change that rebuilds an index per query or scans a whole
+layer, and pass on a slow or busy machine.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'mkrtchyan.mushegh@gmail.com'
+__date__ = '2025-10-19'
+__copyright__ = 'Copyright 2024, Mushegh Mkrtchyan'
+
+import tracemalloc
+import unittest
+
+from qgis.core import QgsPointXY
+
+import dss_counters as counters
+from dss_hpp_engine import HPPSegmentEngine
+from dss_session import DSSSession
+from dss_watershed_engine import WatershedLoadEngine
+
+from utilities import CATCHMENTS, POINTS_PER_CATCHMENT, get_qgis_app, hpp_dataset, strip_dataset
+
+QGIS_APP = get_qgis_app()
+
+HPP_PAIRS = 10
+# Outlet catchment 1105: the catchments 1105 to 1119 are upstream of it
+OUTLET = 5
+UPSTREAM = CATCHMENTS - OUTLET
+PEAK_MEMORY_BUDGET = 8 * 1024 * 1024
+
+
+class WatershedPerformanceTest(unittest.TestCase):
+    """Test a watershed query reuses its structures and reads only what it needs."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.layers = strip_dataset()
+        self.session = DSSSession()
+        self.point = QgsPointXY(10 * OUTLET + 5, 5)
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.session.clear()
+        self.session = None
+
+    def test_session_query_budgets(self):
+        """The first query builds each structure once; the second builds and scans nothing."""
+        engine = WatershedLoadEngine(*self.layers, session=self.session)
+        with counters.counting() as first:
+            engine.calculate(self.point)
+        # water bodies, catchments and groundwater; the point layers are read through snapshots
+        self.assertLessEqual(first[counters.SPATIAL_INDEX_BUILDS], 3)
+        self.assertEqual(first[counters.UNION_CALLS], 1)
+
+        engine = WatershedLoadEngine(*self.layers, session=self.session)
+        tracemalloc.start()
+        try:
+            with counters.counting() as second:
+                engine.calculate(self.point)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(second[counters.SPATIAL_INDEX_BUILDS], 0)
+        self.assertEqual(second[counters.FULL_LAYER_SCANS], 0)
+        self.assertEqual(second[counters.UNION_CALLS], 1)
+        self.assertLess(peak, PEAK_MEMORY_BUDGET)
+
+    def test_upstream_catchments_are_fetched_by_id(self):
+        """Only the upstream catchments are read with their geometry."""
+        engine = WatershedLoadEngine(*self.layers, session=self.session)
+        engine.rcode_hierarchy()
+        with counters.counting() as work:
+            selected = engine.select_upstream_catchments(str(1100 + OUTLET))
+        self.assertEqual(len(selected), UPSTREAM)
+        self.assertEqual(work[counters.FEATURES_FETCHED], UPSTREAM)
+        self.assertEqual(work[counters.FULL_LAYER_SCANS], 0)
+
+    def test_exact_predicates_only_near_the_boundary(self):
+        """Points well inside or outside the union skip the exact GEOS test."""
+        engine = WatershedLoadEngine(*self.layers, session=self.session)
+        with counters.counting() as work:
+            engine.calculate(self.point)
+        points_in_union = 2 * UPSTREAM * POINTS_PER_CATCHMENT
+        self.assertLess(work[counters.EXACT_PREDICATES], points_in_union // 4)
+
+    def test_engine_without_session_keeps_its_indexes(self):
+        """Without a session, the engine builds its indexes on the first query only."""
+        engine = WatershedLoadEngine(*self.layers)
+        engine.calculate(self.point)
+        with counters.counting() as work:
+            engine.calculate(self.point)
+        self.assertEqual(work[counters.SPATIAL_INDEX_BUILDS], 0)
+        self.assertEqual(work[counters.UNION_CALLS], 1)
+
+
+class HPPPerformanceTest(unittest.TestCase):
+    """Test HPP runs share the session indexes and fetch features by id."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.layers = hpp_dataset(HPP_PAIRS, strip_dataset()[1])
+        self.session = DSSSession()
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.session.clear()
+        self.session = None
+
+    def test_repeated_run_budgets(self):
+        """A second run on the same session builds no index and fetches a bounded number of features."""
+        HPPSegmentEngine(*self.layers, session=self.session).run(max_workers=1)
+
+        engine = HPPSegmentEngine(*self.layers, session=self.session)
+        tracemalloc.start()
+        try:
+            with counters.counting() as work:
+                segments = engine.run(max_workers=1)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(len(segments), HPP_PAIRS)
+        self.assertEqual(work[counters.SPATIAL_INDEX_BUILDS], 0)
+        # the discharge dictionary and the abstraction layer are read once per run
+        self.assertLessEqual(work[counters.FULL_LAYER_SCANS], 2)
+        # the nearest river of both points of every pair, in batches of at most 8 candidates
+        self.assertLessEqual(work[counters.FEATURES_FETCHED], 2 * HPP_PAIRS * 8)
+        self.assertLess(peak, PEAK_MEMORY_BUDGET)
+
+
+if __name__ == "__main__":
+    suite = unittest.TestSuite()
+    suite.addTests(unittest.makeSuite(WatershedPerformanceTest))
+    suite.addTests(unittest.makeSuite(HPPPerformanceTest))
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
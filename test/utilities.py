@@ -6,6 +6,11 @@ import logging
 
 
 LOGGER = logging.getLogger('QGIS')
+
+# Size of the strip_dataset() strip
+CATCHMENTS = 20
+POINTS_PER_CATCHMENT = 10
+
 QGIS_APP = None  # Static variable used to hold hand to running QGIS app
 CANVAS = None
 PARENT = None
@@ -59,3 +64,89 @@ def get_qgis_app():
         IFACE = QgisInterface(CANVAS)
 
     return QGIS_APP, CANVAS, IFACE, PARENT
+
+
+def memory_layer(definition, name, rows):
+    """Memory layer from (wkt, attributes dict) rows."""
+    from qgis.core import QgsFeature, QgsGeometry, QgsVectorLayer
+
+    layer = QgsVectorLayer(definition, name, 'memory')
+    features = []
+    for wkt, attributes in rows:
+        feature = QgsFeature(layer.fields())
+        for field_name, value in attributes.items():
+            feature.setAttribute(field_name, value)
+        feature.setGeometry(QgsGeometry.fromWkt(wkt))
+        features.append(feature)
+    layer.dataProvider().addFeatures(features)
+    return layer
+
+
+def file_layer(path, layer, driver_name='GPKG'):
+    """Writes `layer` to `path` (GeoPackage or shapefile) and opens the written copy."""
+    from qgis.core import QgsProject, QgsVectorFileWriter, QgsVectorLayer
+
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = driver_name
+    options.layerName = layer.name()
+    writer = QgsVectorFileWriter.create(
+        path, layer.fields(), layer.wkbType(), layer.crs(), QgsProject.instance().transformContext(), options
+    )
+    writer.addFeatures(list(layer.getFeatures()))
+    del writer
+    if driver_name == 'GPKG':
+        path = f'{path}|layername={layer.name()}'
+    return QgsVectorLayer(path, layer.name(), 'ogr')
+
+
+def hpp_dataset(pairs, catchments=None):
+    """
+    (rivers, abstraction, discharge, catchments) layers for an HPP run: one
+    river along y = 5 and `pairs` abstraction/discharge pairs on it, coded
+    1, 2, ..., the pair i abstracting at x = 10 i + 2 and discharging at
+    x = 10 i + 8. Without `catchments`, one catchment covers the river.
+    """
+    crs = 'crs=EPSG:32638'
+    rivers = memory_layer(f'LineString?{crs}', 'rivers', [(f'LineString(0 5, {10 * pairs} 5)', {})])
+    abstraction = memory_layer(f'Point?{crs}&field=N_Jrar:string', 'hpp_abstraction', [
+        (f'Point({10 * i + 2} 5.5)', {'N_Jrar': str(i + 1)}) for i in range(pairs)
+    ])
+    discharge = memory_layer(f'Point?{crs}&field=N_Jrher:string', 'hpp_discharge', [
+        (f'Point({10 * i + 8} 4.5)', {'N_Jrher': str(i + 1)}) for i in range(pairs)
+    ])
+    if catchments is None:
+        catchments = memory_layer(f'Polygon?{crs}&field=RCode:string', 'catchments', [
+            (f'Polygon((0 0, {10 * pairs} 0, {10 * pairs} 10, 0 10, 0 0))', {'RCode': '1100'})
+        ])
+    return rivers, abstraction, discharge, catchments
+
+
+def strip_dataset():
+    """
+    A strip of square catchments 10 m wide, coded 1100, 1101, ... from west
+    to east, with a water body line and POINTS_PER_CATCHMENT abstraction and
+    discharge points in each, and one groundwater body per catchment.
+    """
+    crs = 'crs=EPSG:32638'
+    catchments = memory_layer(f'Polygon?{crs}&field=RCode:string', 'catchments', [
+        (f'Polygon(({10 * i} 0, {10 * i + 10} 0, {10 * i + 10} 10, {10 * i} 10, {10 * i} 0))', {'RCode': str(1100 + i)})
+        for i in range(CATCHMENTS)
+    ])
+    water_bodies = memory_layer(f'LineString?{crs}&field=W_av:double&field=W_ef:double', 'water_bodies', [
+        (f'LineString({10 * i + 1} 5, {10 * i + 9} 5)', {'W_av': 1000.0, 'W_ef': 100.0})
+        for i in range(CATCHMENTS)
+    ])
+    step = 10 / POINTS_PER_CATCHMENT
+    xs = [step * (i + 0.5) for i in range(CATCHMENTS * POINTS_PER_CATCHMENT)]
+    abstraction = memory_layer(f'Point?{crs}&field=abs_m3_yr:double&field=Groundwate:string', 'abstraction', [
+        (f'Point({x} 3)', {'abs_m3_yr': 1.0, 'Groundwate': 'yes' if i % 2 else None})
+        for i, x in enumerate(xs)
+    ])
+    discharge = memory_layer(f'Point?{crs}&field=Tm3_y:double&field=Swg_m3_y:double', 'discharge', [
+        (f'Point({x} 7)', {'Tm3_y': 1.0, 'Swg_m3_y': 0.5}) for x in xs
+    ])
+    groundwater = memory_layer(f'Polygon?{crs}&field=GW_Usable:double', 'groundwater', [
+        (f'Polygon(({10 * i + 2} 2, {10 * i + 8} 2, {10 * i + 8} 8, {10 * i + 2} 8, {10 * i + 2} 2))', {'GW_Usable': 10.0})
+        for i in range(CATCHMENTS)
+    ])
+    return water_bodies, catchments, abstraction, discharge, groundwater